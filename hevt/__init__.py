@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""HEVT 熱像監控：可在無 Tk 環境下匯入的擷取/分析核心。"""
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+自適應取樣頻率：依各裝置的斜率與警報狀態自動下 SET_THRESH D4（取樣間隔）。
+
+  fast     警報中、擴散中的熱點 / ROI 警報、接近門檻（Max >= Alarm - 5 °C）或升溫中（MaxSlope >= 0.75 × Slope）
+  normal   Max >= Alarm - 10 °C 或 MaxSlope >= 0.5 × Slope
+  idle     其它
+
+升級立即生效；降級要「較寬的條件」（溫度再低 HYST_TEMP °C、斜率再降到 HYST_SLOPE 倍）連續 HOLD 秒都不成立，
+且一次只降一級，避免在門檻附近來回切換。門檻取 engine.thresholds（GUI 改門檻後立即適用）。
+
+訊號來源：有主機端分析（analytics）時用逐幀重算的 Report，否則用裝置的 REPORT。
+時間用 dev.last_seen，指令只在等級改變或距上次送出超過 REASSERT 秒時送
+（裝置重開、舊韌體沒有 ACK 時也會回到正確的間隔）；開啟 --cmd-acks 時送失敗會在下一筆樣本重送。
+手動 Set Threshold 送出的 D4 會在下次等級改變或 REASSERT 時被覆蓋。
+"""
+
+from .commands import threshold_command
+from .report import Report
+
+RATE_LEVELS = ("fast", "normal", "idle")
+DEFAULT_INTERVALS = (50, 200, 1000)    # ms，依 RATE_LEVELS 順序
+NEAR_MARGIN = (5.0, 10.0)              # °C：Max 距 Alarm 門檻多近算 fast / normal
+RISING = (0.75, 0.5)                  # MaxSlope 達 Slope 門檻的幾倍算 fast / normal
+HYST_TEMP = 2.0                        # °C：降級時溫度條件多放寬的量
+HYST_SLOPE = 0.8                       # 降級時斜率條件乘上的倍數
+HOLD = 10.0                            # 秒：較寬的條件連續不成立多久才降一級
+REASSERT = 30.0                        # 秒：同一等級多久重送一次
+
+
+def parse_intervals(text: str) -> tuple:
+    """'50,200,1000' -> (50, 200, 1000)；需三個遞增的正整數（fast < normal < idle）"""
+    parts = tuple(int(x) for x in text.split(","))
+    if len(parts) != len(RATE_LEVELS) or parts[0] <= 0 or list(parts) != sorted(set(parts)):
+        raise ValueError("need three increasing intervals in ms: FAST,NORMAL,IDLE")
+    return parts
+
+
+class _DeviceRate:
+    __slots__ = ("level", "calm_since", "sent_at", "sent_level", "changes")
+
+    def __init__(self):
+        self.level = -1                # RATE_LEVELS 的索引；-1 = 還沒有樣本
+        self.calm_since = None         # 較寬的條件開始不成立的時間
+        self.sent_at = None            # 上次送出的時間；None = 要重送
+        self.sent_level = -1
+        self.changes = 0
+
+
+class RateController:
+    """接在 Engine 的 on_report / on_stats 上；回呼在接收執行緒執行，狀態不另外加鎖。"""
+
+    def __init__(self, engine, intervals: tuple = DEFAULT_INTERVALS, hold: float = HOLD,
+                 reassert: float = REASSERT):
+        if len(intervals) != len(RATE_LEVELS):
+            raise ValueError(f"intervals must have {len(RATE_LEVELS)} values")
+        self.engine = engine
+        self.intervals = tuple(intervals)
+        self.hold = hold
+        self.reassert = reassert
+        self.devices: dict[str, _DeviceRate] = {}
+        self.commands_sent = 0
+        self.send_failures = 0
+
+    def attach(self):
+        """訂閱 engine：有 analytics 時看主機端重算值，否則看裝置 REPORT"""
+        if self.engine.analytics:
+            self.engine.subscribe(on_stats=self.on_sample)
+        else:
+            self.engine.subscribe(on_report=self.on_sample)
+        return self
+
+    # ---------------- 判斷 ----------------
+    def _wanted(self, dev, report: Report, relaxed: bool) -> int:
+        """樣本對應的等級；relaxed=True 時用降級用的較寬條件"""
+        if report.alarm:
+            return 0
+        if dev.tracker is not None and dev.tracker.growing():
+            return 0
+        if dev.rois is not None and dev.rois.alarm.any():
+            return 0
+        th = self.engine.thresholds
+        extra_temp = HYST_TEMP if relaxed else 0.0
+        slope_scale = HYST_SLOPE if relaxed else 1.0
+        for level in range(len(RATE_LEVELS) - 1):
+            if report.max_temp >= th["alarm"] - NEAR_MARGIN[level] - extra_temp:
+                return level
+            if report.max_slope >= th["slope"] * RISING[level] * slope_scale:
+                return level
+        return len(RATE_LEVELS) - 1
+
+    def on_sample(self, dev, report: Report):
+        st = self.devices.get(dev.device_id)
+        if st is None:
+            st = self.devices[dev.device_id] = _DeviceRate()
+        now = dev.last_seen
+        want = self._wanted(dev, report, relaxed=False)
+        if st.level < 0 or want < st.level:
+            self._change(dev, st, want, report)
+        elif want > st.level:
+            if self._wanted(dev, report, relaxed=True) <= st.level:
+                st.calm_since = None
+            elif st.calm_since is None:
+                st.calm_since = now
+            elif now - st.calm_since >= self.hold:
+                self._change(dev, st, st.level + 1, report)
+                st.calm_since = now    # 再降一級還要再等 hold
+        else:
+            st.calm_since = None
+
+        if st.sent_level != st.level or st.sent_at is None or now - st.sent_at >= self.reassert:
+            self._send(dev, st, now)
+
+    def _change(self, dev, st: _DeviceRate, level: int, report: Report):
+        if st.level >= 0:
+            print(f"[RATE] {dev.device_id}: {RATE_LEVELS[st.level]} -> {RATE_LEVELS[level]} "
+                  f"({self.intervals[level]} ms; max {report.max_temp:.1f} °C, slope {report.max_slope:.2f})")
+            st.changes += 1
+        st.level = level
+        st.calm_since = None
+
+    def _send(self, dev, st: _DeviceRate, now: float):
+        engine = self.engine
+        if not engine.sockets_ready:
+            return
+        th = engine.thresholds
+        level = st.level
+        cmd = threshold_command(th["alarm"], th["slope"], th["diffusion"], self.intervals[level])
+        try:
+            future = engine.send_command(cmd, engine.device_ip(dev.device_id))
+        except Exception as e:
+            self.send_failures += 1
+            print(f"[RATE] {dev.device_id}: send failed:", e)
+            return
+        self.commands_sent += 1
+        st.sent_at = now
+        st.sent_level = level
+        if future is not None:
+            future.add_done_callback(lambda f: self._on_result(st, level, f.result()))
+
+    def _on_result(self, st: _DeviceRate, level: int, result):
+        if not result.ok and st.sent_level == level:
+            self.send_failures += 1
+            st.sent_at = None          # 下一筆樣本重送
+
+    # ---------------- 統計 ----------------
+    def interval_of(self, device_id: str) -> int | None:
+        st = self.devices.get(device_id)
+        return self.intervals[st.level] if st is not None and st.level >= 0 else None
+
+    def stats(self) -> dict:
+        levels = [st.level for st in list(self.devices.values()) if st.level >= 0]
+        return {"levels": {name: levels.count(i) for i, name in enumerate(RATE_LEVELS)},
+                "expected_fps": sum(1000.0 / self.intervals[i] for i in levels),
+                "changes": sum(st.changes for st in list(self.devices.values())),
+                "commands": self.commands_sent, "failures": self.send_failures}
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+主機端分析：由收到的影像幀重算 D1–D10（與裝置 REPORT 相同欄位）。
+
+  D1/D2/D3  Max/Min/Avg 溫度
+  D4/D5     每像素斜率（°C/s，視窗頭尾相減）的最大/平均
+  D6        Over Count：溫度 >= Alarm 門檻的像素數
+  D7        Diff Area：與上一幀溫差 > Diffusion 門檻的像素數
+  D8/D9/D10 Avg 溫度 / Max 斜率 / Diff Area 在視窗內的線性趨勢（每秒變化量）
+  alarm     Over Count > 0 或 Max 斜率 >= Slope 門檻
+
+每幀成本 O(像素)：像素歷史放在預先配置的環裡，趨勢用滑動視窗的累加和更新，
+不重掃歷史。
+"""
+
+import numpy as np
+
+from .report import Report
+
+DEFAULT_WINDOW = 16            # 幀
+
+
+class RollingTrend:
+    """
+    固定長度滑動視窗的最小平方斜率；累加和遞增更新，每 N 次重算一次抑制誤差。
+
+    時間以 t0 為原點存放；重算時把 t0 移到視窗內最舊的樣本，
+    長時間執行時 t 仍只跨一個視窗，stt / st² 相減不會失去精度。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.t = np.zeros(size, dtype=np.float64)
+        self.y = np.zeros(size, dtype=np.float64)
+        self.n = 0
+        self.pos = 0
+        self._pushes = 0
+        self.t0 = None
+        self.st = self.sy = self.stt = self.sty = 0.0
+
+    def push(self, t: float, y: float) -> float:
+        if self.t0 is None:
+            self.t0 = t
+        t -= self.t0
+        if self.n == self.size:
+            ot, oy = self.t[self.pos], self.y[self.pos]
+            self.st -= ot
+            self.sy -= oy
+            self.stt -= ot * ot
+            self.sty -= ot * oy
+        else:
+            self.n += 1
+        self.t[self.pos] = t
+        self.y[self.pos] = y
+        self.pos = (self.pos + 1) % self.size
+        self.st += t
+        self.sy += y
+        self.stt += t * t
+        self.sty += t * y
+
+        self._pushes += 1
+        if self._pushes >= self.size:
+            self._resum()
+        return self.slope()
+
+    def _resum(self):
+        n = self.n
+        t, y = self.t[:n], self.y[:n]
+        oldest = float(self.t[self.pos]) if n == self.size else float(t[0])
+        t -= oldest
+        self.t0 += oldest
+        self.st, self.sy = float(t.sum()), float(y.sum())
+        self.stt, self.sty = float(t @ t), float(t @ y)
+        self._pushes = 0
+
+    def slope(self) -> float:
+        n = self.n
+        if n < 2:
+            return 0.0
+        den = n * self.stt - self.st * self.st
+        if den <= 1e-12:
+            return 0.0
+        return float((n * self.sty - self.st * self.sy) / den)
+
+
+class FrameAnalyzer:
+    """單一裝置的主機端統計；update() 每幀呼叫一次，回傳 Report。"""
+
+    def __init__(self, npix: int, window: int = DEFAULT_WINDOW,
+                 alarm: float = 30.0, slope: float = 2.0, diffusion: float = 1.2):
+        self.alarm = alarm
+        self.slope = slope
+        self.diffusion = diffusion
+        self.window = window
+
+        self._hist = np.zeros((window, npix), dtype=np.float32)
+        self._times = np.zeros(window, dtype=np.float64)
+        self._count = 0
+        self._pos = 0
+        self._tmp = np.empty(npix, dtype=np.float32)
+        self._mask = np.empty(npix, dtype=bool)
+
+        self._avg_trend = RollingTrend(window)
+        self._slope_trend = RollingTrend(window)
+        self._diff_trend = RollingTrend(window)
+        self.last: Report | None = None
+
+    def set_thresholds(self, alarm: float | None = None, slope: float | None = None,
+                       diffusion: float | None = None):
+        if alarm is not None:
+            self.alarm = alarm
+        if slope is not None:
+            self.slope = slope
+        if diffusion is not None:
+            self.diffusion = diffusion
+
+    def update(self, frame: np.ndarray, t: float) -> Report:
+        cur = frame.reshape(-1)
+        tmp, mask = self._tmp, self._mask
+        prev_pos = (self._pos - 1) % self.window
+        oldest_pos = self._pos if self._count == self.window else 0
+
+        vmax = float(cur.max())
+        vmin = float(cur.min())
+        vavg = float(cur.mean())
+        over = int(np.count_nonzero(np.greater_equal(cur, self.alarm, out=mask)))
+
+        if self._count:
+            np.subtract(cur, self._hist[prev_pos], out=tmp)
+            np.abs(tmp, out=tmp)
+            diff_area = int(np.count_nonzero(np.greater(tmp, self.diffusion, out=mask)))
+
+            dt = t - self._times[oldest_pos]
+            if dt > 0:
+                np.subtract(cur, self._hist[oldest_pos], out=tmp)
+                tmp *= 1.0 / dt
+                max_slope = float(tmp.max())
+                avg_slope = float(tmp.mean())
+            else:
+                max_slope = avg_slope = 0.0
+        else:
+            diff_area = 0
+            max_slope = avg_slope = 0.0
+
+        # 寫入歷史環（覆蓋最舊的一格）
+        self._hist[self._pos] = cur
+        self._times[self._pos] = t
+        self._pos = (self._pos + 1) % self.window
+        self._count = min(self._count + 1, self.window)
+
+        self.last = Report(
+            alarm=int(over > 0 or max_slope >= self.slope),
+            max_temp=vmax, min_temp=vmin, avg_temp=vavg,
+            max_slope=max_slope, avg_slope=avg_slope,
+            over_count=over, diff_area=diff_area,
+            avg_temp_trend=self._avg_trend.push(t, vavg),
+            max_slope_trend=self._slope_trend.push(t, max_slope),
+            diff_area_trend=self._diff_trend.push(t, diff_area),
+        )
+        return self.last
+
+
+def compare_reports(device: Report, host: Report) -> dict:
+    """裝置 REPORT 與主機重算值的差（host - device），用來核對韌體。"""
+    return {name: getattr(host, name) - getattr(device, name) for name in Report._fields}
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+逐像素背景／雜訊模型：每個像素一組 EWMA 平均與變異數，每幀 O(像素) 更新。
+
+  d        = frame - mean
+  changed  = d² > k² · max(var, min_std²)          （統計門檻，取代固定 2 °C）
+  mean    += a · d
+  var      = (1 - a) · (var + a · d²)             （EWMA 變異數的遞增式）
+
+a 對未變化的像素為 alpha；變化中的像素平均只以 alpha_fg（小很多）更新、變異數不更新：
+熱點不會幾幀內就被吸收成背景，但緩慢漂移（環境溫度、感測器暖機）仍會慢慢跟上。
+前 warmup 幀用累積平均（a = 1/n）快速收斂，期間不標記變化。
+
+顯示用的降噪幀：未變化的像素做時間平滑（EWMA，係數 display_alpha），
+變化中的像素直接用原值，真正的變化不延遲。
+
+所有陣列在建立時配置，update() 只做寫入預先配置陣列的 NumPy 運算，不保留歷史幀。
+"""
+
+import numpy as np
+
+DEFAULT_ALPHA = 0.05           # 背景學習率（約 20 幀的時間常數）
+DEFAULT_ALPHA_FG = 0.002       # 變化中像素的學習率
+DEFAULT_K = 3.0                # 幾個標準差以外算變化
+DEFAULT_MIN_STD = 0.15         # °C；變異數下限，避免極安靜的像素對微小變動過度敏感
+DEFAULT_DISPLAY_ALPHA = 0.3
+DEFAULT_WARMUP = 8             # 幀
+
+
+class BackgroundModel:
+    def __init__(self, shape: tuple, alpha: float = DEFAULT_ALPHA, alpha_fg: float = DEFAULT_ALPHA_FG,
+                 k: float = DEFAULT_K, min_std: float = DEFAULT_MIN_STD,
+                 display_alpha: float = DEFAULT_DISPLAY_ALPHA, warmup: int = DEFAULT_WARMUP):
+        self.shape = tuple(shape)
+        self.alpha = alpha
+        self.alpha_fg = alpha_fg
+        self.k = k
+        self.min_std = min_std
+        self.display_alpha = display_alpha
+        self.warmup = max(1, int(warmup))
+        self.frames = 0
+
+        self.mean = np.zeros(self.shape, dtype=np.float32)
+        self.var = np.zeros(self.shape, dtype=np.float32)
+        self.mask = np.zeros(self.shape, dtype=bool)        # 最新一幀的變化像素
+        self.denoised = np.zeros(self.shape, dtype=np.float32)
+        self._d = np.empty(self.shape, dtype=np.float32)
+        self._d2 = np.empty(self.shape, dtype=np.float32)
+        self._a = np.empty(self.shape, dtype=np.float32)
+        self._lim = np.empty(self.shape, dtype=np.float32)
+
+    @property
+    def std(self) -> np.ndarray:
+        """目前的逐像素雜訊標準差（新配置的陣列；給顯示/除錯用）"""
+        return np.sqrt(self.var)
+
+    def reset(self):
+        self.frames = 0
+        self.mask[:] = False
+
+    def update(self, frame: np.ndarray) -> np.ndarray:
+        """送入一幀（shape 同建立時）；回傳變化遮罩（self.mask，下一次 update 前有效）。"""
+        frame = frame.reshape(self.shape)
+        mean, var, d, d2, a = self.mean, self.var, self._d, self._d2, self._a
+        self.frames += 1
+        if self.frames == 1:
+            np.copyto(mean, frame)
+            var.fill(self.min_std * self.min_std)
+            np.copyto(self.denoised, frame)
+            self.mask[:] = False
+            return self.mask
+
+        np.subtract(frame, mean, out=d)
+        np.multiply(d, d, out=d2)
+        warming = self.frames <= self.warmup
+        if warming:
+            a.fill(max(self.alpha, 1.0 / self.frames))
+            self.mask[:] = False
+        else:
+            # changed = d² > k² · max(var, min_std²)
+            np.maximum(var, self.min_std * self.min_std, out=self._lim)
+            self._lim *= self.k * self.k
+            np.greater(d2, self._lim, out=self.mask)
+            a.fill(self.alpha)
+            np.copyto(a, 0.0, where=self.mask)
+
+        # var = (1 - a) · (var + a · d²)；變化中的像素不更新變異數（否則熱點會撐大自己的門檻）
+        d2 *= a
+        var += d2
+        np.subtract(1.0, a, out=d2)
+        var *= d2
+        # mean += a · d；變化中的像素以 alpha_fg 慢慢跟上
+        if not warming:
+            np.copyto(a, self.alpha_fg, where=self.mask)
+        d *= a
+        mean += d
+
+        # 降噪顯示：靜止像素平滑，變化像素直接取原值
+        out = self.denoised
+        np.subtract(frame, out, out=d)
+        d *= self.display_alpha
+        out += d
+        if not warming:
+            np.copyto(out, frame, where=self.mask)
+        return self.mask
@@ -0,0 +1,551 @@
+# -*- coding: utf-8 -*-
+"""
+效能基準：各階段 micro-benchmark + 以模擬器驅動的端到端情境，輸出 JSON 供版本間比較。
+
+  micro   REPORT 解析、組幀（raw / HVT1 各編碼）、diff_mask、主機分析、熱點追蹤、ROI、幀歷史環、
+          update_gui（有顯示器時）、熱像繪製（fast / mpl）、LINE 警報（對本機 stub HTTP server）
+  e2e     模擬器（子行程）以 8/16/64 Hz × 1/10/50 台送到 Engine，量完成率與每幀 CPU
+
+  python -m hevt.bench --out bench.json
+  python -m hevt.bench --quick --compare bench.json      # 與舊結果比較，退步時 exit 1
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from .analytics import FrameAnalyzer
+from .background import BackgroundModel
+from .codec import ENC_DELTA, ENC_F32, ENC_I16, DeltaEncoder, encode
+from .engine import PIX_H, PIX_W, DeviceState, Engine
+from .frames import ChunkAssembler, FrameRing, split_payload
+from .history import HISTORY_ENCODINGS, FrameHistory
+from .hotspot import HotspotTracker
+from .line import LineAlerter, LineConfig, LineDispatcher
+from .render import ThermalRenderer
+from .report import Report, format_report, pack_report, parse_binary_report, parse_report
+from .roi import Roi, RoiStats
+
+BENCH_VERSION = 1
+E2E_RATES = (8, 16, 64)
+E2E_DEVICES = (1, 10, 50)
+E2E_CMD_PORT = 21234           # 不與正在跑的 main.py 搶 1234/1235
+E2E_IMG_PORT = 21235
+DEFAULT_TOLERANCE = 0.20       # 比較時容許的退步比例
+
+# 比較時看的指標與方向
+LOWER_IS_BETTER = ("median_us", "cpu_us_per_frame")
+HIGHER_IS_BETTER = ("completion",)
+
+_SAMPLE_REPORT = Report(1, 41.25, 22.5, 27.75, 1.5, 0.25, 12, 30, 0.12, -0.03, 1.5)
+
+
+# --------------------------------
+# 計時
+# --------------------------------
+def _measure(name: str, fn, number: int, repeat: int) -> dict:
+    """fn 呼叫 number 次為一批，共 repeat 批；回傳每次呼叫的 µs 統計。"""
+    fn()   # 暖機
+    per_op = []
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        per_op.append((time.perf_counter_ns() - t0) / number / 1000.0)
+    med = statistics.median(per_op)
+    return {
+        "name": name,
+        "kind": "micro",
+        "metrics": {
+            "median_us": round(med, 3),
+            "min_us": round(min(per_op), 3),
+            "max_us": round(max(per_op), 3),
+            "ops_per_sec": round(1e6 / med, 1) if med else None,
+        },
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def _skipped(name: str, reason: str) -> dict:
+    return {"name": name, "kind": "micro", "skipped": reason}
+
+
+def _test_frames(n: int = 64, seed: int = 0) -> np.ndarray:
+    """緩慢變化的熱場景（讓 DELTA 編碼大多不需關鍵幀）"""
+    rng = np.random.default_rng(seed)
+    base = 25.0 + rng.normal(0, 0.3, size=(PIX_H, PIX_W))
+    drift = np.linspace(0, 2.0, n)[:, None, None]
+    return (base[None] + drift + rng.normal(0, 0.05, size=(n, PIX_H, PIX_W))).astype(np.float32)
+
+
+# --------------------------------
+# stub HTTP server（LINE）
+# --------------------------------
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"      # keep-alive，與真實 API 一樣可重用連線
+    disable_nagle_algorithm = True     # header 與 body 分兩次寫，不關 Nagle 會多等 40 ms delayed ACK
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        pass
+
+
+def _stub_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --------------------------------
+# micro-benchmarks
+# --------------------------------
+def bench_parse(scale: float) -> list:
+    msg = format_report(_SAMPLE_REPORT)
+    packed = pack_report(_SAMPLE_REPORT)
+    return [_measure("report.parse", lambda: parse_report(msg), int(20000 * scale), 7),
+            _measure("report.parse_binary", lambda: parse_binary_report(packed), int(20000 * scale), 7)]
+
+
+def bench_assembly(scale: float) -> list:
+    results = []
+    frames = _test_frames()
+    n = len(frames)
+
+    # raw float32：與單機 raw 串流相同（一個 datagram = 一整幀）
+    ring = FrameRing(PIX_H, PIX_W)
+    raw = [memoryview(f.tobytes()) for f in frames]
+    state = {"i": 0}
+
+    def raw_step():
+        i = state["i"] = (state["i"] + 1) % n
+        data = raw[i]
+        ring.reset_partial()
+        if ring.commit(ring.write_from(data, len(data))):
+            ring.publish()
+    results.append(_measure("assemble.raw", raw_step, int(20000 * scale), 7))
+
+    # HVT1 分塊：每幀 3 包（256 像素/包）
+    for name, enc in (("f32", ENC_F32), ("i16", ENC_I16), ("delta", ENC_DELTA)):
+        delta = DeltaEncoder()
+        packets = []
+        for fid, f in enumerate(frames):
+            if enc == ENC_DELTA:
+                e, payload = delta.encode(f)
+            else:
+                e, payload = enc, encode(f, enc)
+            packets.append([memoryview(p) for p in split_payload(payload, e, fid, 256)])
+        ring = FrameRing(PIX_H, PIX_W)
+        asm = ChunkAssembler(ring)
+        state = {"i": 0}
+
+        def chunk_step(packets=packets, asm=asm, state=state):
+            i = state["i"] = (state["i"] + 1) % n
+            if i == 0:
+                # 新一輪 frame_id 從 0 開始：重設，避免被當成過期封包；DELTA 從關鍵幀重新開始
+                asm.last_fid = -1
+                asm.frame_id = -1
+            for p in packets[i]:
+                asm.feed(p, len(p), 0.0)
+        results.append(_measure(f"assemble.chunked.{name}", chunk_step, int(10000 * scale), 7))
+    return results
+
+
+def bench_diff_mask(scale: float) -> list:
+    dev = DeviceState("bench", LineConfig())
+    frames = _test_frames()
+    for f in frames[:2]:
+        dev.ring.write_pixels()[:] = f.reshape(-1)
+        dev.ring.publish()
+
+    def step():
+        dev._on_published()
+
+    model = BackgroundModel((PIX_H, PIX_W))
+    state = {"i": 0}
+
+    def bg_step():
+        i = state["i"] = (state["i"] + 1) % len(frames)
+        model.update(frames[i])
+    return [_measure("diff_mask", step, int(20000 * scale), 7),
+            _measure("diff_mask.background", bg_step, int(20000 * scale), 7)]
+
+
+def bench_analytics(scale: float) -> list:
+    frames = _test_frames()
+    analyzer = FrameAnalyzer(PIX_H * PIX_W)
+    state = {"i": 0, "t": 0.0}
+
+    def step():
+        i = state["i"] = (state["i"] + 1) % len(frames)
+        state["t"] += 1 / 16
+        analyzer.update(frames[i], state["t"])
+    return [_measure("analytics.update", step, int(5000 * scale), 7)]
+
+
+def bench_hotspot(scale: float) -> list:
+    frames = _test_frames()
+    hot = frames.copy()
+    yy, xx = np.mgrid[:PIX_H, :PIX_W]
+    for i in range(len(hot)):
+        # 逐漸擴大的熱點 + 一個固定的小熱點
+        hot[i][(yy - 10) ** 2 + (xx - 15) ** 2 <= (1 + i * 0.1) ** 2] = 35.0
+        hot[i][20:22, 2:4] = 33.0
+    results = []
+    for name, seq in (("quiet", frames), ("hot", hot)):
+        tracker = HotspotTracker(PIX_H, PIX_W, hot_threshold=30.0)
+        state = {"i": 0, "t": 0.0}
+
+        def step(seq=seq, tracker=tracker, state=state):
+            i = state["i"] = (state["i"] + 1) % len(seq)
+            state["t"] += 1 / 16
+            tracker.update(seq[i], None, state["t"])
+        results.append(_measure(f"hotspot.update.{name}", step, int(5000 * scale), 7))
+    return results
+
+
+def bench_roi(scale: float) -> list:
+    frames = _test_frames()
+    results = []
+    for n in (1, 8, 32):
+        # n 個條狀 ROI 鋪滿整幀；每幀成本應與 n 無關
+        rows = [(k * PIX_H // n, (k + 1) * PIX_H // n) if n <= PIX_H else (k % PIX_H, k % PIX_H + 1)
+                for k in range(n)]
+        cols = [(0, PIX_W) if n <= PIX_H else ((k // PIX_H) * PIX_W // 2, (k // PIX_H + 1) * PIX_W // 2)
+                for k in range(n)]
+        stats = RoiStats([Roi(f"r{k}", (r0, c0, r1, c1)) for k, ((r0, r1), (c0, c1)) in enumerate(zip(rows, cols))],
+                         PIX_H, PIX_W)
+        state = {"i": 0, "t": 0.0}
+
+        def step(stats=stats, state=state):
+            i = state["i"] = (state["i"] + 1) % len(frames)
+            state["t"] += 1 / 16
+            stats.update(frames[i], state["t"])
+        results.append(_measure(f"roi.update.{n}", step, int(10000 * scale), 7))
+    return results
+
+
+def bench_history(scale: float) -> list:
+    frames = _test_frames()
+    results = []
+    for enc in HISTORY_ENCODINGS:
+        history = FrameHistory(PIX_H, PIX_W, 600, enc)
+        state = {"i": 0, "t": 0.0}
+
+        def step(history=history, state=state):
+            i = state["i"] = (state["i"] + 1) % len(frames)
+            state["t"] += 1 / 16
+            history.push(frames[i], state["t"])
+        results.append(_measure(f"history.push.{enc}", step, int(20000 * scale), 7))
+    return results
+
+
+def bench_render(scale: float) -> list:
+    results = []
+    frames = _test_frames()
+    state = {"i": 0}
+
+    def next_frame():
+        i = state["i"] = (state["i"] + 1) % len(frames)
+        return frames[i]
+
+    try:
+        fast = ThermalRenderer(PIX_H, PIX_W, scale=12)
+    except ImportError as e:
+        return [_skipped("render.fast_ppm", f"matplotlib: {e}")]
+    results.append(_measure("render.fast_ppm", lambda: fast.ppm(next_frame()), int(2000 * scale), 7))
+
+    try:
+        import matplotlib
+        matplotlib.use("Agg", force=False)
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+    except ImportError as e:
+        results.append(_skipped("render.mpl_imshow", f"matplotlib: {e}"))
+        return results
+    fig = Figure(figsize=(5, 4))
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    im = ax.imshow(frames[0], cmap="inferno", vmin=20, vmax=60)
+    fig.colorbar(im, ax=ax)
+
+    def mpl_step():
+        im.set_data(next_frame())
+        canvas.draw()
+    results.append(_measure("render.mpl_imshow", mpl_step, max(1, int(20 * scale)), 5))
+    return results
+
+
+def bench_update_gui(scale: float) -> list:
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception as e:       # 無 tkinter 或無顯示器
+        return [_skipped("gui.update_gui", f"no Tk display: {e}")]
+    try:
+        from .gui import ThermalApp
+
+        class _Vars:
+            """只建 update_gui 用到的 StringVar，不建整個視窗"""
+        app = _Vars()
+        for name in ("alarm_text", "max_temp_var", "min_temp_var", "avg_temp_var", "max_slope_var",
+                     "avg_slope_var", "over_count_var", "diff_area_var", "avgTempT_var",
+                     "maxSlopeT_var", "diffAreaT_var"):
+            setattr(app, name, tk.StringVar(root))
+        app.alarm_label = tk.Label(root, textvariable=app.alarm_text)
+        r = _SAMPLE_REPORT
+        state = {"a": 0}
+
+        def step():
+            state["a"] ^= 1
+            ThermalApp.update_gui(app, state["a"], *r[1:])
+        return [_measure("gui.update_gui", step, int(2000 * scale), 5)]
+    except Exception as e:
+        return [_skipped("gui.update_gui", str(e))]
+    finally:
+        root.destroy()
+
+
+def bench_line(scale: float) -> list:
+    server = _stub_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v2/bot/message/push"
+    dispatcher = LineDispatcher(url=url, max_queue=1 << 16)
+    cfg = LineConfig(enabled=True, token="bench", group_id="Cbench", user_id="Ubench", cooldown=0)
+    alerter = LineAlerter(cfg, dispatcher, device_id="bench")
+    results = []
+    try:
+        # 接收執行緒上的成本：NORMAL→OVER 每次都觸發、排入 2 個目標
+        state = {"a": 0}
+
+        def step():
+            state["a"] ^= 1
+            alerter.maybe_send(41.0, 27.0, 30, state["a"])
+        with contextlib.redirect_stdout(io.StringIO()):    # 每次觸發都會印 [LINE] queued
+            res = _measure("line.maybe_send", step, int(500 * scale), 5)
+
+        # 等佇列送完，記錄對 stub server 的實際推送延遲
+        deadline = time.monotonic() + 60
+        while dispatcher.stats()["queue_depth"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.2)
+        st = dispatcher.stats()
+        res["metrics"]["push_latency_avg_ms"] = round(st["latency_avg"] * 1000, 3)
+        res["metrics"]["push_latency_max_ms"] = round(st["latency_max"] * 1000, 3)
+        res["metrics"]["pushes_sent"] = st["sent"]
+        res["metrics"]["pushes_failed"] = st["failed"]
+        results.append(res)
+
+        # 同步來回（Send Test 的路徑）
+        results.append(_measure("line.push_all_roundtrip", lambda: dispatcher.push_all(cfg, "bench"),
+                                max(1, int(50 * scale)), 5))
+    finally:
+        dispatcher.close()
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+MICRO = (bench_parse, bench_assembly, bench_diff_mask, bench_analytics, bench_hotspot, bench_roi, bench_history,
+         bench_render, bench_update_gui, bench_line)
+
+
+# --------------------------------
+# 端到端
+# --------------------------------
+def _sim_process(devices: int, fps: float, duration: float, ready, result):
+    from .simulator import Simulator
+    try:
+        sim = Simulator(devices=devices, fps=fps, cmd_port=E2E_CMD_PORT, img_port=E2E_IMG_PORT,
+                        listen=False, seed=1)
+    except OSError as e:
+        ready.put(f"bind failed: {e}")
+        return
+    ready.put("ok")
+    sim.start()
+    time.sleep(duration)
+    sim.stop()
+    # 多等一下讓延後的封包送完
+    time.sleep(0.1)
+    result.put(sim.stats())
+    sim.close()
+
+
+def bench_e2e(fps: float, devices: int, duration: float, analytics: bool = True) -> dict:
+    name = f"e2e.{int(fps)}hz.{devices}dev"
+    engine = Engine(bind_ip="127.0.0.1", cmd_port=E2E_CMD_PORT, img_port=E2E_IMG_PORT,
+                    multi=True, analytics=analytics)
+    try:
+        engine.open()
+    except OSError as e:
+        return {"name": name, "kind": "e2e", "skipped": f"bind failed: {e}"}
+
+    ctx = multiprocessing.get_context("spawn")
+    ready, result = ctx.Queue(), ctx.Queue()
+    proc = ctx.Process(target=_sim_process, args=(devices, fps, duration, ready, result), daemon=True)
+    engine.start()
+    proc.start()
+    try:
+        status = ready.get(timeout=30)
+        if status != "ok":
+            return {"name": name, "kind": "e2e", "skipped": status}
+        cpu0, wall0 = time.process_time(), time.monotonic()
+        sim_stats = result.get(timeout=duration + 30)
+        time.sleep(0.2)        # 讓接收端處理完尾端封包
+        cpu, wall = time.process_time() - cpu0, time.monotonic() - wall0
+    finally:
+        proc.join(timeout=10)
+        engine.stop()
+
+    devs = list(engine.devices.values())
+    completed = sum(d.frames_completed for d in devs)
+    sent = sim_stats["frames_sent"]
+    return {
+        "name": name,
+        "kind": "e2e",
+        "params": {"fps": fps, "devices": devices, "duration": duration, "analytics": analytics},
+        "metrics": {
+            "frames_sent": sent,
+            "frames_completed": completed,
+            "frames_dropped": sum(d.frames_dropped for d in devs),
+            "reports_received": sum(d.reports_received for d in devs),
+            "reports_sent": sim_stats["reports_sent"],
+            "completion": round(completed / sent, 4) if sent else None,
+            "frames_per_sec": round(completed / wall, 1),
+            "host_cpu_pct": round(100.0 * cpu / wall, 1),
+            "cpu_us_per_frame": round(cpu / completed * 1e6, 1) if completed else None,
+        },
+    }
+
+
+# --------------------------------
+# 比較 / 輸出
+# --------------------------------
+def _environment() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except Exception:
+        rev = ""
+    return {
+        "bench_version": BENCH_VERSION,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git": rev,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(base: dict, current: dict, tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """回傳退步清單 [(name, metric, base, current)]"""
+    old = {r["name"]: r.get("metrics", {}) for r in base.get("results", [])}
+    regressions = []
+    for r in current.get("results", []):
+        prev = old.get(r["name"])
+        if not prev or "metrics" not in r:
+            continue
+        for key in LOWER_IS_BETTER:
+            a, b = prev.get(key), r["metrics"].get(key)
+            if a and b is not None and b > a * (1 + tolerance):
+                regressions.append((r["name"], key, a, b))
+        for key in HIGHER_IS_BETTER:
+            a, b = prev.get(key), r["metrics"].get(key)
+            if a and b is not None and b < a * (1 - tolerance):
+                regressions.append((r["name"], key, a, b))
+    return regressions
+
+
+def _print_result(r: dict):
+    if "skipped" in r:
+        print(f"  {r['name']:<28} skipped ({r['skipped']})")
+        return
+    m = r["metrics"]
+    if r["kind"] == "micro":
+        extra = "".join(f"  {k}={v}" for k, v in m.items() if k.startswith("push_"))
+        print(f"  {r['name']:<28} {m['median_us']:>10.2f} µs/op  ({m['ops_per_sec']:.0f}/s){extra}")
+    else:
+        print(f"  {r['name']:<28} completion={m['completion']}  {m['frames_per_sec']} frames/s  "
+              f"cpu={m['host_cpu_pct']}%  {m['cpu_us_per_frame']} µs/frame")
+
+
+def _int_list(value: str) -> tuple:
+    return tuple(int(v) for v in value.split(",") if v)
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="HEVT benchmark suite")
+    p.add_argument("--out", help="結果寫入 JSON 檔")
+    p.add_argument("--compare", metavar="BASE.json", help="與先前的結果比較；有退步時 exit 1")
+    p.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="容許退步比例（預設 0.2）")
+    p.add_argument("--quick", action="store_true", help="較少次數、e2e 每情境 2 秒")
+    p.add_argument("--micro-only", action="store_true")
+    p.add_argument("--e2e-only", action="store_true")
+    p.add_argument("--rates", type=_int_list, default=E2E_RATES, help="e2e 頻率（Hz），逗號分隔")
+    p.add_argument("--devices", type=_int_list, default=E2E_DEVICES, help="e2e 裝置數，逗號分隔")
+    p.add_argument("--duration", type=float, help="e2e 每個情境的秒數（預設 5，--quick 為 2）")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    scale = 0.2 if args.quick else 1.0
+    duration = args.duration or (2.0 if args.quick else 5.0)
+    report = {"environment": _environment(), "results": []}
+
+    if not args.e2e_only:
+        print("[BENCH] micro")
+        for bench in MICRO:
+            for r in bench(scale):
+                report["results"].append(r)
+                _print_result(r)
+    if not args.micro_only:
+        print("[BENCH] e2e")
+        for fps in args.rates:
+            for devices in args.devices:
+                r = bench_e2e(fps, devices, duration)
+                report["results"].append(r)
+                _print_result(r)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[BENCH] saved to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        regressions = compare(base, report, args.tolerance)
+        for name, key, a, b in regressions:
+            print(f"[REGRESSION] {name} {key}: {a} -> {b}")
+        if regressions:
+            return 1
+        print(f"[BENCH] no regressions vs {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+影像像素編碼（HVT1 分塊封包 header 的 flags 低 4 bits）。
+
+  ENC_F32    float32                    3072 B/幀（舊版）
+  ENC_I16    int16，單位 0.01 °C         1536 B/幀
+  ENC_F16    float16                    1536 B/幀
+  ENC_DELTA  int8，與上一幀差 0.01 °C    768 B/幀（一個 datagram）
+
+DELTA 需參考上一幀：發送端每 N 幀（或差值超出 int8 時）送一張 ENC_I16 關鍵幀。
+主機端解碼全部向量化，直接寫進 FrameRing 的 slot。
+"""
+
+import numpy as np
+
+ENC_F32 = 0
+ENC_I16 = 1
+ENC_F16 = 2
+ENC_DELTA = 3
+ENC_MASK = 0x0F
+
+ENCODINGS = {"f32": ENC_F32, "i16": ENC_I16, "f16": ENC_F16, "delta": ENC_DELTA}
+ELEM_SIZE = {ENC_F32: 4, ENC_I16: 2, ENC_F16: 2, ENC_DELTA: 1}
+_DTYPE = {ENC_F32: np.dtype("<f4"), ENC_I16: np.dtype("<i2"), ENC_F16: np.dtype("<f2"),
+          ENC_DELTA: np.dtype("i1")}
+CENTI = 0.01
+DEFAULT_KEYFRAME_INTERVAL = 16
+
+
+def decode_into(enc: int, src, offset: int, npix: int, dst: np.ndarray, prev: np.ndarray | None = None):
+    """把 src[offset:] 的 npix 個像素解碼到 dst（float32，長度 npix）；DELTA 需給 prev。"""
+    raw = np.frombuffer(src, dtype=_DTYPE[enc], count=npix, offset=offset)
+    if enc == ENC_F32 or enc == ENC_F16:
+        np.copyto(dst, raw)
+    elif enc == ENC_I16:
+        np.multiply(raw, CENTI, out=dst)
+    elif enc == ENC_DELTA:
+        np.multiply(raw, CENTI, out=dst)
+        np.add(dst, prev, out=dst)
+    else:
+        raise ValueError(f"unknown encoding {enc}")
+
+
+def encode(frame: np.ndarray, enc: int) -> bytes:
+    """非 DELTA 編碼（發送端/模擬器用）"""
+    flat = np.asarray(frame, dtype=np.float32).reshape(-1)
+    if enc == ENC_F32:
+        return flat.astype("<f4").tobytes()
+    if enc == ENC_F16:
+        return flat.astype("<f2").tobytes()
+    if enc == ENC_I16:
+        return np.clip(np.rint(flat / CENTI), -32768, 32767).astype("<i2").tobytes()
+    raise ValueError(f"encoding {enc} needs DeltaEncoder")
+
+
+class DeltaEncoder:
+    """
+    發送端的 DELTA 編碼器：與「接收端重建出來的」上一幀相減，誤差不會累積。
+    每 keyframe_interval 幀、或差值超出 int8 範圍時改送 ENC_I16 關鍵幀。
+    """
+
+    def __init__(self, keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self._ref: np.ndarray | None = None    # 以 0.01 °C 為單位的重建幀（int32）
+        self._since_key = 0
+
+    def encode(self, frame: np.ndarray) -> tuple:
+        """回傳 (enc, payload)"""
+        q = np.clip(np.rint(np.asarray(frame, dtype=np.float32).reshape(-1) / CENTI), -32768, 32767).astype(np.int32)
+        if self._ref is not None and self._since_key < self.keyframe_interval:
+            d = q - self._ref
+            if d.min() >= -128 and d.max() <= 127:
+                self._ref = self._ref + d
+                self._since_key += 1
+                return ENC_DELTA, d.astype("i1").tobytes()
+        self._ref = q
+        self._since_key = 1
+        return ENC_I16, q.astype("<i2").tobytes()
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+可靠指令通道：序號、ACK、逾時重送，多台裝置的指令同時在途。
+
+  主機 → 裝置指令埠     SEQ=<n>;<指令>              例：SEQ=812;SET_THRESH:D1=30,D2=2,D3=1.2,D4=100
+  裝置 → 主機指令埠     ACK,SEQ=<n>,OK
+                        ACK,SEQ=<n>,ERR=<原因>
+
+裝置記住最近收過的序號；重送的指令（ACK 掉了）只回同一個 ACK，不再執行一次。
+序號起點隨機，主機重啟後不會撞到裝置還記得的舊序號。
+舊韌體不認得 SEQ= 前綴，所以這層需明確開啟（Engine(command_acks=True) / --cmd-acks）。
+
+每台裝置同時最多 window 筆在途（預設 1：同一台的指令依序生效，SET_THRESH 不會被舊的蓋掉），
+其餘排隊；不同裝置之間互不等待，批次下發給 N 台時 N 筆同時在途。
+重送間隔從 timeout 起每次加倍（上限 max_timeout），retries 次後以 timeout 結束。
+submit() 回傳 concurrent.futures.Future，結果為 CommandResult。
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+from dataclasses import dataclass
+
+from .metrics import Histogram
+
+DEFAULT_TIMEOUT = 0.25         # 秒；第一次重送前等多久
+DEFAULT_RETRIES = 4            # 重送次數（總共最多 1 + retries 次）
+DEFAULT_MAX_TIMEOUT = 2.0
+DEFAULT_WINDOW = 1             # 每台同時在途的指令數
+SEQ_MOD = 1 << 31
+ACK_PREFIX = b"ACK,"
+
+
+@dataclass
+class CommandResult:
+    ip: str
+    command: str
+    status: str                # ok | error | timeout | sent（未開 ACK，只確定有送出）| cancelled
+    attempts: int = 0
+    rtt: float | None = None   # 第一次送出 → ACK（秒）
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("ok", "sent")
+
+    def __str__(self):
+        extra = f" rtt={self.rtt * 1000:.0f}ms" if self.rtt is not None else ""
+        err = f" ({self.error})" if self.error else ""
+        return f"{self.ip}: {self.status}{err} attempts={self.attempts}{extra}"
+
+
+def threshold_command(alarm, slope, diffusion, interval_ms) -> str:
+    return f"SET_THRESH:D1={alarm},D2={slope},D3={diffusion},D4={interval_ms}"
+
+
+def format_command(seq: int, cmd: str) -> bytes:
+    return f"SEQ={seq};{cmd}".encode()
+
+
+def parse_command(msg: str) -> tuple:
+    """裝置端：'SEQ=n;CMD' -> (n, CMD)；沒有序號（舊格式）時為 (None, msg)"""
+    if msg.startswith("SEQ="):
+        head, sep, cmd = msg.partition(";")
+        if sep:
+            try:
+                return int(head[4:]), cmd
+            except ValueError:
+                pass
+    return None, msg
+
+
+def format_ack(seq: int, error: str = "") -> bytes:
+    return (f"ACK,SEQ={seq},ERR={error}" if error else f"ACK,SEQ={seq},OK").encode()
+
+
+def parse_ack(msg: str) -> tuple:
+    """'ACK,SEQ=n,OK' -> (n, '')；'ACK,SEQ=n,ERR=x' -> (n, 'x')；格式錯誤丟出 ValueError"""
+    parts = msg.strip().split(",", 2)
+    if len(parts) < 3 or parts[0] != "ACK" or not parts[1].startswith("SEQ="):
+        raise ValueError(f"bad ACK: {msg!r}")
+    status = parts[2]
+    if status == "OK":
+        return int(parts[1][4:]), ""
+    if status.startswith("ERR="):
+        return int(parts[1][4:]), status[4:] or "error"
+    raise ValueError(f"bad ACK status: {msg!r}")
+
+
+class _Pending:
+    __slots__ = ("seq", "ip", "command", "data", "future", "attempts", "first_sent", "deadline", "rto")
+
+    def __init__(self, seq: int, ip: str, command: str, future: Future):
+        self.seq = seq
+        self.ip = ip
+        self.command = command
+        self.data = format_command(seq, command)
+        self.future = future
+        self.attempts = 0
+        self.first_sent = 0.0
+        self.deadline = 0.0
+        self.rto = 0.0
+
+
+class CommandChannel:
+    """
+    sendto(data: bytes, ip: str) 由 Engine 提供（指令 socket）。
+    on_ack() 由接收執行緒呼叫；poll() 由接收迴圈定期呼叫處理重送/逾時；submit() 可在任何執行緒。
+    on_submit()（可選）在新指令開始計時後呼叫：接收迴圈可藉此提早醒來，依新的 next_deadline() 等待。
+    """
+
+    def __init__(self, sendto, timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 max_timeout: float = DEFAULT_MAX_TIMEOUT, window: int = DEFAULT_WINDOW, on_submit=None):
+        self._sendto = sendto
+        self._on_submit = on_submit
+        self.timeout = timeout
+        self.retries = retries
+        self.max_timeout = max_timeout
+        self.window = max(1, window)
+        self._lock = threading.Lock()
+        self._seq = random.randrange(1, SEQ_MOD)
+        self._inflight: dict[int, _Pending] = {}       # seq -> 在途
+        self._queued: dict[str, deque] = {}            # ip -> 等 window 空出來的指令
+        self._per_ip: dict[str, int] = {}              # ip -> 在途數
+
+        # 統計
+        self.sent = 0
+        self.retransmits = 0
+        self.acked = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.stray_acks = 0
+        self.send_failures = 0
+        self.rtt_hist = Histogram()
+
+    # ---------------- 送出 ----------------
+    def submit(self, ip: str, command: str) -> Future:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            seq = self._seq
+            self._seq = seq % (SEQ_MOD - 1) + 1
+            p = _Pending(seq, ip, command, future)
+            if self._per_ip.get(ip, 0) >= self.window:
+                self._queued.setdefault(ip, deque()).append(p)
+                return future
+            self._start(p, time.monotonic())
+        self._transmit(p)
+        if self._on_submit is not None:
+            self._on_submit()
+        return future
+
+    def submit_many(self, commands: dict) -> dict:
+        """{ip: 指令} -> {ip: Future}；各台同時在途"""
+        return {ip: self.submit(ip, cmd) for ip, cmd in commands.items()}
+
+    def _start(self, p: _Pending, now: float):
+        """（持有鎖）登記為在途並計入第一次送出；實際送出在鎖外"""
+        self._inflight[p.seq] = p
+        self._per_ip[p.ip] = self._per_ip.get(p.ip, 0) + 1
+        p.attempts = 1
+        self.sent += 1
+        p.first_sent = now
+        p.rto = self.timeout
+        p.deadline = now + p.rto
+
+    def _transmit(self, p: _Pending):
+        """（鎖外）送出；次數與統計已在持有鎖時記好"""
+        try:
+            self._sendto(p.data, p.ip)
+        except OSError as e:
+            # socket 暫時不能送：留給下一次重送；socket 已關閉時 poll() 最後會以 timeout 結束
+            with self._lock:
+                self.send_failures += 1
+                failures = self.send_failures
+            if failures == 1 or failures % 100 == 0:
+                print(f"[CMD ERR] send to {p.ip} failed: {e} (failures={failures})")
+
+    def _finish(self, p: _Pending) -> _Pending | None:
+        """（持有鎖）移出在途，回傳該台下一筆要送的指令（若有）；Future 由呼叫端在鎖外完成"""
+        self._inflight.pop(p.seq, None)
+        left = self._per_ip.get(p.ip, 1) - 1
+        nxt = None
+        queue = self._queued.get(p.ip)
+        if queue:
+            nxt = queue.popleft()
+            if not queue:
+                del self._queued[p.ip]
+        if left or nxt is not None:
+            self._per_ip[p.ip] = left
+        else:
+            self._per_ip.pop(p.ip, None)
+        return nxt
+
+    # ---------------- 接收端呼叫 ----------------
+    def on_ack(self, ip: str, msg: str) -> bool:
+        """處理一個 ACK；不認得的序號（重複 ACK、已逾時）或不是該指令目標 ip 送來的，計為 stray 並回 False"""
+        try:
+            seq, error = parse_ack(msg)
+        except ValueError as e:
+            print("[CMD]", e)
+            return False
+        now = time.monotonic()
+        with self._lock:
+            p = self._inflight.get(seq)
+            if p is None or p.ip != ip:
+                self.stray_acks += 1
+                return False
+            rtt = now - p.first_sent
+            self.rtt_hist.observe(rtt)
+            if error:
+                self.errors += 1
+            else:
+                self.acked += 1
+            nxt = self._finish(p)
+            if nxt is not None:
+                self._start(nxt, now)
+        p.future.set_result(CommandResult(p.ip, p.command, "error" if error else "ok", p.attempts, rtt, error))
+        if nxt is not None:
+            self._transmit(nxt)
+        return True
+
+    def poll(self, now: float | None = None):
+        """重送到期的指令，超過重送次數的以 timeout 結束"""
+        now = time.monotonic() if now is None else now
+        resend, expired = [], []
+        with self._lock:
+            for p in list(self._inflight.values()):
+                if p.deadline > now:
+                    continue
+                if p.attempts > self.retries:
+                    self.timeouts += 1
+                    expired.append(p)
+                    nxt = self._finish(p)
+                    if nxt is not None:
+                        self._start(nxt, now)
+                        resend.append(nxt)
+                    continue
+                p.rto = min(p.rto * 2, self.max_timeout)
+                p.deadline = now + p.rto
+                p.attempts += 1
+                self.retransmits += 1
+                resend.append(p)
+        for p in expired:
+            p.future.set_result(CommandResult(p.ip, p.command, "timeout", p.attempts, error="no ACK"))
+        for p in resend:
+            self._transmit(p)
+
+    def next_deadline(self) -> float | None:
+        """最早的重送/逾時時間（monotonic）；沒有在途指令時為 None"""
+        with self._lock:
+            return min((p.deadline for p in self._inflight.values()), default=None)
+
+    @property
+    def max_duration(self) -> float:
+        """一筆指令從送出到確定 timeout 最久的秒數"""
+        total, rto = 0.0, self.timeout
+        for _ in range(self.retries + 1):
+            total += rto
+            rto = min(rto * 2, self.max_timeout)
+        return total
+
+    # ---------------- 其它 ----------------
+    def close(self):
+        """結束所有在途與排隊中的指令（cancelled）"""
+        with self._lock:
+            pending = list(self._inflight.values()) + [p for q in self._queued.values() for p in q]
+            self._inflight.clear()
+            self._queued.clear()
+            self._per_ip.clear()
+        for p in pending:
+            p.future.set_result(CommandResult(p.ip, p.command, "cancelled", p.attempts, error="channel closed"))
+
+    def stats(self) -> dict:
+        with self._lock:
+            inflight = len(self._inflight)
+            queued = sum(len(q) for q in self._queued.values())
+        return {"inflight": inflight, "queued": queued, "sent": self.sent, "retransmits": self.retransmits,
+                "acked": self.acked, "errors": self.errors, "timeouts": self.timeouts,
+                "stray_acks": self.stray_acks, "send_failures": self.send_failures}
+
+
+def wait_results(futures: dict, timeout: float | None = None) -> dict:
+    """{key: Future} -> {key: CommandResult}；逾時未完成的記為 timeout"""
+    wait(list(futures.values()), timeout=timeout)
+    out = {}
+    for key, f in futures.items():
+        if f.done():
+            out[key] = f.result()
+        else:
+            out[key] = CommandResult(str(key), "", "timeout", error="wait timed out")
+    return out
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""本地設定檔（line_config.json）路徑與讀寫。"""
+
+import json
+import os
+import sys
+
+# 在打包後使用 exe 目錄，開發時使用 main.py 所在目錄
+if getattr(sys, "frozen", False):
+    APP_DIR = os.path.dirname(sys.executable)
+else:
+    APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG_PATH = os.path.join(APP_DIR, "line_config.json")
+
+
+def load_line_config(path: str = CONFIG_PATH) -> dict:
+    """讀取設定檔；檔案不存在時丟出 FileNotFoundError。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f) or {}
+
+
+def save_line_config(data: dict, path: str = CONFIG_PATH) -> None:
+    """寫入設定檔；若檔案已存在且含有 channel_secret，就保留舊 secret。"""
+    data = dict(data)
+    data.setdefault("channel_secret", "(stored)")  # 不把 secret 顯示在 UI；僅在檔案內保存/載入
+    existing = {}
+    if os.path.isfile(path):
+        try:
+            existing = load_line_config(path)
+        except Exception:
+            existing = {}
+    if "channel_secret" in existing and isinstance(existing["channel_secret"], str):
+        data["channel_secret"] = existing["channel_secret"]
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def has_channel_secret(data: dict) -> bool:
+    secret = data.get("channel_secret")
+    return isinstance(secret, str) and bool(secret)
@@ -0,0 +1,696 @@
+# -*- coding: utf-8 -*-
+"""
+擷取/分析核心：UDP 接收、REPORT 解析、影像組幀與警報邏輯。
+
+不 import tkinter / matplotlib；GUI 只是其中一個訂閱者（subscriber），
+headless 節點直接使用 Engine 即可。
+"""
+
+import selectors
+import socket
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from .analytics import FrameAnalyzer
+from .background import DEFAULT_K, BackgroundModel
+from .codec import DEFAULT_KEYFRAME_INTERVAL, ENCODINGS
+from .commands import ACK_PREFIX, CommandChannel, CommandResult, threshold_command, wait_results
+from .frames import CHUNK_MAGIC, FRAME_SLOTS, ChunkAssembler, FrameRing
+from .history import FrameHistory, history_layout
+from .hotspot import HotspotTracker
+from .line import AlertDigest, LineAlerter, LineConfig, LineDispatcher
+from .metrics import Histogram
+from .report import BIN_REPORT_MAGIC, Report, parse_binary_report, parse_report
+from .roi import RoiStats, rois_for
+
+# --------------------------------
+# 參數（預設值，可於 GUI / CLI 覆寫）
+# --------------------------------
+DEFAULT_BIND_IP = ""           # 留空 => 綁定所有介面 (0.0.0.0)
+DEFAULT_STM32_IP = "192.168.5.11"
+STM32_CMD_PORT = 1234
+STM32_IMG_PORT = 1235
+TEMP_MIN = 20
+TEMP_MAX = 60
+PIX_H, PIX_W = 24, 32
+DIFF_THRESHOLD = 2.0           # diff_mask：與上一幀溫差門檻（°C）
+FRAME_TIMEOUT = 2.0            # 未完成的幀超過此秒數即丟棄
+DEFAULT_DEVICE = "default"     # 單機模式下所有封包歸到同一台
+MAX_DEVICES = 256              # 多機模式下最多追蹤的來源位址數
+RCVBUF_BYTES = 1 << 20         # 多台同時送時，加大核心接收緩衝
+SCRATCH_BYTES = 4096           # 共用接收緩衝：容得下一整幀 float32（3072 B）+ HVT1 header，不截斷
+ALERT_SOURCES = ("device", "host", "hotspot", "roi")  # LINE 警報依據：裝置 REPORT、主機重算值、擴散中的熱點或各 ROI
+IMG_FORMATS = ("raw", "auto")  # raw：舊版 float32 串流；auto：另外辨識帶 HVT1 header 的分塊封包
+
+
+def _log_command_result(future):
+    result = future.result()
+    if result.status != "ok":
+        print(f"[CMD] {result.command}: {result}")
+
+
+def get_local_ip_for(remote_ip: str) -> str:
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect((remote_ip, 9))  # 任意 UDP 埠
+        return s.getsockname()[0]
+    except Exception:
+        return "(unknown)"
+    finally:
+        s.close()
+
+
+class DeviceState:
+    """單一 STM32 的狀態：影像環、最新 REPORT 與警報狀態。"""
+
+    def __init__(self, device_id: str, line_config: LineConfig, slots: int = FRAME_SLOTS,
+                 analyzer: FrameAnalyzer | None = None, dispatcher: LineDispatcher | None = None,
+                 digest: AlertDigest | None = None, background: BackgroundModel | None = None,
+                 tracker: HotspotTracker | None = None, rois: RoiStats | None = None,
+                 history: FrameHistory | None = None):
+        self.device_id = device_id
+        self.ring = FrameRing(PIX_H, PIX_W, slots)
+        self.chunks = ChunkAssembler(self.ring)
+        self.frames_completed = 0
+        self.frames_timeout = 0        # raw 串流逾時丟棄的不完整幀
+        self.diff_mask = np.zeros((PIX_H, PIX_W), dtype=bool)
+        self._diff_tmp = np.empty((PIX_H, PIX_W), dtype=np.float32)
+        self.background = background              # 逐像素背景模型（可選）：統計門檻的 diff_mask + 降噪幀
+        self.last_report: Report | None = None
+        self.reports_received = 0
+        self.parse_errors = 0
+        self.img_packets = 0
+        self.cmd_packets = 0
+        self.lag_hist = Histogram()    # 幀的第一包 → 處理完（Engine.timing 時才記錄）
+        self.analyzer = analyzer                  # 主機端重算 D1–D10（可選）
+        self.host_report: Report | None = None
+        self.tracker = tracker                    # 熱點偵測與追蹤（可選）
+        self.rois = rois                          # 各 ROI 的統計（可選）
+        self.history = history                    # 最近 N 幀的歷史環（可選，GUI 回看用）
+        # 每個 ROI 自己的 OVER/冷卻狀態（alert_source="roi"）；digest 中以 "device/roi" 列出
+        self.roi_alerters = [LineAlerter(line_config, dispatcher, device_id=f"{device_id}/{name}", digest=digest)
+                             for name in rois.names] if rois is not None else []
+        # 共用設定、dispatcher 與 digest，各自的 OVER/冷卻狀態
+        self.alerter = LineAlerter(line_config, dispatcher, device_id=device_id, digest=digest)
+        self.last_seen = 0.0
+
+    @property
+    def alarm(self) -> int:
+        return self.last_report.alarm if self.last_report is not None else 0
+
+    @property
+    def hotspots(self) -> list:
+        """本幀的熱點軌跡（沒開熱點追蹤時為空）"""
+        return self.tracker.active if self.tracker is not None else []
+
+    @property
+    def frame_seq(self) -> int:
+        """已完成的幀數；變了表示有新幀"""
+        return self.ring.seq
+
+    @property
+    def frame_data(self) -> np.ndarray:
+        """最新完成的幀（ring slot 的 view，不複製）"""
+        return self.ring.latest_frame()
+
+    @property
+    def last_frame(self) -> np.ndarray:
+        return self.ring.previous_frame()
+
+    @property
+    def display_frame(self) -> np.ndarray:
+        """顯示用的幀：有背景模型時為降噪幀，否則同 frame_data"""
+        return self.background.denoised if self.background is not None else self.ring.latest_frame()
+
+    def expire_partial(self, now: float):
+        """丟棄超過 FRAME_TIMEOUT 仍未完成的幀（raw 組到一半的 slot、分塊格式缺塊的幀）"""
+        ring = self.ring
+        if ring.filled and now - ring.started_at > FRAME_TIMEOUT:
+            print(f"[WARN] {self.device_id}: Timeout, incomplete frame")
+            self.frames_timeout += 1
+            ring.reset_partial()
+        chunks = self.chunks
+        if chunks.chunks_got and not chunks.complete and now - ring.started_at > FRAME_TIMEOUT:
+            print(f"[WARN] {self.device_id}: Timeout, incomplete chunked frame {chunks.frame_id}")
+            chunks.drop_partial()
+
+    def begin_packet(self, now: float) -> memoryview:
+        """準備收一個影像封包；回傳可直接 recv_into 的 buffer。"""
+        self.expire_partial(now)
+        ring = self.ring
+        if ring.filled == 0:
+            ring.started_at = now
+        return ring.write_view()
+
+    def end_packet(self, nbytes: int) -> bool:
+        """記錄收到的 byte 數；湊滿一幀時發佈到 ring 並更新 diff_mask，回 True。"""
+        if not self.ring.commit(nbytes):
+            return False
+        self.ring.publish()
+        self._on_published()
+        return True
+
+    def feed_chunk(self, buf: memoryview, nbytes: int, now: float) -> bool:
+        """處理一個 HVT1 分塊封包；湊齊一幀時回 True。"""
+        self.expire_partial(now)
+        if not self.chunks.feed(buf, nbytes, now):
+            return False
+        self._on_published()
+        return True
+
+    @property
+    def frames_dropped(self) -> int:
+        return self.frames_timeout + self.chunks.frames_dropped
+
+    def _on_published(self):
+        self.frames_completed += 1
+        if self.background is not None:
+            np.copyto(self.diff_mask, self.background.update(self.frame_data))
+            return
+        # diff_mask = |frame - last_frame| > DIFF_THRESHOLD，全部寫入預先配置的陣列
+        np.subtract(self.frame_data, self.last_frame, out=self._diff_tmp)
+        np.abs(self._diff_tmp, out=self._diff_tmp)
+        np.greater(self._diff_tmp, DIFF_THRESHOLD, out=self.diff_mask)
+
+
+class Engine:
+    """
+    持有 socket、單一接收執行緒（selector）與各裝置狀態。
+
+    單機模式：所有封包歸到 DEFAULT_DEVICE（與舊版相同，接受任何來源）。
+    多機模式：依來源 IP 分流到各自的 DeviceState，一個行程一條執行緒服務所有裝置。
+
+    訂閱者回呼在接收執行緒上執行：
+      - on_report(dev: DeviceState, report: Report)
+      - on_frame(dev: DeviceState, frame: np.ndarray[PIX_H, PIX_W], diff_mask: np.ndarray[bool])
+    GUI 需自行轉回 Tk 執行緒。frame 是 ring slot 的 view，之後 FRAME_SLOTS-1 幀內有效，
+    要長期保留請自行 copy。
+    """
+
+    def __init__(self, bind_ip: str = DEFAULT_BIND_IP, stm32_ip: str = DEFAULT_STM32_IP,
+                 cmd_port: int = STM32_CMD_PORT, img_port: int = STM32_IMG_PORT,
+                 multi: bool = False, line_config: LineConfig | None = None,
+                 img_format: str = "raw", encoding: str | None = None,
+                 analytics: bool = False, alert_source: str = "device",
+                 line_dispatcher: LineDispatcher | None = None,
+                 background: bool = False, background_k: float = DEFAULT_K, hotspots: bool = False,
+                 roi_config: dict | None = None, history: int = 0, history_encoding: str = "i16",
+                 command_acks: bool = False):
+        if img_format not in IMG_FORMATS:
+            raise ValueError(f"img_format must be one of {IMG_FORMATS}")
+        if alert_source not in ALERT_SOURCES:
+            raise ValueError(f"alert_source must be one of {ALERT_SOURCES}")
+        if history:
+            history_layout(PIX_H, PIX_W, history, history_encoding)   # 檢查參數
+        self.bind_ip = bind_ip
+        self.stm32_ip = stm32_ip
+        self.cmd_port = cmd_port
+        self.img_port = img_port
+        self.multi = multi
+        self.img_format = img_format
+        self.encoding = encoding       # 新裝置上線時要求的像素編碼（None = 不要求）
+        self.analytics = analytics or alert_source == "host"
+        self.alert_source = alert_source
+        self.background = background   # diff_mask 改用逐像素背景模型（k 個標準差），並提供降噪顯示幀
+        self.background_k = background_k
+        self.hotspots = hotspots or alert_source == "hotspot"
+        self.roi_config = roi_config   # {device_id 或 "*": [Roi, ...]}（見 roi.py）
+        self.history = history         # 每台保留的幀數（0 = 不保留），見 history.py
+        self.history_encoding = history_encoding
+        self.thresholds = {"alarm": 30.0, "slope": 2.0, "diffusion": 1.2}
+        self.line_config = line_config or LineConfig()
+        self.line_dispatcher = line_dispatcher or LineDispatcher()
+        self._owns_dispatcher = line_dispatcher is None   # 外部傳入的 dispatcher 由呼叫端關閉
+        self.line_digest = AlertDigest(self.line_config, self.line_dispatcher, clock=self._alert_now)
+        self.alert_clock = None        # 重播時換成錄製時間（回傳 datetime）；None = 現在時間
+        # last_seen（monotonic）→ wall-clock 的差；重播時 last_seen 已是錄製時間，設為 0.0
+        # None = 每次以 time.time() - time.monotonic() 換算
+        self.wall_offset = None
+        # 指令加序號、等 ACK、逾時重送（需韌體支援，見 commands.py）；None = 舊版單發
+        self.command_acks = command_acks
+        self.commands = None
+        self._wake_r = self._wake_w = None
+        if command_acks:
+            # 送出新指令時喚醒接收迴圈：不必等目前的 select 逾時才開始算重送時間
+            self._wake_r, self._wake_w = socket.socketpair()
+            self._wake_r.setblocking(False)
+            self._wake_w.setblocking(False)
+            self.commands = CommandChannel(self._sendto_cmd, on_submit=self._wake)
+
+        self.sock_cmd: socket.socket | None = None
+        self.sock_img: socket.socket | None = None
+        self.sockets_ready = False
+        self.threads_started = False
+        self._stop = threading.Event()
+
+        self.devices: dict[str, DeviceState] = {}
+        self._devices_lock = threading.Lock()
+        self.packets_rejected = 0      # 超過 MAX_DEVICES 的來源
+
+        # 延遲直方圖（見 metrics.py）；每幀多兩次取時間，預設關閉
+        self.timing = False
+        self.parse_hist = Histogram()
+        self.frame_hist = Histogram()
+
+        # 多機模式／分塊格式：影像封包先收進共用緩衝，分流後一次複製到該裝置的 ring slot
+        self._scratch = bytearray(SCRATCH_BYTES)
+        self._scratch_mv = memoryview(self._scratch)
+
+        self._report_subs = []
+        self._frame_subs = []
+        self._device_subs = []
+        self._stats_subs = []
+        self._hotspot_subs = []
+        self._roi_subs = []
+
+    # ---------------- 訂閱 ----------------
+    def subscribe(self, on_report=None, on_frame=None, on_device=None, on_stats=None, on_hotspots=None,
+                  on_rois=None):
+        """
+        on_stats(dev, report)：主機端由影像重算的 Report（需 analytics）
+        on_hotspots(dev, tracks)：每幀的熱點軌跡 list[Hotspot]（需 hotspots）
+        on_rois(dev, stats)：每幀的 RoiStats（該裝置有設定 ROI 時）
+        """
+        if on_report is not None:
+            self._report_subs.append(on_report)
+        if on_frame is not None:
+            self._frame_subs.append(on_frame)
+        if on_device is not None:
+            self._device_subs.append(on_device)
+        if on_stats is not None:
+            self._stats_subs.append(on_stats)
+        if on_hotspots is not None:
+            self._hotspot_subs.append(on_hotspots)
+        if on_rois is not None:
+            self._roi_subs.append(on_rois)
+
+    # ---------------- 裝置 ----------------
+    def device_key(self, ip: str) -> str:
+        return ip if self.multi else DEFAULT_DEVICE
+
+    def get_device(self, ip: str) -> DeviceState | None:
+        """依來源 IP 取得（必要時建立）裝置狀態；超過 MAX_DEVICES 回 None。"""
+        key = self.device_key(ip)
+        dev = self.devices.get(key)
+        if dev is not None:
+            return dev
+        with self._devices_lock:
+            if len(self.devices) >= MAX_DEVICES:
+                return None
+            analyzer = FrameAnalyzer(PIX_H * PIX_W, **self.thresholds) if self.analytics else None
+            background = BackgroundModel((PIX_H, PIX_W), k=self.background_k) if self.background else None
+            tracker = HotspotTracker(PIX_H, PIX_W, hot_threshold=self.thresholds["alarm"]) if self.hotspots else None
+            rois = rois_for(self.roi_config, key)
+            rois = RoiStats(rois, PIX_H, PIX_W, alarm=self.thresholds["alarm"],
+                            slope=self.thresholds["slope"]) if rois else None
+            history = FrameHistory(PIX_H, PIX_W, self.history, self.history_encoding) if self.history else None
+            dev = self.devices.setdefault(key, DeviceState(key, self.line_config, analyzer=analyzer,
+                                                            dispatcher=self.line_dispatcher,
+                                                            digest=self.line_digest,
+                                                            background=background, tracker=tracker,
+                                                            rois=rois, history=history))
+        print(f"[NET] new device: {key} ({ip})")
+        if self.encoding:
+            try:
+                self.request_encoding(self.encoding, ip)
+            except Exception as e:
+                print("[CMD] request encoding failed:", e)
+        for cb in self._device_subs:
+            cb(dev)
+        return dev
+
+    def device_ip(self, device_id: str) -> str:
+        return self.stm32_ip if device_id == DEFAULT_DEVICE else device_id
+
+    # ---------------- Socket ----------------
+    def open(self):
+        """依 bind_ip 重新綁定指令/影像 socket；失敗時丟出 OSError。"""
+        self.close()
+        bind = self.bind_ip or ""
+        socks = []
+        try:
+            for port in (self.cmd_port, self.img_port):
+                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                socks.append(s)
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                try:
+                    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_BYTES)
+                except OSError:
+                    pass
+                s.setblocking(False)
+                s.bind((bind, port))
+        except Exception:
+            for s in socks:
+                s.close()
+            raise
+
+        self.sock_cmd, self.sock_img = socks
+        self.sockets_ready = True
+        print(f"[NET] bind=({bind or '0.0.0.0'}) cmd:{self.cmd_port} img:{self.img_port} "
+              f"-> remote:{'(multi)' if self.multi else self.stm32_ip}")
+
+    def close(self):
+        self.sockets_ready = False
+        for s in (self.sock_cmd, self.sock_img):
+            try:
+                if s:
+                    s.close()
+            except Exception:
+                pass
+        self.sock_cmd = None
+        self.sock_img = None
+
+    def send_command(self, cmd: str, ip: str | None = None):
+        """
+        送出一筆指令到 STM32（預設 stm32_ip）；socket 未就緒時丟出 RuntimeError。
+        開啟 command_acks 時回傳 Future[CommandResult]（收到 ACK / 重送後仍逾時才完成），否則回傳 None。
+        """
+        if not self.sockets_ready or self.sock_cmd is None:
+            raise RuntimeError("command socket not ready")
+        ip = (ip or self.stm32_ip).strip()
+        if self.commands is None:
+            self.sock_cmd.sendto(cmd.encode(), (ip, self.cmd_port))
+            print("[CMD] Sent:", cmd)
+            return None
+        future = self.commands.submit(ip, cmd)
+        print(f"[CMD] Sent: {cmd} -> {ip}")
+        future.add_done_callback(_log_command_result)
+        return future
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass                       # 已有未讀的喚醒位元組就夠了
+
+    def _drain_wake(self, sock: socket.socket, _now: float):
+        try:
+            sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _sendto_cmd(self, data: bytes, ip: str):
+        sock = self.sock_cmd
+        if not self.sockets_ready or sock is None:
+            raise OSError("command socket not ready")
+        sock.sendto(data, (ip, self.cmd_port))
+
+    def send_batch(self, commands: dict, timeout: float | None = None) -> dict:
+        """
+        {ip: 指令} 同時送給多台，等全部有結果後回傳 {ip: CommandResult}。
+        未開 command_acks 時只能確定有送出（status="sent"）。
+        """
+        if not self.sockets_ready or self.sock_cmd is None:
+            raise RuntimeError("command socket not ready")
+        if self.commands is None:
+            results = {}
+            for ip, cmd in commands.items():
+                try:
+                    self.sock_cmd.sendto(cmd.encode(), (ip, self.cmd_port))
+                    results[ip] = CommandResult(ip, cmd, "sent", 1)
+                except OSError as e:
+                    results[ip] = CommandResult(ip, cmd, "error", 1, error=str(e))
+            return results
+        futures = self.commands.submit_many(commands)
+        if timeout is None:
+            # 同一台前面還有排隊的指令時要多等幾輪
+            timeout = self.commands.max_duration * 2 + 1.0
+        results = wait_results(futures, timeout)
+        ok = sum(1 for r in results.values() if r.ok)
+        print(f"[CMD] batch: {ok}/{len(results)} acknowledged")
+        return results
+
+    def apply_thresholds(self, ips: list, alarm: float, slope: float, diffusion: float, interval_ms: int,
+                         timeout: float | None = None) -> dict:
+        """把一組門檻下發給多台（同時在途），並更新主機端分析門檻；回傳 {ip: CommandResult}"""
+        self.set_thresholds(alarm, slope, diffusion)
+        cmd = threshold_command(alarm, slope, diffusion, interval_ms)
+        return self.send_batch({ip: cmd for ip in ips}, timeout)
+
+    def set_thresholds(self, alarm: float, slope: float, diffusion: float):
+        """更新主機端分析門檻（與送給裝置的 SET_THRESH D1/D2/D3 相同）"""
+        self.thresholds = {"alarm": alarm, "slope": slope, "diffusion": diffusion}
+        for dev in list(self.devices.values()):
+            if dev.analyzer is not None:
+                dev.analyzer.set_thresholds(**self.thresholds)
+            if dev.tracker is not None:
+                dev.tracker.hot_threshold = alarm
+            if dev.rois is not None:
+                dev.rois.set_thresholds(alarm, slope)
+
+    def set_line_config(self, cfg: LineConfig):
+        """就地更新 LINE 設定（各裝置的 alerter 與 digest 持有同一個物件）"""
+        if cfg is not self.line_config:
+            self.line_config.update_from(cfg)
+
+    def request_encoding(self, name: str, ip: str | None = None,
+                         keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL):
+        """要求裝置改用指定的像素編碼（f32/i16/f16/delta）；實際編碼以封包 flags 為準。"""
+        if name not in ENCODINGS:
+            raise ValueError(f"encoding must be one of {tuple(ENCODINGS)}")
+        cmd = f"SET_ENCODING={name.upper()}"
+        if name == "delta":
+            cmd += f",KEY={keyframe_interval}"
+        self.send_command(cmd, ip)
+
+    # ---------------- 執行緒 ----------------
+    def start(self) -> bool:
+        """啟動接收執行緒；已在運行時回 False。"""
+        if self.threads_started:
+            return False
+        self._stop.clear()
+        threading.Thread(target=self._loop, daemon=True).start()
+        self.threads_started = True
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self.close()
+        self.threads_started = False
+        if self.commands is not None:
+            self.commands.close()
+        self.line_digest.close()           # 先送出最後一個摘要視窗，再關 dispatcher
+        if self._owns_dispatcher:
+            self.line_dispatcher.close()
+
+    # ---------------- 處理 ----------------
+    def _alert(self, dev: DeviceState, report: Report):
+        self._maybe_send(dev, report.max_temp, report.avg_temp, report.diff_area, int(report.alarm))
+
+    def _alert_hotspot(self, dev: DeviceState):
+        """有擴散中的熱點就視為 OVER（沿用 alerter 的 NORMAL→OVER / 冷卻 / digest 邏輯）；DiffArea 為熱點面積"""
+        growing = dev.tracker.growing()
+        if growing:
+            worst = max(growing, key=lambda tr: tr.area)
+            self._maybe_send(dev, worst.peak, worst.mean, worst.area, 1)
+        else:
+            self._maybe_send(dev, 0.0, 0.0, 0, 0)
+
+    def _alert_now(self) -> datetime:
+        clock = self.alert_clock
+        return clock() if clock is not None else datetime.now()
+
+    def _alert_rois(self, dev: DeviceState):
+        """每個 ROI 各自依自己的門檻觸發；DiffArea 為該 ROI 的 Over Count"""
+        st = dev.rois
+        clock = self.alert_clock
+        now = clock() if clock is not None else None
+        for k, alerter in enumerate(dev.roi_alerters):
+            try:
+                alerter.maybe_send(max_val=float(st.max[k]), avg_val=float(st.avg[k]),
+                                   diff_area=int(st.over_count[k]), alarm_now=int(st.alarm[k]), now=now)
+            except Exception as e:
+                print("[LINE SEND GUARD ERROR]", e)
+
+    def _maybe_send(self, dev: DeviceState, max_val: float, avg_val: float, diff_area: int, alarm: int):
+        try:
+            clock = self.alert_clock
+            dev.alerter.maybe_send(max_val=max_val, avg_val=avg_val, diff_area=diff_area, alarm_now=alarm,
+                                   now=clock() if clock is not None else None)
+        except Exception as e:
+            print("[LINE SEND GUARD ERROR]", e)
+
+    def handle_report(self, dev: DeviceState, report: Report):
+        dev.last_report = report
+        dev.reports_received += 1
+        if self.alert_source == "device":
+            self._alert(dev, report)
+        for cb in self._report_subs:
+            cb(dev, report)
+
+    def wall_time(self, t: float) -> float:
+        """Engine 的時間（dev.last_seen）換成 wall-clock 秒"""
+        offset = self.wall_offset
+        return t + (time.time() - time.monotonic() if offset is None else offset)
+
+    def handle_frame(self, dev: DeviceState):
+        if dev.history is not None:
+            dev.history.push(dev.frame_data, self.wall_time(dev.last_seen), dev.alarm)
+        for cb in self._frame_subs:
+            cb(dev, dev.frame_data, dev.diff_mask)
+        if dev.analyzer is not None:
+            stats = dev.analyzer.update(dev.frame_data, dev.last_seen)
+            dev.host_report = stats
+            if self.alert_source == "host":
+                self._alert(dev, stats)
+            for cb in self._stats_subs:
+                cb(dev, stats)
+        if dev.tracker is not None:
+            tracks = dev.tracker.update(dev.frame_data, dev.diff_mask, dev.last_seen)
+            if self.alert_source == "hotspot":
+                self._alert_hotspot(dev)
+            for cb in self._hotspot_subs:
+                cb(dev, tracks)
+        if dev.rois is not None:
+            dev.rois.update(dev.frame_data, dev.last_seen)
+            if self.alert_source == "roi":
+                self._alert_rois(dev)
+            for cb in self._roi_subs:
+                cb(dev, dev.rois)
+
+    # ---------------- 非 UDP 來源（重播等） ----------------
+    def feed_report(self, device_id: str, report: Report, now: float):
+        """由外部來源送入一筆 REPORT，與 UDP 收到的相同處理。"""
+        dev = self.get_device(device_id)
+        if dev is None:
+            return
+        dev.last_seen = now
+        self.handle_report(dev, report)
+
+    def feed_frame(self, device_id: str, frame: np.ndarray, now: float) -> bool:
+        """由外部來源送入一整幀 float32 像素，走與 raw 串流相同的組幀路徑；完成時回 True。"""
+        dev = self.get_device(device_id)
+        if dev is None:
+            return False
+        dev.last_seen = now
+        data = memoryview(np.ascontiguousarray(frame, dtype=np.float32)).cast("B")
+        dev.begin_packet(now)
+        if not dev.end_packet(dev.ring.write_from(data, len(data))):
+            return False
+        self.handle_frame(dev)
+        return True
+
+    def _frame_received(self, dev: DeviceState):
+        if not self.timing:
+            self.handle_frame(dev)
+            return
+        t0 = time.monotonic()
+        self.handle_frame(dev)
+        t1 = time.monotonic()
+        self.frame_hist.observe(t1 - t0)
+        dev.lag_hist.observe(t1 - dev.ring.started_at)
+
+    def _drain_cmd(self, sock: socket.socket, now: float):
+        # 一次最多取 256 包，避免單一 socket 餓死另一個
+        for _ in range(256):
+            try:
+                data, addr = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            if data.startswith(ACK_PREFIX):
+                if self.commands is not None:
+                    self.commands.on_ack(addr[0], data.decode(errors="ignore"))
+                continue
+            if data.startswith(BIN_REPORT_MAGIC):
+                parse, msg = parse_binary_report, data
+            elif data.startswith(b"REPORT"):
+                parse, msg = parse_report, data.decode(errors="ignore").strip()
+            else:
+                continue
+            dev = self.get_device(addr[0])
+            if dev is None:
+                self.packets_rejected += 1
+                continue
+            dev.last_seen = now
+            dev.cmd_packets += 1
+            try:
+                if self.timing:
+                    t0 = time.perf_counter()
+                    report = parse(msg)
+                    self.parse_hist.observe(time.perf_counter() - t0)
+                else:
+                    report = parse(msg)
+            except Exception as e:
+                dev.parse_errors += 1
+                print(f"[ERR] Parse REPORT ({dev.device_id}):", e)
+                continue
+            self.handle_report(dev, report)
+
+    def _drain_img(self, sock: socket.socket, now: float):
+        if not self.multi and self.img_format == "raw":
+            # 單機 raw：直接 recv_into 到 ring slot 的正確位移，零複製
+            dev = self.get_device(DEFAULT_DEVICE)
+            for _ in range(256):
+                try:
+                    nbytes, _addr = sock.recvfrom_into(dev.begin_packet(now))
+                except (BlockingIOError, InterruptedError):
+                    return
+                dev.last_seen = now
+                dev.img_packets += 1
+                if dev.end_packet(nbytes):
+                    self._frame_received(dev)
+            return
+
+        scratch = self._scratch_mv
+        detect = self.img_format == "auto"
+        for _ in range(256):
+            try:
+                nbytes, addr = sock.recvfrom_into(scratch)
+            except (BlockingIOError, InterruptedError):
+                return
+            dev = self.get_device(addr[0])
+            if dev is None:
+                self.packets_rejected += 1
+                continue
+            dev.last_seen = now
+            dev.img_packets += 1
+            if detect and self._scratch.startswith(CHUNK_MAGIC):
+                done = dev.feed_chunk(scratch, nbytes, now)
+            else:
+                dev.begin_packet(now)
+                done = dev.end_packet(dev.ring.write_from(scratch, nbytes))
+            if done:
+                self._frame_received(dev)
+
+    def _loop(self):
+        """單一 selector 迴圈同時服務指令與影像 socket、所有裝置。"""
+        sel = None
+        registered = None
+        while not self._stop.is_set():
+            try:
+                if not self.sockets_ready or self.sock_cmd is None or self.sock_img is None:
+                    time.sleep(0.1)
+                    continue
+                # socket 重新綁定（Apply Network）後重建 selector
+                if registered != (self.sock_cmd, self.sock_img):
+                    if sel is not None:
+                        sel.close()
+                    sel = selectors.DefaultSelector()
+                    sel.register(self.sock_cmd, selectors.EVENT_READ, self._drain_cmd)
+                    sel.register(self.sock_img, selectors.EVENT_READ, self._drain_img)
+                    if self._wake_r is not None:
+                        sel.register(self._wake_r, selectors.EVENT_READ, self._drain_wake)
+                    registered = (self.sock_cmd, self.sock_img)
+
+                timeout = 0.5
+                deadline = self.commands.next_deadline() if self.commands is not None else None
+                if deadline is not None:
+                    timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+                events = sel.select(timeout=timeout)
+                if events:
+                    now = time.monotonic()   # 每批封包取一次時間
+                    for key, _ in events:
+                        key.data(key.fileobj, now)
+                if self.commands is not None:
+                    self.commands.poll()
+            except OSError:
+                registered = None
+                time.sleep(0.1)
+            except Exception as e:
+                print("[RECV ERR]", e)
+                time.sleep(0.1)
+        if sel is not None:
+            sel.close()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+預先配置的影像環形緩衝（frame ring）。
+
+每台裝置一塊 (slots, PIX_H*PIX_W) float32 記憶體；封包直接 recv_into 到
+目前組幀中的 slot 的正確位移，完成後只交出 slot 索引（不複製）。
+穩態下不再配置任何影像緩衝。
+"""
+
+import struct
+
+import numpy as np
+
+from .codec import ELEM_SIZE, ENC_DELTA, ENC_F32, ENC_MASK, decode_into
+
+FRAME_SLOTS = 4                # 環大小；交出的 frame view 在之後 slots-1 幀內保持有效
+
+# --------------------------------
+# 分塊影像封包（可選格式）
+#   magic "HVT1" | frame_id u16 | chunk_idx u8 | chunk_count u8 | pix_offset u16 | flags u8 | pad
+#   之後接像素；pix_offset 為此塊第一個像素在幀內的位置，
+#   flags 低 4 bits 為像素編碼（見 codec.py，0 = float32）。
+# 未帶 magic 的封包視為舊版 raw float32 串流。
+# --------------------------------
+CHUNK_MAGIC = b"HVT1"
+CHUNK_HEADER = struct.Struct("<4sHBBHBx")
+MAX_CHUNKS = 256
+STALE_WINDOW = 8               # 比目前舊 8 個 frame_id 以內視為遲到封包；更舊表示裝置重啟，重新同步
+_NO_CHUNKS = bytes(MAX_CHUNKS)
+
+
+def pack_chunk(frame_id: int, chunk_idx: int, chunk_count: int, pix_offset: int,
+               payload: bytes, flags: int = 0) -> bytes:
+    return CHUNK_HEADER.pack(CHUNK_MAGIC, frame_id & 0xFFFF, chunk_idx, chunk_count,
+                             pix_offset, flags) + payload
+
+
+def split_frame(frame: np.ndarray, frame_id: int, chunk_pixels: int = 256) -> list:
+    """把一幀（float32）切成分塊封包（模擬器/測試用）。"""
+    flat = np.ascontiguousarray(frame, dtype=np.float32).reshape(-1)
+    return split_payload(flat.tobytes(), ENC_F32, frame_id, chunk_pixels)
+
+
+def split_payload(payload: bytes, enc: int, frame_id: int, chunk_pixels: int = 256) -> list:
+    """把已編碼的整幀像素切成分塊封包。"""
+    elem = ELEM_SIZE[enc]
+    npix = len(payload) // elem
+    count = (npix + chunk_pixels - 1) // chunk_pixels
+    return [pack_chunk(frame_id, i, count, i * chunk_pixels,
+                       payload[i * chunk_pixels * elem:(i + 1) * chunk_pixels * elem], enc)
+            for i in range(count)]
+
+
+def _fid_stale(fid: int, current: int) -> bool:
+    """frame_id 以 16-bit 迴繞比較：fid 是否為 current 之前不久的舊幀"""
+    return 0 < ((current - fid) & 0xFFFF) <= STALE_WINDOW
+
+
+class FrameRing:
+    def __init__(self, height: int, width: int, slots: int = FRAME_SLOTS):
+        if slots < 2:
+            raise ValueError("FrameRing needs at least 2 slots")
+        self.height = height
+        self.width = width
+        self.slots = slots
+        self.frame_bytes = height * width * 4
+
+        self.buf = np.zeros((slots, height * width), dtype=np.float32)
+        self._frames = [self.buf[i].reshape((height, width)) for i in range(slots)]
+        self._bytes = [memoryview(self.buf[i]).cast("B") for i in range(slots)]
+
+        self.write_idx = 0         # 組幀中的 slot
+        self.filled = 0            # 已寫入的 byte 數
+        self.started_at = 0.0      # 本幀第一包的時間
+        self.latest = slots - 1    # 最新完成的 slot（初始為全 0 的空幀）
+        self.seq = 0               # 已完成幀數
+
+    # ---------------- 讀取 ----------------
+    def frame(self, idx: int) -> np.ndarray:
+        """slot 的 (H, W) view（不複製）。"""
+        return self._frames[idx]
+
+    def latest_frame(self) -> np.ndarray:
+        return self._frames[self.latest]
+
+    def previous_frame(self) -> np.ndarray:
+        return self._frames[(self.latest - 1) % self.slots]
+
+    # ---------------- 寫入 ----------------
+    def reset_partial(self):
+        self.filled = 0
+
+    def write_view(self) -> memoryview:
+        """目前 slot 尚未填的部分，給 recv_into 直接寫入。"""
+        return self._bytes[self.write_idx][self.filled:]
+
+    def write_pixels(self) -> np.ndarray:
+        """目前 slot 的一維 float32 view，給解碼器直接寫入。"""
+        return self.buf[self.write_idx]
+
+    def latest_pixels(self) -> np.ndarray:
+        return self.buf[self.latest]
+
+    def write_from(self, src, nbytes: int) -> int:
+        """從外部 buffer 複製（多機模式共用接收緩衝時用）；回傳實際寫入的 byte 數。"""
+        n = min(nbytes, self.frame_bytes - self.filled)
+        self._bytes[self.write_idx][self.filled:self.filled + n] = src[:n]
+        return n
+
+    def commit(self, nbytes: int) -> bool:
+        """記錄寫入的 byte 數；湊滿一幀時回 True（之後應呼叫 publish）。"""
+        self.filled += nbytes
+        return self.filled >= self.frame_bytes
+
+    def publish(self) -> int:
+        """把組好的 slot 設為最新幀並換下一個 slot；回傳 slot 索引。"""
+        self.latest = self.write_idx
+        self.write_idx = (self.write_idx + 1) % self.slots
+        self.filled = 0
+        self.seq += 1
+        return self.latest
+
+
+class ChunkAssembler:
+    """
+    分塊格式的組幀：依 chunk_idx 放到 ring slot 的位移，允許亂序。
+
+    出現更新的 frame_id 時，立即丟棄未完成的舊幀（最多損失一幀，不需等逾時）；
+    沒有新幀時由 DeviceState.expire_partial 在 FRAME_TIMEOUT 後呼叫 drop_partial；
+    比目前稍舊的遲到封包直接丟棄。
+    DELTA 編碼的幀只有在上一幀（frame_id-1）完整時才能解碼，否則等下一張關鍵幀。
+    """
+
+    def __init__(self, ring: FrameRing):
+        self.ring = ring
+        self.frame_id = -1
+        self.chunk_count = 0
+        self.chunks_got = 0
+        self.complete = False
+        self.last_fid = -1         # 最近發佈的 frame_id（DELTA 的參考幀）
+        self._seen = bytearray(MAX_CHUNKS)
+
+        # 統計
+        self.frames_dropped = 0    # 被更新的幀取代而放棄的不完整幀
+        self.chunks_lost = 0       # 上述幀中缺的塊數
+        self.stale_packets = 0     # 屬於舊幀、遲到的封包
+        self.bad_packets = 0       # header 不合理
+        self.delta_no_ref = 0      # DELTA 封包但參考幀遺失
+
+    def _start(self, frame_id: int, chunk_count: int, now: float):
+        if self.chunks_got and not self.complete:
+            self.frames_dropped += 1
+            self.chunks_lost += self.chunk_count - self.chunks_got
+        self.frame_id = frame_id
+        self.chunk_count = chunk_count
+        self.chunks_got = 0
+        self.complete = False
+        self._seen[:] = _NO_CHUNKS
+        self.ring.reset_partial()
+        self.ring.started_at = now
+
+    def drop_partial(self):
+        """逾時：放棄目前不完整的幀；之後同 frame_id 的遲到封包一律忽略"""
+        if self.chunks_got and not self.complete:
+            self.frames_dropped += 1
+            self.chunks_lost += self.chunk_count - self.chunks_got
+            self.complete = True
+
+    def feed(self, buf: memoryview, nbytes: int, now: float) -> bool:
+        """處理一個分塊封包（含 header）；湊齊一幀時發佈到 ring 並回 True。"""
+        if nbytes < CHUNK_HEADER.size:
+            self.bad_packets += 1
+            return False
+        _magic, fid, idx, count, pix_off, flags = CHUNK_HEADER.unpack_from(buf)
+        enc = flags & ENC_MASK
+        elem = ELEM_SIZE.get(enc)
+        ring = self.ring
+        npix = (nbytes - CHUNK_HEADER.size) // elem if elem else 0
+        if (elem is None or count == 0 or idx >= count
+                or (pix_off + npix) * 4 > ring.frame_bytes):
+            self.bad_packets += 1
+            return False
+        if enc == ENC_DELTA and self.last_fid != ((fid - 1) & 0xFFFF):
+            self.delta_no_ref += 1
+            return False
+
+        if fid != self.frame_id:
+            if self.frame_id >= 0 and _fid_stale(fid, self.frame_id):
+                self.stale_packets += 1
+                return False
+            self._start(fid, count, now)
+        elif self.complete or self._seen[idx]:
+            return False   # 重複封包
+
+        end = pix_off + npix
+        decode_into(enc, buf, CHUNK_HEADER.size, npix, ring.write_pixels()[pix_off:end],
+                    ring.latest_pixels()[pix_off:end] if enc == ENC_DELTA else None)
+        self._seen[idx] = 1
+        self.chunks_got += 1
+        if self.chunks_got < self.chunk_count:
+            return False
+        self.complete = True
+        self.last_fid = fid
+        ring.publish()
+        return True
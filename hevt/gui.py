@@ -0,0 +1,872 @@
+# -*- coding: utf-8 -*-
+"""Tk 視窗：Engine 的一個可選訂閱者。"""
+
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+import tkinter as tk
+from tkinter import ttk, messagebox
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+from .codec import ENCODINGS
+from .config import CONFIG_PATH, has_channel_secret, load_line_config, save_line_config
+from .engine import DEFAULT_DEVICE, Engine, PIX_H, PIX_W, TEMP_MAX, TEMP_MIN, get_local_ip_for
+from .line import DEFAULT_TEMPLATE, LineConfig, format_line_text, push_to_all_targets
+from .render import ThermalRenderer, build_lut
+
+
+DEFAULT_DISPLAY_FPS = 10
+RENDERERS = ("fast", "mpl")    # fast：查表 + PhotoImage；mpl：原本的 imshow 重繪
+FAST_SCALE = 12                # 24x32 -> 288x384
+HEADS_SCALE = 4                # All Heads 縮圖 96x128
+HEADS_COLUMNS = 6
+TREND_REFRESH_MS = 2000
+HISTORY_SPEEDS = ("0.25x", "0.5x", "1x", "2x", "4x")
+TREND_FIELDS = (("Max Temp", "max_temp"), ("Min Temp", "min_temp"), ("Avg Temp", "avg_temp"),
+                ("Max Slope", "max_slope"), ("Avg Slope", "avg_slope"), ("Over Count", "over_count"),
+                ("Diff Area", "diff_area"), ("avgT Trend", "avg_temp_trend"),
+                ("maxSlope Trend", "max_slope_trend"), ("diffArea Trend", "diff_area_trend"),
+                ("Alarm", "alarm"))
+TREND_RANGES = (("5 min", 300), ("1 hour", 3600), ("24 hours", 86400), ("7 days", 7 * 86400),
+                ("30 days", 30 * 86400))
+
+
+class ThermalApp:
+    def __init__(self, engine: Engine, display_fps: float = DEFAULT_DISPLAY_FPS, renderer: str = "fast",
+                 trends=None):
+        if renderer not in RENDERERS:
+            raise ValueError(f"renderer must be one of {RENDERERS}")
+        self.engine = engine
+        self.trends = trends           # TimeSeriesStore；None = 不提供 Trends 圖
+        self.renderer_kind = renderer
+        self._lut = build_lut()
+
+        self.root = root = tk.Tk()
+        root.title("🔥 HEVT")
+        root.geometry("1180x680")
+
+        # 狀態變數
+        self.alarm_state_var = tk.StringVar(value="NORMAL")
+        self.max_temp_var  = tk.StringVar(value="000.00 °C")
+        self.min_temp_var  = tk.StringVar(value="000.00 °C")
+        self.avg_temp_var  = tk.StringVar(value="000.00 °C")
+        self.max_slope_var = tk.StringVar(value="000.00 °C")
+        self.avg_slope_var = tk.StringVar(value="000.00 °C")
+        self.over_count_var = tk.StringVar(value="000")
+        self.diff_area_var  = tk.StringVar(value="000")
+        self.avgTempT_var   = tk.StringVar(value="000.00")
+        self.maxSlopeT_var  = tk.StringVar(value="000.00")
+        self.diffAreaT_var  = tk.StringVar(value="000.00")
+
+        # 網路設定變數（可編輯）
+        self.bind_ip_var  = tk.StringVar(value=engine.bind_ip)
+        self.stm32_ip_var = tk.StringVar(value=engine.stm32_ip)
+        self.local_ip_hint_var = tk.StringVar(value="Local IP: (unknown)")
+        # 多機模式：目前顯示/下指令的裝置
+        self.device_var = tk.StringVar(value="" if engine.multi else DEFAULT_DEVICE)
+        self.selected_device = self.device_var.get()
+        self.device_var.trace_add("write", lambda *_: self._on_device_selected())
+
+        # LINE 設定變數（可編輯）
+        cfg = engine.line_config
+        self.line_enable_var = tk.BooleanVar(value=cfg.enabled)
+
+        # - 這兩個會從檔案載入/儲存
+        self.line_token_var   = tk.StringVar(value=cfg.token)   # Channel Access Token（長 token）
+        self.line_secret_file_loaded = tk.StringVar(value="Secret: (not loaded)")
+
+        # - 目標對象：可同時填（都會推）
+        self.line_group_var   = tk.StringVar(value=cfg.group_id)   # C...（groupId）
+        self.line_user_var    = tk.StringVar(value=cfg.user_id)    # U...（userId）
+
+        # - 其它
+        self.line_tpl_var     = tk.StringVar(value=cfg.template or DEFAULT_TEMPLATE)
+        self.line_cooldown_var = tk.StringVar(value=str(cfg.cooldown))  # 秒
+        self.line_digest_var   = tk.StringVar(value=f"{cfg.digest_window:g}")  # 秒，0 = 不合併
+
+        for v in (self.line_enable_var, self.line_token_var, self.line_group_var,
+                  self.line_user_var, self.line_tpl_var, self.line_cooldown_var, self.line_digest_var):
+            v.trace_add("write", lambda *_: self._sync_line_config())
+
+        self._build_image()
+        self._build_info()
+        self._build_net()
+        self._build_line()
+        self._build_ctrl()
+
+        # 顯示刷新（pull）；不向 engine 訂閱逐筆回呼
+        self.refresh_ms = max(1, int(1000 / max(0.1, display_fps)))
+        self._known_devices = 0
+        self._shown_seq = -1
+        self._shown_report = None
+        self._shown_report_count = 0
+        self.frames_shown = 0
+        self.frames_coalesced = 0
+        self.reports_coalesced = 0
+        self._heads_win = None
+        self._heads = {}               # device_id -> [photo, label, shown_seq]
+        self._roi_win = None
+        self._roi_rows = None          # 目前表格顯示的 (device_id, ROI 名稱)
+        self._trend_win = None
+        self._hist_win = None
+        self._hist = None              # 回看中的 FrameHistory snapshot
+        self._hist_after = None        # 播放中的 after id
+        self._cmd_results = deque(maxlen=64)  # 指令結果（ACK 回呼 / 批次執行緒寫入，刷新 tick 取出）
+
+    # --------------------------------
+    # 熱像圖
+    # --------------------------------
+    def _build_image(self):
+        self.renderer = None
+        if self.renderer_kind == "fast":
+            self.renderer = ThermalRenderer(PIX_H, PIX_W, scale=FAST_SCALE, lut=self._lut)
+            self._photo = tk.PhotoImage(master=self.root, width=self.renderer.out_w, height=self.renderer.out_h)
+            tk.Label(self.root, image=self._photo, bd=0).place(x=20, y=20)
+            return
+
+        # Matplotlib imshow（較慢，保留作為對照）
+        self.fig, self.ax = plt.subplots(figsize=(4, 3))
+        self.img_artist = self.ax.imshow(np.zeros((PIX_H, PIX_W), dtype=np.float32), cmap='inferno', vmin=TEMP_MIN, vmax=TEMP_MAX)
+        self.ax.axis('off')
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.root)
+        self.canvas.get_tk_widget().place(x=20, y=20)
+
+    # --------------------------------
+    # 資訊顯示區
+    # --------------------------------
+    def _build_info(self):
+        frame_info = ttk.LabelFrame(self.root, text="Report Status")
+        frame_info.place(x=450, y=20, width=700, height=220)
+
+        self.alarm_label = tk.Label(frame_info, text="🟢 NORMAL", font=("Arial", 16), bg="green", fg="white")
+        self.alarm_label.grid(row=0, column=0, columnspan=6, pady=10, sticky="we")
+
+        cells = [
+            (1, 0, "Max Temp:", self.max_temp_var), (1, 2, "Min Temp:", self.min_temp_var),
+            (1, 4, "Avg Temp:", self.avg_temp_var),
+            (2, 0, "Max Slope:", self.max_slope_var), (2, 2, "Avg Slope:", self.avg_slope_var),
+            (3, 0, "Over Count:", self.over_count_var), (3, 2, "Diff Area:", self.diff_area_var),
+            (4, 0, "avgT Trend:", self.avgTempT_var), (4, 2, "maxSlope Trend:", self.maxSlopeT_var),
+            (4, 4, "diffArea Trend:", self.diffAreaT_var),
+        ]
+        for row, col, text, var in cells:
+            ttk.Label(frame_info, text=text).grid(row=row, column=col, sticky="w", padx=10, pady=5)
+            ttk.Label(frame_info, textvariable=var, font=("Arial", 14)).grid(row=row, column=col + 1, sticky="w")
+
+        # 主機端重算（analytics）：勾選後顯示由影像算出的值，而非裝置 REPORT
+        self.host_stats_var = tk.BooleanVar(value=self.engine.alert_source == "host")
+        if self.engine.analytics:
+            ttk.Checkbutton(frame_info, text="Host stats", variable=self.host_stats_var).grid(row=2, column=4, columnspan=2, padx=10, sticky="w")
+        if getattr(self.engine, "roi_config", None):
+            ttk.Button(frame_info, text="ROIs", command=self.open_roi_window).grid(row=3, column=4, padx=10, sticky="w")
+        if self.trends is not None:
+            ttk.Button(frame_info, text="Trends", command=self.open_trend_window).grid(row=3, column=5, padx=10, sticky="w")
+        if getattr(self.engine, "history", 0):
+            ttk.Button(frame_info, text="History", command=self.open_history_window).grid(row=2, column=5, padx=10, sticky="e")
+
+    # --------------------------------
+    # 網路設定區
+    # --------------------------------
+    def _build_net(self):
+        frame_net = ttk.LabelFrame(self.root, text="Network Settings")
+        frame_net.place(x=20, y=360, width=410, height=260)
+
+        ttk.Label(frame_net, text="Bind IP (Local):").grid(row=0, column=0, padx=10, pady=8, sticky="e")
+        ttk.Entry(frame_net, textvariable=self.bind_ip_var, width=18).grid(row=0, column=1, padx=5, pady=8, sticky="w")
+        ttk.Label(frame_net, text="(留空=0.0.0.0)").grid(row=0, column=2, padx=5, sticky="w")
+
+        ttk.Label(frame_net, text="STM32 IP (Remote):").grid(row=1, column=0, padx=10, pady=8, sticky="e")
+        ttk.Entry(frame_net, textvariable=self.stm32_ip_var, width=18).grid(row=1, column=1, padx=5, pady=8, sticky="w")
+
+        ttk.Label(frame_net, textvariable=self.local_ip_hint_var).grid(row=2, column=0, columnspan=3, padx=10, pady=5, sticky="w")
+
+        ttk.Button(frame_net, text="Apply Network", width=18, command=self.apply_network).grid(row=3, column=0, padx=10, pady=12, sticky="w")
+        ttk.Button(frame_net, text="Start/Connect", width=18, command=self.start_connect).grid(row=3, column=1, padx=5, pady=12, sticky="w")
+
+        if self.engine.multi:
+            ttk.Label(frame_net, text="Device:").grid(row=4, column=0, padx=10, pady=4, sticky="e")
+            self.device_combo = ttk.Combobox(frame_net, textvariable=self.device_var, width=16, state="readonly")
+            self.device_combo.grid(row=4, column=1, padx=5, pady=4, sticky="w")
+            ttk.Button(frame_net, text="All Heads", command=self.open_heads_window).grid(row=4, column=2, padx=5, pady=4, sticky="w")
+
+    # --------------------------------
+    # LINE 設定區
+    # --------------------------------
+    def _build_line(self):
+        frame_line = ttk.LabelFrame(self.root, text="LINE Settings (Messaging API)")
+        frame_line.place(x=450, y=260, width=700, height=200)
+
+        # 切換、冷卻、測試
+        ttk.Checkbutton(frame_line, text="Enable LINE Alert", variable=self.line_enable_var).grid(row=0, column=0, padx=10, pady=6, sticky="w")
+        ttk.Label(frame_line, text="Cooldown(s):").grid(row=0, column=2, padx=6, pady=4, sticky="e")
+        ttk.Entry(frame_line, textvariable=self.line_cooldown_var, width=8).grid(row=0, column=3, padx=6, pady=4, sticky="w")
+
+        # Token 與 Secret 檔
+        ttk.Label(frame_line, text="Channel Access Token:").grid(row=1, column=0, padx=10, pady=4, sticky="e")
+        ttk.Entry(frame_line, textvariable=self.line_token_var, width=46, show="•").grid(row=1, column=1, padx=6, pady=4, sticky="w")
+        ttk.Button(frame_line, text="Load/Save", command=self.on_config_dialog).grid(row=1, column=2, padx=6, pady=4, sticky="w")
+        ttk.Label(frame_line, textvariable=self.line_secret_file_loaded, foreground="#666").grid(row=1, column=3, padx=6, pady=4, sticky="w")
+
+        # 目標：Group 與 User
+        ttk.Label(frame_line, text="Group ID (C...):").grid(row=2, column=0, padx=10, pady=4, sticky="e")
+        ttk.Entry(frame_line, textvariable=self.line_group_var, width=46).grid(row=2, column=1, padx=6, pady=4, sticky="w")
+
+        ttk.Label(frame_line, text="User ID (U..., 逗號分隔):").grid(row=3, column=0, padx=10, pady=4, sticky="e")
+        ttk.Entry(frame_line, textvariable=self.line_user_var, width=46).grid(row=3, column=1, padx=6, pady=4, sticky="w")
+        ttk.Label(frame_line, text="Digest(s):").grid(row=3, column=2, padx=6, pady=4, sticky="e")
+        ttk.Entry(frame_line, textvariable=self.line_digest_var, width=8).grid(row=3, column=3, padx=6, pady=4, sticky="w")
+
+        # Template & 測試
+        ttk.Label(frame_line, text="Template:").grid(row=4, column=0, padx=10, pady=4, sticky="e")
+        ttk.Entry(frame_line, textvariable=self.line_tpl_var, width=64).grid(row=4, column=1, columnspan=3, padx=6, pady=4, sticky="we")
+        ttk.Button(frame_line, text="Send Test", command=self.send_line_test_popup).grid(row=0, column=1, padx=6, pady=4, sticky="w")
+
+    # --------------------------------
+    # 原「Threshold Settings」
+    # --------------------------------
+    def _build_ctrl(self):
+        frame_ctrl = ttk.LabelFrame(self.root, text="Threshold Settings")
+        frame_ctrl.place(x=450, y=470, width=700, height=170)
+
+        fields = ["Alarm", "Slope", "Diffusion", "Interval (ms)"]
+        default_values = {"Alarm": "30.0", "Slope": "2.0", "Diffusion": "1.2", "Interval (ms)": "100"}
+        self.entries = {}
+        for i, f in enumerate(fields):
+            ttk.Label(frame_ctrl, text=f + ":").grid(row=i, column=0, padx=10, pady=5, sticky="w")
+            e = ttk.Entry(frame_ctrl, width=10)
+            e.insert(0, default_values.get(f, ""))
+            e.grid(row=i, column=1, padx=10, pady=5)
+            self.entries[f] = e
+
+        ttk.Button(frame_ctrl, text="Set Threshold", command=self.set_threshold).grid(row=3, column=2, columnspan=1, pady=10)
+        ttk.Button(frame_ctrl, text="Apply to all", command=self.apply_thresholds_all).grid(row=3, column=3, pady=10, sticky="w")
+        # 最近一筆指令的結果（需 --cmd-acks 才有 ACK）
+        self.cmd_status_var = tk.StringVar(value="")
+        ttk.Label(frame_ctrl, textvariable=self.cmd_status_var, width=40).grid(row=1, column=2, columnspan=3, rowspan=2, padx=10, sticky="w")
+        ttk.Button(frame_ctrl, text="Get Image", command=self.get_image).grid(row=5, column=0, columnspan=1, pady=10)
+
+        # 像素編碼（需分塊封包格式）
+        ttk.Label(frame_ctrl, text="Encoding:").grid(row=0, column=2, padx=10, pady=5, sticky="e")
+        self.encoding_var = tk.StringVar(value=self.engine.encoding or "f32")
+        enc_combo = ttk.Combobox(frame_ctrl, textvariable=self.encoding_var, values=list(ENCODINGS), width=8, state="readonly")
+        enc_combo.grid(row=0, column=3, padx=5, pady=5, sticky="w")
+        enc_combo.bind("<<ComboboxSelected>>", lambda _e: self.set_encoding())
+
+        self.auto_flag = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_ctrl, text="Auto", variable=self.auto_flag,
+                        command=lambda: self.send_check("Auto", self.auto_flag)).grid(row=5, column=1, padx=10, pady=5, sticky="w")
+
+    # --------------------------------
+    # 指令
+    # --------------------------------
+    def require_cmd_socket(self):
+        if not self.engine.sockets_ready:
+            messagebox.showwarning("Network", "Socket 尚未就緒，請先在 Network Settings 中 Apply/Start。")
+            return False
+        return True
+
+    def _send(self, cmd: str):
+        if not self.require_cmd_socket():
+            return
+        self.engine.stm32_ip = self.stm32_ip_var.get().strip()
+        if not self.selected_device:
+            messagebox.showwarning("Network", "尚未收到任何裝置的封包")
+            return
+        try:
+            future = self.engine.send_command(cmd, self.engine.device_ip(self.selected_device))
+        except Exception as e:
+            messagebox.showerror("Send Error", str(e))
+            return
+        if future is not None:
+            self.cmd_status_var.set(f"{cmd.split(':', 1)[0]}: waiting for ACK")
+            future.add_done_callback(lambda f: self._cmd_results.append(f.result()))
+
+    def _read_thresholds(self):
+        """(alarm, slope, diffusion, interval_ms)；欄位不是數字時跳警告並回傳 None"""
+        e = self.entries
+        try:
+            return (float(e['Alarm'].get()), float(e['Slope'].get()), float(e['Diffusion'].get()),
+                    int(e['Interval (ms)'].get()))
+        except ValueError:
+            messagebox.showwarning("Threshold", "Alarm / Slope / Diffusion / Interval 需為數字")
+            return None
+
+    def apply_thresholds_all(self):
+        """同一組門檻同時下發給所有已知裝置；等 ACK 在背景執行緒，結果由刷新 tick 顯示"""
+        if not self.require_cmd_socket():
+            return
+        values = self._read_thresholds()
+        if values is None:
+            return
+        if not self.engine.devices:
+            messagebox.showwarning("Network", "尚未收到任何裝置的封包")
+            return
+        self.engine.stm32_ip = self.stm32_ip_var.get().strip()
+        ips = [self.engine.device_ip(d) for d in sorted(self.engine.devices)]
+        self.cmd_status_var.set(f"Apply to all: sending to {len(ips)} devices ...")
+
+        def run():
+            try:
+                self._cmd_results.append(self.engine.apply_thresholds(ips, *values))
+            except Exception as e:
+                print("[CMD] apply to all failed:", e)
+                self._cmd_results.append({})
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _show_cmd_results(self):
+        while self._cmd_results:
+            result = self._cmd_results.popleft()
+            if not isinstance(result, dict):
+                self.cmd_status_var.set(f"{result.command.split(':', 1)[0]}: {result}")
+                continue
+            failed = [r for r in result.values() if not r.ok]
+            text = f"Apply to all: {len(result) - len(failed)}/{len(result)} OK"
+            if failed:
+                text += "; " + ", ".join(f"{r.ip} {r.status}" for r in failed[:3])
+                if len(failed) > 3:
+                    text += f" (+{len(failed) - 3})"
+            self.cmd_status_var.set(text)
+
+    def set_threshold(self):
+        e = self.entries
+        try:
+            self.engine.set_thresholds(float(e['Alarm'].get()), float(e['Slope'].get()), float(e['Diffusion'].get()))
+        except ValueError:
+            messagebox.showwarning("Threshold", "Alarm / Slope / Diffusion 需為數字")
+            return
+        self._send(f"SET_THRESH:D1={e['Alarm'].get()},D2={e['Slope'].get()},D3={e['Diffusion'].get()},D4={e['Interval (ms)'].get()}")
+
+    def set_encoding(self):
+        if not self.require_cmd_socket() or not self.selected_device:
+            return
+        if self.engine.img_format != "auto":
+            print("[NET] encoding requested, switching image format to auto")
+            self.engine.img_format = "auto"
+        self.engine.stm32_ip = self.stm32_ip_var.get().strip()
+        try:
+            self.engine.request_encoding(self.encoding_var.get(), self.engine.device_ip(self.selected_device))
+        except Exception as e:
+            messagebox.showerror("Send Error", str(e))
+
+    def get_image(self):
+        self._send("GET_IMAGE")
+
+    def send_check(self, name, var):
+        value = 1 if var.get() else 0
+        self._send(f"ENABLE_{name.upper()}={value}")
+
+    # --------------------------------
+    # 網路
+    # --------------------------------
+    def apply_network(self):
+        """套用 GUI 的 IP 設定並重新綁定 socket（尚不啟動接收執行緒）"""
+        bind_ip = self.bind_ip_var.get().strip()
+        remote_ip = self.stm32_ip_var.get().strip()
+        if not remote_ip:
+            messagebox.showwarning("Network", "請輸入 STM32 IP")
+            return
+
+        self.engine.bind_ip = bind_ip
+        self.engine.stm32_ip = remote_ip
+        try:
+            self.engine.open()
+        except Exception as e:
+            messagebox.showerror("Network Error", f"Socket 綁定失敗：{e}")
+            return
+
+        self.local_ip_hint_var.set(f"Local IP: {get_local_ip_for(remote_ip)}  (bind={bind_ip or '0.0.0.0'})")
+        messagebox.showinfo("Network", "Socket 綁定成功。可按 Start/Connect 啟動接收。")
+
+    def start_connect(self):
+        if not self.engine.sockets_ready:
+            messagebox.showwarning("Network", "請先 Apply Network 完成綁定再 Start。")
+            return
+        if self.engine.start():
+            messagebox.showinfo("Network", "接收執行緒已啟動。")
+        else:
+            messagebox.showinfo("Network", "接收執行緒已在運行。")
+
+    # --------------------------------
+    # LINE
+    # --------------------------------
+    def _sync_line_config(self):
+        """把 GUI 的 LINE 設定寫回 engine（各裝置共用）"""
+        try:
+            cooldown = max(0, int(self.line_cooldown_var.get() or "0"))
+        except Exception:
+            cooldown = 0
+        try:
+            digest_window = max(0.0, float(self.line_digest_var.get() or "0"))
+        except Exception:
+            digest_window = 0.0
+        self.engine.set_line_config(LineConfig(
+            enabled=bool(self.line_enable_var.get()),
+            token=self.line_token_var.get().strip(),
+            group_id=self.line_group_var.get().strip(),
+            user_id=self.line_user_var.get().strip(),
+            template=self.line_tpl_var.get(),
+            cooldown=cooldown,
+            digest_window=digest_window,
+        ))
+
+    def send_line_test_popup(self):
+        if not self.line_enable_var.get():
+            messagebox.showwarning("LINE", "請先勾選 Enable LINE Alert")
+            return
+        if not self.line_token_var.get().strip():
+            messagebox.showwarning("LINE", "請先填入 Channel Access Token（或從檔案載入）")
+            return
+        if not (self.line_group_var.get().strip() or self.line_user_var.get().strip()):
+            messagebox.showwarning("LINE", "請先填入 Group ID 或 User ID 任一")
+            return
+
+        stats = {
+            "max": 38.5, "min": 26.2, "avg": 33.0,
+            "max_slope": 1.5, "avg_slope": 0.8,
+            "over": 3, "diff_area": 42,
+            "avgT": 0.0, "maxSlopeT": 0.0, "diffAreaT": 0.0,
+            "now": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        text = "[TEST] " + format_line_text(self.line_tpl_var.get(), stats)
+
+        results = push_to_all_targets(self.engine.line_config, text, self.engine.line_dispatcher)
+
+        lines = []
+        success_any = False
+        for label, ok, status, body in results:
+            success_any = success_any or ok
+            lines.append(f"{label}: {'OK' if ok else 'FAIL'} (status={status})\n{body[:400]}")
+        msg = "\n\n".join(lines)
+
+        if success_any:
+            messagebox.showinfo("LINE Push Result", msg)
+        else:
+            messagebox.showerror("LINE Push Failed", msg)
+
+    # --------------------------------
+    # 設定檔 Load/Save（Channel Secret 放檔案）
+    # --------------------------------
+    def save_config(self):
+        save_line_config({
+            "access_token": self.line_token_var.get().strip(),
+            "group_id": self.line_group_var.get().strip(),
+            "user_id": self.line_user_var.get().strip(),
+            "template": self.line_tpl_var.get(),
+            "cooldown": self.line_cooldown_var.get(),
+            "digest_window": self.line_digest_var.get(),
+        })
+        self.line_secret_file_loaded.set(f"Secret: (in {CONFIG_PATH})")
+        messagebox.showinfo("Config", f"已儲存設定到 {CONFIG_PATH}")
+
+    def load_config(self, quiet: bool = False):
+        if not os.path.isfile(CONFIG_PATH):
+            messagebox.showwarning("Config", f"找不到設定檔：{CONFIG_PATH}\n請先按 Save 建立，或自行建立 JSON。")
+            return
+        try:
+            data = load_line_config()
+            # 載入 access token / 目標 / 模板 / 冷卻
+            self.line_token_var.set(data.get("access_token", ""))
+            self.line_group_var.set(data.get("group_id", ""))
+            self.line_user_var.set(data.get("user_id", ""))
+            self.line_tpl_var.set(data.get("template", self.line_tpl_var.get()))
+            self.line_cooldown_var.set(str(data.get("cooldown", self.line_cooldown_var.get())))
+            self.line_digest_var.set(str(data.get("digest_window", self.line_digest_var.get())))
+            # 只顯示 secret 已載入，不顯示內容
+            if has_channel_secret(data):
+                self.line_secret_file_loaded.set(f"Secret: (in {CONFIG_PATH})")
+            else:
+                self.line_secret_file_loaded.set("Secret: (not loaded)")
+            if not quiet:
+                messagebox.showinfo("Config", f"已從 {CONFIG_PATH} 載入設定")
+        except Exception as e:
+            messagebox.showerror("Config Error", f"讀取失敗：{e}")
+
+    def on_config_dialog(self):
+        # 簡單：點一下就先 Load；再按一次 Save
+        res = messagebox.askyesno("Config", f"從 {CONFIG_PATH} 載入？\n（選否改為儲存目前的 UI 值）")
+        if res:
+            self.load_config()
+        else:
+            # 為了簡潔，這裡只保存 UI 值；secret 請手動加到檔案中
+            self.save_config()
+
+    # --------------------------------
+    # GUI 更新：固定顯示頻率向 engine 取「最新狀態」
+    # 接收執行緒只更新 DeviceState，不碰 Tk；中間的狀態直接略過（合併），
+    # 所有 Matplotlib 呼叫都在 Tk 執行緒上，顯示延遲上限約一個刷新週期。
+    # --------------------------------
+    def _on_device_selected(self):
+        self.selected_device = self.device_var.get()
+        self._shown_seq = -1
+        self._shown_report = None
+        if self._trend_win is not None:
+            self._draw_trend()
+        if self._hist_win is not None:
+            self.history_latest()
+
+    def _refresh(self):
+        try:
+            self._refresh_once()
+        except Exception as e:
+            print("[GUI REFRESH ERR]", e)
+        self.root.after(self.refresh_ms, self._refresh)
+
+    def _refresh_once(self):
+        engine = self.engine
+        if self._cmd_results:
+            self._show_cmd_results()
+        if engine.multi and len(engine.devices) != self._known_devices:
+            self._known_devices = len(engine.devices)
+            self.device_combo["values"] = sorted(engine.devices)
+            if not self.device_var.get() and engine.devices:
+                self.device_var.set(next(iter(engine.devices)))
+
+        dev = engine.devices.get(self.selected_device)
+        if dev is None:
+            return
+
+        use_host = self.host_stats_var.get()
+        report = dev.host_report if use_host else dev.last_report
+        count = dev.frames_completed if use_host else dev.reports_received
+        if report is not None and report is not self._shown_report:
+            if self._shown_report is not None:
+                self.reports_coalesced += max(0, count - self._shown_report_count - 1)
+            self.update_gui(*report)
+            self._shown_report = report
+            self._shown_report_count = count
+
+        if self._heads_win is not None:
+            self._refresh_heads()
+
+        seq = dev.frame_seq
+        if seq != self._shown_seq:
+            if self._shown_seq >= 0:
+                self.frames_coalesced += max(0, seq - self._shown_seq - 1)
+            self._show_frame(dev.display_frame)
+            self._shown_seq = seq
+            self.frames_shown += 1
+            if self._roi_win is not None:
+                self._refresh_rois(dev)
+
+    # --------------------------------
+    # All Heads：多機縮圖牆（同一個刷新 tick 更新）
+    # --------------------------------
+    def open_heads_window(self):
+        if self._heads_win is not None:
+            self._heads_win.lift()
+            return
+        self._heads_win = tk.Toplevel(self.root)
+        self._heads_win.title("HEVT - All Heads")
+        self._heads_win.protocol("WM_DELETE_WINDOW", self._close_heads_window)
+        self._heads_renderer = ThermalRenderer(PIX_H, PIX_W, scale=HEADS_SCALE, lut=self._lut)
+        self._heads = {}
+
+    def _close_heads_window(self):
+        self._heads_win.destroy()
+        self._heads_win = None
+        self._heads = {}
+
+    def _refresh_heads(self):
+        r = self._heads_renderer
+        for device_id in sorted(self.engine.devices):
+            dev = self.engine.devices[device_id]
+            tile = self._heads.get(device_id)
+            if tile is None:
+                n = len(self._heads)
+                photo = tk.PhotoImage(master=self._heads_win, width=r.out_w, height=r.out_h)
+                label = tk.Label(self._heads_win, image=photo, text=device_id, compound="top", bd=0)
+                label.grid(row=n // HEADS_COLUMNS, column=n % HEADS_COLUMNS, padx=4, pady=4)
+                tile = self._heads[device_id] = [photo, label, -1]
+            if dev.frame_seq != tile[2]:
+                tile[0].configure(data=bytes(r.ppm(dev.display_frame)), format="PPM")
+                tile[1].config(bg="red" if dev.alarm else self._heads_win.cget("bg"))
+                tile[2] = dev.frame_seq
+
+    # --------------------------------
+    # ROIs：目前裝置各 ROI 的統計（有新幀時更新）
+    # --------------------------------
+    def open_roi_window(self):
+        if self._roi_win is not None:
+            self._roi_win.lift()
+            return
+        self._roi_win = tk.Toplevel(self.root)
+        self._roi_win.title("HEVT - ROIs")
+        self._roi_win.protocol("WM_DELETE_WINDOW", self._close_roi_window)
+        columns = ("max", "min", "avg", "slope", "over")
+        tree = ttk.Treeview(self._roi_win, columns=columns, height=10)
+        tree.heading("#0", text="ROI")
+        for col, text in zip(columns, ("Max", "Min", "Avg", "Max Slope", "Over")):
+            tree.heading(col, text=text)
+            tree.column(col, width=80, anchor="e")
+        tree.tag_configure("alarm", background="#f88")
+        tree.pack(fill="both", expand=True, padx=6, pady=6)
+        self._roi_tree = tree
+        self._roi_rows = None
+
+    def _close_roi_window(self):
+        self._roi_win.destroy()
+        self._roi_win = None
+
+    def _refresh_rois(self, dev):
+        tree = self._roi_tree
+        st = getattr(dev, "rois", None)
+        rows = st.rows() if st is not None else []
+        key = (dev.device_id, tuple(r[0] for r in rows))
+        if key != self._roi_rows:
+            tree.delete(*tree.get_children())
+            for i, row in enumerate(rows):
+                tree.insert("", "end", iid=str(i), text=row[0])
+            self._roi_rows = key
+        for i, (_name, vmax, vmin, vavg, slope, over, alarm) in enumerate(rows):
+            tree.item(str(i), values=(f"{vmax:.2f}", f"{vmin:.2f}", f"{vavg:.2f}", f"{slope:.2f}", over),
+                      tags=("alarm",) if alarm else ())
+
+    # --------------------------------
+    # Trends：目前裝置某個 REPORT 欄位的 min/max/avg（查彙總桶，不掃原始樣本）
+    # --------------------------------
+    def open_trend_window(self):
+        if self._trend_win is not None:
+            self._trend_win.lift()
+            return
+        win = self._trend_win = tk.Toplevel(self.root)
+        win.title("HEVT - Trends")
+        win.protocol("WM_DELETE_WINDOW", self._close_trend_window)
+        bar = ttk.Frame(win)
+        bar.pack(fill="x", padx=6, pady=4)
+        self.trend_field_var = tk.StringVar(value=TREND_FIELDS[0][0])
+        self.trend_range_var = tk.StringVar(value=TREND_RANGES[1][0])
+        ttk.Combobox(bar, textvariable=self.trend_field_var, values=[f[0] for f in TREND_FIELDS],
+                     width=16, state="readonly").pack(side="left")
+        ttk.Combobox(bar, textvariable=self.trend_range_var, values=[r[0] for r in TREND_RANGES],
+                     width=10, state="readonly").pack(side="left", padx=6)
+        self.trend_info_var = tk.StringVar()
+        ttk.Label(bar, textvariable=self.trend_info_var).pack(side="left", padx=6)
+        for v in (self.trend_field_var, self.trend_range_var):
+            v.trace_add("write", lambda *_: self._draw_trend())
+
+        self._trend_fig = Figure(figsize=(8, 3.5))
+        self._trend_ax = self._trend_fig.add_subplot(111)
+        self._trend_canvas = FigureCanvasTkAgg(self._trend_fig, master=win)
+        self._trend_canvas.get_tk_widget().pack(fill="both", expand=True)
+        self._refresh_trend()
+
+    def _close_trend_window(self):
+        self._trend_win.destroy()
+        self._trend_win = None
+
+    def _refresh_trend(self):
+        if self._trend_win is None:
+            return
+        try:
+            self._draw_trend()
+        except Exception as e:
+            print("[TRENDS] draw error:", e)
+        self._trend_win.after(TREND_REFRESH_MS, self._refresh_trend)
+
+    def _draw_trend(self):
+        label = self.trend_field_var.get()
+        field = dict(TREND_FIELDS)[label]
+        span = dict(TREND_RANGES)[self.trend_range_var.get()]
+        t1 = self.trends.clock()
+        res = self.trends.query(self.selected_device, field, t1 - span, t1 + 1)
+        ax = self._trend_ax
+        ax.clear()
+        if len(res["t"]):
+            when = [datetime.fromtimestamp(t) for t in res["t"]]
+            if res["level"]:
+                ax.fill_between(when, res["min"], res["max"], step="post", alpha=0.3, color="tab:orange")
+            ax.plot(when, res["avg"], drawstyle="steps-post" if res["level"] else "default", color="tab:red")
+        ax.set_ylabel(label)
+        ax.grid(True, alpha=0.3)
+        self._trend_fig.autofmt_xdate()
+        self._trend_canvas.draw_idle()
+        level = f"{res['level']} s buckets" if res["level"] else "raw samples"
+        self.trend_info_var.set(f"{self.selected_device}: {len(res['t'])} points ({level})")
+
+    # --------------------------------
+    # History：目前裝置最近 N 幀回看（開啟/Latest 時凍結一份 snapshot，拖曳或播放）
+    # --------------------------------
+    def open_history_window(self):
+        if self._hist_win is not None:
+            self._hist_win.lift()
+            self.history_latest()
+            return
+        win = self._hist_win = tk.Toplevel(self.root)
+        win.title("HEVT - History")
+        win.protocol("WM_DELETE_WINDOW", self._close_history_window)
+        self._hist_renderer = ThermalRenderer(PIX_H, PIX_W, scale=FAST_SCALE, lut=self._lut)
+        self._hist_photo = tk.PhotoImage(master=win, width=self._hist_renderer.out_w, height=self._hist_renderer.out_h)
+        self._hist_buf = np.zeros((PIX_H, PIX_W), dtype=np.float32)
+        tk.Label(win, image=self._hist_photo, bd=0).pack(padx=6, pady=6)
+
+        self.hist_pos_var = tk.IntVar(value=0)
+        self._hist_scale = tk.Scale(win, from_=0, to=0, orient="horizontal", showvalue=False,
+                                    variable=self.hist_pos_var, command=lambda _v: self._on_history_scrub())
+        self._hist_scale.pack(fill="x", padx=6)
+        # 警報中的幀：滑桿下方的紅色刻度
+        self._hist_marks = tk.Canvas(win, height=6, highlightthickness=0)
+        self._hist_marks.pack(fill="x", padx=6)
+        self._hist_marks.bind("<Configure>", lambda _e: self._draw_history_marks())
+
+        bar = ttk.Frame(win)
+        bar.pack(fill="x", padx=6, pady=4)
+        ttk.Button(bar, text="◀ Alarm", width=8, command=self.history_prev_alarm).pack(side="left")
+        ttk.Button(bar, text="◀", width=3, command=lambda: self.history_step(-1)).pack(side="left", padx=2)
+        self._hist_play_btn = ttk.Button(bar, text="Play", width=6, command=self.history_toggle_play)
+        self._hist_play_btn.pack(side="left", padx=2)
+        ttk.Button(bar, text="▶", width=3, command=lambda: self.history_step(1)).pack(side="left", padx=2)
+        ttk.Button(bar, text="Latest", width=7, command=self.history_latest).pack(side="left", padx=2)
+        self.hist_speed_var = tk.StringVar(value="1x")
+        ttk.Combobox(bar, textvariable=self.hist_speed_var, values=HISTORY_SPEEDS, width=6,
+                     state="readonly").pack(side="left", padx=6)
+        self.hist_info_var = tk.StringVar()
+        ttk.Label(win, textvariable=self.hist_info_var).pack(anchor="w", padx=6, pady=(0, 6))
+        self.history_latest()
+
+    def _close_history_window(self):
+        self._history_pause()
+        self._hist_win.destroy()
+        self._hist_win = None
+        self._hist = None
+
+    def history_latest(self):
+        """重新凍結目前裝置的歷史環，跳到最新一幀"""
+        self._history_pause()
+        dev = self.engine.devices.get(self.selected_device)
+        src = getattr(dev, "history", None)
+        self._hist = h = src.snapshot() if src is not None and len(src) else None
+        self._draw_history_marks()
+        if h is None:
+            self._hist_scale.configure(from_=0, to=0)
+            self.hist_info_var.set(f"{self.selected_device or '-'}: no frames yet")
+            return
+        self._hist_scale.configure(from_=h.first_seq, to=h.last_seq)
+        self.hist_pos_var.set(h.last_seq)
+        self._show_history_frame(h.last_seq)
+
+    def _draw_history_marks(self):
+        c = self._hist_marks
+        c.delete("all")
+        h = self._hist
+        if h is None or len(h) < 2:
+            return
+        width = max(1, c.winfo_width())
+        first, span = h.first_seq, h.last_seq - h.first_seq
+        for seq in h.alarm_seqs(h.first_seq, h.count):
+            x = (seq - first) * (width - 1) / span
+            c.create_line(x, 0, x, 6, fill="red")
+
+    def _on_history_scrub(self):
+        if self._hist is not None:
+            self._show_history_frame(self.hist_pos_var.get())
+
+    def _show_history_frame(self, seq: int):
+        h = self._hist
+        seq = min(max(seq, h.first_seq), h.last_seq)
+        frame = h.frame_at(seq, out=self._hist_buf)
+        self._hist_photo.configure(data=bytes(self._hist_renderer.ppm(frame)), format="PPM")
+        t = h.time_at(seq)
+        back = h.time_at(h.last_seq) - t
+        stamp = datetime.fromtimestamp(t).strftime("%H:%M:%S.%f")[:-4]
+        alarm = "  🔴 ALARM" if h.alarm_at(seq) else ""
+        self.hist_info_var.set(f"{self.selected_device}  frame {seq - h.first_seq + 1}/{len(h)}  "
+                               f"{stamp} (-{back:.1f} s)  max {frame.max():.2f} °C{alarm}")
+
+    def history_step(self, n: int):
+        if self._hist is None:
+            return
+        self._history_pause()
+        seq = min(max(self.hist_pos_var.get() + n, self._hist.first_seq), self._hist.last_seq)
+        self.hist_pos_var.set(seq)
+        self._show_history_frame(seq)
+
+    def history_prev_alarm(self):
+        """跳到目前位置之前最近一次「轉為警報」的幀"""
+        h = self._hist
+        if h is None:
+            return
+        self._history_pause()
+        seqs = h.alarm_seqs(h.first_seq, self.hist_pos_var.get())
+        if not len(seqs):
+            return
+        starts = seqs[np.concatenate(([True], np.diff(seqs) > 1))]
+        self.hist_pos_var.set(int(starts[-1]))
+        self._show_history_frame(int(starts[-1]))
+
+    def history_toggle_play(self):
+        if self._hist_after is not None:
+            self._history_pause()
+            return
+        h = self._hist
+        if h is None:
+            return
+        if self.hist_pos_var.get() >= h.last_seq:
+            self.hist_pos_var.set(h.first_seq)          # 在結尾按 Play 從頭播
+        self._hist_play_btn.configure(text="Pause")
+        self._history_tick()
+
+    def _history_pause(self):
+        if self._hist_after is not None:
+            self._hist_win.after_cancel(self._hist_after)
+            self._hist_after = None
+            self._hist_play_btn.configure(text="Play")
+
+    def _history_tick(self):
+        h = self._hist
+        seq = self.hist_pos_var.get()
+        self._show_history_frame(seq)
+        if seq >= h.last_seq:
+            self._hist_after = None
+            self._hist_play_btn.configure(text="Play")
+            return
+        # 依錄下的時間間隔播放
+        speed = float(self.hist_speed_var.get().rstrip("x"))
+        delay = (h.time_at(seq + 1) - h.time_at(seq)) / speed
+        self.hist_pos_var.set(seq + 1)
+        self._hist_after = self._hist_win.after(int(min(1000, max(10, delay * 1000))), self._history_tick)
+
+    def _show_frame(self, frame):
+        if self.renderer is not None:
+            # Tk 只吃 bytes：由預先配置的 PPM 緩衝複製一次
+            self._photo.configure(data=bytes(self.renderer.ppm(frame)), format="PPM")
+            return
+        self.img_artist.set_data(frame)
+        self.img_artist.set_clim(vmin=TEMP_MIN, vmax=TEMP_MAX)
+        self.canvas.draw_idle()
+
+    def update_gui(self, alarm, D1, D2, D3, D4, D5, D6, D7, D8, D9, D10):
+        if alarm:
+            self.alarm_label.config(text="🔴 OVER TEMP", bg="red")
+        else:
+            self.alarm_label.config(text="🟢 NORMAL", bg="green")
+        self.max_temp_var.set(f"{D1:.2f} °C")
+        self.min_temp_var.set(f"{D2:.2f} °C")
+        self.avg_temp_var.set(f"{D3:.2f} °C")
+        self.max_slope_var.set(f"{D4:.2f} °C")
+        self.avg_slope_var.set(f"{D5:.2f} °C")
+        self.over_count_var.set(f"{D6}")
+        self.diff_area_var.set(f"{D7}")
+        self.avgTempT_var.set(f"{D8:.2f}")
+        self.maxSlopeT_var.set(f"{D9:.2f}")
+        self.diffAreaT_var.set(f"{D10:.2f}")
+
+    # --------------------------------
+    # 主迴圈
+    # --------------------------------
+    def run(self):
+        # 開機自動載入設定（若存在）
+        if os.path.isfile(CONFIG_PATH):
+            try:
+                self.load_config(quiet=True)
+            except Exception as e:
+                print("[CONFIG] load on start error:", e)
+        self.root.after(self.refresh_ms, self._refresh)
+        self.root.mainloop()
+        self.engine.stop()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""無顯示器節點：只跑 Engine（接收、解析、警報），完全不載入 Tk / Matplotlib。"""
+
+import os
+import signal
+import threading
+
+from .config import CONFIG_PATH, load_line_config
+from .analytics import compare_reports
+from .engine import Engine
+from .line import LineConfig
+
+
+def run_headless(engine: Engine, line_enabled: bool = False, config_path: str = CONFIG_PATH,
+                 verbose: bool = False, digest_window: float | None = None, source=None) -> int:
+    """source：非 UDP 的輸入（ReplaySource / relay.Aggregator）；給了就不綁 socket，來源結束即停止。"""
+    if os.path.isfile(config_path):
+        try:
+            engine.line_config.update_from(LineConfig.from_file_data(load_line_config(config_path), enabled=line_enabled))
+        except Exception as e:
+            print("[CONFIG] load on start error:", e)
+    elif line_enabled:
+        print(f"[CONFIG] 找不到設定檔：{config_path}，LINE 警報停用")
+    if digest_window is not None:
+        engine.line_config.digest_window = max(0.0, digest_window)
+
+    last_alarm = {}
+
+    def on_report(dev, report):
+        if report.alarm != last_alarm.get(dev.device_id):
+            print(f"[ALARM] {dev.device_id}: {'OVER' if report.alarm else 'NORMAL'} max={report.max_temp:.2f} "
+                  f"avg={report.avg_temp:.2f} diff_area={report.diff_area}")
+            last_alarm[dev.device_id] = report.alarm
+        elif verbose:
+            print(f"[REPORT] {dev.device_id}:", tuple(report))
+
+    def on_stats(dev, stats):
+        if not verbose:
+            return
+        line = f"[HOST] {dev.device_id}: max={stats.max_temp:.2f} avg={stats.avg_temp:.2f} " \
+               f"maxSlope={stats.max_slope:.2f} over={stats.over_count} diff={stats.diff_area}"
+        if dev.last_report is not None:
+            delta = compare_reports(dev.last_report, stats)
+            worst = max(delta, key=lambda k: abs(delta[k]))
+            line += f"  (vs device: worst {worst} {delta[worst]:+.2f})"
+        print(line)
+
+    growing_seen = set()
+
+    def on_hotspots(dev, tracks):
+        # 每條軌跡第一次判定為擴散中時印一次
+        for tr in tracks:
+            key = (dev.device_id, tr.track_id)
+            if key not in growing_seen and dev.tracker.is_growing(tr):
+                growing_seen.add(key)
+                print(f"[HOTSPOT] {dev.device_id}: #{tr.track_id} growing at ({tr.cy:.1f},{tr.cx:.1f}) "
+                      f"area={tr.area} peak={tr.peak:.2f} growth={tr.growth:+.1f}px/s")
+        if len(growing_seen) > 10000:
+            growing_seen.clear()
+
+    roi_alarm = {}
+
+    def on_rois(dev, st):
+        # ROI 警報狀態改變時印一次
+        for name, vmax, _vmin, vavg, slope, over, alarm in st.rows():
+            key = (dev.device_id, name)
+            if alarm != roi_alarm.get(key, False):
+                roi_alarm[key] = alarm
+                print(f"[ROI] {dev.device_id}/{name}: {'OVER' if alarm else 'NORMAL'} max={vmax:.2f} "
+                      f"avg={vavg:.2f} maxSlope={slope:.2f} over={over}")
+
+    engine.subscribe(on_report=on_report, on_stats=on_stats, on_hotspots=on_hotspots, on_rois=on_rois)
+
+    done = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: done.set())
+    signal.signal(signal.SIGTERM, lambda *_: done.set())
+
+    if source is not None:
+        source.start()
+        print(f"[HEADLESS] {source.name} running, Ctrl+C to stop")
+        while not done.wait(0.2) and not source.done.is_set():
+            pass
+        source.stop()
+        stats = source.stats()
+        print(f"[{source.name.upper()}] frames={stats['frames']} reports={stats['reports']} "
+              f"elapsed={stats['elapsed']:.2f}s ({stats['frames_per_sec']:.0f} frames/s)")
+        engine.stop()
+        return 0
+
+    try:
+        engine.open()
+    except OSError as e:
+        print("[NET ERR] Socket 綁定失敗：", e)
+        return 1
+    engine.start()
+    print("[HEADLESS] running, Ctrl+C to stop")
+
+    while not done.wait(1.0):
+        pass
+    engine.stop()
+    print("[HEADLESS] stopped")
+    return 0
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+逐裝置的幀歷史環：最近 capacity 幀，(capacity, PIX_H, PIX_W) int16 或 float16 一塊預先配置的陣列。
+
+  i16   單位 0.01 °C（與 codec 的 ENC_I16 相同），-327.68 ~ 327.67 °C，1536 B/幀
+  f16   半精度浮點，40 °C 附近解析度約 0.03 °C，1536 B/幀
+
+600 幀 ≈ 0.9 MB/台，記憶體只由 capacity 決定，與執行多久無關；push() 只寫入預先配置的陣列，
+不建立新的 ndarray（每個 slot 的 view 在建立時就切好）。
+
+times 一律是 wall-clock 秒（time.time() 的尺度，可直接 datetime.fromtimestamp）：
+Engine 把 monotonic 的 last_seen 換算後才 push，重播時則是錄製時間。
+
+幀以「序號」定位（第幾個 push，從 0 起）：first_seq..last_seq 之間的幀還在環裡，
+更舊的已被覆寫。讀取一律是 view（raw_at / views），需要溫度時 frame_at 解碼到呼叫端給的緩衝。
+陣列可由外部提供（arrays=），例如 --multiprocess 時放在共用記憶體，GUI 行程直接讀。
+"""
+
+import numpy as np
+
+HISTORY_ENCODINGS = ("i16", "f16")
+I16_SCALE = 100.0                  # 0.01 °C
+DEFAULT_CAPACITY = 600             # 幀；16 fps 約 37 秒
+
+
+def history_layout(height: int, width: int, capacity: int, encoding: str = "i16") -> tuple:
+    """(name, dtype, shape)：frames / times / alarm / seq（seq 為單一 int64：已 push 的幀數）"""
+    if encoding not in HISTORY_ENCODINGS:
+        raise ValueError(f"history encoding must be one of {HISTORY_ENCODINGS}")
+    if capacity < 2:
+        raise ValueError("history needs at least 2 frames")
+    return (
+        ("frames", np.int16 if encoding == "i16" else np.float16, (capacity, height, width)),
+        ("times", np.float64, (capacity,)),
+        ("alarm", np.uint8, (capacity,)),
+        ("seq", np.int64, (1,)),
+    )
+
+
+class FrameHistory:
+    """單一寫入者（接收執行緒）；讀取端（GUI）只讀，寫到一半的 slot 最多讓某一幀顯示不完整。"""
+
+    def __init__(self, height: int, width: int, capacity: int = DEFAULT_CAPACITY,
+                 encoding: str = "i16", arrays: dict | None = None):
+        parts = history_layout(height, width, capacity, encoding)
+        if arrays is None:
+            # np.zeros：未寫到的頁不佔實體記憶體
+            arrays = {name: np.zeros(shape, dtype) for name, dtype, shape in parts}
+        self.height = height
+        self.width = width
+        self.capacity = capacity
+        self.encoding = encoding
+        self.frames = arrays["frames"]
+        self.times = arrays["times"]
+        self.alarm = arrays["alarm"]
+        self._seq = arrays["seq"]
+        self._slots = [self.frames[i] for i in range(capacity)]
+        self._min_seq = 0                  # snapshot：複製期間被覆寫的序號之前都不算數
+        self._tmp = np.empty((height, width), dtype=np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self.frames.nbytes + self.times.nbytes + self.alarm.nbytes
+
+    # ---------------- 寫入 ----------------
+    def push(self, frame: np.ndarray, t: float, alarm: int = 0):
+        """t：wall-clock 秒"""
+        seq = int(self._seq[0])
+        i = seq % self.capacity
+        slot = self._slots[i]
+        if self.encoding == "i16":
+            tmp = self._tmp
+            np.multiply(frame, I16_SCALE, out=tmp)
+            np.clip(tmp, -32768, 32767, out=tmp)
+            np.rint(tmp, out=slot, casting="unsafe")
+        else:
+            np.copyto(slot, frame, casting="same_kind")
+        self.times[i] = t
+        self.alarm[i] = 1 if alarm else 0
+        self._seq[0] = seq + 1             # 寫完 slot 才公布
+
+    # ---------------- 讀取 ----------------
+    @property
+    def count(self) -> int:
+        """已 push 的幀數（= 下一個序號）"""
+        return int(self._seq[0])
+
+    @property
+    def first_seq(self) -> int:
+        return max(self._min_seq, self.count - self.capacity)
+
+    @property
+    def last_seq(self) -> int:
+        """最新一幀的序號；還沒有幀時為 -1"""
+        return self.count - 1
+
+    def __len__(self) -> int:
+        return max(0, self.count - self.first_seq)
+
+    def has(self, seq: int) -> bool:
+        return self.first_seq <= seq < self.count
+
+    def _slot(self, seq: int) -> int:
+        if not self.has(seq):
+            raise IndexError(f"frame {seq} is not in the history ({self.first_seq}..{self.last_seq})")
+        return seq % self.capacity
+
+    def raw_at(self, seq: int) -> np.ndarray:
+        """序號 seq 的 (H, W) 編碼值 view（不複製）"""
+        return self._slots[self._slot(seq)]
+
+    def frame_at(self, seq: int, out: np.ndarray | None = None) -> np.ndarray:
+        """序號 seq 解碼成 °C（float32，寫入 out；未給時配置新陣列）"""
+        raw = self.raw_at(seq)
+        if out is None:
+            out = np.empty((self.height, self.width), dtype=np.float32)
+        if self.encoding == "i16":
+            np.multiply(raw, 1.0 / I16_SCALE, out=out, casting="unsafe")
+        else:
+            np.copyto(out, raw, casting="same_kind")
+        return out
+
+    def time_at(self, seq: int) -> float:
+        return float(self.times[self._slot(seq)])
+
+    def alarm_at(self, seq: int) -> bool:
+        return bool(self.alarm[self._slot(seq)])
+
+    def views(self, start: int, stop: int) -> list:
+        """
+        序號 [start, stop) 的編碼值，依時間順序的 1～2 段 (n, H, W) view（環跨過結尾時兩段）。
+        時間與警報旗標用同樣的切法可由 segments() 取得。
+        """
+        return [self.frames[a:b] for a, b in self.segments(start, stop)]
+
+    def segments(self, start: int, stop: int) -> list:
+        """序號 [start, stop) 對應的 slot 範圍 [(a, b), ...]（超出環的部分截掉）"""
+        start = max(start, self.first_seq)
+        stop = min(stop, self.count)
+        if start >= stop:
+            return []
+        a, n = start % self.capacity, stop - start
+        if a + n <= self.capacity:
+            return [(a, a + n)]
+        return [(a, self.capacity), (0, a + n - self.capacity)]
+
+    def seq_at_time(self, t: float) -> int:
+        """時間 <= t 的最後一幀的序號（沒有則為 first_seq）"""
+        best = seq = self.first_seq
+        for a, b in self.segments(self.first_seq, self.count):
+            k = int(np.searchsorted(self.times[a:b], t, side="right"))
+            if k:
+                best = seq + k - 1
+            if k < b - a:
+                break
+            seq += b - a
+        return best
+
+    def snapshot(self) -> "FrameHistory":
+        """目前內容的複本（約 capacity × 1.5 KB）；回看時凍結畫面，不受之後的寫入影響"""
+        seq = self._seq.copy()
+        arrays = {"frames": self.frames.copy(), "times": self.times.copy(),
+                  "alarm": self.alarm.copy(), "seq": seq}
+        snap = FrameHistory(self.height, self.width, self.capacity, self.encoding, arrays=arrays)
+        # 複製時寫入端可能已覆寫了最舊的幾個 slot
+        snap._min_seq = max(self._min_seq, self.count - self.capacity)
+        return snap
+
+    def alarm_seqs(self, start: int, stop: int) -> np.ndarray:
+        """[start, stop) 中警報旗標為 1 的序號"""
+        out, seq = [], max(start, self.first_seq)
+        for a, b in self.segments(start, stop):
+            out.append(np.flatnonzero(self.alarm[a:b]) + seq)
+            seq += b - a
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
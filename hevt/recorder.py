@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""
+影像錄製：每個完成的幀（含當時最新的 REPORT）與每筆 REPORT 附加到 mmap 的分段檔。
+
+分段檔（*.hvr）配置一次固定容量，之後只做附加寫入：
+  header (64 B)  magic "HVR1" | version | capacity | count | H | W | t_first | t_last
+  時間索引        float64[capacity]，每筆記錄在錄製時間軸上的時間（遞增）
+  記錄            RECORD_DTYPE[capacity]，固定長度；kind 區分幀（REC_FRAME）與單獨的 REPORT（REC_REPORT）
+
+REPORT 收到就單獨記一筆（沒有影像的裝置 / 時段也留得下 REPORT，重播時能重跑 REPORT 觸發的警報）；
+幀記錄也帶著當時最新的 REPORT，以 report_seq 判斷是不是同一筆。
+
+錄製時間軸 = 錄影開始時的 wall-clock + 之後 time.monotonic() 經過的秒數；
+NTP 校時、手動調鐘不會讓它倒退，排序、換檔、seek 與重播節奏都用它。
+時鐘沒被調過時它就等於 wall-clock，所以 seek 仍可直接給日期時間。
+新的錄影從目錄內最後一筆之後接續，重啟前後調過鐘也保持遞增。
+每筆記錄另存當下的 wall-clock（RECORD_DTYPE 的 t），只當中繼資料。
+
+寫入 = 幾次欄位指定到 mmap（約 3 KB memcpy），不配置 Python 物件、不呼叫 write()。
+讀取以時間索引二分搜尋，只碰到該時間區段的頁面，不需讀整個檔。
+分段依筆數或秒數換檔；超過保留上限（總大小 / 份數 / 時間）時刪掉最舊的分段。
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from .engine import PIX_H, PIX_W
+from .report import Report
+
+SEGMENT_MAGIC = b"HVR1"
+SEGMENT_VERSION = 2
+READABLE_VERSIONS = (1, 2)         # 1：沒有 REPORT 記錄（kind 欄位為 0 = 幀）
+SEGMENT_SUFFIX = ".hvr"
+SEGMENT_HEADER = struct.Struct("<4sHxxIIHHdd")
+HEADER_SIZE = 64
+DEVICE_ID_LEN = 32
+SPARE_NAME = "next.hvr.part"       # 背景預先配置的下一個分段（不在 list_segments 內）
+
+DEFAULT_SEGMENT_FRAMES = 8192      # 每段約 25 MB（16 fps 單台約 8.5 分鐘）
+DEFAULT_SEGMENT_SECONDS = 600.0
+DEFAULT_MAX_BYTES = 2 << 30        # 保留上限：全部分段合計 2 GB
+
+# REPORT 的 D1–D10（alarm 另存），順序同 Report 欄位
+REPORT_VALUES = Report._fields[1:]
+RECORD_DTYPE = np.dtype([
+    ("t", "<f8"),                              # wall-clock 秒（time.time()）；中繼資料，不保證遞增
+    ("device", f"S{DEVICE_ID_LEN}"),
+    ("report_seq", "<u4"),                     # 裝置已收到的 REPORT 數；0 = 尚無 REPORT
+    ("alarm", "u1"),
+    ("kind", "u1"),                            # REC_FRAME / REC_REPORT
+    ("_pad", "V2"),
+    ("report", "<f8", (len(REPORT_VALUES),)),    # float64：重播時與原 REPORT 完全相同
+    ("frame", "<f4", (PIX_H, PIX_W)),
+])
+
+
+REC_FRAME = 0
+REC_REPORT = 1                                 # 只有 REPORT；frame 欄位沒有內容
+
+
+def _segment_size(capacity: int) -> int:
+    return HEADER_SIZE + capacity * 8 + capacity * RECORD_DTYPE.itemsize
+
+
+def _segment_name(t: float, n: int = 0) -> str:
+    """檔名即開始時間（錄製時間軸），排序 = 時間順序；同一毫秒重名時加序號"""
+    name = time.strftime("%Y%m%d-%H%M%S", time.localtime(t)) + f"-{int(t * 1000) % 1000:03d}"
+    return f"{name}.{n}{SEGMENT_SUFFIX}" if n else name + SEGMENT_SUFFIX
+
+
+def record_report(rec) -> Report | None:
+    """由一筆記錄還原 Report（無 REPORT 時回 None）"""
+    if not rec["report_seq"]:
+        return None
+    vals = rec["report"]
+    return Report(int(rec["alarm"]), *(float(v) for v in vals[:5]), int(vals[5]), int(vals[6]),
+                  *(float(v) for v in vals[7:]))
+
+
+class Segment:
+    """單一分段檔的 mmap 視圖；writable=False 時唯讀（可讀取寫入中的分段）。"""
+
+    def __init__(self, path: str, capacity: int | None = None, writable: bool = False):
+        self.path = path
+        self.writable = writable
+        if writable:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+            try:
+                # 先實際配置磁碟空間：磁碟滿時在這裡丟 OSError，而不是寫 mmap 時 SIGBUS
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, _segment_size(capacity))
+                else:
+                    os.ftruncate(fd, _segment_size(capacity))
+                self._mm = mmap.mmap(fd, 0, access=mmap.ACCESS_WRITE)
+            finally:
+                os.close(fd)
+            self.capacity = capacity
+            self.count = 0
+            self.t_first = self.t_last = 0.0
+            self._write_header()
+        else:
+            with open(path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, capacity, _count, h, w, _t0, _t1 = SEGMENT_HEADER.unpack_from(self._mm)
+            if magic != SEGMENT_MAGIC or version not in READABLE_VERSIONS or (h, w) != (PIX_H, PIX_W):
+                self._mm.close()
+                raise ValueError(f"not a recording segment: {path}")
+            self.capacity = capacity
+            self.refresh()
+        self.times = np.frombuffer(self._mm, dtype="<f8", count=self.capacity, offset=HEADER_SIZE)
+        self.records = np.frombuffer(self._mm, dtype=RECORD_DTYPE, count=self.capacity,
+                                     offset=HEADER_SIZE + self.capacity * 8)
+        self._cols = [self.records[name] for name in ("t", "device", "report_seq", "alarm", "kind", "report", "frame")]
+
+    def _write_header(self):
+        SEGMENT_HEADER.pack_into(self._mm, 0, SEGMENT_MAGIC, SEGMENT_VERSION, self.capacity,
+                                 self.count, PIX_H, PIX_W, self.t_first, self.t_last)
+
+    def refresh(self):
+        """重新讀 header（讀取寫入中的分段時用）"""
+        _m, _v, _cap, self.count, _h, _w, self.t_first, self.t_last = SEGMENT_HEADER.unpack_from(self._mm)
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def append(self, ts: float, t: float, device_id: str, frame: np.ndarray | None, report: Report | None,
+               report_seq: int):
+        """ts：錄製時間軸（索引，需遞增）；t：wall-clock（記錄的中繼資料）；frame=None 為單獨的 REPORT"""
+        i = self.count
+        c_t, c_dev, c_seq, c_alarm, c_kind, c_report, c_frame = self._cols
+        c_t[i] = t
+        c_dev[i] = device_id.encode()[:DEVICE_ID_LEN]
+        if frame is not None:
+            c_kind[i] = REC_FRAME
+            c_frame[i] = frame
+        else:
+            c_kind[i] = REC_REPORT
+        if report is not None:
+            c_seq[i] = report_seq
+            c_alarm[i] = report.alarm
+            c_report[i] = report[1:]
+        else:
+            c_seq[i] = 0
+        # 先寫記錄與索引，最後才更新 count：讀取端看到的 count 一定是完整記錄
+        self.times[i] = ts
+        if i == 0:
+            self.t_first = ts
+        self.t_last = ts
+        self.count = i + 1
+        self._write_header()
+
+    def search(self, t0: float, t1: float) -> tuple:
+        """時間索引（錄製時間軸）二分搜尋：回傳 [t0, t1) 的記錄索引範圍 (lo, hi)"""
+        times = self.times[:self.count]
+        return int(np.searchsorted(times, t0, "left")), int(np.searchsorted(times, t1, "left"))
+
+    def close(self):
+        if self._mm is None:
+            return
+        self.times = self.records = self._cols = None
+        # 不截短檔案：讀取端可能仍 mmap 著
+        if self.writable:
+            self._mm.flush()
+        try:
+            self._mm.close()
+        except BufferError:
+            pass    # 呼叫端仍持有記錄 view；交給 GC 在 view 釋放後關閉
+        self._mm = None
+
+
+class FrameRecorder:
+    """
+    Engine 的 on_frame / on_report 訂閱者：把每個完成的幀（帶該裝置最新 REPORT）與每筆 REPORT 附加到分段檔。
+
+    engine.subscribe(on_frame=recorder.on_frame, on_report=recorder.on_report)
+
+    換檔時直接接手背景執行緒預先配置好的下一個分段（只做 rename），
+    配置磁碟空間與保留上限清理都不在接收執行緒上。
+    """
+
+    def __init__(self, directory: str, segment_frames: int = DEFAULT_SEGMENT_FRAMES,
+                 segment_seconds: float = DEFAULT_SEGMENT_SECONDS, max_bytes: int | None = DEFAULT_MAX_BYTES,
+                 max_segments: int | None = None, max_age: float | None = None):
+        self.directory = directory
+        self.segment_frames = segment_frames
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+        self._seg: Segment | None = None
+        self._seg_started = 0.0
+        # 錄製時間軸的起點：接在目錄內最後一筆之後（重啟前把鐘調回去也不倒退；+1 ms 讓分段不同名）
+        self._ts_base = max(time.time(), _last_time(directory) + 0.001)
+        self._mono_base = time.monotonic()
+        self._spare: Segment | None = None
+        self._spare_path = os.path.join(directory, SPARE_NAME)
+        self._lock = threading.Lock()
+        self._prep_lock = threading.Lock()
+        self._prep_thread: threading.Thread | None = None
+        self._closed = False
+
+        # 統計
+        self.frames_recorded = 0
+        self.reports_recorded = 0
+        self.segments_created = 0
+        self.segments_deleted = 0
+        self.errors = 0
+
+        self._prepare_async()
+
+    def on_frame(self, dev, frame, _diff_mask=None):
+        self.record(dev.device_id, frame, dev.last_report, dev.reports_received)
+
+    def on_report(self, dev, report: Report):
+        self.record(dev.device_id, None, report, dev.reports_received)
+
+    def record(self, device_id: str, frame: np.ndarray | None, report: Report | None = None,
+               report_seq: int = 0, t: float | None = None):
+        """
+        frame=None 時只記 REPORT。
+        t 指定時（匯入外部資料）同時當作錄製時間軸，呼叫端須依時間順序送入。
+        """
+        with self._lock:
+            if self._closed:
+                return
+            if t is None:
+                t = time.time()
+                ts = self._ts_base + (time.monotonic() - self._mono_base)
+            else:
+                ts = t
+            try:
+                seg = self._seg
+                if seg is None or seg.full or ts - self._seg_started >= self.segment_seconds:
+                    seg = self._rollover(ts)
+                seg.append(ts, t, device_id, frame, report, report_seq)
+                if frame is not None:
+                    self.frames_recorded += 1
+                else:
+                    self.reports_recorded += 1
+            except OSError as e:
+                # 磁碟滿等錯誤：不影響接收，只在第一次與每 1000 次印出，並放棄目前分段
+                self.errors += 1
+                if self.errors == 1 or self.errors % 1000 == 0:
+                    print(f"[REC ERR] {e} (errors={self.errors})")
+                self._close_segment()
+
+    # ---------------- 分段 ----------------
+    def _rollover(self, t: float) -> Segment:
+        self._close_segment()
+        path = os.path.join(self.directory, _segment_name(t))
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, _segment_name(t, n))
+            n += 1
+
+        with self._prep_lock:
+            spare, self._spare = self._spare, None
+        if spare is not None:
+            os.rename(spare.path, path)
+            spare.path = path
+            seg = spare
+        else:
+            seg = Segment(path, capacity=self.segment_frames, writable=True)
+        self._seg = seg
+        self._seg_started = t
+        self.segments_created += 1
+        self._prepare_async()
+        return seg
+
+    def _close_segment(self):
+        if self._seg is not None:
+            try:
+                self._seg.close()
+            except OSError as e:
+                print("[REC ERR] close segment:", e)
+            self._seg = None
+
+    def _prepare_async(self):
+        if self._prep_thread is not None and self._prep_thread.is_alive():
+            return
+        self._prep_thread = threading.Thread(target=self._prepare, daemon=True)
+        self._prep_thread.start()
+
+    def _prepare(self):
+        """背景：清理超過保留上限的分段，再預先配置下一個分段。"""
+        try:
+            self._enforce_retention(time.time())
+            if self._spare is not None or self._closed:
+                return
+            if os.path.exists(self._spare_path):
+                os.remove(self._spare_path)        # 上次異常結束留下的
+            # 配置在鎖外；接收執行緒換檔時不會等這裡
+            spare = Segment(self._spare_path, capacity=self.segment_frames, writable=True)
+            with self._prep_lock:
+                self._spare = spare
+        except OSError as e:
+            print("[REC ERR] prepare segment:", e)
+
+    def _enforce_retention(self, now: float):
+        # 在鎖內取寫入中的分段與目錄快照：列出之後才換檔的新分段不會被當成可刪
+        with self._lock:
+            writing = self._seg.path if self._seg is not None else None
+            paths = list_segments(self.directory)
+        # 預留目前與下一個分段的空間
+        sizes = [os.path.getsize(p) for p in paths]
+        reserve = _segment_size(self.segment_frames)
+        total = sum(sizes) + reserve
+        keep = len(paths) + 1
+        for path, size in zip(paths, sizes):        # 由舊到新；寫入中的分段一定最新
+            if path == writing:
+                break
+            too_many = self.max_segments is not None and keep > self.max_segments
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            too_old = self.max_age is not None and now - os.path.getmtime(path) > self.max_age
+            if not (too_many or too_big or too_old):
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                print("[REC ERR] retention:", e)
+                continue
+            total -= size
+            keep -= 1
+            self.segments_deleted += 1
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._close_segment()
+        if self._prep_thread is not None:
+            self._prep_thread.join()
+        with self._prep_lock:
+            if self._spare is not None:
+                self._spare.close()
+                self._spare = None
+                try:
+                    os.remove(self._spare_path)
+                except OSError:
+                    pass
+
+
+def list_segments(directory: str) -> list:
+    """目錄內的分段檔，由舊到新（檔名即開始時間）"""
+    try:
+        names = sorted(n for n in os.listdir(directory) if n.endswith(SEGMENT_SUFFIX))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, n) for n in names]
+
+
+def _last_time(directory: str) -> float:
+    """目錄內最後一筆記錄的錄製時間軸；沒有記錄時回 0"""
+    for path in reversed(list_segments(directory)):
+        try:
+            seg = Segment(path)
+        except (OSError, ValueError):
+            continue
+        try:
+            if seg.count:
+                return seg.t_last
+        finally:
+            seg.close()
+    return 0.0
+
+
+class RecordingReader:
+    """
+    唯讀存取錄製目錄；records() 回傳的是 mmap 上的結構化陣列 view（不複製）。
+
+    with RecordingReader("rec") as r:
+        for recs in r.records(t0, t1, device="192.168.5.11"):
+            recs["t"], recs["kind"], recs["frame"], recs["report"] ...
+
+    time_range / records 的 t0、t1 都是錄製時間軸（見模組說明）。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._open: dict[str, Segment] = {}
+
+    def segments(self) -> list:
+        segs = []
+        for path in list_segments(self.directory):
+            seg = self._open.get(path)
+            if seg is None:
+                try:
+                    seg = Segment(path)
+                except (OSError, ValueError) as e:
+                    print(f"[REC] skip {os.path.basename(path)}: {e}")
+                    continue
+                self._open[path] = seg
+            else:
+                seg.refresh()
+            if seg.count:
+                segs.append(seg)
+        return segs
+
+    def time_range(self) -> tuple:
+        segs = self.segments()
+        if not segs:
+            return (0.0, 0.0)
+        return (segs[0].t_first, segs[-1].t_last)
+
+    def devices(self) -> list:
+        found = set()
+        for seg in self.segments():
+            found.update(np.unique(seg.records["device"][:seg.count]).tolist())
+        return sorted(d.decode() for d in found)
+
+    def records(self, t0: float = float("-inf"), t1: float = float("inf"), device: str | None = None,
+                with_times: bool = False):
+        """
+        依時間順序逐分段產生 [t0, t1)（錄製時間軸）的記錄 view；指定 device 時為過濾後的複本。
+        with_times=True 時產生 (times, recs)，times 為對應的錄製時間軸（重播節奏用）。
+        """
+        key = device.encode()[:DEVICE_ID_LEN] if device is not None else None
+        for seg in self.segments():
+            if seg.t_last < t0 or seg.t_first >= t1:
+                continue
+            lo, hi = seg.search(t0, t1)
+            if lo >= hi:
+                continue
+            recs = seg.records[lo:hi]
+            times = seg.times[lo:hi]
+            if key is not None:
+                keep = recs["device"] == key
+                recs, times = recs[keep], times[keep]
+                if not len(recs):
+                    continue
+            yield (times, recs) if with_times else recs
+
+    def close(self):
+        for seg in self._open.values():
+            seg.close()
+        self._open.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
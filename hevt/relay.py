@@ -0,0 +1,586 @@
+# -*- coding: utf-8 -*-
+"""
+多廠區彙整：邊緣節點把完成的幀與 REPORT 批次壓縮後，經一條常駐 TCP 連線送到中央彙整節點。
+
+  邊緣   python main.py --headless --multi --forward central:5600 --forward-name plantA
+  中央   python main.py --headless --aggregate 5600 --line --record /data/rec
+
+中央把每筆資料以 "<邊緣名稱>/<裝置 id>" 餵進自己的 Engine（feed_report / feed_frame），
+走與 UDP 相同的分析 / 警報 / 錄影 / 趨勢 / GUI 路徑；LINE 警報只需在中央開啟。
+
+連線上的訊息：u32 長度（不含自己）| u8 種類 | 內容
+  HELLO  邊緣 → 中央   u64 session | 名稱（UTF-8）
+  BATCH  邊緣 → 中央   u64 批次序號 | u32 解壓後長度 | zlib(記錄 ...)
+  ACK    中央 → 邊緣   u64 已處理到的批次序號（累積）
+
+一批內的記錄：u8 種類 | u8 id 長度 | f64 時間（邊緣的 wall clock）| u16 內容長度 | 裝置 id | 內容
+  REPORT   pack_report() 的 42 B 二進位格式
+  FRAME    u8 編碼 | 像素；同一批內每台第一幀為 ENC_I16，之後為 ENC_DELTA（一批自成一體，
+           丟掉某一批不影響其它批的解碼）
+
+邊緣每 BATCH_INTERVAL 秒封一批，收到 ACK 才從緩衝移除；斷線時批次留在緩衝，重連後從最舊未確認的
+一批重送，中央依 (名稱, session) 記住處理到的序號，重送的批次只回 ACK 不再處理一次。
+緩衝有上限（壓縮後的位元組數）：超過一半開始抽幀（每台只留 1/2、1/4、1/8 的幀，REPORT 全留），
+滿了才丟最舊的批次。接收執行緒只做一次幀複製，編碼 / 壓縮 / 傳送都在轉送執行緒。
+
+中央的 Engine 時間：樣本以邊緣的擷取時間換算到本機 monotonic，批次一次到達也不影響斜率計算。
+"""
+
+import select
+import selectors
+import socket
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+
+import numpy as np
+
+from .codec import ENC_DELTA, ENC_I16, ELEM_SIZE, DeltaEncoder, decode_into
+from .engine import PIX_H, PIX_W, Engine
+from .report import pack_report, parse_binary_report
+
+DEFAULT_RELAY_PORT = 5600
+BATCH_INTERVAL = 0.25              # 秒
+BATCH_MAX_RECORDS = 4096           # 一批最多幾筆（也是待封批記錄的上限）
+DEFAULT_BUFFER_BYTES = 64 << 20    # 未確認批次的上限（壓縮後）
+WINDOW_BYTES = 4 << 20             # 已送出未確認的上限；超過就等 ACK
+ZLIB_LEVEL = 1
+RECONNECT_MIN = 0.5                # 秒；重連間隔由此加倍
+RECONNECT_MAX = 10.0
+SEND_TIMEOUT = 10.0
+MAX_MESSAGE = 32 << 20
+THIN_LEVELS = ((0.5, 1), (0.75, 2), (0.9, 4), (1.01, 8))   # (緩衝使用率, 每幾幀留一幀)
+THIN_HYSTERESIS = 0.1              # 放寬抽幀時，使用率要比進入該級的門檻再低這麼多
+
+MSG_HEADER = struct.Struct("<IB")
+MSG_HELLO = 1
+MSG_BATCH = 2
+MSG_ACK = 3
+HELLO = struct.Struct("<Q")
+BATCH = struct.Struct("<QI")
+ACK = struct.Struct("<Q")
+RECORD = struct.Struct("<BBdH")
+REC_REPORT = 1
+REC_FRAME = 2
+NPIX = PIX_H * PIX_W
+
+
+def parse_address(text: str, default_host: str = "") -> tuple:
+    """'host:port' / 'port' -> (host, port)"""
+    host, sep, port = text.rpartition(":")
+    if not sep:
+        host = default_host
+    return host or default_host, int(port)
+
+
+def _message(kind: int, body: bytes) -> bytes:
+    return MSG_HEADER.pack(len(body) + 1, kind) + body
+
+
+# --------------------------------
+# 批次編碼
+# --------------------------------
+def encode_batch(records) -> bytes:
+    """[(kind, device_id, t, 內容)] -> 未壓縮的批次內容；幀在這裡做一批內的 DELTA 編碼"""
+    out = bytearray()
+    encoders = {}
+    for kind, device_id, t, item in records:
+        dev = device_id.encode()[:255]
+        if kind == REC_REPORT:
+            payload = pack_report(item)
+        else:
+            enc = encoders.get(device_id)
+            if enc is None:
+                enc = encoders[device_id] = DeltaEncoder(keyframe_interval=BATCH_MAX_RECORDS)
+            code, pixels = enc.encode(item)
+            payload = bytes((code,)) + pixels
+        out += RECORD.pack(kind, len(dev), t, len(payload))
+        out += dev
+        out += payload
+    return bytes(out)
+
+
+def decode_batch(data: bytes):
+    """encode_batch 的反向；產生 (kind, device_id, t, Report 或 float32 幀)。幀是共用緩衝的 view，下一筆前有效"""
+    view = memoryview(data)
+    prev = {}
+    frame = np.empty(NPIX, dtype=np.float32)
+    pos, end = 0, len(data)
+    while pos < end:
+        kind, id_len, t, size = RECORD.unpack_from(view, pos)
+        pos += RECORD.size
+        device_id = bytes(view[pos:pos + id_len]).decode(errors="replace")
+        pos += id_len
+        payload = view[pos:pos + size]
+        pos += size
+        if len(payload) != size:
+            raise ValueError("truncated record")
+        if kind == REC_REPORT:
+            yield kind, device_id, t, parse_binary_report(payload)
+        elif kind == REC_FRAME:
+            enc = payload[0]
+            if enc not in (ENC_I16, ENC_DELTA) or size != 1 + NPIX * ELEM_SIZE[enc]:
+                raise ValueError(f"bad frame record (encoding {enc}, {size} B)")
+            ref = prev.get(device_id)
+            if enc == ENC_DELTA and ref is None:
+                raise ValueError("delta frame without keyframe")
+            decode_into(enc, payload, 1, NPIX, frame, ref)
+            if ref is None:
+                ref = prev[device_id] = np.empty(NPIX, dtype=np.float32)
+            np.copyto(ref, frame)
+            yield kind, device_id, t, frame.reshape(PIX_H, PIX_W)
+        else:
+            raise ValueError(f"unknown record kind {kind}")
+
+
+class _Batch:
+    __slots__ = ("seq", "data", "frames", "reports")
+
+    def __init__(self, seq: int, data: bytes, frames: int, reports: int):
+        self.seq = seq
+        self.data = data
+        self.frames = frames
+        self.reports = reports
+
+
+# --------------------------------
+# 邊緣：轉送
+# --------------------------------
+class EdgeForwarder:
+    """
+    Engine 的 on_frame / on_report 訂閱者；一條轉送執行緒負責封批、壓縮、連線、重送。
+
+    forwarder = EdgeForwarder(engine, ("central", 5600), name="plantA").attach()
+    forwarder.start() ... forwarder.close()
+    """
+
+    def __init__(self, engine: Engine, address: tuple, name: str | None = None,
+                 buffer_bytes: int = DEFAULT_BUFFER_BYTES, batch_interval: float = BATCH_INTERVAL):
+        self.engine = engine
+        self.address = address
+        self.name = name or socket.gethostname()
+        self.buffer_bytes = buffer_bytes
+        self.batch_interval = batch_interval
+        self.session = uuid.uuid4().int & ((1 << 64) - 1)
+        self._pending = deque()            # 接收執行緒 append，轉送執行緒 popleft
+        self._outbox: deque[_Batch] = deque()
+        self._outbox_bytes = 0
+        self._unsent = 0                   # outbox 中從第幾個開始還沒送（斷線時歸零）
+        self._inflight_bytes = 0
+        self._seq = 0
+        self._stride = 1
+        self._thin_counts: dict[str, int] = {}
+        self._sock: socket.socket | None = None
+        self._rbuf = bytearray()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        # 統計
+        self.connected = False
+        self.connect_failures = 0          # 連續連線失敗次數
+        self.reconnects = 0
+        self.batches_sent = 0
+        self.batches_acked = 0
+        self.batches_dropped = 0
+        self.batches_resent = 0
+        self.frames_forwarded = 0
+        self.reports_forwarded = 0
+        self.frames_thinned = 0
+        self.records_dropped = 0           # 待封批記錄超過上限（轉送執行緒跟不上）
+        self.bytes_raw = 0
+        self.bytes_compressed = 0
+
+    def attach(self):
+        self.engine.subscribe(on_frame=self.on_frame, on_report=self.on_report)
+        return self
+
+    # ---------------- 接收執行緒 ----------------
+    def on_frame(self, dev, frame, _diff_mask=None):
+        stride = self._stride
+        if stride > 1:
+            n = self._thin_counts.get(dev.device_id, 0)
+            self._thin_counts[dev.device_id] = n + 1
+            if n % stride:
+                self.frames_thinned += 1
+                return
+        if len(self._pending) >= BATCH_MAX_RECORDS:
+            self.records_dropped += 1
+            return
+        self._pending.append((REC_FRAME, dev.device_id, time.time(), frame.copy()))
+
+    def on_report(self, dev, report):
+        if len(self._pending) >= BATCH_MAX_RECORDS:
+            self.records_dropped += 1
+            return
+        self._pending.append((REC_REPORT, dev.device_id, time.time(), report))
+
+    # ---------------- 轉送執行緒 ----------------
+    def start(self):
+        print(f"[FWD] forwarding as {self.name!r} to {self.address[0]}:{self.address[1]}")
+        self._thread = threading.Thread(target=self._run, name="forwarder", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        next_batch = time.monotonic() + self.batch_interval
+        reconnect_at, backoff = 0.0, RECONNECT_MIN
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now >= next_batch:
+                self._seal()
+                next_batch = now + self.batch_interval
+            if self._sock is None and now >= reconnect_at:
+                if self._connect():
+                    backoff = RECONNECT_MIN
+                else:
+                    reconnect_at = now + backoff
+                    backoff = min(backoff * 2, RECONNECT_MAX)
+            if self._sock is not None and not self._pump():
+                reconnect_at = time.monotonic() + backoff
+            self._wait(next_batch)
+        self._seal()
+        if self._sock is not None:
+            self._pump()
+            self._drain_acks(min(1.0, self.batch_interval * 4))
+        self._disconnect()
+
+    def _wait(self, until: float):
+        timeout = max(0.0, until - time.monotonic())
+        sock = self._sock
+        if sock is None:
+            self._stop.wait(timeout)
+            return
+        try:
+            if select.select([sock], [], [], timeout)[0]:
+                self._read_acks()
+        except (OSError, ValueError) as e:
+            self._on_error(e)
+
+    def _seal(self):
+        """待送記錄封成一批（壓縮）放進 outbox；超過緩衝上限時丟最舊的批次"""
+        pending = self._pending
+        n = min(len(pending), BATCH_MAX_RECORDS)
+        if not n:
+            return
+        records = [pending.popleft() for _ in range(n)]
+        raw = encode_batch(records)
+        frames = sum(1 for r in records if r[0] == REC_FRAME)
+        self._seq += 1
+        body = BATCH.pack(self._seq, len(raw)) + zlib.compress(raw, ZLIB_LEVEL)
+        batch = _Batch(self._seq, _message(MSG_BATCH, body), frames, n - frames)
+        self._outbox.append(batch)
+        self._outbox_bytes += len(batch.data)
+        self.bytes_raw += len(raw)
+        self.bytes_compressed += len(body)
+        while self._outbox_bytes > self.buffer_bytes and len(self._outbox) > 1:
+            old = self._outbox.popleft()
+            self._outbox_bytes -= len(old.data)
+            if self._unsent:
+                self._unsent -= 1
+                self._inflight_bytes -= len(old.data)
+            self.batches_dropped += 1
+        self._update_stride()
+
+    def _update_stride(self):
+        fill = self._outbox_bytes / self.buffer_bytes
+        for level, stride in THIN_LEVELS:
+            if fill < level:
+                break
+        if stride < self._stride:
+            entered = next(THIN_LEVELS[i - 1][0] for i, (_, s) in enumerate(THIN_LEVELS) if s == self._stride)
+            if fill >= entered - THIN_HYSTERESIS:
+                return
+        if stride != self._stride:
+            print(f"[FWD] buffer {fill:.0%} full, forwarding 1/{stride} of frames")
+            self._stride = stride
+
+    def _connect(self) -> bool:
+        try:
+            sock = socket.create_connection(self.address, timeout=SEND_TIMEOUT)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall(_message(MSG_HELLO, HELLO.pack(self.session) + self.name.encode()))
+        except OSError as e:
+            self.connect_failures += 1
+            if self.connect_failures == 1 or self.connect_failures % 20 == 0:
+                print(f"[FWD] connect to {self.address[0]}:{self.address[1]} failed "
+                      f"({self.connect_failures}x, {len(self._outbox)} batch(es) buffered):", e)
+            return False
+        self._sock = sock
+        self.connect_failures = 0
+        self._rbuf.clear()
+        if self.batches_sent:
+            self.reconnects += 1
+        self.batches_resent += self._unsent
+        self._unsent = 0
+        self._inflight_bytes = 0
+        self.connected = True
+        print(f"[FWD] connected, {len(self._outbox)} batch(es) buffered")
+        return True
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self.connected = False
+
+    def _on_error(self, e):
+        print("[FWD] connection lost:", e)
+        self._disconnect()
+
+    def _pump(self) -> bool:
+        """送出還沒送的批次（已送未確認的不超過 WINDOW_BYTES）；連線失敗回 False"""
+        outbox = self._outbox
+        try:
+            while self._unsent < len(outbox) and self._inflight_bytes < WINDOW_BYTES:
+                batch = outbox[self._unsent]
+                self._sock.sendall(batch.data)
+                self._unsent += 1
+                self._inflight_bytes += len(batch.data)
+                self.batches_sent += 1
+        except OSError as e:
+            self._on_error(e)
+            return False
+        return True
+
+    def _read_acks(self):
+        data = self._sock.recv(65536)
+        if not data:
+            raise ConnectionResetError("aggregator closed the connection")
+        buf = self._rbuf
+        buf += data
+        while len(buf) >= MSG_HEADER.size:
+            size, kind = MSG_HEADER.unpack_from(buf)
+            if len(buf) < 4 + size:
+                break
+            if kind == MSG_ACK:
+                self._on_ack(ACK.unpack_from(buf, MSG_HEADER.size)[0])
+            del buf[:4 + size]
+
+    def _on_ack(self, seq: int):
+        outbox = self._outbox
+        while outbox and outbox[0].seq <= seq and self._unsent:
+            batch = outbox.popleft()
+            self._outbox_bytes -= len(batch.data)
+            self._inflight_bytes -= len(batch.data)
+            self._unsent -= 1
+            self.batches_acked += 1
+            self.frames_forwarded += batch.frames
+            self.reports_forwarded += batch.reports
+        self._update_stride()
+
+    def _drain_acks(self, timeout: float):
+        """結束前等一下最後幾批的 ACK"""
+        deadline = time.monotonic() + timeout
+        while self._outbox and self._sock is not None and time.monotonic() < deadline:
+            self._wait(deadline)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(SEND_TIMEOUT + 2.0)
+        if self._outbox:
+            print(f"[FWD] {len(self._outbox)} batch(es) not acknowledged at exit")
+
+    def stats(self) -> dict:
+        return {"connected": self.connected, "buffered_batches": len(self._outbox),
+                "buffered_bytes": self._outbox_bytes, "pending_records": len(self._pending),
+                "stride": self._stride, "reconnects": self.reconnects, "batches_sent": self.batches_sent,
+                "batches_acked": self.batches_acked, "batches_resent": self.batches_resent,
+                "batches_dropped": self.batches_dropped, "frames_forwarded": self.frames_forwarded,
+                "reports_forwarded": self.reports_forwarded, "frames_thinned": self.frames_thinned,
+                "records_dropped": self.records_dropped, "bytes_raw": self.bytes_raw,
+                "bytes_compressed": self.bytes_compressed}
+
+
+# --------------------------------
+# 中央：彙整
+# --------------------------------
+class _EdgeConn:
+    __slots__ = ("sock", "addr", "buf", "name", "session")
+
+    def __init__(self, sock: socket.socket, addr):
+        self.sock = sock
+        self.addr = addr
+        self.buf = bytearray()
+        self.name: str | None = None
+        self.session = 0
+
+
+class Aggregator:
+    """
+    Engine 的輸入來源（與 ReplaySource 同一組介面：start / stop / done / stats）。
+    單一執行緒以 selector 服務所有邊緣連線，依序把記錄餵給 engine。
+    """
+
+    name = "aggregate"
+
+    def __init__(self, engine: Engine, host: str = "", port: int = DEFAULT_RELAY_PORT):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self._listen: socket.socket | None = None
+        self._conns: dict[socket.socket, _EdgeConn] = {}
+        self._last_seq: dict[tuple, int] = {}     # (name, session) -> 已處理的批次序號
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.done = threading.Event()
+        self._started = 0.0
+
+        # 統計
+        self.frames = 0
+        self.reports = 0
+        self.batches = 0
+        self.duplicates = 0
+        self.protocol_errors = 0
+        self.bytes_received = 0
+        self.elapsed = 0.0
+        self.edge_lag: dict[str, float] = {}       # 邊緣名稱 -> 最近一批最後一筆的延遲（秒）
+
+    def open(self):
+        """綁定監聽埠；失敗時丟出 OSError"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((self.host, self.port))
+            sock.listen(64)
+        except OSError:
+            sock.close()
+            raise
+        sock.setblocking(False)
+        self._listen = sock
+        self.port = sock.getsockname()[1]
+
+    def start(self):
+        if self._listen is None:
+            self.open()
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="aggregator", daemon=True)
+        self._thread.start()
+        print(f"[AGG] listening on {self.host or '0.0.0.0'}:{self.port}")
+
+    def _run(self):
+        try:
+            with selectors.DefaultSelector() as sel:
+                sel.register(self._listen, selectors.EVENT_READ)
+                while not self._stop.is_set():
+                    for key, _ in sel.select(timeout=0.5):
+                        if key.fileobj is self._listen:
+                            self._accept(sel)
+                        else:
+                            self._on_readable(sel, self._conns[key.fileobj])
+        finally:
+            for conn in list(self._conns.values()):
+                conn.sock.close()
+            self._conns.clear()
+            self._listen.close()
+            self.elapsed = time.monotonic() - self._started
+            self.done.set()
+
+    def _accept(self, sel):
+        try:
+            sock, addr = self._listen.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._conns[sock] = _EdgeConn(sock, addr)
+        sel.register(sock, selectors.EVENT_READ)
+
+    def _drop(self, sel, conn: _EdgeConn, reason: str):
+        print(f"[AGG] {conn.name or conn.addr[0]} disconnected: {reason}")
+        sel.unregister(conn.sock)
+        conn.sock.close()
+        self._conns.pop(conn.sock, None)
+
+    def _on_readable(self, sel, conn: _EdgeConn):
+        try:
+            data = conn.sock.recv(1 << 20)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._drop(sel, conn, str(e))
+            return
+        if not data:
+            self._drop(sel, conn, "closed")
+            return
+        self.bytes_received += len(data)
+        buf = conn.buf
+        buf += data
+        try:
+            while len(buf) >= MSG_HEADER.size:
+                size, kind = MSG_HEADER.unpack_from(buf)
+                if size > MAX_MESSAGE or size < 1:
+                    raise ValueError(f"bad message size {size}")
+                if len(buf) < 4 + size:
+                    break
+                body = bytes(buf[MSG_HEADER.size:4 + size])
+                del buf[:4 + size]
+                self._on_message(conn, kind, body)
+        except (ValueError, struct.error, zlib.error, OSError) as e:
+            self.protocol_errors += 1
+            self._drop(sel, conn, f"protocol error: {e}")
+
+    def _on_message(self, conn: _EdgeConn, kind: int, body: bytes):
+        if kind == MSG_HELLO:
+            conn.session = HELLO.unpack_from(body)[0]
+            conn.name = body[HELLO.size:].decode(errors="replace") or conn.addr[0]
+            print(f"[AGG] edge {conn.name!r} connected from {conn.addr[0]}")
+            return
+        if kind != MSG_BATCH or conn.name is None:
+            raise ValueError(f"unexpected message {kind}")
+        seq, raw_len = BATCH.unpack_from(body)
+        key = (conn.name, conn.session)
+        if seq <= self._last_seq.get(key, 0):
+            self.duplicates += 1           # 重連後重送、已處理過的批次
+        else:
+            raw = zlib.decompress(body[BATCH.size:])
+            if len(raw) != raw_len:
+                raise ValueError("batch length mismatch")
+            self._feed(conn.name, raw)
+            self._last_seq[key] = seq
+            self.batches += 1
+        conn.sock.sendall(_message(MSG_ACK, ACK.pack(seq)))
+
+    def _feed(self, edge: str, raw: bytes):
+        engine = self.engine
+        # 邊緣的 wall clock -> 本機 monotonic（Engine 的 last_seen 與斜率用的時間）
+        offset = time.monotonic() - time.time()
+        t = None
+        for kind, device_id, t, item in decode_batch(raw):
+            device_id = f"{edge}/{device_id}"
+            if kind == REC_REPORT:
+                engine.feed_report(device_id, item, t + offset)
+                self.reports += 1
+            else:
+                engine.feed_frame(device_id, item, t + offset)
+                self.frames += 1
+        if t is not None:
+            self.edge_lag[edge] = time.time() - t
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        elif self._listen is not None and self._thread is None:
+            self._listen.close()
+
+    def edges(self) -> list:
+        return sorted(c.name for c in list(self._conns.values()) if c.name)
+
+    def stats(self) -> dict:
+        elapsed = self.elapsed or (time.monotonic() - self._started if self._started else 0.0) or 1e-9
+        return {
+            "frames": self.frames,
+            "reports": self.reports,
+            "elapsed": elapsed,
+            "frames_per_sec": self.frames / elapsed,
+            "batches": self.batches,
+            "duplicates": self.duplicates,
+            "edges": len(self.edges()),
+        }
+
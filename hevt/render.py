@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+快速熱像繪製：溫度 → 256 階索引 → 預先算好的 inferno 查表（RGBA uint8），
+可選預先算好的整數倍放大，輸出可直接餵給 Tk PhotoImage 的 PPM 資料。
+
+不經過 Matplotlib 的 normalize / colormap / 整張圖重繪；每幀只有幾次
+寫入預先配置陣列的 NumPy 呼叫。
+"""
+
+import numpy as np
+
+from .engine import TEMP_MAX, TEMP_MIN
+
+LUT_SIZE = 256
+
+
+def build_lut(cmap_name: str = "inferno", n: int = LUT_SIZE) -> np.ndarray:
+    """(n, 4) RGBA uint8 色表；只在建立時載入 Matplotlib 的 colormap 一次。"""
+    from matplotlib import colormaps
+    return (colormaps[cmap_name](np.linspace(0.0, 1.0, n)) * 255 + 0.5).astype(np.uint8)
+
+
+class ThermalRenderer:
+    def __init__(self, height: int, width: int, scale: int = 1,
+                 tmin: float = TEMP_MIN, tmax: float = TEMP_MAX, lut: np.ndarray | None = None):
+        self.height = height
+        self.width = width
+        self.scale = max(1, int(scale))
+        self.out_h = height * self.scale
+        self.out_w = width * self.scale
+        self.lut = build_lut() if lut is None else lut
+        self._lut_rgb = np.ascontiguousarray(self.lut[:, :3])
+        self.set_range(tmin, tmax)
+
+        self._tmp = np.empty(height * width, dtype=np.float32)
+        self._idx = np.empty(height * width, dtype=np.uint8)
+        if self.scale > 1:
+            # 放大用的索引表：輸出像素 -> 來源像素
+            rows = np.arange(self.out_h) // self.scale
+            cols = np.arange(self.out_w) // self.scale
+            self._upmap = (rows[:, None] * width + cols[None, :]).reshape(-1)
+            self._idx_up = np.empty(self.out_h * self.out_w, dtype=np.uint8)
+        else:
+            self._upmap = None
+            self._idx_up = self._idx
+
+        # PPM (P6) = header + RGB；RGB 直接寫進同一塊 bytearray
+        header = f"P6\n{self.out_w} {self.out_h}\n255\n".encode("ascii")
+        self._ppm = bytearray(len(header) + self.out_h * self.out_w * 3)
+        self._ppm[:len(header)] = header
+        self._rgb = np.frombuffer(self._ppm, dtype=np.uint8, offset=len(header)).reshape(-1, 3)
+        self._rgba = np.empty((self.out_h * self.out_w, 4), dtype=np.uint8)
+
+    def set_range(self, tmin: float, tmax: float):
+        self.tmin = float(tmin)
+        self.tmax = float(tmax)
+        self._k = (LUT_SIZE - 1) / max(1e-6, self.tmax - self.tmin)
+
+    def index(self, frame: np.ndarray) -> np.ndarray:
+        """溫度 → 0..255 色表索引（已放大）"""
+        tmp = self._tmp
+        np.subtract(frame.reshape(-1), self.tmin, out=tmp)
+        np.multiply(tmp, self._k, out=tmp)
+        np.clip(tmp, 0, LUT_SIZE - 1, out=tmp)
+        np.copyto(self._idx, tmp, casting="unsafe")
+        if self._upmap is not None:
+            np.take(self._idx, self._upmap, out=self._idx_up)
+        return self._idx_up
+
+    def rgba(self, frame: np.ndarray) -> np.ndarray:
+        """(out_h, out_w, 4) RGBA uint8；回傳內部緩衝，下一次呼叫會覆蓋。"""
+        np.take(self.lut, self.index(frame), axis=0, out=self._rgba)
+        return self._rgba.reshape(self.out_h, self.out_w, 4)
+
+    def ppm(self, frame: np.ndarray) -> bytearray:
+        """PPM P6 資料（給 PhotoImage）；回傳內部緩衝，下一次呼叫會覆蓋。"""
+        np.take(self._lut_rgb, self.index(frame), axis=0, out=self._rgb)
+        return self._ppm
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+重播：把錄製的幀與 REPORT（見 recorder.py）送回 Engine，走與 UDP 相同的
+組幀 → diff_mask → 主機分析 → 警報 → 訂閱者（GUI / 錄影）路徑。
+
+  speed = 1      即時
+  speed = N      N 倍速
+  speed = 0      不等待，盡快送（回歸測試警報邏輯、量測 pipeline 吞吐量）
+
+重播時 Engine 的警報時鐘改用錄製時間，冷卻時間等判斷與現場一致，不受倍速影響。
+節奏、seek 與送進 Engine 的時間都用錄製時間軸（見 recorder.py），錄影時調過鐘也不會亂序或卡住。
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from .engine import Engine
+from .recorder import REC_REPORT, RecordingReader, record_report
+
+
+class ReplaySource:
+    name = "replay"
+
+    def __init__(self, engine: Engine, directory: str, speed: float = 1.0,
+                 t0: float | None = None, t1: float | None = None, device: str | None = None):
+        self.engine = engine
+        self.directory = directory
+        self.speed = speed
+        self.t0 = float("-inf") if t0 is None else t0
+        self.t1 = float("inf") if t1 is None else t1
+        self.device = device
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.current_t = 0.0           # 目前重播到的錄製時間
+
+        # 統計
+        self.frames = 0
+        self.reports = 0
+        self.elapsed = 0.0
+        self.done = threading.Event()
+
+    def _alert_clock(self) -> datetime:
+        return datetime.fromtimestamp(self.current_t)
+
+    def run(self) -> dict:
+        """在目前執行緒重播到結束（或 stop()）；回傳 stats()。"""
+        self.engine.alert_clock = self._alert_clock
+        self.engine.wall_offset = 0.0      # 送進 Engine 的時間就是錄製時間
+        start = time.monotonic()
+        try:
+            with RecordingReader(self.directory) as reader:
+                self._play(reader, start)
+        finally:
+            self.elapsed = time.monotonic() - start
+            self.engine.alert_clock = None
+            self.engine.wall_offset = None
+            self.done.set()
+        return self.stats()
+
+    def _play(self, reader: RecordingReader, start: float):
+        engine = self.engine
+        last_seq = {}
+        pace = self.speed > 0
+        rec_start = None
+        for times, recs in reader.records(self.t0, self.t1, self.device, with_times=True):
+            for i in range(len(recs)):
+                if self._stop.is_set():
+                    return
+                t = float(times[i])
+                if pace:
+                    if rec_start is None:
+                        rec_start = t
+                    wait = (t - rec_start) / self.speed - (time.monotonic() - start)
+                    if wait > 0 and self._stop.wait(wait):
+                        return
+                self.current_t = t
+                rec = recs[i]
+                device_id = rec["device"].decode()
+                # REPORT 單獨一筆、也隨幀錄下；序號變了才視為新的一筆
+                seq = int(rec["report_seq"])
+                if seq and last_seq.get(device_id) != seq:
+                    last_seq[device_id] = seq
+                    engine.feed_report(device_id, record_report(rec), t)
+                    self.reports += 1
+                if rec["kind"] == REC_REPORT:
+                    continue
+                engine.feed_frame(device_id, rec["frame"], t)
+                self.frames += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="replay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def stats(self) -> dict:
+        elapsed = self.elapsed or 1e-9
+        return {
+            "frames": self.frames,
+            "reports": self.reports,
+            "elapsed": self.elapsed,
+            "frames_per_sec": self.frames / elapsed,
+        }
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+STM32 REPORT 解析。
+
+文字格式 `REPORT,ALARM=..,D1=..,...,D10=..` 依 REPORT_SCHEMA 以 key 對應欄位：
+順序不拘、未知的 key 忽略、缺少的欄位用預設值（至少要有一個已知 key）。
+
+二進位格式（可選）：固定 42 B，一次 struct.unpack 即得全部欄位
+  magic "HRP1" | alarm u8 | pad | D6 u16 | D7 u16 | D1..D5, D8..D10 float32（little endian）
+"""
+
+import struct
+from typing import NamedTuple
+
+
+class Report(NamedTuple):
+    """一筆 REPORT；欄位順序與 GUI 的 alarm, D1..D10 相同。"""
+    alarm: int
+    max_temp: float         # D1
+    min_temp: float         # D2
+    avg_temp: float         # D3
+    max_slope: float        # D4
+    avg_slope: float        # D5
+    over_count: int         # D6
+    diff_area: int          # D7
+    avg_temp_trend: float   # D8
+    max_slope_trend: float  # D9
+    diff_area_trend: float  # D10
+
+
+# --------------------------------
+# 文字格式
+# --------------------------------
+# (key, Report 欄位, 型別, 預設值)；韌體加欄位時在這裡加一行
+REPORT_SCHEMA = (
+    ("ALARM", "alarm", int, 0),
+    ("D1", "max_temp", float, 0.0),
+    ("D2", "min_temp", float, 0.0),
+    ("D3", "avg_temp", float, 0.0),
+    ("D4", "max_slope", float, 0.0),
+    ("D5", "avg_slope", float, 0.0),
+    ("D6", "over_count", int, 0),
+    ("D7", "diff_area", int, 0),
+    ("D8", "avg_temp_trend", float, 0.0),
+    ("D9", "max_slope_trend", float, 0.0),
+    ("D10", "diff_area_trend", float, 0.0),
+)
+REPORT_PREFIX = "REPORT"
+
+
+def _to_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value))   # 韌體送 "12.0" 也接受
+
+
+def _compile_schema(schema) -> tuple:
+    index = {f: i for i, f in enumerate(Report._fields)}
+    fields = {}
+    for key, field, kind, _default in schema:
+        fields[key] = (index[field], _to_int if kind is int else float)
+    defaults = [None] * len(Report._fields)
+    for _key, field, _kind, default in schema:
+        defaults[index[field]] = default
+    if None in defaults:
+        missing = [Report._fields[i] for i, d in enumerate(defaults) if d is None]
+        raise ValueError(f"REPORT_SCHEMA missing fields: {missing}")
+    return fields, tuple(defaults)
+
+
+_KEYS, _DEFAULTS = _compile_schema(REPORT_SCHEMA)
+
+
+def parse_report(msg: str) -> Report:
+    """解析文字 REPORT；沒有任何已知 key 或數值格式錯誤時丟出 ValueError。"""
+    parts = msg.split(",")
+    if parts[0].strip() != REPORT_PREFIX:
+        raise ValueError("not a REPORT message")
+    values = list(_DEFAULTS)
+    keys = _KEYS
+    found = 0
+    for part in parts[1:]:
+        key, _, value = part.partition("=")
+        spec = keys.get(key.strip())
+        if spec is not None:
+            values[spec[0]] = spec[1](value)
+            found += 1
+    if not found:
+        raise ValueError("REPORT without known fields")
+    return Report._make(values)
+
+
+def format_report(report: Report) -> str:
+    """parse_report 的反向（模擬器/測試用）"""
+    return (f"REPORT,ALARM={int(report.alarm)},D1={report.max_temp:.2f},D2={report.min_temp:.2f},"
+            f"D3={report.avg_temp:.2f},D4={report.max_slope:.2f},D5={report.avg_slope:.2f},"
+            f"D6={int(report.over_count)},D7={int(report.diff_area)},D8={report.avg_temp_trend:.2f},"
+            f"D9={report.max_slope_trend:.2f},D10={report.diff_area_trend:.2f}")
+
+
+# --------------------------------
+# 二進位格式
+# --------------------------------
+BIN_REPORT_MAGIC = b"HRP1"
+BIN_REPORT = struct.Struct("<4sBxHH8f")
+
+
+def parse_binary_report(data) -> Report:
+    """解析二進位 REPORT（bytes / memoryview）；長度不足或 magic 不符時丟出 ValueError。"""
+    if len(data) < BIN_REPORT.size:
+        raise ValueError(f"binary REPORT too short ({len(data)} B)")
+    magic, alarm, over, diff, d1, d2, d3, d4, d5, d8, d9, d10 = BIN_REPORT.unpack_from(data)
+    if magic != BIN_REPORT_MAGIC:
+        raise ValueError("bad binary REPORT magic")
+    return Report(alarm, d1, d2, d3, d4, d5, over, diff, d8, d9, d10)
+
+
+def pack_report(report: Report) -> bytes:
+    """parse_binary_report 的反向（模擬器/測試用）"""
+    r = report
+    return BIN_REPORT.pack(BIN_REPORT_MAGIC, int(r.alarm), min(int(r.over_count), 0xFFFF),
+                           min(int(r.diff_area), 0xFFFF), r.max_temp, r.min_temp, r.avg_temp,
+                           r.max_slope, r.avg_slope, r.avg_temp_trend, r.max_slope_trend,
+                           r.diff_area_trend)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+關注區域（ROI）：每台裝置可設定多個矩形區域（馬達、匯流排、斷路器 …），
+各自算 Max/Min/Avg、像素斜率、Over Count，並有自己的 Alarm / Slope 門檻。
+
+設定檔（JSON），key 為 device id（單機模式為 "default"），"*" 為未列出裝置的預設：
+
+  {
+    "*":            [{"name": "motor", "rect": [0, 0, 12, 16], "alarm": 45, "slope": 2.0}],
+    "192.168.5.12": [{"name": "busbar", "rect": [4, 8, 10, 30]},
+                     {"name": "breaker", "rect": [14, 0, 24, 10], "alarm": 60}]
+  }
+
+rect 為 [row0, col0, row1, col1)（半開區間）；區域重疊時後面的優先。
+alarm / slope 未給時跟著全域門檻（Set Threshold）。
+
+建立時把所有 ROI 編成一張標籤圖，算好「依標籤排序的像素索引」與各段起點；
+每幀只做一次 gather，再以 reduceat 一次算出所有 ROI 的統計 ——
+ROI 數量不會讓每幀的 NumPy 呼叫次數變多。
+"""
+
+import json
+from dataclasses import dataclass
+
+import numpy as np
+
+DEFAULT_WINDOW = 16            # 幀；像素斜率 = (目前 - 視窗最舊) / 時間差，與 analytics.py 相同
+DEFAULT_DEVICE_KEY = "*"
+
+
+@dataclass
+class Roi:
+    name: str
+    rect: tuple                # (row0, col0, row1, col1)，半開區間
+    alarm: float | None = None # None = 跟著全域門檻
+    slope: float | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Roi":
+        rect = tuple(int(v) for v in data["rect"])
+        if len(rect) != 4:
+            raise ValueError(f"ROI {data.get('name')!r}: rect must be [row0, col0, row1, col1]")
+        alarm = data.get("alarm")
+        slope = data.get("slope")
+        return cls(name=str(data["name"]), rect=rect,
+                   alarm=None if alarm is None else float(alarm),
+                   slope=None if slope is None else float(slope))
+
+
+def load_roi_config(path: str) -> dict:
+    """讀取 ROI 設定檔；回傳 {device_id: [Roi, ...]}，格式錯誤時丟出 ValueError。"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f) or {}
+    if not isinstance(data, dict):
+        raise ValueError("ROI config must be an object of {device_id: [roi, ...]}")
+    return {str(dev): [Roi.from_dict(r) for r in rois] for dev, rois in data.items()}
+
+
+def rois_for(config: dict | None, device_id: str) -> list:
+    if not config:
+        return []
+    return config.get(device_id, config.get(DEFAULT_DEVICE_KEY, []))
+
+
+class RoiStats:
+    """單一裝置所有 ROI 的每幀統計；結果放在預先配置的陣列（長度 = ROI 數）。"""
+
+    def __init__(self, rois: list, height: int, width: int, window: int = DEFAULT_WINDOW,
+                 alarm: float = 30.0, slope: float = 2.0):
+        if not rois:
+            raise ValueError("RoiStats needs at least one ROI")
+        self.rois = list(rois)
+        self.names = [r.name for r in self.rois]
+        n = len(self.rois)
+
+        labels = np.zeros((height, width), dtype=np.int32)
+        for k, roi in enumerate(self.rois):
+            r0, c0, r1, c1 = roi.rect
+            labels[max(0, r0):min(height, r1), max(0, c0):min(width, c1)] = k + 1
+        self.labels = labels
+        flat = labels.reshape(-1)
+        counts = np.bincount(flat, minlength=n + 1)
+        empty = [self.names[k] for k in range(n) if counts[k + 1] == 0]
+        if empty:
+            raise ValueError(f"ROI without pixels (outside the frame or fully overlapped): {empty}")
+        order = np.argsort(flat, kind="stable")
+        self._sel = np.ascontiguousarray(order[counts[0]:])           # 依 ROI 排好的像素索引
+        self.counts = counts[1:].astype(np.int64)
+        self._starts = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+        self._pix_roi = flat[self._sel] - 1                            # 每個選取像素屬於哪個 ROI
+        npix = len(self._sel)
+
+        self.alarm_thresh = np.empty(n, dtype=np.float32)
+        self.slope_thresh = np.empty(n, dtype=np.float32)
+        self._pix_alarm = np.empty(npix, dtype=np.float32)
+        self.set_thresholds(alarm, slope)
+
+        self.window = window
+        self._hist = np.zeros((window, npix), dtype=np.float32)
+        self._times = np.zeros(window, dtype=np.float64)
+        self._count = 0
+        self._pos = 0
+        self._vals = np.empty(npix, dtype=np.float32)
+        self._tmp = np.empty(npix, dtype=np.float32)
+        self._over = np.empty(npix, dtype=bool)
+
+        self.max = np.zeros(n, dtype=np.float32)
+        self.min = np.zeros(n, dtype=np.float32)
+        self.avg = np.zeros(n, dtype=np.float32)
+        self.max_slope = np.zeros(n, dtype=np.float32)
+        self.avg_slope = np.zeros(n, dtype=np.float32)
+        self.over_count = np.zeros(n, dtype=np.int64)
+        self.alarm = np.zeros(n, dtype=bool)
+        self._slope_alarm = np.zeros(n, dtype=bool)
+        self._sum = np.zeros(n, dtype=np.float32)
+
+    def set_thresholds(self, alarm: float | None = None, slope: float | None = None):
+        """更新全域門檻；只影響沒有自訂門檻的 ROI"""
+        for k, roi in enumerate(self.rois):
+            if alarm is not None:
+                self.alarm_thresh[k] = roi.alarm if roi.alarm is not None else alarm
+            if slope is not None:
+                self.slope_thresh[k] = roi.slope if roi.slope is not None else slope
+        np.take(self.alarm_thresh, self._pix_roi, out=self._pix_alarm)
+
+    def update(self, frame: np.ndarray, t: float):
+        starts = self._starts
+        vals = np.take(frame.reshape(-1), self._sel, out=self._vals)
+        np.maximum.reduceat(vals, starts, out=self.max)
+        np.minimum.reduceat(vals, starts, out=self.min)
+        np.add.reduceat(vals, starts, out=self._sum)
+        np.divide(self._sum, self.counts, out=self.avg)
+        np.greater_equal(vals, self._pix_alarm, out=self._over)
+        np.add.reduceat(self._over, starts, out=self.over_count)
+
+        oldest = self._pos if self._count == self.window else 0
+        dt = t - self._times[oldest]
+        if self._count and dt > 0:
+            tmp = self._tmp
+            np.subtract(vals, self._hist[oldest], out=tmp)
+            tmp *= 1.0 / dt
+            np.maximum.reduceat(tmp, starts, out=self.max_slope)
+            np.add.reduceat(tmp, starts, out=self._sum)
+            np.divide(self._sum, self.counts, out=self.avg_slope)
+        else:
+            self.max_slope.fill(0.0)
+            self.avg_slope.fill(0.0)
+        self._hist[self._pos] = vals
+        self._times[self._pos] = t
+        self._pos = (self._pos + 1) % self.window
+        self._count = min(self._count + 1, self.window)
+
+        np.greater_equal(self.max, self.alarm_thresh, out=self.alarm)
+        np.greater_equal(self.max_slope, self.slope_thresh, out=self._slope_alarm)
+        self.alarm |= self._slope_alarm
+
+    def rows(self) -> list:
+        """[(name, max, min, avg, max_slope, over_count, alarm), ...]（顯示用）"""
+        return [(name, float(self.max[k]), float(self.min[k]), float(self.avg[k]),
+                 float(self.max_slope[k]), int(self.over_count[k]), bool(self.alarm[k]))
+                for k, name in enumerate(self.names)]
@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+"""
+STM32 模擬器／負載產生器：在本機說與實機相同的 UDP 協定。
+
+每台模擬裝置綁一個 loopback 位址（127.0.0.2、127.0.0.3 …）的指令埠，
+主機以 --multi 依來源 IP 分流，與現場多台 STM32 相同。
+
+  指令（主機 → 裝置指令埠）
+    GET_IMAGE                  立即送一幀
+    SET_THRESH:D1=..,D2=..,D3=..,D4=..   Alarm / Slope / Diffusion / 取樣間隔 ms
+    ENABLE_AUTO=1|0            開/關連續送影像
+    SET_ENCODING=F32|I16|F16|DELTA[,KEY=n]   改送 HVT1 分塊封包
+    SEQ=n;<指令>               可靠指令（commands.py）：執行後回 ACK,SEQ=n,OK|ERR=..；重複的序號只重回 ACK
+  輸出（裝置 → 主機）
+    REPORT,ALARM=..,D1=..,...,D10=..   每個取樣週期一筆，送到主機指令埠（--binary-report 改送 42 B 二進位）
+    影像                        raw float32（或 HVT1 分塊）送到主機影像埠
+
+場景：環境溫度 + 雜訊 + 幾個高斯熱點，其中一個週期性升溫/降溫，會跨過 Alarm 門檻。
+REPORT 由 FrameAnalyzer 計算，與主機端 --analytics 的定義相同。
+
+網路干擾（每個封包獨立）：loss 機率丟棄（送出與收到的指令都算）、reorder 機率延後送出、jitter 隨機延遲。
+單一執行緒以排程堆積服務所有裝置，可模擬數十台 × 數十 Hz。
+
+  python -m hevt.simulator --devices 10 --fps 16 --loss 0.01 --reorder 0.01 --jitter 2
+  python main.py --headless --multi --bind 127.0.0.1
+"""
+
+import argparse
+from collections import OrderedDict
+import heapq
+import ipaddress
+import itertools
+import selectors
+import socket
+import threading
+import time
+
+import numpy as np
+
+from .analytics import FrameAnalyzer
+from .codec import DEFAULT_KEYFRAME_INTERVAL, ENC_DELTA, ENCODINGS, DeltaEncoder, encode
+from .commands import format_ack, parse_command
+from .engine import PIX_H, PIX_W, STM32_CMD_PORT, STM32_IMG_PORT
+from .frames import split_payload
+from .report import format_report, pack_report
+
+DEFAULT_BASE_IP = "127.0.0.2"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_FPS = 8.0
+DEFAULT_PACKET_PIXELS = 384    # 一幀分兩包（1536 B），與舊版接收端 recvfrom(2048) 相容
+REORDER_DELAY = 0.003          # 被延後的封包晚送幾秒（足以排到後面幾包之後）
+STATS_INTERVAL = 5.0
+ACK_MEMORY = 256               # 記住最近幾個指令序號（重送時只回 ACK）
+
+
+class SimDevice:
+    """單一模擬 STM32：熱場景、裝置端 D1–D10 與指令狀態。"""
+
+    def __init__(self, ip: str, sock: socket.socket, rng: np.random.Generator, fps: float = DEFAULT_FPS,
+                 auto: bool = True, ambient: float = 25.0, peak: float = 20.0, heat_period: float = 60.0,
+                 noise: float = 0.15, packet_pixels: int = DEFAULT_PACKET_PIXELS):
+        self.ip = ip
+        self.sock = sock
+        self.rng = rng
+        self.interval = 1.0 / fps
+        self.auto = auto
+        self.ambient = ambient
+        self.peak = peak
+        self.heat_period = heat_period
+        self.noise = noise
+        self.packet_pixels = packet_pixels
+        self.thresholds = {"alarm": 30.0, "slope": 2.0, "diffusion": 1.2}
+        self.analyzer = FrameAnalyzer(PIX_H * PIX_W, **self.thresholds)
+
+        self.encoding: int | None = None       # None = 舊版 raw float32 串流
+        self.delta = DeltaEncoder()
+        self.frame_id = 0
+        self.want_image = False
+        self.acks: OrderedDict = OrderedDict()  # seq -> 回過的 ACK
+        self.next_at = 0.0
+        self.phase = rng.uniform(0, heat_period)
+
+        # 熱點：(K, H*W) 高斯核，frame = ambient + amps @ kernels + noise
+        yy, xx = np.mgrid[0:PIX_H, 0:PIX_W]
+        centers = rng.uniform((2, 2), (PIX_H - 2, PIX_W - 2), size=(3, 2))
+        sigmas = rng.uniform(1.5, 4.0, size=3)
+        self.kernels = np.stack([
+            np.exp(-((yy - cy) ** 2 + (xx - cx) ** 2) / (2 * s * s)).reshape(-1)
+            for (cy, cx), s in zip(centers, sigmas)
+        ]).astype(np.float32)
+        self.base_amps = rng.uniform(0.5, 3.0, size=3).astype(np.float32)
+        self._amps = self.base_amps.copy()
+        self._frame = np.empty(PIX_H * PIX_W, dtype=np.float32)
+
+        # 統計
+        self.frames_sent = 0
+        self.reports_sent = 0
+        self.commands = 0
+
+    def render(self, t: float) -> np.ndarray:
+        """產生 t 時刻的一幀（內部緩衝，下一次呼叫會覆蓋）"""
+        # 第一個熱點：三角波升溫/降溫，峰值 ambient + peak
+        x = ((t + self.phase) % self.heat_period) / self.heat_period
+        self._amps[0] = self.base_amps[0] + self.peak * (1.0 - abs(2.0 * x - 1.0))
+        np.dot(self._amps, self.kernels, out=self._frame)
+        self._frame += self.ambient
+        self._frame += self.rng.normal(0.0, self.noise, size=self._frame.size).astype(np.float32)
+        return self._frame
+
+    def image_packets(self, frame: np.ndarray) -> list:
+        if self.encoding is None:
+            raw = frame.tobytes()
+            step = self.packet_pixels * 4
+            return [raw[i:i + step] for i in range(0, len(raw), step)]
+        fid = self.frame_id
+        self.frame_id = (fid + 1) & 0xFFFF
+        if self.encoding == ENC_DELTA:
+            enc, payload = self.delta.encode(frame)
+        else:
+            enc, payload = self.encoding, encode(frame, self.encoding)
+        return split_payload(payload, enc, fid, self.packet_pixels)
+
+    def handle_command(self, msg: str) -> str:
+        """執行一筆指令；回傳錯誤原因（成功為空字串）"""
+        self.commands += 1
+        if msg == "GET_IMAGE":
+            self.want_image = True
+        elif msg.startswith("SET_THRESH:"):
+            fields = dict(kv.split("=", 1) for kv in msg[len("SET_THRESH:"):].split(",") if "=" in kv)
+            try:
+                thresholds = {"alarm": float(fields.get("D1", self.thresholds["alarm"])),
+                              "slope": float(fields.get("D2", self.thresholds["slope"])),
+                              "diffusion": float(fields.get("D3", self.thresholds["diffusion"]))}
+                interval = max(0.001, float(fields["D4"]) / 1000.0) if "D4" in fields else self.interval
+            except ValueError:
+                print(f"[SIM] {self.ip}: bad command {msg!r}")
+                return "bad value"
+            self.thresholds = thresholds
+            self.analyzer.set_thresholds(**thresholds)
+            self.interval = interval
+        elif msg.startswith("ENABLE_AUTO="):
+            self.auto = msg.endswith("=1")
+        elif msg.startswith("SET_ENCODING="):
+            name, *opts = msg[len("SET_ENCODING="):].split(",")
+            enc = ENCODINGS.get(name.lower())
+            if enc is None:
+                print(f"[SIM] {self.ip}: unknown encoding {name}")
+                return "unknown encoding"
+            key = DEFAULT_KEYFRAME_INTERVAL
+            for opt in opts:
+                if opt.startswith("KEY="):
+                    key = int(opt[4:])
+            self.encoding = enc
+            self.delta = DeltaEncoder(key)
+        else:
+            print(f"[SIM] {self.ip}: unknown command {msg!r}")
+            return "unknown command"
+        return ""
+
+    def handle_sequenced(self, seq: int, msg: str) -> bytes:
+        """SEQ=n;指令：新序號執行一次並記住 ACK，重複的序號直接回同一個 ACK"""
+        ack = self.acks.get(seq)
+        if ack is None:
+            ack = self.acks[seq] = format_ack(seq, self.handle_command(msg))
+            if len(self.acks) > ACK_MEMORY:
+                self.acks.popitem(last=False)
+        return ack
+
+
+class Simulator:
+    """
+    多台模擬裝置 + 網路干擾；start() 後在背景執行緒跑，stop() 結束。
+
+    loss / reorder：每個封包的機率；jitter：每個封包額外延遲 0..jitter 秒。
+    """
+
+    def __init__(self, devices: int = 1, base_ip: str = DEFAULT_BASE_IP, host: str = DEFAULT_HOST,
+                 cmd_port: int = STM32_CMD_PORT, img_port: int = STM32_IMG_PORT, fps: float = DEFAULT_FPS,
+                 loss: float = 0.0, reorder: float = 0.0, jitter: float = 0.0, auto: bool = True,
+                 encoding: str | None = None, packet_pixels: int = DEFAULT_PACKET_PIXELS,
+                 listen: bool = True, binary_report: bool = False, seed: int | None = None,
+                 verbose: bool = False, **scene):
+        self.host = host
+        self.verbose = verbose         # 逐筆印出收到的指令（大量裝置 / 自適應取樣時會洗版，預設只算在統計裡）
+        self.cmd_port = cmd_port
+        self.img_port = img_port
+        self.loss = loss
+        self.reorder = reorder
+        self.jitter = jitter
+        self.binary_report = binary_report
+        self.rng = np.random.default_rng(seed)
+        self._sel = selectors.DefaultSelector()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._queue = []               # (due, seq, sock, data, addr)：延後送出的封包
+        self._seq = itertools.count()
+
+        self.devices: list[SimDevice] = []
+        first = ipaddress.IPv4Address(base_ip)
+        try:
+            for i in range(devices):
+                ip = str(first + i)
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+                except OSError:
+                    pass
+                # 綁在裝置 IP 的指令埠：主機送到 ip:cmd_port 的指令由這裡收，送出的封包來源 IP 也是它
+                sock.bind((ip, cmd_port if listen else 0))
+                sock.setblocking(False)
+                dev = SimDevice(ip, sock, np.random.default_rng(self.rng.integers(1 << 32)), fps=fps,
+                                auto=auto, packet_pixels=packet_pixels, **scene)
+                if encoding:
+                    dev.handle_command(f"SET_ENCODING={encoding.upper()}")
+                    dev.commands = 0
+                self.devices.append(dev)
+                self._sel.register(sock, selectors.EVENT_READ, dev)
+        except OSError:
+            self.close()
+            raise
+
+        # 統計
+        self.packets_sent = 0
+        self.packets_lost = 0
+        self.packets_reordered = 0
+        self.bytes_sent = 0
+
+    # ---------------- 送出 ----------------
+    def _send(self, sock: socket.socket, data: bytes, addr: tuple, now: float):
+        if self.loss and self.rng.random() < self.loss:
+            self.packets_lost += 1
+            return
+        delay = self.rng.uniform(0.0, self.jitter) if self.jitter else 0.0
+        if self.reorder and self.rng.random() < self.reorder:
+            delay += REORDER_DELAY
+            self.packets_reordered += 1
+        if delay > 0:
+            heapq.heappush(self._queue, (now + delay, next(self._seq), sock, data, addr))
+            return
+        self._sendto(sock, data, addr)
+
+    def _sendto(self, sock: socket.socket, data: bytes, addr: tuple):
+        try:
+            sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            self.packets_lost += 1             # 本機送出緩衝滿，等同掉包
+            return
+        except OSError as e:
+            print("[SIM] send error:", e)
+            return
+        self.packets_sent += 1
+        self.bytes_sent += len(data)
+
+    def _tick(self, dev: SimDevice, now: float):
+        frame = dev.render(now)
+        report = dev.analyzer.update(frame, now)
+        msg = pack_report(report) if self.binary_report else format_report(report).encode()
+        self._send(dev.sock, msg, (self.host, self.cmd_port), now)
+        dev.reports_sent += 1
+        if dev.auto or dev.want_image:
+            dev.want_image = False
+            for pkt in dev.image_packets(frame):
+                self._send(dev.sock, pkt, (self.host, self.img_port), now)
+            dev.frames_sent += 1
+
+    # ---------------- 主迴圈 ----------------
+    def run(self):
+        start = time.monotonic()
+        for dev in self.devices:
+            # 各台錯開，不要同一瞬間一起送
+            dev.next_at = start + self.rng.uniform(0, dev.interval)
+        schedule = [(dev.next_at, i) for i, dev in enumerate(self.devices)]
+        heapq.heapify(schedule)
+        next_stats = start + STATS_INTERVAL
+
+        while not self._stop.is_set():
+            now = time.monotonic()
+            while self._queue and self._queue[0][0] <= now:
+                _due, _seq, sock, data, addr = heapq.heappop(self._queue)
+                self._sendto(sock, data, addr)
+            while schedule and schedule[0][0] <= now:
+                due, i = heapq.heappop(schedule)
+                dev = self.devices[i]
+                self._tick(dev, now)
+                # 以排程時間累加，長期頻率不漂移；落後太多時直接從現在重算
+                nxt = due + dev.interval
+                heapq.heappush(schedule, (nxt if nxt > now - 1.0 else now + dev.interval, i))
+            if now >= next_stats:
+                self._print_stats(now - start)
+                next_stats += STATS_INTERVAL
+
+            wake = schedule[0][0] if schedule else now + 0.5
+            if self._queue:
+                wake = min(wake, self._queue[0][0])
+            for key, _ in self._sel.select(timeout=max(0.0, wake - time.monotonic())):
+                self._drain_commands(key.fileobj, key.data)
+
+    def _drain_commands(self, sock: socket.socket, dev: SimDevice):
+        for _ in range(64):
+            try:
+                data, _addr = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if self.loss and self.rng.random() < self.loss:
+                self.packets_lost += 1
+                continue
+            msg = data.decode(errors="ignore").strip()
+            if self.verbose:
+                print(f"[SIM] {dev.ip} <- {msg}")
+            seq, cmd = parse_command(msg)
+            if seq is None:
+                dev.handle_command(cmd)
+            else:
+                self._send(dev.sock, dev.handle_sequenced(seq, cmd), (self.host, self.cmd_port), time.monotonic())
+
+    def _print_stats(self, elapsed: float):
+        frames = sum(d.frames_sent for d in self.devices)
+        print(f"[SIM] {len(self.devices)} device(s) t={elapsed:.0f}s frames={frames} "
+              f"({frames / max(elapsed, 1e-9):.0f}/s) packets={self.packets_sent} "
+              f"lost={self.packets_lost} reordered={self.packets_reordered} "
+              f"cmds={sum(d.commands for d in self.devices)} "
+              f"{self.bytes_sent / max(elapsed, 1e-9) / 1e6:.2f} MB/s")
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="stm32-sim", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        for dev in self.devices:
+            try:
+                self._sel.unregister(dev.sock)
+            except (KeyError, ValueError):
+                pass
+            dev.sock.close()
+        self._sel.close()
+
+    def stats(self) -> dict:
+        return {
+            "devices": len(self.devices),
+            "frames_sent": sum(d.frames_sent for d in self.devices),
+            "reports_sent": sum(d.reports_sent for d in self.devices),
+            "commands": sum(d.commands for d in self.devices),
+            "packets_sent": self.packets_sent,
+            "packets_lost": self.packets_lost,
+            "packets_reordered": self.packets_reordered,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="HEVT STM32 simulator / load generator")
+    p.add_argument("--devices", type=int, default=1, help="模擬裝置數（IP 由 --base-ip 起連號）")
+    p.add_argument("--base-ip", default=DEFAULT_BASE_IP, help="第一台的 IP（需為本機位址；macOS 需先 ifconfig lo0 alias）")
+    p.add_argument("--host", default=DEFAULT_HOST, help="主機（main.py）IP")
+    p.add_argument("--cmd-port", type=int, default=STM32_CMD_PORT)
+    p.add_argument("--img-port", type=int, default=STM32_IMG_PORT)
+    p.add_argument("--fps", type=float, default=DEFAULT_FPS, help="每台的取樣頻率（之後可由 SET_THRESH D4 改）")
+    p.add_argument("--auto", action=argparse.BooleanOptionalAction, default=True,
+                   help="開機即連續送影像（等同 ENABLE_AUTO=1）")
+    p.add_argument("--encoding", choices=tuple(ENCODINGS), help="開機即送 HVT1 分塊封包（預設 raw float32）")
+    p.add_argument("--packet-pixels", type=int, default=DEFAULT_PACKET_PIXELS, help="每個影像封包的像素數")
+    p.add_argument("--loss", type=float, default=0.0, help="每個封包的遺失機率（0–1）")
+    p.add_argument("--reorder", type=float, default=0.0, help="每個封包被延後（亂序）的機率（0–1）")
+    p.add_argument("--jitter", type=float, default=0.0, help="每個封包額外延遲 0..JITTER 毫秒")
+    p.add_argument("--peak", type=float, default=20.0, help="升溫熱點高出環境溫度的峰值（°C）")
+    p.add_argument("--period", type=float, default=60.0, help="升溫/降溫一輪的秒數")
+    p.add_argument("--binary-report", action="store_true", help="REPORT 改送二進位格式（見 hevt/report.py）")
+    p.add_argument("--no-listen", action="store_true", help="不綁指令埠（純負載產生，不回應指令）")
+    p.add_argument("--seed", type=int, help="亂數種子（可重現）")
+    p.add_argument("--verbose", action="store_true", help="逐筆印出收到的指令（預設只在統計行計數）")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        sim = Simulator(devices=args.devices, base_ip=args.base_ip, host=args.host,
+                        cmd_port=args.cmd_port, img_port=args.img_port, fps=args.fps,
+                        loss=args.loss, reorder=args.reorder, jitter=args.jitter / 1000.0,
+                        auto=args.auto, encoding=args.encoding, packet_pixels=args.packet_pixels,
+                        listen=not args.no_listen, binary_report=args.binary_report, seed=args.seed, verbose=args.verbose,
+                        peak=args.peak, heat_period=args.period)
+    except OSError as e:
+        print(f"[SIM] bind failed: {e}（--base-ip 需為本機位址，或改用 --no-listen）")
+        return 1
+    print(f"[SIM] {args.devices} device(s) from {args.base_ip} -> {args.host} "
+          f"cmd:{args.cmd_port} img:{args.img_port} @ {args.fps:g} Hz")
+    sim.start()
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    sim.close()
+    print("[SIM] stopped", sim.stats())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+REPORT 時間序列：原始樣本環 + 1 秒 / 1 分 / 1 小時的 min/max/avg 彙總桶，可選 SQLite 持久化。
+
+  raw     每台最近 RAW_SAMPLES 筆（float32[N, 11]，alarm 與 D1..D10）
+  1 s     由樣本累積；桶結束時整桶交給 1 min
+  1 min   由 1 s 桶累積（不再看原始樣本），同理 1 h 由 1 min 累積
+
+每筆樣本只更新目前的 1 s 桶（三個 11 元素的 min/max/sum），桶結束時才往上一層送，
+所以每筆成本固定。每層在記憶體保留固定數量的桶（環），查詢時依時間範圍挑
+最粗但仍足夠點數的層級：24 小時的圖用 1 min 桶（1440 點），不掃原始樣本。
+
+有指定資料庫時，結束的桶排入佇列，由背景執行緒每 FLUSH_INTERVAL 秒一次 executemany 寫入
+（WAL 模式，查詢不擋寫入）；超過記憶體環的範圍時改查資料庫。
+保留期限以「寫入過最新的桶」為準，不看 wall-clock：重播舊錄影時剛寫進去的桶不會被當成過期。
+"""
+
+import math
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .report import Report
+
+FIELDS = Report._fields
+LEVELS = (1, 60, 3600)                         # 秒
+RAW_SAMPLES = 1024
+LEVEL_BUCKETS = {1: 900, 60: 1440, 3600: 720}  # 記憶體：15 分鐘 / 24 小時 / 30 天
+DB_RETENTION = {1: 2 * 86400, 60: 90 * 86400, 3600: None}   # 秒；None = 不刪
+DB_COLUMNS = tuple(f"{f}_{agg}" for f in FIELDS for agg in ("min", "max", "avg"))
+DEFAULT_POINTS = 1500                          # 查詢時希望的最多點數
+FLUSH_INTERVAL = 2.0
+PRUNE_INTERVAL = 600.0
+MAX_PENDING_ROWS = 200_000                     # 桶；資料庫寫不進去時的佇列上限（超過丟最舊的）
+
+
+class _BucketRing:
+    """固定容量的桶環；start 遞增"""
+
+    def __init__(self, size: int, nfields: int):
+        self.size = size
+        self.start = np.zeros(size, dtype=np.float64)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.min = np.zeros((size, nfields), dtype=np.float32)
+        self.max = np.zeros((size, nfields), dtype=np.float32)
+        self.sum = np.zeros((size, nfields), dtype=np.float64)
+        self.pos = 0
+        self.n = 0
+
+    def append(self, start: float, count: int, mn, mx, sm):
+        i = self.pos
+        self.start[i] = start
+        self.count[i] = count
+        self.min[i] = mn
+        self.max[i] = mx
+        self.sum[i] = sm
+        self.pos = (i + 1) % self.size
+        self.n = min(self.n + 1, self.size)
+
+    def order(self) -> np.ndarray:
+        """由舊到新的索引"""
+        return (self.pos - self.n + np.arange(self.n)) % self.size
+
+    def oldest(self) -> float | None:
+        return float(self.start[(self.pos - self.n) % self.size]) if self.n else None
+
+
+class _Level:
+    """一個彙總層級：目前開著的桶 + 已結束的桶環"""
+
+    def __init__(self, seconds: int, buckets: int, nfields: int):
+        self.seconds = seconds
+        self.ring = _BucketRing(buckets, nfields)
+        self.cur_start: float | None = None
+        self.cur_count = 0
+        self.cur_min = np.zeros(nfields, dtype=np.float32)
+        self.cur_max = np.zeros(nfields, dtype=np.float32)
+        self.cur_sum = np.zeros(nfields, dtype=np.float64)
+
+    def add(self, t: float, count: int, mn, mx, sm) -> tuple | None:
+        """加入一筆（樣本或下一層的桶）；若因此結束了一個桶，回傳該桶 (start, count, min, max, sum)。"""
+        start = math.floor(t / self.seconds) * self.seconds
+        closed = None
+        if self.cur_start is None:
+            self.cur_start = start
+        elif start > self.cur_start:
+            closed = (self.cur_start, self.cur_count, self.cur_min.copy(), self.cur_max.copy(),
+                      self.cur_sum.copy())
+            self.ring.append(*closed)
+            self.cur_start = start
+            self.cur_count = 0
+        # 時間倒退（裝置時鐘/重播跳動）時併入目前的桶
+        if self.cur_count == 0:
+            self.cur_min[:] = mn
+            self.cur_max[:] = mx
+            self.cur_sum[:] = sm
+        else:
+            np.minimum(self.cur_min, mn, out=self.cur_min)
+            np.maximum(self.cur_max, mx, out=self.cur_max)
+            self.cur_sum += sm
+        self.cur_count += count
+        return closed
+
+
+class _Series:
+    """單一裝置：原始樣本環 + 各層級"""
+
+    def __init__(self, raw_samples: int, nfields: int):
+        self.raw_t = np.zeros(raw_samples, dtype=np.float64)
+        self.raw_v = np.zeros((raw_samples, nfields), dtype=np.float32)
+        self.raw_pos = 0
+        self.raw_n = 0
+        self.levels = [_Level(s, LEVEL_BUCKETS[s], nfields) for s in LEVELS]
+        self._vals = np.zeros(nfields, dtype=np.float32)
+
+    def add(self, t: float, values) -> list:
+        """回傳本次結束的桶 [(level_seconds, bucket), ...]"""
+        v = self._vals
+        v[:] = values
+        i = self.raw_pos
+        self.raw_t[i] = t
+        self.raw_v[i] = v
+        self.raw_pos = (i + 1) % len(self.raw_t)
+        self.raw_n = min(self.raw_n + 1, len(self.raw_t))
+
+        closed = []
+        item = (t, 1, v, v, v)
+        for level in self.levels:
+            bucket = level.add(*item)
+            if bucket is None:
+                break
+            closed.append((level.seconds, bucket))
+            item = bucket                # 結束的桶往上一層送
+        return closed
+
+
+class TimeSeriesStore:
+    """
+    各裝置 REPORT 的時間序列。on_report 可直接當 Engine 訂閱者；clock 可換成重播時間。
+    readonly=True 只查資料庫（例如 --multiprocess 的 GUI 行程，寫入在 ingest 行程）。
+    """
+
+    def __init__(self, db_path: str | None = None, readonly: bool = False,
+                 raw_samples: int = RAW_SAMPLES, clock=time.time):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.raw_samples = raw_samples
+        self.clock = clock
+        self._series: dict[str, _Series] = {}
+        self._lock = threading.Lock()
+        self._pending: list = []
+        self._pending_cond = threading.Condition()
+        self._closed = False
+        self._writer: threading.Thread | None = None
+        self._read_conn: sqlite3.Connection | None = None
+        self._read_lock = threading.Lock()
+
+        # 統計
+        self.samples = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.flushes = 0
+
+        self._insert_sql = f"INSERT OR REPLACE INTO rollup VALUES ({', '.join('?' * (4 + len(DB_COLUMNS)))})"
+        if db_path:
+            conn = self._connect()
+            if not readonly:
+                # 一個桶一列：device, level（秒）, t（桶起點）, count, 各欄位的 _min/_max/_avg
+                conn.executescript(
+                    "CREATE TABLE IF NOT EXISTS rollup ("
+                    " device TEXT NOT NULL, level INTEGER NOT NULL, t REAL NOT NULL, count INTEGER NOT NULL, "
+                    + ", ".join(f"{c} REAL" for c in DB_COLUMNS)
+                    + ", PRIMARY KEY (device, level, t)) WITHOUT ROWID;")
+                conn.commit()
+                self._writer = threading.Thread(target=self._write_loop, name="timeseries", daemon=True)
+                self._writer.start()
+            self._read_conn = conn
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+        if not self.readonly:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---------------- 寫入 ----------------
+    def add(self, device_id: str, t: float, values):
+        with self._lock:
+            series = self._series.get(device_id)
+            if series is None:
+                series = self._series[device_id] = _Series(self.raw_samples, len(FIELDS))
+            closed = series.add(t, values)
+            self.samples += 1
+        if closed and self._writer is not None:
+            rows = []
+            for seconds, (start, count, mn, mx, sm) in closed:
+                # 欄位順序同 DB_COLUMNS：f0_min, f0_max, f0_avg, f1_min, ...
+                vals = np.stack((mn, mx, sm / count), axis=1).ravel().tolist()
+                rows.append((device_id, seconds, start, int(count), *vals))
+            with self._pending_cond:
+                self._pending.extend(rows)
+                over = len(self._pending) - MAX_PENDING_ROWS
+                if over > 0:
+                    del self._pending[:over]
+                    self.rows_dropped += over
+
+    def on_report(self, dev, report: Report):
+        self.add(dev.device_id, self.clock(), report)
+
+    def _write_loop(self):
+        conn = self._connect()
+        last_prune = 0.0
+        newest = None                  # 已寫入最新的桶起點（資料的時間，重播時為錄製時間）
+        while True:
+            with self._pending_cond:
+                if not self._closed:
+                    self._pending_cond.wait(FLUSH_INTERVAL)
+                rows, self._pending = self._pending, []
+                closing = self._closed
+            if rows:
+                try:
+                    with conn:
+                        conn.executemany(self._insert_sql, rows)
+                    self.rows_written += len(rows)
+                    self.flushes += 1
+                    latest = max(r[2] for r in rows)
+                    newest = latest if newest is None else max(newest, latest)
+                except sqlite3.Error as e:
+                    print("[TRENDS] write error:", e)
+                    self.rows_dropped += len(rows)
+            now = time.time()
+            if newest is not None and now - last_prune > PRUNE_INTERVAL:
+                last_prune = now
+                self._prune(conn, newest)
+            if closing:
+                break
+        conn.close()
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        """刪掉比 now（最新的桶）早超過 DB_RETENTION 的桶"""
+        try:
+            with conn:
+                for seconds, keep in DB_RETENTION.items():
+                    if keep is not None:
+                        conn.execute("DELETE FROM rollup WHERE level = ? AND t < ?", (seconds, now - keep))
+        except sqlite3.Error as e:
+            print("[TRENDS] prune error:", e)
+
+    # ---------------- 查詢 ----------------
+    def devices(self) -> list:
+        with self._lock:
+            names = set(self._series)
+        if self._read_conn is not None and (self.readonly or not names):
+            try:
+                with self._read_lock:
+                    names.update(r[0] for r in self._read_conn.execute("SELECT DISTINCT device FROM rollup"))
+            except sqlite3.OperationalError:
+                pass
+        return sorted(names)
+
+    @staticmethod
+    def pick_level(t0: float, t1: float, max_points: int = DEFAULT_POINTS) -> int:
+        """範圍內點數不超過 max_points 的最細層級（秒）"""
+        span = max(0.0, t1 - t0)
+        for seconds in LEVELS:
+            if span / seconds <= max_points:
+                return seconds
+        return LEVELS[-1]
+
+    def query(self, device_id: str, field: str, t0: float, t1: float,
+              max_points: int = DEFAULT_POINTS) -> dict:
+        """
+        回傳 {"level": 秒（0 = 原始樣本）, "t", "min", "max", "avg"}（numpy 陣列，t 為桶起點）。
+        範圍夠短、原始樣本涵蓋得到時直接回原始樣本。
+        """
+        k = FIELDS.index(field)
+        seconds = self.pick_level(t0, t1, max_points)
+        with self._lock:
+            series = self._series.get(device_id)
+            if series is not None and seconds == LEVELS[0]:
+                raw = self._raw_range(series, k, t0, t1)
+                if raw is not None and len(raw["t"]) <= max_points:
+                    return raw
+            mem = self._mem_range(series, seconds, k, t0, t1) if series is not None else None
+        mem_from = mem["t"][0] if mem is not None and len(mem["t"]) else t1
+        if self._read_conn is not None and (mem is None or mem["covered_from"] > t0):
+            db = self._db_range(device_id, seconds, field, t0, min(t1, mem_from))
+            if mem is None:
+                return db
+            return {"level": seconds, **{c: np.concatenate((db[c], mem[c])) for c in ("t", "min", "max", "avg")}}
+        if mem is None:
+            return _empty(seconds)
+        return {c: mem[c] for c in ("level", "t", "min", "max", "avg")}
+
+    @staticmethod
+    def _raw_range(series: _Series, k: int, t0: float, t1: float) -> dict | None:
+        n = series.raw_n
+        idx = (series.raw_pos - n + np.arange(n)) % len(series.raw_t)
+        times = series.raw_t[idx]
+        if not n or times[0] > t0:
+            return None              # 原始樣本不夠久
+        sel = idx[(times >= t0) & (times < t1)]
+        v = series.raw_v[sel, k]
+        return {"level": 0, "t": series.raw_t[sel], "min": v, "max": v, "avg": v}
+
+    @staticmethod
+    def _mem_range(series: _Series, seconds: int, k: int, t0: float, t1: float) -> dict:
+        level = series.levels[LEVELS.index(seconds)]
+        ring = level.ring
+        idx = ring.order()
+        starts = ring.start[idx]
+        sel = idx[(starts >= t0 - seconds) & (starts < t1)]
+        t = ring.start[sel]
+        mn = ring.min[sel, k]
+        mx = ring.max[sel, k]
+        avg = ring.sum[sel, k] / ring.count[sel]
+        # 目前還開著的桶也畫上（最新的資料）
+        if level.cur_count and t0 - seconds <= level.cur_start < t1:
+            t = np.append(t, level.cur_start)
+            mn = np.append(mn, level.cur_min[k])
+            mx = np.append(mx, level.cur_max[k])
+            avg = np.append(avg, level.cur_sum[k] / level.cur_count)
+        oldest = ring.oldest()
+        covered = oldest if oldest is not None else (level.cur_start if level.cur_count else math.inf)
+        return {"level": seconds, "t": t, "min": mn, "max": mx, "avg": avg, "covered_from": covered}
+
+    def _db_range(self, device_id: str, seconds: int, field: str, t0: float, t1: float) -> dict:
+        try:
+            with self._read_lock:
+                rows = self._read_conn.execute(
+                    f"SELECT t, {field}_min, {field}_max, {field}_avg FROM rollup"
+                    " WHERE device = ? AND level = ? AND t >= ? AND t < ? ORDER BY t",
+                    (device_id, seconds, t0 - seconds, t1)).fetchall()
+        except sqlite3.OperationalError:
+            rows = []                # readonly：寫入端還沒建表
+        if not rows:
+            return _empty(seconds)
+        arr = np.array(rows, dtype=np.float64)
+        return {"level": seconds, "t": arr[:, 0], "min": arr[:, 1], "max": arr[:, 2], "avg": arr[:, 3]}
+
+    # ---------------- 其它 ----------------
+    def close(self):
+        """寫出佇列中的桶（目前開著的桶不寫）並關閉資料庫"""
+        with self._pending_cond:
+            self._closed = True
+            self._pending_cond.notify()
+        if self._writer is not None:
+            self._writer.join(30.0)
+        if self._read_conn is not None:
+            with self._read_lock:
+                self._read_conn.close()
+                self._read_conn = None
+
+    def stats(self) -> dict:
+        with self._pending_cond:
+            pending = len(self._pending)
+        return {"devices": len(self._series), "samples": self.samples, "pending_rows": pending,
+                "rows_written": self.rows_written, "rows_dropped": self.rows_dropped, "flushes": self.flushes}
+
+
+def _empty(seconds: int) -> dict:
+    e = np.zeros(0, dtype=np.float64)
+    return {"level": seconds, "t": e, "min": e, "max": e, "avg": e}
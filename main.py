@@ -1,21 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sys
+import argparse
+import functools
+import multiprocessing
 import os
-import json
-import socket
-import threading
-import time
-from datetime import datetime, timedelta
-
-import tkinter as tk
-from tkinter import ttk, messagebox
+import sys
+from datetime import datetime
 
-import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import requests  # HTTP for LINE
+from hevt.codec import ENCODINGS
+from hevt.engine import ALERT_SOURCES, DEFAULT_BIND_IP, DEFAULT_DEVICE, DEFAULT_STM32_IP, IMG_FORMATS, Engine
+from hevt.history import DEFAULT_CAPACITY, HISTORY_ENCODINGS
 
 # --------------------------------
 # Python 版本檢查（建議 3.13.2+）
@@ -24,659 +19,295 @@ REQUIRED_PY = (3, 13, 2)
 if sys.version_info < REQUIRED_PY:
     print(f"[WARN] Python {REQUIRED_PY[0]}.{REQUIRED_PY[1]}.{REQUIRED_PY[2]} 以上較佳，目前為 {sys.version.split()[0]}。")
 
-# --------------------------------
-# 本地設定檔（改為與此 Python 檔同目錄）
-# --------------------------------
-APP_DIR = os.path.dirname(os.path.abspath(__file__))
-# 在打包後使用 exe 目錄，開發時使用原檔案目錄
-if getattr(sys, "frozen", False):
-    APP_DIR = os.path.dirname(sys.executable)
-else:
-    APP_DIR = os.path.dirname(os.path.abspath(__file__))
-
-CONFIG_PATH = os.path.join(APP_DIR, "line_config.json")
-
-# --------------------------------
-# 參數（預設值，可於 GUI 覆寫）
-# --------------------------------
-DEFAULT_BIND_IP = ""           # 留空 => 綁定所有介面 (0.0.0.0)
-DEFAULT_STM32_IP = "192.168.5.11"
-STM32_CMD_PORT = 1234
-STM32_IMG_PORT = 1235
-TEMP_MIN = 20
-TEMP_MAX = 60
-PIX_H, PIX_W = 24, 32
-
-# --------------------------------
-# Socket 與共享狀態
-# --------------------------------
-sock_cmd = None
-sock_img = None
-threads_started = False
-sockets_ready = False
-
-frame_data = np.zeros((PIX_H, PIX_W), dtype=np.float32)
-diff_mask = np.zeros((PIX_H, PIX_W), dtype=int)
-last_frame = np.zeros((PIX_H, PIX_W), dtype=np.float32)
-
-# LINE 推播控制
-last_alarm_state = 0           # 0: NORMAL, 1: OVER
-_last_alert_at: datetime | None = None
-line_lock = threading.Lock()
-
-# --------------------------------
-# Tk GUI
-# --------------------------------
-root = tk.Tk()
-root.title("🔥 HEVT")
-root.geometry("1180x680")
-
-# 狀態變數
-alarm_state_var = tk.StringVar(value="NORMAL")
-max_temp_var  = tk.StringVar(value="000.00 °C")
-min_temp_var  = tk.StringVar(value="000.00 °C")
-avg_temp_var  = tk.StringVar(value="000.00 °C")
-max_slope_var = tk.StringVar(value="000.00 °C")
-avg_slope_var = tk.StringVar(value="000.00 °C")
-over_count_var = tk.StringVar(value="000")
-diff_area_var  = tk.StringVar(value="000")
-avgTempT_var   = tk.StringVar(value="000.00")
-maxSlopeT_var  = tk.StringVar(value="000.00")
-diffAreaT_var  = tk.StringVar(value="000.00")
-
-# 網路設定變數（可編輯）
-bind_ip_var  = tk.StringVar(value=DEFAULT_BIND_IP)
-stm32_ip_var = tk.StringVar(value=DEFAULT_STM32_IP)
-local_ip_hint_var = tk.StringVar(value="Local IP: (unknown)")
-
-# LINE 設定變數（可編輯）
-line_enable_var = tk.BooleanVar(value=False)
-
-# - 這兩個會從檔案載入/儲存
-line_token_var   = tk.StringVar(value="")   # Channel Access Token（長 token）
-line_secret_file_loaded = tk.StringVar(value="Secret: (not loaded)")
-
-# - 目標對象：可同時填（都會推）
-line_group_var   = tk.StringVar(value="")   # C...（groupId）
-line_user_var    = tk.StringVar(value="")   # U...（userId）
-
-# - 其它
-line_tpl_var     = tk.StringVar(
-    value="⚠️ 溫度警報：Max={max:.2f}°C, Avg={avg:.2f}°C, DiffArea={diff_area} @ {now}"
-)
-line_cooldown_var = tk.StringVar(value="60")  # 秒
-
-# --------------------------------
-# Matplotlib 熱像圖
-# --------------------------------
-fig, ax = plt.subplots(figsize=(4, 3))
-img_artist = ax.imshow(frame_data, cmap='inferno', vmin=TEMP_MIN, vmax=TEMP_MAX)
-ax.axis('off')
-canvas = FigureCanvasTkAgg(fig, master=root)
-canvas.get_tk_widget().place(x=20, y=20)
-
-# --------------------------------
-# 資訊顯示區
-# --------------------------------
-frame_info = ttk.LabelFrame(root, text="Report Status")
-frame_info.place(x=450, y=20, width=700, height=220)
-
-alarm_label = tk.Label(frame_info, text="🟢 NORMAL", font=("Arial", 16), bg="green", fg="white")
-alarm_label.grid(row=0, column=0, columnspan=6, pady=10, sticky="we")
-
-ttk.Label(frame_info, text="Max Temp:").grid(row=1, column=0, sticky="w", padx=10, pady=5)
-ttk.Label(frame_info, textvariable=max_temp_var, font=("Arial", 14)).grid(row=1, column=1, sticky="w")
-
-ttk.Label(frame_info, text="Min Temp:").grid(row=1, column=2, sticky="w", padx=10, pady=5)
-ttk.Label(frame_info, textvariable=min_temp_var, font=("Arial", 14)).grid(row=1, column=3, sticky="w")
 
-ttk.Label(frame_info, text="Avg Temp:").grid(row=1, column=4, sticky="w", padx=10, pady=5)
-ttk.Label(frame_info, textvariable=avg_temp_var, font=("Arial", 14)).grid(row=1, column=5, sticky="w")
-
-ttk.Label(frame_info, text="Max Slope:").grid(row=2, column=0, sticky="w", padx=10, pady=5)
-ttk.Label(frame_info, textvariable=max_slope_var, font=("Arial", 14)).grid(row=2, column=1, sticky="w")
-
-ttk.Label(frame_info, text="Avg Slope:").grid(row=2, column=2, sticky="w", padx=10, pady=5)
-ttk.Label(frame_info, textvariable=avg_slope_var, font=("Arial", 14)).grid(row=2, column=3, sticky="w")
-
-ttk.Label(frame_info, text="Over Count:").grid(row=3, column=0, sticky="w", padx=10, pady=5)
-ttk.Label(frame_info, textvariable=over_count_var, font=("Arial", 14)).grid(row=3, column=1, sticky="w")
-
-ttk.Label(frame_info, text="Diff Area:").grid(row=3, column=2, sticky="w", padx=10, pady=5)
-ttk.Label(frame_info, textvariable=diff_area_var, font=("Arial", 14)).grid(row=3, column=3, sticky="w")
-
-ttk.Label(frame_info, text="avgT Trend:").grid(row=4, column=0, sticky="w", padx=10, pady=5)
-ttk.Label(frame_info, textvariable=avgTempT_var, font=("Arial", 14)).grid(row=4, column=1, sticky="w")
-
-ttk.Label(frame_info, text="maxSlope Trend:").grid(row=4, column=2, sticky="w", padx=10, pady=5)
-ttk.Label(frame_info, textvariable=maxSlopeT_var, font=("Arial", 14)).grid(row=4, column=3, sticky="w")
-
-ttk.Label(frame_info, text="diffArea Trend:").grid(row=4, column=4, sticky="w", padx=10, pady=5)
-ttk.Label(frame_info, textvariable=diffAreaT_var, font=("Arial", 14)).grid(row=4, column=5, sticky="w")
-
-# --------------------------------
-# 網路設定區
-# --------------------------------
-frame_net = ttk.LabelFrame(root, text="Network Settings")
-frame_net.place(x=20, y=360, width=410, height=220)
-
-ttk.Label(frame_net, text="Bind IP (Local):").grid(row=0, column=0, padx=10, pady=8, sticky="e")
-e_bind = ttk.Entry(frame_net, textvariable=bind_ip_var, width=18)
-e_bind.grid(row=0, column=1, padx=5, pady=8, sticky="w")
-ttk.Label(frame_net, text="(留空=0.0.0.0)").grid(row=0, column=2, padx=5, sticky="w")
-
-ttk.Label(frame_net, text="STM32 IP (Remote):").grid(row=1, column=0, padx=10, pady=8, sticky="e")
-e_stm = ttk.Entry(frame_net, textvariable=stm32_ip_var, width=18)
-e_stm.grid(row=1, column=1, padx=5, pady=8, sticky="w")
-
-local_ip_hint_var.set("Local IP: (unknown)")
-ttk.Label(frame_net, textvariable=local_ip_hint_var).grid(row=2, column=0, columnspan=3, padx=10, pady=5, sticky="w")
-
-btn_apply = ttk.Button(frame_net, text="Apply Network", width=18)
-btn_apply.grid(row=3, column=0, padx=10, pady=12, sticky="w")
-
-btn_connect = ttk.Button(frame_net, text="Start/Connect", width=18)
-btn_connect.grid(row=3, column=1, padx=5, pady=12, sticky="w")
-
-# --------------------------------
-# LINE 設定區（NEW）
-# --------------------------------
-frame_line = ttk.LabelFrame(root, text="LINE Settings (Messaging API)")
-frame_line.place(x=450, y=260, width=700, height=200)
-
-# 切換、冷卻、測試
-ttk.Checkbutton(frame_line, text="Enable LINE Alert", variable=line_enable_var).grid(row=0, column=0, padx=10, pady=6, sticky="w")
-ttk.Label(frame_line, text="Cooldown(s):").grid(row=0, column=2, padx=6, pady=4, sticky="e")
-ttk.Entry(frame_line, textvariable=line_cooldown_var, width=8).grid(row=0, column=3, padx=6, pady=4, sticky="w")
-
-# Token 與 Secret 檔
-ttk.Label(frame_line, text="Channel Access Token:").grid(row=1, column=0, padx=10, pady=4, sticky="e")
-ttk.Entry(frame_line, textvariable=line_token_var, width=46, show="•").grid(row=1, column=1, padx=6, pady=4, sticky="w")
-ttk.Button(frame_line, text="Load/Save", command=lambda: on_config_dialog()).grid(row=1, column=2, padx=6, pady=4, sticky="w")
-ttk.Label(frame_line, textvariable=line_secret_file_loaded, foreground="#666").grid(row=1, column=3, padx=6, pady=4, sticky="w")
-
-# 目標：Group 與 User
-ttk.Label(frame_line, text="Group ID (C...):").grid(row=2, column=0, padx=10, pady=4, sticky="e")
-ttk.Entry(frame_line, textvariable=line_group_var, width=46).grid(row=2, column=1, padx=6, pady=4, sticky="w")
-
-ttk.Label(frame_line, text="User ID (U...):").grid(row=3, column=0, padx=10, pady=4, sticky="e")
-ttk.Entry(frame_line, textvariable=line_user_var, width=46).grid(row=3, column=1, padx=6, pady=4, sticky="w")
-
-# Template & 測試
-ttk.Label(frame_line, text="Template:").grid(row=4, column=0, padx=10, pady=4, sticky="e")
-ttk.Entry(frame_line, textvariable=line_tpl_var, width=64).grid(row=4, column=1, columnspan=3, padx=6, pady=4, sticky="we")
-ttk.Button(frame_line, text="Send Test", command=lambda: send_line_test_popup()).grid(row=0, column=1, padx=6, pady=4, sticky="w")
-
-# --------------------------------
-# 原「Threshold Settings」
-# --------------------------------
-frame_ctrl = ttk.LabelFrame(root, text="Threshold Settings")
-frame_ctrl.place(x=450, y=470, width=700, height=170)
-
-fields = ["Alarm", "Slope", "Diffusion", "Interval (ms)"]
-default_values = {"Alarm": "30.0", "Slope": "2.0", "Diffusion": "1.2", "Interval (ms)": "100"}
-entries = {}
-for i, f in enumerate(fields):
-    ttk.Label(frame_ctrl, text=f + ":").grid(row=i, column=0, padx=10, pady=5, sticky="w")
-    e = ttk.Entry(frame_ctrl, width=10)
-    e.insert(0, default_values.get(f, ""))
-    e.grid(row=i, column=1, padx=10, pady=5)
-    entries[f] = e
-
-def require_cmd_socket():
-    if not sockets_ready or sock_cmd is None:
-        messagebox.showwarning("Network", "Socket 尚未就緒，請先在 Network Settings 中 Apply/Start。")
-        return False
-    return True
-
-def set_threshold():
-    if not require_cmd_socket(): return
-    cmd = f"SET_THRESH:D1={entries['Alarm'].get()},D2={entries['Slope'].get()},D3={entries['Diffusion'].get()},D4={entries['Interval (ms)'].get()}"
-    try:
-        sock_cmd.sendto(cmd.encode(), (stm32_ip_var.get().strip(), STM32_CMD_PORT))
-        print("[CMD] Sent:", cmd)
-    except Exception as e:
-        messagebox.showerror("Send Error", str(e))
-
-ttk.Button(frame_ctrl, text="Set Threshold", command=set_threshold).grid(row=3, column=2, columnspan=1, pady=10)
-
-def get_image():
-    if not require_cmd_socket(): return
-    cmd = "GET_IMAGE"
-    try:
-        sock_cmd.sendto(cmd.encode(), (stm32_ip_var.get().strip(), STM32_CMD_PORT))
-        print("[CMD] Sent:", cmd)
-    except Exception as e:
-        messagebox.showerror("Send Error", str(e))
-ttk.Button(frame_ctrl, text="Get Image", command=get_image).grid(row=5, column=0, columnspan=1, pady=10)
-
-auto_flag = tk.BooleanVar(value=False)
-def send_check(name, var):
-    if not require_cmd_socket(): return
-    value = 1 if var.get() else 0
-    cmd = f"ENABLE_{name.upper()}={value}"
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="HEVT Thermal Monitor")
+    p.add_argument("--headless", action="store_true", help="不開 Tk 視窗，只跑接收/分析/警報")
+    p.add_argument("--bind", default=DEFAULT_BIND_IP, help="Bind IP (Local)，留空=0.0.0.0")
+    p.add_argument("--stm32", default=DEFAULT_STM32_IP, help="STM32 IP (Remote)")
+    p.add_argument("--multi", action="store_true", help="多機模式：依來源 IP 分流，單一執行緒服務多台 STM32")
+    p.add_argument("--img-format", choices=IMG_FORMATS, default="raw",
+                   help="影像封包格式：raw=舊版 float32 串流；auto=另外辨識 HVT1 分塊封包（含序號，可處理亂序/掉包）")
+    p.add_argument("--encoding", choices=tuple(ENCODINGS),
+                   help="要求裝置改用的像素編碼（需 --img-format auto）：i16/f16 省一半，delta 只剩 1/4")
+    p.add_argument("--analytics", action="store_true", help="主機端由影像重算 D1–D10（可與裝置 REPORT 核對）")
+    p.add_argument("--alert-source", choices=ALERT_SOURCES, default="device",
+                   help="LINE 警報依據：device=裝置 REPORT；host=主機重算值（隱含 --analytics）；"
+                        "hotspot=有擴散中的熱點（隱含 --hotspots）；roi=各 ROI 依自己的門檻（需 --roi）")
+    p.add_argument("--hotspots", action="store_true",
+                   help="每幀標記熱區（>= Alarm 門檻或 diff_mask）並跨幀追蹤，得到質心/面積/峰值/成長率")
+    p.add_argument("--background", type=float, metavar="K", nargs="?", const=3.0,
+                   help="diff_mask 改用逐像素背景/雜訊模型（偏離 K 個標準差，預設 3），GUI 顯示降噪幀")
+    p.add_argument("--roi", metavar="FILE",
+                   help="各裝置的關注區域（JSON，見 hevt/roi.py）：每個 ROI 有自己的 Max/Min/Avg/斜率與門檻")
+    p.add_argument("--history", type=int, metavar="N", nargs="?", const=DEFAULT_CAPACITY, default=0,
+                   help=f"GUI：每台保留最近 N 幀（預設 {DEFAULT_CAPACITY}，約 1.5 KB/幀）供 History 視窗回看/播放")
+    p.add_argument("--history-encoding", choices=HISTORY_ENCODINGS, default="i16",
+                   help="歷史幀的儲存格式：i16=0.01 °C 整數；f16=半精度浮點")
+    p.add_argument("--cmd-acks", action="store_true",
+                   help="指令加序號、等裝置 ACK、逾時重送（韌體需支援 SEQ=/ACK，見 hevt/commands.py）")
+    p.add_argument("--adaptive-rate", metavar="FAST,NORMAL,IDLE", nargs="?", const="50,200,1000",
+                   help="依斜率與警報狀態自動調整各裝置的取樣間隔 D4（ms，預設 50,200,1000；見 hevt/adaptive.py）")
+    p.add_argument("--forward", metavar="HOST:PORT",
+                   help="邊緣節點：把幀與 REPORT 批次壓縮經 TCP 轉送到 --aggregate 的中央節點（見 hevt/relay.py）")
+    p.add_argument("--forward-name", metavar="NAME", help="轉送時的邊緣名稱（中央的裝置 id 為 NAME/裝置；預設主機名稱）")
+    p.add_argument("--forward-buffer-mb", type=float, default=64.0,
+                   help="斷線時保留的未確認資料上限（MB，壓縮後）；過半開始抽幀，滿了丟最舊的")
+    p.add_argument("--aggregate", metavar="[HOST:]PORT", nargs="?", const="5600",
+                   help="中央節點：不收 UDP，改接受各邊緣 --forward 的連線（預設埠 5600），走相同的分析/警報/錄影路徑")
+    p.add_argument("--fps", type=float, default=10, help="GUI 顯示刷新頻率（Hz）；較快的輸入會被合併")
+    p.add_argument("--multiprocess", action="store_true",
+                   help="GUI：UDP 接收/分析改在獨立行程，經共用記憶體交給 GUI（重繪不再拖慢接收）")
+    p.add_argument("--renderer", choices=("fast", "mpl"), default="fast",
+                   help="GUI 熱像繪製：fast=查表+PhotoImage；mpl=Matplotlib imshow")
+    p.add_argument("--line", action="store_true", help="headless：依 line_config.json 啟用 LINE 警報")
+    p.add_argument("--line-digest", type=float, metavar="SEC",
+                   help="headless：SEC 秒內各裝置的警報合併成一則摘要（覆寫設定檔的 digest_window）")
+    p.add_argument("--record", metavar="DIR", help="把每個完成的幀與 REPORT 錄到 DIR（mmap 分段檔，見 hevt/recorder.py）")
+    p.add_argument("--record-max-gb", type=float, default=2.0, help="錄影保留上限（GB），超過時刪最舊的分段")
+    p.add_argument("--replay", metavar="DIR", help="不收 UDP，改重播 --record 錄下的資料（走相同的分析/警報/顯示路徑）")
+    p.add_argument("--speed", type=float, default=1.0, help="重播速度：1=即時，N=N 倍速，0=不等待盡快送")
+    p.add_argument("--replay-from", type=datetime.fromisoformat, metavar="TIME", help="重播起點，例如 2026-01-31T14:00")
+    p.add_argument("--replay-to", type=datetime.fromisoformat, metavar="TIME", help="重播終點")
+    p.add_argument("--replay-device", metavar="ID", help="只重播某台裝置（錄製時的 device id）")
+    p.add_argument("--trends", metavar="DB", nargs="?", const="",
+                   help="保留 REPORT 的時間序列（1 秒/1 分/1 小時彙總），GUI 有 Trends 圖；給 DB 時批次寫入 SQLite")
+    p.add_argument("--metrics", type=int, metavar="PORT", nargs="?", const=9108,
+                   help="在 127.0.0.1:PORT/metrics 提供 Prometheus 格式的計數（預設埠 9108）")
+    p.add_argument("--metrics-bind", default="127.0.0.1", help="metrics 綁定位址")
+    p.add_argument("--metrics-timing", action="store_true",
+                   help="另外記錄各階段延遲直方圖（每幀多兩次取時間）")
+    p.add_argument("-v", "--verbose", action="store_true", help="headless：印出每筆 REPORT")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.encoding and args.img_format != "auto":
+        print("[WARN] --encoding 需要分塊封包格式，自動改用 --img-format auto")
+        args.img_format = "auto"
+
+    if args.forward or args.aggregate:
+        from hevt.relay import parse_address
+        try:
+            args.forward = parse_address(args.forward) if args.forward else None
+            args.aggregate = parse_address(args.aggregate) if args.aggregate else None
+        except ValueError:
+            print("[RELAY] 位址格式為 HOST:PORT（--aggregate 可只給 PORT）")
+            return 1
+        if args.forward and not args.forward[0]:
+            print("[RELAY] --forward 需要 HOST:PORT")
+            return 1
+    if args.aggregate:
+        if args.replay:
+            print("[RELAY] --aggregate 不可與 --replay 同時使用")
+            return 1
+        args.multi = True          # 裝置 id 為 "邊緣/裝置"
+
+    if args.replay:
+        from hevt.recorder import RecordingReader
+        with RecordingReader(args.replay) as reader:
+            devices = [args.replay_device] if args.replay_device else reader.devices()
+        if not devices:
+            print(f"[REPLAY] {args.replay} 沒有錄製資料")
+            return 1
+        # 錄的是多台（或以 IP 區分）時，用多機模式保留各自的狀態
+        if devices != [DEFAULT_DEVICE]:
+            args.multi = True
+        print(f"[REPLAY] {len(devices)} device(s): {', '.join(devices[:8])}{' ...' if len(devices) > 8 else ''}")
+        if args.record and os.path.abspath(args.record) == os.path.abspath(args.replay):
+            print("[REPLAY] --record 不可與 --replay 同一個目錄")
+            return 1
+
+    roi_config = None
+    if args.roi:
+        from hevt.engine import PIX_H, PIX_W
+        from hevt.roi import RoiStats, load_roi_config
+        try:
+            roi_config = load_roi_config(args.roi)
+            for rois in roi_config.values():
+                if rois:
+                    RoiStats(rois, PIX_H, PIX_W)  # 先檢查範圍，不要等裝置上線才失敗
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[ROI] 無法讀取 {args.roi}：{e}")
+            return 1
+    elif args.alert_source == "roi":
+        print("[ROI] --alert-source roi 需要 --roi FILE")
+        return 1
+
+    if args.adaptive_rate is not None:
+        from hevt.adaptive import parse_intervals
+        try:
+            args.adaptive_rate = parse_intervals(args.adaptive_rate)
+        except ValueError as e:
+            print(f"[RATE] --adaptive-rate：{e}")
+            return 1
+
+    if args.history and args.history < 2:
+        print("[HISTORY] --history 至少要 2 幀")
+        return 1
+
+    engine_kwargs = dict(bind_ip=args.bind, stm32_ip=args.stm32, multi=args.multi,
+                         img_format=args.img_format, encoding=args.encoding,
+                         analytics=args.analytics, alert_source=args.alert_source,
+                         background=args.background is not None, background_k=args.background or 3.0,
+                         hotspots=args.hotspots, roi_config=roi_config,
+                         history=args.history, history_encoding=args.history_encoding,
+                         command_acks=args.cmd_acks)
+
+    if args.multiprocess and not args.headless:
+        return run_multiprocess(args, engine_kwargs)
+    if args.multiprocess:
+        print("[WARN] --multiprocess 只用於 GUI 模式，headless 忽略")
+
+    engine = Engine(**engine_kwargs)
     try:
-        sock_cmd.sendto(cmd.encode(), (stm32_ip_var.get().strip(), STM32_CMD_PORT))
-        print("[CMD] Sent:", cmd)
-    except Exception as e:
-        messagebox.showerror("Send Error", str(e))
-
-ttk.Checkbutton(frame_ctrl, text="Auto", variable=auto_flag, command=lambda: send_check("Auto", auto_flag)).grid(row=5, column=1, padx=10, pady=5, sticky="w")
-
-# --------------------------------
-# 內部工具
-# --------------------------------
-def get_local_ip_for(remote_ip: str) -> str:
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        source, recorder, metrics, trends, forwarder = build_pipeline(args, engine)
+    except OSError as e:
+        print("[AGG] 無法綁定：", e)
+        return 1
     try:
-        s.connect((remote_ip, 9))  # 任意 UDP 埠
-        return s.getsockname()[0]
-    except Exception:
-        return "(unknown)"
+        if args.headless:
+            from hevt.headless import run_headless
+            return run_headless(engine, line_enabled=args.line, verbose=args.verbose,
+                                digest_window=args.line_digest, source=source)
+
+        # GUI 模式才載入 Tk / Matplotlib
+        from hevt.gui import ThermalApp
+        app = ThermalApp(engine, display_fps=args.fps, renderer=args.renderer, trends=trends)
+        if metrics is not None:
+            from hevt.metrics import collect_gui
+            metrics.add_collector(lambda w: collect_gui(w, app))
+        if source is not None:
+            source.start()
+        app.run()
+        return 0
     finally:
-        s.close()
-
-def close_sockets():
-    global sock_cmd, sock_img, sockets_ready
-    sockets_ready = False
-    for s in (sock_cmd, sock_img):
+        close_pipeline(source, recorder, metrics, trends, forwarder, engine.line_digest)
+
+
+def build_pipeline(args, engine: Engine) -> tuple:
+    """
+    在 engine 上掛輸入來源（重播 / 彙整）/ 錄影 / 趨勢 / 自適應取樣 / 轉送 / metrics；
+    回傳 (source, recorder, metrics, trends, forwarder)，沒有的為 None。彙整埠綁定失敗時丟出 OSError。
+    """
+    source = None
+    if args.replay:
+        from hevt.replay import ReplaySource
+        source = ReplaySource(engine, args.replay, speed=args.speed,
+                              t0=args.replay_from.timestamp() if args.replay_from else None,
+                              t1=args.replay_to.timestamp() if args.replay_to else None,
+                              device=args.replay_device)
+    elif args.aggregate:
+        from hevt.relay import Aggregator
+        source = Aggregator(engine, *args.aggregate)
+        source.open()
+
+    recorder = None
+    if args.record:
+        from hevt.recorder import FrameRecorder
+        recorder = FrameRecorder(args.record, max_bytes=int(args.record_max_gb * (1 << 30)))
+        engine.subscribe(on_frame=recorder.on_frame, on_report=recorder.on_report)
+        print(f"[REC] recording to {args.record}")
+
+    trends = None
+    if args.trends is not None:
+        from hevt.timeseries import TimeSeriesStore
+        trends = TimeSeriesStore(args.trends or None)
+        if args.replay:
+            trends.clock = lambda: source.current_t
+        engine.subscribe(on_report=trends.on_report)
+        print(f"[TRENDS] {'persisting to ' + args.trends if args.trends else 'in memory only'}")
+
+    rate = None
+    if args.adaptive_rate is not None:
+        if source is not None:
+            print(f"[RATE] {source.name} 時沒有 UDP 裝置可調整，--adaptive-rate 忽略")
+        else:
+            from hevt.adaptive import RateController
+            rate = RateController(engine, args.adaptive_rate).attach()
+            print(f"[RATE] adaptive intervals fast/normal/idle = {'/'.join(map(str, args.adaptive_rate))} ms")
+
+    forwarder = None
+    if args.forward:
+        from hevt.relay import EdgeForwarder
+        forwarder = EdgeForwarder(engine, args.forward, name=args.forward_name,
+                                  buffer_bytes=int(args.forward_buffer_mb * (1 << 20))).attach()
+        forwarder.start()
+
+    metrics = None
+    if args.metrics is not None:
+        from hevt.metrics import (MetricsServer, collect_aggregator, collect_forwarder, collect_rate,
+                                  collect_recorder, collect_timeseries)
+        engine.timing = args.metrics_timing
+        metrics = MetricsServer(engine, host=args.metrics_bind, port=args.metrics)
+        if recorder is not None:
+            metrics.add_collector(lambda w: collect_recorder(w, recorder))
+        if trends is not None:
+            metrics.add_collector(lambda w: collect_timeseries(w, trends))
+        if rate is not None:
+            metrics.add_collector(lambda w: collect_rate(w, rate))
+        if forwarder is not None:
+            metrics.add_collector(lambda w: collect_forwarder(w, forwarder))
+        if args.aggregate:
+            metrics.add_collector(lambda w: collect_aggregator(w, source))
         try:
-            if s:
-                s.close()
-        except Exception:
-            pass
-    sock_cmd = None
-    sock_img = None
-
-def apply_network():
-    """套用 GUI 的 IP 設定並重新綁定 socket（尚不啟動接收執行緒）"""
-    global sock_cmd, sock_img, sockets_ready
-
-    bind_ip = bind_ip_var.get().strip()
-    remote_ip = stm32_ip_var.get().strip()
-    if not remote_ip:
-        messagebox.showwarning("Network", "請輸入 STM32 IP")
-        return
-
-    close_sockets()
-
-    try:
-        # 指令 socket
-        sc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sc.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sc.settimeout(1.0)
-        sc.bind((bind_ip if bind_ip else "", STM32_CMD_PORT))
-
-        # 影像 socket
-        si = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        si.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        si.settimeout(2.0)
-        si.bind((bind_ip if bind_ip else "", STM32_IMG_PORT))
-
-        sock_cmd, sock_img = sc, si
-        sockets_ready = True
-
-        local_ip_hint_var.set(f"Local IP: {get_local_ip_for(remote_ip)}  (bind={bind_ip or '0.0.0.0'})")
-        messagebox.showinfo("Network", "Socket 綁定成功。可按 Start/Connect 啟動接收。")
-        print(f"[NET] bind=({bind_ip or '0.0.0.0'}) cmd:{STM32_CMD_PORT} img:{STM32_IMG_PORT} -> remote:{remote_ip}")
-    except Exception as e:
-        close_sockets()
-        messagebox.showerror("Network Error", f"Socket 綁定失敗：{e}")
-
-btn_apply.configure(command=apply_network)
-
-# --------------------------------
-# LINE Messaging API
-# --------------------------------
-def _line_push(token: str, to_id: str, text: str) -> bool:
-    """呼叫 LINE Push，to_id 可為 U*/R*/C*；回 True 表成功"""
-    if not token or not to_id:
-        return False
-    url = "https://api.line.me/v2/bot/message/push"
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    payload = {"to": to_id, "messages": [{"type": "text", "text": text}]}
-    try:
-        r = requests.post(url, headers=headers, json=payload, timeout=8)
-        if r.status_code < 300:
-            return True
-        print("[LINE] push FAIL", r.status_code, r.text)
-        return False
-    except Exception as e:
-        print("[LINE] push ERROR", e)
-        return False
-
-def format_line_text(tpl: str, stats: dict) -> str:
-    try:
-        return tpl.format(**stats)
-    except Exception:
-        return f"⚠️ 警報：Max={stats.get('max', 0):.2f}°C, Avg={stats.get('avg', 0):.2f}°C, DiffArea={stats.get('diff_area', 0)}"
-
-def push_to_all_targets(text: str):
-    token = line_token_var.get().strip()
-    targets = []
-    g = line_group_var.get().strip()
-    u = line_user_var.get().strip()
-    if g:
-        targets.append(g)
-    if u:
-        targets.append(u)
-    if not targets:
-        print("[LINE] 無目標 id（Group/User）")
-        return
-    for t in targets:
-        _line_push(token, t, text)
-
-
-def maybe_send_line_alarm(max_val: float, avg_val: float, diff_area: int, alarm_now: int):
-    """在 NORMAL→OVER 或冷卻期屆滿時觸發推送（對 group 與 user 同時）"""
-    global last_alarm_state, _last_alert_at
-
-    if not line_enable_var.get():
-        last_alarm_state = alarm_now
-        return
-
-    token_ok = bool(line_token_var.get().strip())
-    tgt_ok = bool(line_group_var.get().strip() or line_user_var.get().strip())
-    if not token_ok or not tgt_ok:
-        last_alarm_state = alarm_now
-        return
-
-    # 冷卻秒數
+            metrics.start()
+        except OSError as e:
+            print("[METRICS] 無法綁定：", e)
+            metrics = None
+    return source, recorder, metrics, trends, forwarder
+
+
+def close_pipeline(source, recorder, metrics, trends=None, forwarder=None, digest=None):
+    if metrics is not None:
+        metrics.stop()
+    if source is not None:
+        source.stop()
+    if digest is not None:
+        digest.close()             # 來源停了才送出最後一個摘要視窗
+    if forwarder is not None:
+        forwarder.close()
+    if recorder is not None:
+        recorder.close()
+    if trends is not None:
+        trends.close()
+
+
+def _ingest_setup(args, engine: Engine):
+    """--multiprocess：在 ingest 行程掛上同樣的 pipeline（重播 / 彙整直接開始）；回傳結束時的清理"""
+    source, recorder, metrics, trends, forwarder = build_pipeline(args, engine)
+    if source is not None:
+        source.start()
+    return functools.partial(close_pipeline, source, recorder, metrics, trends, forwarder, engine.line_digest)
+
+
+def run_multiprocess(args, engine_kwargs: dict) -> int:
+    from hevt.gui import ThermalApp
+    from hevt.multiproc import RemoteEngine
+
+    # 彙總由 ingest 行程寫入 SQLite；GUI 行程只讀同一個資料庫
+    if args.trends == "":
+        print("[TRENDS] --multiprocess 的 Trends 圖需要 --trends DB（記憶體中的序列在 ingest 行程）")
+    engine = RemoteEngine(engine_kwargs, setup=functools.partial(_ingest_setup, args))
+    trends = None
     try:
-        cooldown = max(0, int(line_cooldown_var.get() or "0"))
+        if args.trends:
+            from hevt.timeseries import TimeSeriesStore
+            trends = TimeSeriesStore(args.trends, readonly=True)
+        app = ThermalApp(engine, display_fps=args.fps, renderer=args.renderer, trends=trends)
     except Exception:
-        cooldown = 0
-
-    now = datetime.now()
-    should_fire = False
-    if alarm_now == 1 and last_alarm_state == 0:
-        should_fire = True
-    elif alarm_now == 1 and _last_alert_at is not None:
-        should_fire = (now - _last_alert_at) >= timedelta(seconds=cooldown)
-
-    if alarm_now == 1 and should_fire:
-        stats = {
-            "max": max_val, "avg": avg_val, "diff_area": diff_area,
-            "now": now.strftime("%Y-%m-%d %H:%M:%S"),
-        }
-        text = format_line_text(line_tpl_var.get(), stats)
-
-        def _worker():
-            try:
-                with line_lock:
-                    push_to_all_targets(text)
-                print("[LINE] pushed:", text)
-            except Exception as e:
-                print("[LINE ERROR]", e)
-
-        threading.Thread(target=_worker, daemon=True).start()
-        _last_alert_at = now
-
-    last_alarm_state = alarm_now
-
-# --------------------------------
-# 設定檔 Load/Save（Channel Secret 放檔案）
-# --------------------------------
-def save_config():
-    data = {
-        "access_token": line_token_var.get().strip(),
-        "channel_secret": "(stored)",  # 不把 secret 顯示在 UI；僅在檔案內保存/載入
-        "group_id": line_group_var.get().strip(),
-        "user_id": line_user_var.get().strip(),
-        "template": line_tpl_var.get(),
-        "cooldown": line_cooldown_var.get(),
-    }
-    # 若檔案已存在且含有 channel_secret，就保留舊 secret
-    existing = {}
-    if os.path.isfile(CONFIG_PATH):
-        try:
-            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-                existing = json.load(f) or {}
-        except Exception:
-            existing = {}
-    if "channel_secret" in existing and isinstance(existing["channel_secret"], str):
-        data["channel_secret"] = existing["channel_secret"]
-
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-    line_secret_file_loaded.set(f"Secret: (in {CONFIG_PATH})")
-    messagebox.showinfo("Config", f"已儲存設定到 {CONFIG_PATH}")
-
-def load_config():
-    if not os.path.isfile(CONFIG_PATH):
-        messagebox.showwarning("Config", f"找不到設定檔：{CONFIG_PATH}\n請先按 Save 建立，或自行建立 JSON。")
-        return
+        engine.stop()
+        raise
     try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f) or {}
-        # 載入 access token / 目標 / 模板 / 冷卻
-        line_token_var.set(data.get("access_token", ""))
-        line_group_var.set(data.get("group_id", ""))
-        line_user_var.set(data.get("user_id", ""))
-        line_tpl_var.set(data.get("template", line_tpl_var.get()))
-        line_cooldown_var.set(str(data.get("cooldown", line_cooldown_var.get())))
-        # 只顯示 secret 已載入，不顯示內容
-        if "channel_secret" in data and isinstance(data["channel_secret"], str) and data["channel_secret"]:
-            line_secret_file_loaded.set(f"Secret: (in {CONFIG_PATH})")
-        else:
-            line_secret_file_loaded.set("Secret: (not loaded)")
-        messagebox.showinfo("Config", f"已從 {CONFIG_PATH} 載入設定")
-    except Exception as e:
-        messagebox.showerror("Config Error", f"讀取失敗：{e}")
-
-def on_config_dialog():
-    # 簡單：點一下就先 Load；再按一次 Save
-    # 也可改成彈出對話框讓你輸入 Secret 後寫入檔案
-    res = messagebox.askyesno("Config", f"從 {CONFIG_PATH} 載入？\n（選否改為儲存目前的 UI 值）")
-    if res:
-        load_config()
-    else:
-        # 若要寫入/更新 secret，可在這裡 prompt 一次
-        # 為了簡潔，這裡只保存 UI 值；secret 請手動加到檔案中或用一次性小對話窗擴充
-        save_config()
-
-# --------------------------------
-# GUI 更新
-# --------------------------------
-def update_gui(alarm, D1, D2, D3, D4, D5, D6, D7, D8, D9, D10):
-    # UI
-    if alarm:
-        alarm_label.config(text="🔴 OVER TEMP", bg="red")
-    else:
-        alarm_label.config(text="🟢 NORMAL", bg="green")
-    max_temp_var.set(f"{D1:.2f} °C")
-    min_temp_var.set(f"{D2:.2f} °C")
-    avg_temp_var.set(f"{D3:.2f} °C")
-    max_slope_var.set(f"{D4:.2f} °C")
-    avg_slope_var.set(f"{D5:.2f} °C")
-    over_count_var.set(f"{D6}")
-    diff_area_var.set(f"{D7}")
-    avgTempT_var.set(f"{D8:.2f}")
-    maxSlopeT_var.set(f"{D9:.2f}")
-    diffAreaT_var.set(f"{D10:.2f}")
-
-    # LINE：警報推送
-    try:
-        maybe_send_line_alarm(max_val=D1, avg_val=D3, diff_area=D7, alarm_now=int(alarm))
-    except Exception as e:
-        print("[LINE SEND GUARD ERROR]", e)
-
-# --------------------------------
-# 接收執行緒
-# --------------------------------
-def recv_thread():
-    while True:
-        try:
-            if not sockets_ready or sock_cmd is None:
-                time.sleep(0.1)
-                continue
-            data, addr = sock_cmd.recvfrom(2048)
-            msg = data.decode(errors="ignore").strip()
-            if msg.startswith("REPORT"):
-                parts = msg.split(',')
-                try:
-                    alarm = int(parts[1].split('=')[1])
-                    D1 = float(parts[2].split('=')[1])
-                    D2 = float(parts[3].split('=')[1])
-                    D3 = float(parts[4].split('=')[1])
-                    D4 = float(parts[5].split('=')[1])
-                    D5 = float(parts[6].split('=')[1])
-                    D6 = int(parts[7].split('=')[1])
-                    D7 = int(parts[8].split('=')[1])
-                    D8 = float(parts[9].split('=')[1])
-                    D9 = float(parts[10].split('=')[1])
-                    D10 = float(parts[11].split('=')[1])
-                    root.after(0, update_gui, alarm, D1, D2, D3, D4, D5, D6, D7, D8, D9, D10)
-                except Exception as e:
-                    print("[ERR] Parse REPORT:", e)
-        except socket.timeout:
-            continue
-        except OSError:
-            time.sleep(0.1)
-        except Exception as e:
-            print("[CMD RECV ERR]", e)
-            time.sleep(0.1)
-
-def udp_img_thread():
-    global frame_data, diff_mask, last_frame
-    while True:
-        try:
-            if not sockets_ready or sock_img is None:
-                time.sleep(0.1)
-                continue
-
-            frame = np.zeros(PIX_H * PIX_W, dtype=np.float32)
-            received = 0
-            start_time = time.time()
-
-            while received < PIX_H * PIX_W:
-                data, addr = sock_img.recvfrom(2048)
-                pixels = np.frombuffer(data, dtype=np.float32)
-                n = min(len(pixels), PIX_H * PIX_W - received)
-                frame[received:received+n] = pixels[:n]
-                received += n
-                if time.time() - start_time > 2.0:
-                    print("[WARN] Timeout, incomplete frame")
-                    break
-
-            if received < PIX_H * PIX_W:
-                continue
-
-            frame_data = frame.reshape((PIX_H, PIX_W))
-            diff_mask = np.abs(frame_data - last_frame) > 2.0
-            last_frame = frame_data.copy()
-
-            img_artist.set_data(frame_data)
-            img_artist.set_clim(vmin=TEMP_MIN, vmax=TEMP_MAX)
-            root.after_idle(canvas.draw_idle)
-
-        except socket.timeout:
-            continue
-        except OSError:
-            time.sleep(0.1)
-        except Exception as e:
-            print("[IMG RECV ERR]", e)
-            time.sleep(0.1)
-def _line_push(token: str, to_id: str, text: str):
-    """呼叫 LINE Push，to_id 可為 U*/R*/C*；回傳 (ok, status, body)。"""
-    if not token or not to_id:
-        return (False, 0, "missing token or to_id")
-    url = "https://api.line.me/v2/bot/message/push"
-    headers = {"Authorization": f"Bearer {token.strip()}", "Content-Type": "application/json"}
-    payload = {"to": to_id.strip(), "messages": [{"type": "text", "text": text}]}
-    try:
-        r = requests.post(url, headers=headers, json=payload, timeout=8)
-        ok = r.status_code < 300
-        if not ok:
-            print("[LINE] push FAIL", r.status_code, r.text)
-        return (ok, r.status_code, r.text)
-    except Exception as e:
-        print("[LINE] push ERROR", e)
-        return (False, -1, str(e))
-
-
-def push_to_all_targets(text: str):
-    token = line_token_var.get().strip()
-    targets = []
-    g = line_group_var.get().strip()
-    u = line_user_var.get().strip()
-    if g:
-        targets.append(("Group/Room", g))
-    if u:
-        targets.append(("User", u))
-    if not targets:
-        return [("None", False, 0, "no target id")]
-    results = []
-    for label, t in targets:
-        ok, status, body = _line_push(token, t, text)
-        results.append((label, ok, status, body))
-    return results
-
-
-def send_line_test_popup():
-    if not line_enable_var.get():
-        messagebox.showwarning("LINE", "請先勾選 Enable LINE Alert")
-        return
-    if not line_token_var.get().strip():
-        messagebox.showwarning("LINE", "請先填入 Channel Access Token（或從檔案載入）")
-        return
-    if not (line_group_var.get().strip() or line_user_var.get().strip()):
-        messagebox.showwarning("LINE", "請先填入 Group ID 或 User ID 任一")
-        return
-
-    stats = {
-        "max": 38.5, "min": 26.2, "avg": 33.0,
-        "max_slope": 1.5, "avg_slope": 0.8,
-        "over": 3, "diff_area": 42,
-        "avgT": 0.0, "maxSlopeT": 0.0, "diffAreaT": 0.0,
-        "now": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-    }
-    text = "[TEST] " + format_line_text(line_tpl_var.get(), stats)
-
-    results = push_to_all_targets(text)
-
-    lines = []
-    success_any = False
-    for label, ok, status, body in results:
-        success_any = success_any or ok
-        lines.append(f"{label}: {'OK' if ok else 'FAIL'} (status={status})\n{body[:400]}")
-    msg = "\n\n".join(lines)
-
-    if success_any:
-        messagebox.showinfo("LINE Push Result", msg)
-    else:
-        messagebox.showerror("LINE Push Failed", msg)
-
-# --------------------------------
-# 控制：Start/Connect
-# --------------------------------
-def start_connect():
-    global threads_started
-    if not sockets_ready:
-        messagebox.showwarning("Network", "請先 Apply Network 完成綁定再 Start。")
-        return
-    if not threads_started:
-        threading.Thread(target=recv_thread, daemon=True).start()
-        threading.Thread(target=udp_img_thread, daemon=True).start()
-        threads_started = True
-        messagebox.showinfo("Network", "接收執行緒已啟動。")
-    else:
-        messagebox.showinfo("Network", "接收執行緒已在運行。")
-
-btn_connect.configure(command=start_connect)
-btn_apply.configure(command=apply_network)
+        app.run()      # 結束時 engine.stop() 關閉 ingest 行程與共用記憶體
+    finally:
+        if trends is not None:
+            trends.close()
+    return 0
 
-# --------------------------------
-# 開機自動載入設定（若存在）
-# --------------------------------
-if os.path.isfile(CONFIG_PATH):
-    try:
-        load_config()
-    except Exception as e:
-        print("[CONFIG] load on start error:", e)
 
-# --------------------------------
-# 主迴圈
-# --------------------------------
-root.mainloop()
+if __name__ == "__main__":
+    # 打包成 exe（PyInstaller）時，spawn 出來的 ingest 行程要在這裡接手，不能重跑 CLI
+    multiprocessing.freeze_support()
+    sys.exit(main())
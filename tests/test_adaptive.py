@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""自適應取樣：升級立即、降級要較寬條件持續 hold 秒且一次一級、重送與失敗重試"""
+
+from concurrent.futures import Future
+
+import pytest
+
+from hevt.adaptive import RateController, parse_intervals
+from hevt.commands import CommandResult
+from hevt.report import Report
+
+
+class _Engine:
+    analytics = False
+    sockets_ready = True
+
+    def __init__(self, result=None):
+        self.thresholds = {"alarm": 30.0, "slope": 2.0, "diffusion": 1.2}
+        self.sent = []
+        self.result = result
+
+    def device_ip(self, device_id):
+        return device_id
+
+    def send_command(self, cmd, ip):
+        self.sent.append((ip, int(cmd.rsplit("D4=", 1)[1])))
+        if self.result is None:
+            return None
+        fut = Future()
+        fut.set_result(CommandResult(ip, cmd, self.result))
+        return fut
+
+
+class _Dev:
+    device_id = "10.0.0.2"
+    tracker = None
+    rois = None
+    last_seen = 0.0
+
+
+def _feed(ctl, dev, t, max_temp, slope=0.0, alarm=0):
+    dev.last_seen = t
+    ctl.on_sample(dev, Report(alarm, max_temp, 0.0, 0.0, slope, 0.0, 0, 0, 0.0, 0.0, 0.0))
+    return ctl.interval_of(dev.device_id)
+
+
+def test_parse_intervals():
+    assert parse_intervals("50,200,1000") == (50, 200, 1000)
+    for bad in ("50,200", "200,50,1000", "0,200,1000", "50,50,1000"):
+        with pytest.raises(ValueError):
+            parse_intervals(bad)
+
+
+def test_upgrade_immediate_downgrade_after_hold_one_step():
+    engine, dev = _Engine(), _Dev()
+    ctl = RateController(engine, hold=10.0, reassert=1000.0)
+    assert _feed(ctl, dev, 0.0, 15.0) == 1000            # 第一筆直接定等級
+    assert _feed(ctl, dev, 1.0, 26.0) == 50              # 接近門檻：立即 fast
+    # 24 °C 平常算 normal，但降級用的較寬條件（Alarm - 5 - 2）仍是 fast：不開始計時
+    for t in range(2, 30):
+        assert _feed(ctl, dev, float(t), 24.0) == 50
+    # 降溫後較寬條件連續 hold 秒不成立才降一級
+    assert _feed(ctl, dev, 30.0, 10.0) == 50
+    assert _feed(ctl, dev, 39.0, 10.0) == 50
+    assert _feed(ctl, dev, 40.0, 10.0) == 200            # 只降到 normal
+    assert _feed(ctl, dev, 49.0, 10.0) == 200
+    assert _feed(ctl, dev, 50.0, 10.0) == 1000
+    assert [d4 for _ip, d4 in engine.sent] == [1000, 50, 200, 1000]
+    assert ctl.stats()["changes"] == 3
+
+
+def test_calm_interrupted_restarts_hold():
+    engine, dev = _Engine(), _Dev()
+    ctl = RateController(engine, hold=10.0, reassert=1000.0)
+    _feed(ctl, dev, 0.0, 0.0, slope=1.6)                  # 升溫中：fast
+    _feed(ctl, dev, 1.0, 0.0)
+    _feed(ctl, dev, 8.0, 0.0, slope=1.3)                  # 較寬條件（1.5 × 0.8）又成立
+    assert _feed(ctl, dev, 12.0, 0.0) == 50
+    assert _feed(ctl, dev, 21.0, 0.0) == 50
+    assert _feed(ctl, dev, 22.0, 0.0) == 200
+
+
+def test_alarm_and_threshold_changes():
+    engine, dev = _Engine(), _Dev()
+    ctl = RateController(engine, hold=10.0, reassert=1000.0)
+    assert _feed(ctl, dev, 0.0, 10.0, alarm=1) == 50
+    engine.thresholds["alarm"] = 60.0                     # GUI 改門檻立即適用
+    assert _feed(ctl, dev, 1.0, 48.0) == 50
+    assert _feed(ctl, dev, 11.0, 48.0) == 200             # 48 >= 60 - 10 - 2：停在 normal
+    assert _feed(ctl, dev, 30.0, 48.0) == 200
+
+
+def test_reassert_and_retry_on_failure():
+    engine, dev = _Engine(result="timeout"), _Dev()
+    ctl = RateController(engine, hold=10.0, reassert=30.0)
+    _feed(ctl, dev, 0.0, 10.0)
+    _feed(ctl, dev, 1.0, 10.0)                            # 上次送失敗：下一筆重送
+    assert len(engine.sent) == 2 and ctl.stats()["failures"] == 2
+    engine.result = "ok"
+    _feed(ctl, dev, 2.0, 10.0)
+    _feed(ctl, dev, 3.0, 10.0)
+    assert len(engine.sent) == 3
+    _feed(ctl, dev, 32.0, 10.0)                           # REASSERT 到了
+    assert len(engine.sent) == 4
+
+
+def test_stats_expected_fps():
+    engine = _Engine()
+    ctl = RateController(engine)
+    for i, temp in enumerate((10.0, 22.0, 28.0)):
+        dev = _Dev()
+        dev.device_id = f"10.0.0.{i + 2}"
+        _feed(ctl, dev, 0.0, temp)
+    s = ctl.stats()
+    assert s["levels"] == {"fast": 1, "normal": 1, "idle": 1}
+    assert s["expected_fps"] == pytest.approx(20 + 5 + 1)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""主機端分析：RollingTrend 長時間執行的精度"""
+
+import pytest
+
+from hevt.analytics import RollingTrend
+
+
+def test_rolling_trend_slope():
+    trend = RollingTrend(10)
+    for i in range(25):
+        slope = trend.push(i * 0.5, 3.0 * i * 0.5 + 1.0)
+    assert slope == pytest.approx(3.0)
+
+
+def test_rolling_trend_rebases_on_long_run():
+    trend = RollingTrend(10)
+    t = 0.0
+    for i in range(200_000):
+        t = i * 0.05
+        slope = trend.push(t, 0.5 * t + 20.0)
+    assert slope == pytest.approx(0.5, rel=1e-9)
+    # 存放的時間只跨一個視窗，原點跟著視窗前進
+    assert trend.t.max() - trend.t.min() < 10 * 0.05
+    assert t - trend.t0 < 2 * 10 * 0.05
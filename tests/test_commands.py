@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""可靠指令通道：ACK 要來自指令的目標裝置；新指令要喚醒接收迴圈"""
+
+import time
+
+from hevt.commands import CommandChannel
+from hevt.engine import Engine
+
+
+def _channel():
+    sent = []
+    ch = CommandChannel(lambda data, ip: sent.append((ip, data)), timeout=0.1, retries=1)
+    return ch, sent
+
+
+def _seq(data: bytes) -> int:
+    return int(data.decode().split(";", 1)[0][len("SEQ="):])
+
+
+def test_ack_from_other_device_is_stray():
+    ch, sent = _channel()
+    fut_a = ch.submit("10.0.0.2", "PING")
+    fut_b = ch.submit("10.0.0.3", "PING")
+    seq_a = _seq(sent[0][1])
+
+    # 另一台回了相同序號：不能完成 10.0.0.2 的指令
+    assert not ch.on_ack("10.0.0.3", f"ACK,SEQ={seq_a},OK")
+    assert not fut_a.done()
+    assert ch.stats()["stray_acks"] == 1
+
+    assert ch.on_ack("10.0.0.2", f"ACK,SEQ={seq_a},OK")
+    assert fut_a.result().status == "ok"
+    assert not fut_b.done()
+
+
+def test_counters_and_send_failures():
+    calls = []
+
+    def sendto(data, ip):
+        calls.append(ip)
+        raise OSError("network unreachable")
+
+    ch = CommandChannel(sendto, timeout=0.1, retries=1)
+    fut = ch.submit("10.0.0.2", "PING")
+    ch.poll(now=1e9)                   # 重送一次
+    ch.poll(now=2e9)                   # 超過重送次數
+    st = ch.stats()
+    assert (st["sent"], st["retransmits"], st["send_failures"], st["timeouts"]) == (1, 1, 2, 1)
+    assert len(calls) == 2
+    result = fut.result()
+    assert result.status == "timeout" and result.attempts == 2
+
+
+def test_on_submit_called_for_started_commands():
+    woke = []
+    ch = CommandChannel(lambda data, ip: None, timeout=0.1, retries=1, window=1, on_submit=lambda: woke.append(1))
+    ch.submit("10.0.0.2", "PING")
+    ch.submit("10.0.0.2", "PING")              # 排隊中（window=1）：還沒有重送時間
+    assert woke == [1]
+
+
+def test_engine_loop_wakes_for_new_command():
+    engine = Engine(bind_ip="127.0.0.1", multi=True, command_acks=True, cmd_port=41244, img_port=41245)
+    engine.open()
+    engine.start()
+    try:
+        engine.commands.timeout = 0.05
+        engine.commands.retries = 0
+        for pause in (0.3, 0.15, 0.05):
+            time.sleep(pause)                  # 迴圈停在沒有指令時的 select（0.5 s）
+            t0 = time.monotonic()
+            result = engine.send_command("PING", "127.0.0.9").result(2.0)
+            assert result.status == "timeout"
+            assert time.monotonic() - t0 < 0.2     # 0.05 s 就該結束，不用等 select 逾時
+    finally:
+        engine.stop()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""組幀：分塊格式遺失封包時的逾時丟棄"""
+
+import numpy as np
+
+from hevt.engine import FRAME_TIMEOUT, PIX_H, PIX_W, DeviceState
+from hevt.frames import split_frame
+from hevt.line import LineConfig
+
+
+def _feed(dev, pkt, now):
+    return dev.feed_chunk(memoryview(pkt), len(pkt), now)
+
+
+def test_lost_chunk_times_out():
+    dev = DeviceState("10.0.0.2", LineConfig())
+    frame = np.full((PIX_H, PIX_W), 30.0, dtype=np.float32)
+    pkts = split_frame(frame, frame_id=1)
+    assert len(pkts) == 3
+
+    assert not _feed(dev, pkts[0], 0.0)
+    assert not _feed(dev, pkts[1], 0.1)        # pkts[2] 遺失
+    assert dev.frames_dropped == 0
+
+    # 沒有更新的 frame_id 時，也要在 FRAME_TIMEOUT 後放棄未完成的幀
+    dev.expire_partial(FRAME_TIMEOUT + 1.0)
+    assert dev.frames_dropped == 1
+    assert dev.chunks.chunks_lost == 1
+
+    # 遲到的最後一塊不能把逾時的殘幀當成完整幀發佈
+    assert not _feed(dev, pkts[2], FRAME_TIMEOUT + 1.1)
+    assert dev.frames_completed == 0
+
+    # 下一幀照常組好
+    for i, pkt in enumerate(split_frame(frame + 1.0, frame_id=2)):
+        done = _feed(dev, pkt, FRAME_TIMEOUT + 2.0 + i * 0.01)
+    assert done
+    assert dev.frames_completed == 1
+    assert dev.frames_dropped == 1
+    assert float(dev.frame_data.max()) == 31.0
+
+
+def test_partial_chunk_frame_kept_within_timeout():
+    dev = DeviceState("10.0.0.2", LineConfig())
+    pkts = split_frame(np.zeros((PIX_H, PIX_W), dtype=np.float32), frame_id=5)
+    _feed(dev, pkts[0], 0.0)
+    dev.expire_partial(FRAME_TIMEOUT * 0.5)
+    assert dev.frames_dropped == 0
+    _feed(dev, pkts[1], FRAME_TIMEOUT * 0.6)
+    assert _feed(dev, pkts[2], FRAME_TIMEOUT * 0.7)
+    assert dev.frames_completed == 1
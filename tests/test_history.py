@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""幀歷史環的時間：一律 wall-clock，與資料來源（即時 / 重播）無關"""
+
+import time
+
+import numpy as np
+
+from hevt.engine import PIX_H, PIX_W, Engine
+
+
+def test_live_frames_stamped_with_wall_clock():
+    engine = Engine(history=8)
+    engine.feed_frame("default", np.zeros((PIX_H, PIX_W), np.float32), time.monotonic())
+    h = engine.devices["default"].history
+    assert h.count == 1
+    assert abs(h.times[0] - time.time()) < 1.0
+
+
+def test_replay_frames_keep_recorded_time():
+    engine = Engine(history=8)
+    engine.wall_offset = 0.0           # ReplaySource：送進來的已是錄製時間
+    recorded = 1_700_000_000.0
+    engine.feed_frame("default", np.zeros((PIX_H, PIX_W), np.float32), recorded)
+    assert engine.devices["default"].history.times[0] == recorded
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""熱點：8 連通標記、區塊量測、跨幀追蹤與擴散判斷"""
+
+from collections import deque
+
+import numpy as np
+import pytest
+
+from hevt.hotspot import BlobLabeler, HotspotTracker, measure_blobs
+
+H, W = 24, 32
+
+
+def _reference_labels(mask: np.ndarray) -> np.ndarray:
+    """BFS 標記（8 連通），編號依光柵順序的第一個像素"""
+    out = np.zeros(mask.shape, dtype=np.int32)
+    n = 0
+    for y, x in zip(*np.nonzero(mask)):
+        if out[y, x]:
+            continue
+        n += 1
+        out[y, x] = n
+        todo = deque([(y, x)])
+        while todo:
+            cy, cx = todo.popleft()
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    ny, nx = cy + dy, cx + dx
+                    if 0 <= ny < mask.shape[0] and 0 <= nx < mask.shape[1] and mask[ny, nx] and not out[ny, nx]:
+                        out[ny, nx] = n
+                        todo.append((ny, nx))
+    return out
+
+
+def test_labels_diagonal_and_separate_blobs():
+    mask = np.zeros((H, W), dtype=bool)
+    mask[2, 2] = mask[3, 3] = mask[4, 2] = True        # 只靠對角線相連（含左下方向）
+    mask[10:12, 20:23] = True
+    labels, n = BlobLabeler(H, W).label(mask)
+    assert n == 2
+    assert labels[2, 2] == labels[3, 3] == labels[4, 2] == 1
+    assert (labels[10:12, 20:23] == 2).all()
+    assert (labels[~mask] == 0).all()
+
+
+def test_labels_empty_mask():
+    labels, n = BlobLabeler(H, W).label(np.zeros((H, W), dtype=bool))
+    assert n == 0 and not labels.any()
+
+
+@pytest.mark.parametrize("density", [0.1, 0.3, 0.5])
+def test_labels_match_reference(density):
+    rng = np.random.default_rng(7)
+    labeler = BlobLabeler(H, W)
+    for _ in range(20):
+        mask = rng.random((H, W)) < density
+        labels, n = labeler.label(mask)
+        ref = _reference_labels(mask)
+        assert n == ref.max()
+        np.testing.assert_array_equal(labels, ref)
+
+
+def test_measure_blobs():
+    frame = np.full((H, W), 20.0, dtype=np.float32)
+    frame[5:7, 5:8] = [[30, 31, 32], [33, 34, 36]]
+    frame[15, 25] = 50.0
+    frame[16, 26] = 40.0
+    labels, n = BlobLabeler(H, W).label(frame >= 30)
+    m = measure_blobs(labels, n, frame)
+    np.testing.assert_array_equal(m["area"], [6, 2])
+    np.testing.assert_allclose(m["cy"], [5.5, 15.5])
+    np.testing.assert_allclose(m["cx"], [6.0, 25.5])
+    np.testing.assert_allclose(m["peak"], [36.0, 50.0])
+    np.testing.assert_allclose(m["mean"], [196 / 6, 45.0])
+
+
+def _square(half: int, cy: int = 12, cx: int = 16) -> np.ndarray:
+    frame = np.full((H, W), 20.0, dtype=np.float32)
+    frame[cy - half:cy + half, cx - half:cx + half] = 40.0
+    return frame
+
+
+def test_spreading_hotspot_keeps_track_and_grows():
+    tracker = HotspotTracker(H, W, hot_threshold=30.0)
+    for i, half in enumerate((1, 2, 3, 4, 5)):
+        active = tracker.update(_square(half), None, t=i * 0.5)
+        assert [tr.track_id for tr in active] == [1]       # 同一個熱點
+    tr = active[0]
+    assert tr.area == 100 and tr.hits == 5
+    assert tr.growth > tracker.growth_threshold
+    assert tracker.growing() == [tr]
+
+
+def test_static_hotspot_not_growing():
+    tracker = HotspotTracker(H, W, hot_threshold=30.0)
+    for i in range(6):
+        tracker.update(_square(3), None, t=i * 0.5)
+    assert tracker.active and not tracker.growing()
+
+
+def test_small_blobs_filtered_and_tracks_expire():
+    tracker = HotspotTracker(H, W, hot_threshold=30.0, max_missed=2)
+    noise = np.full((H, W), 20.0, dtype=np.float32)
+    noise[0, 0] = 40.0                                      # 1 px < min_area
+    assert tracker.update(noise, None, t=0.0) == []
+    tracker.update(_square(2), None, t=0.5)
+    cold = np.full((H, W), 20.0, dtype=np.float32)
+    for k in range(1, 4):
+        assert tracker.update(cold, None, t=0.5 + k * 0.5) == []
+        assert len(tracker.tracks) == (1 if k <= 2 else 0)
+    # 結束後再出現是新的軌跡
+    assert tracker.update(_square(2), None, t=3.0)[0].track_id == 2
+
+
+def test_diff_mask_adds_pixels():
+    tracker = HotspotTracker(H, W, hot_threshold=30.0)
+    diff = np.zeros((H, W), dtype=bool)
+    diff[3:5, 3:5] = True
+    active = tracker.update(np.full((H, W), 20.0, dtype=np.float32), diff, t=0.0)
+    assert len(active) == 1 and active[0].area == 4
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""LINE 推送器（對本機 stub server 驗證重試 / 關閉）與警報摘要"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from hevt.line import AlertDigest, LineAlerter, LineConfig, LineDispatcher
+
+
+class _Stub:
+    """本機假 LINE API：依序回 script 裡的狀態碼（用完就一直回 200），記錄收到的推送。"""
+
+    def __init__(self, script=(), delay=0.0):
+        self.script = list(script)
+        self.delay = delay
+        self.received = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                time.sleep(stub.delay)
+                with stub.lock:
+                    stub.received.append(json.loads(body))
+                    code = stub.script.pop(0) if stub.script else 200
+                self.send_response(code)
+                if code == 429:
+                    self.send_header("Retry-After", "0.2")
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v2/bot/message/push"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub(request):
+    s = _Stub(**getattr(request, "param", {}))
+    yield s
+    s.close()
+
+
+@pytest.mark.parametrize("stub", [{"script": [429, 503]}], indirect=True)
+def test_retry_after_429_and_5xx(stub):
+    d = LineDispatcher(workers=1, backoff=0.05, url=stub.url)
+    t0 = time.monotonic()
+    ok, status, _body = d.submit("token", "Cgroup", "hello").result(5)
+    assert ok and status == 200
+    assert time.monotonic() - t0 >= 0.2            # 有照 Retry-After 等
+    assert len(stub.received) == 3
+    assert stub.received[-1]["to"] == "Cgroup"
+    s = d.stats()
+    assert (s["sent"], s["retries"], s["rate_limited"]) == (1, 2, 1)
+    d.close()
+
+
+@pytest.mark.parametrize("stub", [{"script": [400]}], indirect=True)
+def test_non_retryable_fails_once(stub):
+    d = LineDispatcher(workers=1, backoff=0.05, url=stub.url)
+    ok, status, _body = d.submit("token", "Cgroup", "hello").result(5)
+    assert not ok and status == 400
+    assert len(stub.received) == 1
+    assert d.stats()["failed"] == 1
+    d.close()
+
+
+def test_multicast_for_user_list(stub):
+    d = LineDispatcher(workers=1, url=stub.url)
+    assert d.submit("token", ["U1", "U2"], "hi").result(5)[0]
+    assert stub.received[0]["to"] == ["U1", "U2"]
+    d.close()
+
+
+def test_close_drains_queue(stub):
+    d = LineDispatcher(workers=2, url=stub.url)
+    futs = [d.submit("token", f"C{i}", "x") for i in range(10)]
+    d.close(timeout=5)
+    assert all(f.done() and f.result()[0] for f in futs)
+    assert len(stub.received) == 10
+    assert d.submit("token", "C0", "late") is None      # 關閉後不再收
+    assert d.stats()["dropped"] == 1
+
+
+@pytest.mark.parametrize("stub", [{"delay": 0.3}], indirect=True)
+def test_close_timeout_counts_dropped(stub, capsys):
+    d = LineDispatcher(workers=1, url=stub.url)
+    futs = [d.submit("token", f"C{i}", "x") for i in range(5)]
+    t0 = time.monotonic()
+    d.close(timeout=0.1)
+    assert time.monotonic() - t0 < 1.0                  # 有上限，不會等完全部
+    s = d.stats()
+    assert s["dropped"] >= 3
+    assert sum(f.done() and not f.result()[0] for f in futs) == s["dropped"]
+    assert "dropped" in capsys.readouterr().out
+
+
+# ---------------- 警報摘要 ----------------
+class _Collect:
+    def __init__(self):
+        self.texts = []
+
+    def submit_all(self, config, text):
+        self.texts.append(text)
+        return []
+
+
+def _digest(window=60.0, clock=None):
+    cfg = LineConfig(enabled=True, token="t", group_id="C1", digest_window=window)
+    sink = _Collect()
+    return AlertDigest(cfg, sink, clock=clock), sink, cfg
+
+
+def test_digest_groups_by_device():
+    t0 = datetime(2024, 1, 1, 8, 0, 0)
+    digest, sink, _cfg = _digest()
+    digest.add("dev-a", 40.0, 30.0, 5, t0)
+    digest.add("dev-b", 55.0, 35.0, 9, t0 + timedelta(seconds=1))
+    digest.add("dev-a", 45.0, 28.0, 3, t0 + timedelta(seconds=2))
+    digest.close()
+    assert len(sink.texts) == 1
+    lines = sink.texts[0].splitlines()
+    assert "2 台 @ 2024-01-01 08:00:00" in lines[0]          # 標上第一筆警報的時間
+    assert lines[1].startswith("dev-b: Max=55.00")             # 依 Max 排序
+    assert lines[2] == "dev-a: Max=45.00°C, Avg=30.00°C, DiffArea=5 (x2)"
+
+
+def test_digest_windows_follow_alert_clock():
+    # 重播：警報時間跨三個視窗，即使 wall time 幾乎沒過也要分成三則
+    t0 = datetime(2024, 1, 1, 8, 0, 0)
+    clock = [t0]
+    digest, sink, _cfg = _digest(clock=lambda: clock[0])
+    for minutes in (0, 0.5, 2, 5):
+        clock[0] = t0 + timedelta(minutes=minutes)
+        digest.add("dev-a", 40.0, 30.0, 1, clock[0])
+    assert [t.splitlines()[0][-8:] for t in sink.texts] == ["08:00:00", "08:02:00"]
+    digest.close()
+    assert sink.texts[-1].splitlines()[0].endswith("08:05:00")
+    assert digest.digests_sent == 3
+
+
+def test_digest_thread_flushes_when_clock_passes_window():
+    t0 = datetime(2024, 1, 1, 8, 0, 0)
+    clock = [t0]
+    digest, sink, _cfg = _digest(clock=lambda: clock[0])
+    digest.add("dev-a", 40.0, 30.0, 1)
+    clock[0] = t0 + timedelta(minutes=2)
+    deadline = time.monotonic() + 3
+    while not sink.texts and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(sink.texts) == 1
+    digest.close()
+    assert len(sink.texts) == 1
+
+
+def test_alerter_routes_to_digest():
+    t0 = datetime(2024, 1, 1, 8, 0, 0)
+    digest, sink, cfg = _digest()
+    alerter = LineAlerter(cfg, device_id="dev-a", digest=digest)
+    alerter.maybe_send(50.0, 30.0, 4, 1, now=t0)
+    alerter.maybe_send(51.0, 30.0, 4, 1, now=t0 + timedelta(seconds=1))   # 冷卻中
+    digest.close()
+    assert len(sink.texts) == 1 and "08:00:00" in sink.texts[0]
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""--multiprocess：RemoteEngine 要提供 GUI 用到的 Engine 設定（History / ROIs 按鈕）"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from hevt.multiproc import RemoteEngine
+from hevt.roi import Roi
+
+ROI_CONFIG = {"*": [Roi("motor", (0, 0, 12, 16)), Roi("bus", (12, 16, 24, 32), alarm=60.0)]}
+
+
+@pytest.fixture(scope="module")
+def remote():
+    engine = RemoteEngine({"bind_ip": "127.0.0.1", "multi": True, "history": 50, "roi_config": ROI_CONFIG})
+    yield engine
+    engine.stop()
+
+
+def test_remote_engine_settings(remote):
+    assert remote.history == 50
+    assert remote.history_encoding == "i16"
+    assert remote.roi_config == ROI_CONFIG
+    assert remote.state.rois == 2
+
+
+def _button_texts(widget) -> set:
+    texts = set()
+    for child in widget.winfo_children():
+        if child.winfo_class() == "TButton":
+            texts.add(child.cget("text"))
+        texts |= _button_texts(child)
+    return texts
+
+
+def test_gui_controls_with_remote_engine(remote):
+    tk = pytest.importorskip("tkinter")
+    try:
+        tk.Tk().destroy()
+    except tk.TclError as e:
+        pytest.skip(f"no display: {e}")
+    from hevt.gui import ThermalApp
+
+    app = ThermalApp(remote)
+    try:
+        texts = _button_texts(app.root)
+        assert "History" in texts
+        assert "ROIs" in texts
+    finally:
+        app.root.destroy()
+
+
+@pytest.fixture
+def remote_acks():
+    engine = RemoteEngine({"bind_ip": "127.0.0.1", "multi": True, "command_acks": True,
+                           "cmd_port": 41234, "img_port": 41235})
+    engine.open()
+    engine.start()
+    yield engine
+    engine.stop()
+
+
+def test_rpc_not_blocked_by_batch(remote_acks):
+    results = []
+    t = threading.Thread(target=lambda: results.append(
+        remote_acks.apply_thresholds(["127.0.0.9"], 31.0, 2.0, 1.2, 200, timeout=1.5)))
+    t.start()
+    time.sleep(0.2)
+    # 批次在 ingest 端等 ACK 時，其它 RPC 不用等它
+    t0 = time.monotonic()
+    remote_acks.set_thresholds(32.0, 2.0, 1.2)
+    assert time.monotonic() - t0 < 1.0
+    t.join()
+    assert results[0]["127.0.0.9"].status == "timeout"
+
+
+def test_late_reply_is_discarded(remote_acks):
+    with pytest.raises(RuntimeError):
+        remote_acks._call("send_batch", {"127.0.0.9": "PING"}, 1.0, rpc_timeout=0.1)
+    time.sleep(1.2)                        # 遲到的批次回覆已進 Pipe
+    assert remote_acks._call("start") is False   # 拿到的是自己的回覆，不是上一筆的 dict
+
+
+def test_send_command_returns_future(remote_acks):
+    future = remote_acks.send_command("PING", "127.0.0.9")
+    assert isinstance(future, Future)
+    result = future.result(timeout=15)
+    assert (result.ip, result.command, result.status) == ("127.0.0.9", "PING", "timeout")
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""錄製/重播：wall-clock 被調回去時，索引順序與 seek 不受影響；沒有影像的 REPORT 也錄得下"""
+
+import time
+
+import numpy as np
+
+import hevt.recorder as recorder
+from hevt.engine import PIX_H, PIX_W, Engine
+from hevt.recorder import REC_FRAME, REC_REPORT, FrameRecorder, RecordingReader
+from hevt.replay import ReplaySource
+from hevt.report import Report
+
+
+class _Clock:
+    def __init__(self, wall: float):
+        self.wall = wall
+        self.mono = 100.0
+
+    def step(self, dt: float, wall_jump: float = 0.0):
+        self.mono += dt
+        self.wall += dt + wall_jump
+
+
+def _patch(monkeypatch, clock):
+    monkeypatch.setattr(recorder.time, "time", lambda: clock.wall)
+    monkeypatch.setattr(recorder.time, "monotonic", lambda: clock.mono)
+
+
+def _record(rec, clock, n, value=0.0):
+    frame = np.zeros((PIX_H, PIX_W), dtype=np.float32)
+    for i in range(n):
+        frame[0, 0] = value + i
+        rec.record("dev", frame)
+        clock.step(1.0)
+
+
+def test_wall_clock_step_back(tmp_path, monkeypatch):
+    clock = _Clock(1_700_000_000.0)
+    _patch(monkeypatch, clock)
+    rec = FrameRecorder(str(tmp_path), segment_frames=4, max_bytes=None)
+    _record(rec, clock, 3, value=0.0)
+    clock.step(0.0, wall_jump=-3600.0)         # NTP / DST：鐘往回跳一小時
+    _record(rec, clock, 6, value=10.0)
+    rec.close()
+
+    with RecordingReader(str(tmp_path)) as reader:
+        chunks = list(reader.records(with_times=True))
+        times = np.concatenate([t for t, _ in chunks])
+        order = np.concatenate([r["frame"][:, 0, 0] for _, r in chunks])
+        walls = np.concatenate([r["t"] for _, r in chunks])
+        t_first, t_last = reader.time_range()
+        # 錄製時間軸遞增、記錄依寫入順序
+        assert np.all(np.diff(times) > 0)
+        assert order.tolist() == [0, 1, 2, 10, 11, 12, 13, 14, 15]
+        # wall-clock 原樣保留為中繼資料
+        assert walls[3] == walls[2] + 1.0 - 3600.0
+        assert (t_first, t_last) == (times[0], times[-1])
+        # seek 依錄製時間軸：跳鐘後的區段也找得到
+        sub = np.concatenate([r["frame"][:, 0, 0] for r in reader.records(times[4], times[7])])
+        assert sub.tolist() == [11, 12, 13]
+
+
+def test_restart_after_clock_step_back(tmp_path, monkeypatch):
+    clock = _Clock(1_700_000_000.0)
+    _patch(monkeypatch, clock)
+    rec = FrameRecorder(str(tmp_path), segment_frames=4, max_bytes=None)
+    _record(rec, clock, 2, value=0.0)
+    rec.close()
+
+    clock.step(5.0, wall_jump=-7200.0)         # 重啟前鐘被調回兩小時
+    rec = FrameRecorder(str(tmp_path), segment_frames=4, max_bytes=None)
+    _record(rec, clock, 2, value=10.0)
+    rec.close()
+
+    with RecordingReader(str(tmp_path)) as reader:
+        chunks = list(reader.records(with_times=True))
+        times = np.concatenate([t for t, _ in chunks])
+        order = np.concatenate([r["frame"][:, 0, 0] for _, r in chunks])
+        assert np.all(np.diff(times) > 0)
+        assert order.tolist() == [0, 1, 10, 11]
+
+
+def _report(alarm: int, max_temp: float) -> Report:
+    return Report(alarm, max_temp, 20.0, 25.0, 0.5, 0.25, 3, 4, 0.0, 0.0, 0.0)
+
+
+def test_reports_without_frames_are_replayed(tmp_path):
+    # 裝置只送 REPORT、沒有影像：REPORT 仍要留在錄影裡，重播時照樣送回 Engine
+    src = Engine(multi=True)
+    rec = FrameRecorder(str(tmp_path), max_bytes=None)
+    src.subscribe(on_frame=rec.on_frame, on_report=rec.on_report)
+    frame = np.full((PIX_H, PIX_W), 21.0, dtype=np.float32)
+    reports = [_report(0, 28.0), _report(1, 35.5), _report(0, 29.0)]
+    src.feed_report("10.0.0.2", reports[0], 1.0)
+    src.feed_frame("10.0.0.3", frame, 1.5)
+    src.feed_report("10.0.0.2", reports[1], 2.0)
+    src.feed_report("10.0.0.3", reports[2], 2.5)
+    src.feed_frame("10.0.0.3", frame, 3.0)             # 帶著同一筆 REPORT：重播時不重複
+    rec.close()
+    assert (rec.frames_recorded, rec.reports_recorded) == (2, 3)
+
+    with RecordingReader(str(tmp_path)) as reader:
+        kinds = np.concatenate([r["kind"] for r in reader.records()])
+    assert kinds.tolist() == [REC_REPORT, REC_FRAME, REC_REPORT, REC_REPORT, REC_FRAME]
+
+    dst = Engine(multi=True)
+    got = []
+    dst.subscribe(on_report=lambda dev, r: got.append((dev.device_id, r)),
+                  on_frame=lambda dev, f, _m: got.append((dev.device_id, "frame")))
+    stats = ReplaySource(dst, str(tmp_path), speed=0).run()
+    assert got == [("10.0.0.2", reports[0]), ("10.0.0.3", "frame"), ("10.0.0.2", reports[1]),
+                   ("10.0.0.3", reports[2]), ("10.0.0.3", "frame")]
+    assert (stats["frames"], stats["reports"]) == (2, 3)
+
+
+def test_retention_keeps_segment_being_written(tmp_path):
+    rec = FrameRecorder(str(tmp_path), segment_frames=2, max_bytes=None, max_segments=2)
+    frame = np.zeros((PIX_H, PIX_W), dtype=np.float32)
+    for i in range(9):
+        rec.record("dev", frame, t=1_700_000_000.0 + i)
+        rec._prep_thread.join()
+    writing = rec._seg.path
+    rec._enforce_retention(time.time())
+    segs = recorder.list_segments(str(tmp_path))
+    assert writing in segs and len(segs) <= 2
+    rec.close()
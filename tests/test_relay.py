@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""多廠區彙整：批次編碼、localhost 上的轉送 / 斷線重送 / 重複批次、緩衝吃緊時抽幀"""
+
+import socket
+import time
+import zlib
+
+import numpy as np
+import pytest
+
+from hevt.engine import PIX_H, PIX_W, Engine
+from hevt.relay import (BATCH, MSG_BATCH, REC_FRAME, REC_REPORT, Aggregator, EdgeForwarder, _EdgeConn,
+                        decode_batch, encode_batch)
+from hevt.report import Report
+
+REPORT = Report(0, 31.5, 20.0, 25.25, 0.5, 0.25, 3, 4, 0.0, 0.0, 0.0)
+
+
+class _Dev:
+    def __init__(self, device_id):
+        self.device_id = device_id
+
+
+class _Engine:
+    def subscribe(self, **_kw):
+        pass
+
+
+def _frames(n, seed=0):
+    rng = np.random.default_rng(seed)
+    base = (20 + 20 * rng.random((PIX_H, PIX_W))).astype(np.float32)
+    return [base + 0.1 * i for i in range(n)]
+
+
+def _wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return cond()
+
+
+def test_batch_round_trip():
+    frames = _frames(3)
+    records = [(REC_FRAME, "a", 1.0, frames[0]), (REC_REPORT, "a", 1.5, REPORT),
+               (REC_FRAME, "b", 2.0, frames[2]), (REC_FRAME, "a", 2.5, frames[1])]
+    out = [(k, d, t, item.copy() if k == REC_FRAME else item) for k, d, t, item in decode_batch(encode_batch(records))]
+    assert [(k, d, t) for k, d, t, _ in out] == [(k, d, t) for k, d, t, _ in records]
+    assert out[1][3] == REPORT
+    for (_k, _d, _t, got), (_k2, _d2, _t2, want) in zip(out, records):
+        if _k == REC_FRAME:
+            np.testing.assert_allclose(got, want, atol=0.006)
+    with pytest.raises(ValueError):
+        list(decode_batch(encode_batch(records)[:-1]))
+
+
+@pytest.fixture
+def central():
+    engine = Engine(multi=True)
+    got = {"frames": [], "reports": []}
+    engine.subscribe(on_frame=lambda dev, frame, _m: got["frames"].append(dev.device_id),
+                     on_report=lambda dev, r: got["reports"].append((dev.device_id, r)))
+    agg = Aggregator(engine, host="127.0.0.1", port=0)
+    agg.open()
+    yield agg, got
+    agg.stop()
+
+
+def test_forward_to_aggregator(central):
+    agg, got = central
+    agg.start()
+    fwd = EdgeForwarder(_Engine(), ("127.0.0.1", agg.port), name="plantA", batch_interval=0.05)
+    fwd.start()
+    dev = _Dev("10.0.0.2")
+    for frame in _frames(5):
+        fwd.on_frame(dev, frame)
+    fwd.on_report(dev, REPORT)
+    assert _wait_for(lambda: len(got["frames"]) == 5 and got["reports"])
+    assert got["reports"] == [("plantA/10.0.0.2", REPORT)]
+    assert set(got["frames"]) == {"plantA/10.0.0.2"}
+    assert _wait_for(lambda: fwd.stats()["batches_acked"] >= 1 and not fwd.stats()["buffered_batches"])
+    assert agg.edges() == ["plantA"]
+    fwd.close()
+
+
+def test_buffered_while_central_down_then_delivered():
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()                          # 先沒人聽：連線失敗、批次留在緩衝
+
+    fwd = EdgeForwarder(_Engine(), ("127.0.0.1", port), name="plantB", batch_interval=0.05)
+    fwd.start()
+    dev = _Dev("10.0.0.3")
+    for frame in _frames(4):
+        fwd.on_frame(dev, frame)
+    assert _wait_for(lambda: fwd.stats()["buffered_batches"] >= 1 and fwd.connect_failures >= 1)
+    assert not fwd.connected
+
+    engine = Engine(multi=True)
+    frames = []
+    engine.subscribe(on_frame=lambda d, f, _m: frames.append(d.device_id))
+    agg = Aggregator(engine, host="127.0.0.1", port=port)
+    agg.start()
+    try:
+        assert _wait_for(lambda: len(frames) == 4, timeout=10.0)
+        assert _wait_for(lambda: not fwd.stats()["buffered_batches"])
+        assert fwd.stats()["frames_forwarded"] == 4
+    finally:
+        fwd.close()
+        agg.stop()
+
+
+class _Sock:
+    def __init__(self):
+        self.sent = []
+
+    def sendall(self, data):
+        self.sent.append(data)
+
+
+def test_resent_batch_is_acked_not_replayed(central):
+    agg, got = central
+    raw = encode_batch([(REC_REPORT, "10.0.0.2", time.time(), REPORT)])
+    body = BATCH.pack(1, len(raw)) + zlib.compress(raw)
+    conn = _EdgeConn(_Sock(), ("127.0.0.1", 1))
+    conn.name, conn.session = "plantA", 42
+    agg._on_message(conn, MSG_BATCH, body)
+    agg._on_message(conn, MSG_BATCH, body)             # 重連後重送同一批
+    assert len(got["reports"]) == 1
+    assert agg.duplicates == 1 and len(conn.sock.sent) == 2     # 兩次都回 ACK
+    conn.session = 43                                  # 邊緣重啟：新的 session 從頭算
+    agg._on_message(conn, MSG_BATCH, body)
+    assert len(got["reports"]) == 2
+
+
+def test_thinning_keeps_reports_and_recovers():
+    fwd = EdgeForwarder(_Engine(), ("127.0.0.1", 1), buffer_bytes=40_000)
+    dev = _Dev("10.0.0.2")
+    frames = _frames(200, seed=1)
+    strides = []
+    for i, frame in enumerate(frames):
+        fwd.on_frame(dev, frame + np.float32(i % 7))   # 每幀都不同，壓縮後仍有一定大小
+        fwd.on_report(dev, REPORT)
+        fwd._seal()
+        strides.append(fwd._stride)
+    assert strides[0] == 1 and max(strides) == 8
+    assert strides == sorted(strides)                  # 只變緊、不來回
+    s = fwd.stats()
+    assert s["frames_thinned"] > 0
+    assert s["batches_dropped"] > 0                    # 緩衝滿了丟最舊的
+    assert s["buffered_bytes"] <= 40_000 or s["buffered_batches"] == 1
+    # 每一批都留著 REPORT（抽幀只抽幀）
+    assert all(b.reports == 1 for b in fwd._outbox)
+
+    # 假裝都送出去並收到 ACK：緩衝清空後回到全部轉送
+    fwd._unsent = len(fwd._outbox)
+    fwd._inflight_bytes = fwd._outbox_bytes
+    fwd._on_ack(fwd._outbox[-1].seq)
+    assert fwd._stride == 1 and not fwd._outbox
+
+
+def test_stride_hysteresis():
+    fwd = EdgeForwarder(_Engine(), ("127.0.0.1", 1), buffer_bytes=1000)
+    for fill, stride in ((400, 1), (500, 2), (760, 4), (700, 4), (660, 4), (640, 2), (450, 2), (390, 1)):
+        fwd._outbox_bytes = fill
+        fwd._update_stride()
+        assert fwd._stride == stride, fill
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""REPORT：依 schema 解析文字格式、二進位格式來回轉換"""
+
+import pytest
+
+from hevt.engine import Engine
+from hevt.report import (BIN_REPORT, Report, format_report, pack_report, parse_binary_report,
+                         parse_report)
+
+SAMPLE = Report(1, 52.5, 20.25, 31.75, 1.5, 0.25, 12, 34, 0.5, -0.75, 2.0)
+
+
+def test_text_round_trip():
+    assert parse_report(format_report(SAMPLE)) == SAMPLE
+
+
+def test_text_keys_in_any_order_with_defaults():
+    r = parse_report("REPORT,D7=9,FUTURE=1,D1=40.5,ALARM=1,D6=3.0")
+    assert (r.alarm, r.max_temp, r.over_count, r.diff_area) == (1, 40.5, 3, 9)
+    assert r.min_temp == 0.0 and r.diff_area_trend == 0.0      # 缺少的欄位用預設值
+    assert isinstance(r.over_count, int)
+
+
+@pytest.mark.parametrize("msg", ["REPORT", "REPORT,FOO=1", "STATUS,D1=1", "REPORT,D1=abc"])
+def test_text_rejects_bad_messages(msg):
+    with pytest.raises(ValueError):
+        parse_report(msg)
+
+
+def test_binary_round_trip():
+    data = pack_report(SAMPLE)
+    assert len(data) == BIN_REPORT.size == 42
+    assert parse_binary_report(data) == SAMPLE
+    assert parse_binary_report(memoryview(data + b"\0\0")) == SAMPLE   # 後面多的不管
+
+
+def test_binary_clamps_counts_and_rejects_bad_data():
+    big = SAMPLE._replace(over_count=70000, diff_area=70000)
+    r = parse_binary_report(pack_report(big))
+    assert (r.over_count, r.diff_area) == (0xFFFF, 0xFFFF)
+    with pytest.raises(ValueError):
+        parse_binary_report(pack_report(SAMPLE)[:-1])
+    with pytest.raises(ValueError):
+        parse_binary_report(b"XXXX" + pack_report(SAMPLE)[4:])
+
+
+class _FakeSock:
+    def __init__(self, packets):
+        self.packets = list(packets)
+
+    def recvfrom(self, _n):
+        if not self.packets:
+            raise BlockingIOError
+        return self.packets.pop(0)
+
+
+def test_engine_accepts_both_formats():
+    engine = Engine(multi=True)
+    got = []
+    engine.subscribe(on_report=lambda dev, r: got.append((dev.device_id, r)))
+    engine._drain_cmd(_FakeSock([
+        (format_report(SAMPLE).encode(), ("10.0.0.2", 5000)),
+        (pack_report(SAMPLE), ("10.0.0.3", 5000)),
+        (b"REPORT,garbage", ("10.0.0.2", 5000)),
+    ]), 1.0)
+    assert got == [("10.0.0.2", SAMPLE), ("10.0.0.3", SAMPLE)]
+    assert engine.devices["10.0.0.2"].parse_errors == 1
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""ROI：reduceat 統計與逐區以 NumPy 切片算的結果一致、門檻、斜率、設定檔"""
+
+import json
+
+import numpy as np
+import pytest
+
+from hevt.roi import Roi, RoiStats, load_roi_config, rois_for
+
+H, W = 24, 32
+ROIS = [Roi("motor", (0, 0, 12, 16), alarm=45.0),
+        Roi("busbar", (4, 8, 10, 30)),                  # 與 motor 重疊：後面的優先
+        Roi("breaker", (14, 0, 30, 10), slope=1.0)]     # 超出畫面的部分裁掉
+
+
+def _masks():
+    labels = np.zeros((H, W), dtype=int)
+    for k, roi in enumerate(ROIS):
+        r0, c0, r1, c1 = roi.rect
+        labels[r0:r1, c0:c1] = k + 1
+    return [labels == k + 1 for k in range(len(ROIS))]
+
+
+def test_reductions_match_per_roi_slices():
+    rng = np.random.default_rng(3)
+    stats = RoiStats(ROIS, H, W, alarm=35.0, slope=2.0)
+    frame = (20 + 30 * rng.random((H, W))).astype(np.float32)
+    stats.update(frame, t=0.0)
+    thresh = [45.0, 35.0, 35.0]
+    for k, m in enumerate(_masks()):
+        vals = frame[m]
+        assert stats.counts[k] == m.sum()
+        assert stats.max[k] == vals.max() and stats.min[k] == vals.min()
+        assert stats.avg[k] == pytest.approx(vals.mean(), rel=1e-5)
+        assert stats.over_count[k] == (vals >= thresh[k]).sum()
+        assert stats.alarm[k] == (vals.max() >= thresh[k])
+    assert stats.max_slope.tolist() == [0.0, 0.0, 0.0]        # 第一幀沒有斜率
+
+
+def test_slope_against_oldest_frame_in_window():
+    stats = RoiStats(ROIS, H, W, window=4, alarm=100.0, slope=2.0)
+    base = np.full((H, W), 20.0, dtype=np.float32)
+    for i in range(6):
+        frame = base.copy()
+        frame[_masks()[2]] += 1.5 * i                         # breaker 每秒升 1.5 °C
+        stats.update(frame, t=float(i))
+    # 視窗 4 幀：與 3 秒前比較
+    np.testing.assert_allclose(stats.max_slope, [0.0, 0.0, 1.5], atol=1e-5)
+    np.testing.assert_allclose(stats.avg_slope, [0.0, 0.0, 1.5], atol=1e-5)
+    # breaker 自訂 slope=1.0 → 斜率警報；其它沿用全域 2.0
+    assert stats.alarm.tolist() == [False, False, True]
+
+
+def test_set_thresholds_keeps_custom_values():
+    stats = RoiStats(ROIS, H, W, alarm=30.0, slope=2.0)
+    stats.set_thresholds(alarm=50.0)
+    assert stats.alarm_thresh.tolist() == [45.0, 50.0, 50.0]
+    assert stats.slope_thresh.tolist() == [2.0, 2.0, 1.0]
+    frame = np.full((H, W), 48.0, dtype=np.float32)
+    stats.update(frame, t=0.0)
+    assert stats.alarm.tolist() == [True, False, False]
+    assert stats.rows()[0][:2] == ("motor", 48.0)
+
+
+def test_empty_roi_rejected():
+    with pytest.raises(ValueError):
+        RoiStats([Roi("a", (0, 0, 4, 4)), Roi("b", (0, 0, 4, 4))], H, W)    # a 被完全蓋掉
+    with pytest.raises(ValueError):
+        RoiStats([Roi("out", (30, 40, 35, 45))], H, W)
+
+
+def test_load_config_and_device_fallback(tmp_path):
+    path = tmp_path / "rois.json"
+    path.write_text(json.dumps({
+        "*": [{"name": "motor", "rect": [0, 0, 12, 16], "alarm": 45}],
+        "10.0.0.2": [{"name": "busbar", "rect": [4, 8, 10, 30]}],
+    }), encoding="utf-8")
+    config = load_roi_config(str(path))
+    assert rois_for(config, "10.0.0.2") == [Roi("busbar", (4, 8, 10, 30))]
+    assert rois_for(config, "10.0.0.9") == [Roi("motor", (0, 0, 12, 16), alarm=45.0)]
+    assert rois_for(None, "10.0.0.2") == []
+    path.write_text(json.dumps({"*": [{"name": "bad", "rect": [0, 0, 1]}]}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_roi_config(str(path))
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""REPORT 時間序列：彙總桶、查詢挑層級、SQLite 寫入與保留期限（以資料時間為準）"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+import hevt.timeseries as timeseries
+from hevt.report import Report
+from hevt.timeseries import TimeSeriesStore
+
+DAY = 86400.0
+
+
+def _report(v: float) -> Report:
+    return Report(0, v, v - 5, v - 2, 0.1, 0.05, 0, 0, 0.0, 0.0, 0.0)
+
+
+def _rows(path: str) -> dict:
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT level, COUNT(*) FROM rollup GROUP BY level").fetchall())
+
+
+def test_replay_of_old_recording_keeps_rollups(tmp_path, monkeypatch):
+    monkeypatch.setattr(timeseries, "PRUNE_INTERVAL", 0.0)     # 每次寫入都清一次
+    path = str(tmp_path / "trends.db")
+    store = TimeSeriesStore(path)
+    t0 = (timeseries.time.time() - 3 * DAY) // 60 * 60        # 三天前的錄影
+    for i in range(200):
+        store.add("dev", t0 + i, _report(25.0 + i * 0.01))
+    store.close()
+    rows = _rows(path)
+    assert rows[1] == 199                  # 最後一個 1 s 桶還開著
+    assert rows[60] == 3
+
+
+def test_prune_relative_to_newest_bucket(tmp_path, monkeypatch):
+    monkeypatch.setattr(timeseries, "PRUNE_INTERVAL", 0.0)
+    monkeypatch.setattr(timeseries, "FLUSH_INTERVAL", 0.01)
+    path = str(tmp_path / "trends.db")
+    store = TimeSeriesStore(path)
+    t0 = 1_000_000.0
+    for i in range(10):
+        store.add("dev", t0 + i, _report(25.0))
+    store._writer.join(0.2)                # 讓第一批寫入
+    for i in range(10):
+        store.add("dev", t0 + 3 * DAY + i, _report(25.0))
+    store.close()
+    with sqlite3.connect(path) as conn:
+        oldest = conn.execute("SELECT MIN(t) FROM rollup WHERE level = 1").fetchone()[0]
+    assert oldest >= t0 + 3 * DAY - timeseries.DB_RETENTION[1]
+
+
+def test_rollup_buckets_from_samples():
+    store = TimeSeriesStore()
+    t0 = 1_000_000.0                       # 不在分鐘邊界上（999960 + 40）：第一個 1 min 桶只有 20 秒
+    for i in range(300):                   # 每秒 2 筆，150 秒
+        store.add("dev", t0 + i * 0.5, _report(float(i)))
+    series = store._series["dev"]
+    one_s, one_m = series.levels[0], series.levels[1]
+    assert one_s.ring.n == 149             # 最後一秒還開著
+    i = one_s.ring.order()[0]
+    assert (one_s.ring.start[i], one_s.ring.count[i]) == (t0, 2)
+    assert one_s.ring.min[i, 1] == 0.0 and one_s.ring.max[i, 1] == 1.0
+    assert one_s.ring.sum[i, 1] / one_s.ring.count[i] == 0.5
+    # 1 min 由 1 s 桶累積：count 是樣本數
+    idx = one_m.ring.order()
+    assert one_m.ring.start[idx].tolist() == [999_960.0, 1_000_020.0, 1_000_080.0]
+    assert one_m.ring.count[idx[0]] == 40 and one_m.ring.max[idx[0], 1] == 39.0
+    assert one_m.ring.count[idx[1]] == 120 and one_m.ring.min[idx[1], 1] == 40.0
+
+
+def test_pick_level():
+    assert TimeSeriesStore.pick_level(0, 600) == 1
+    assert TimeSeriesStore.pick_level(0, 86400) == 60
+    assert TimeSeriesStore.pick_level(0, 30 * 86400) == 3600
+    assert TimeSeriesStore.pick_level(0, 3600, max_points=30) == 3600
+
+
+def test_query_raw_then_rollups():
+    store = TimeSeriesStore(raw_samples=64)
+    t0 = 1_000_000.0
+    for i in range(600):
+        store.add("dev", t0 + i, _report(float(i)))
+    # 範圍在原始樣本內：直接回原始樣本
+    raw = store.query("dev", "max_temp", t0 + 560, t0 + 570)
+    assert raw["level"] == 0 and raw["avg"].tolist() == list(np.arange(560.0, 570.0))
+    # 原始樣本不夠久：改用 1 s 桶（含還開著的最後一桶）
+    q = store.query("dev", "max_temp", t0, t0 + 600)
+    assert q["level"] == 1 and len(q["t"]) == 600 and q["max"][-1] == 599.0
+    # 點數限制：改用 1 min 桶
+    q = store.query("dev", "max_temp", t0, t0 + 600, max_points=20)
+    assert q["level"] == 60
+    assert q["t"][0] == 999_960.0 and q["min"][0] == 0.0 and q["max"][0] == 19.0
+    assert q["avg"][1] == pytest.approx(np.arange(20, 80).mean())
+    assert store.query("other", "max_temp", t0, t0 + 600)["t"].size == 0
+
+
+def test_query_reads_database_beyond_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(timeseries, "LEVEL_BUCKETS", {1: 10, 60: 10, 3600: 10})
+    monkeypatch.setattr(timeseries, "FLUSH_INTERVAL", 0.01)
+    path = str(tmp_path / "trends.db")
+    store = TimeSeriesStore(path, raw_samples=8)
+    t0 = 1_000_000.0
+    for i in range(100):
+        store.add("dev", t0 + i, _report(float(i)))
+    # 記憶體只剩最近 10 個 1 s 桶，較舊的從資料庫補
+    deadline = timeseries.time.monotonic() + 5
+    while store.stats()["rows_written"] < 100 and timeseries.time.monotonic() < deadline:
+        timeseries.time.sleep(0.01)
+    q = store.query("dev", "max_temp", t0, t0 + 100)
+    assert q["level"] == 1
+    assert q["t"].tolist() == [t0 + i for i in range(100)]
+    assert q["max"].tolist() == [float(i) for i in range(100)]
+    store.close()
+    # readonly（--multiprocess 的 GUI 行程）只看資料庫
+    ro = TimeSeriesStore(path, readonly=True)
+    assert ro.devices() == ["dev"]
+    assert ro.query("dev", "max_temp", t0, t0 + 100)["t"].size == 99    # 開著的最後一桶沒寫
+    ro.close()